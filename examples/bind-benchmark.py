@@ -0,0 +1,143 @@
+"""Measures the time taken by :func:`pytential.bind` (symbolic preprocessing
+and compilation, no evaluation) for the integral equation operators in
+:mod:`pytential.symbolic.pde` and :mod:`pytential.symbolic.stokes`.
+"""
+
+import numpy as np
+import pyopencl as cl
+
+from meshmode.array_context import PyOpenCLArrayContext
+from meshmode.discretization import Discretization
+from meshmode.discretization.poly_element import \
+        InterpolatoryQuadratureSimplexGroupFactory
+
+from pytential import bind, sym, GeometryCollection
+
+import logging
+logging.basicConfig(level=logging.WARNING)
+
+# {{{ set some constants for use below
+
+target_order = 4
+nruns = 5
+
+# }}}
+
+
+# {{{ operators
+
+def get_operators(ambient_dim):
+    from sumpy.kernel import LaplaceKernel, HelmholtzKernel, BiharmonicKernel
+    from pytential.symbolic.pde.scalar import (
+            DirichletOperator, NeumannOperator, BiharmonicClampedPlateOperator)
+
+    k = sym.var("k")
+    ops = {}
+
+    for knl, knl_kwargs in [
+            (LaplaceKernel(ambient_dim), {}),
+            (HelmholtzKernel(ambient_dim), {"k": k}),
+            ]:
+        ops[f"dirichlet-{knl}"] = DirichletOperator(knl, -1,
+                use_l2_weighting=True,
+                kernel_arguments=knl_kwargs).operator(sym.var("sigma"))
+        ops[f"neumann-{knl}"] = NeumannOperator(knl, -1,
+                use_l2_weighting=True,
+                kernel_arguments=knl_kwargs).operator(sym.var("sigma"))
+
+    sym_mu = sym.var("mu")
+    if ambient_dim == 2:
+        op = BiharmonicClampedPlateOperator(BiharmonicKernel(2), -1)
+        ops["clamped-plate"] = op.operator(op.get_density_var("sigma"))
+
+        from pytential.symbolic.pde.cahn_hilliard import CahnHilliardOperator
+        op = CahnHilliardOperator(lambda1=1.5, lambda2=1.25, c=1)
+        ops["cahn-hilliard"] = op.operator(op.make_unknown("sigma"))
+
+        from pytential.symbolic.stokes import HsiaoKressExteriorStokesOperator
+        op = HsiaoKressExteriorStokesOperator(
+                omega=sym.make_sym_vector("omega", ambient_dim))
+        ops["stokes-hsiao-kress"] = op.operator(op.get_density_var("sigma"),
+                normal=sym.normal(ambient_dim).as_vector(), mu=sym_mu)
+    else:
+        from pytential.symbolic.pde.maxwell import (
+                PECChargeCurrentMFIEOperator, MuellerAugmentedMFIEOperator)
+
+        op = PECChargeCurrentMFIEOperator(k=k)
+        ops["maxwell-mfie-j"] = op.j_operator(-1, sym.make_sym_vector("jt", 2))
+        ops["maxwell-mfie-rho"] = op.rho_operator(-1, sym.var("rho"))
+
+        op = MuellerAugmentedMFIEOperator(omega=0.4, mus=(1, 1), epss=(1.5, 1))
+        ops["maxwell-mueller"] = op.operator(op.make_unknown("u"))
+
+        from pytential.symbolic.stokes import HebekerExteriorStokesOperator
+        op = HebekerExteriorStokesOperator()
+        ops["stokes-hebeker"] = op.operator(op.get_density_var("sigma"),
+                normal=sym.normal(ambient_dim).as_vector(), mu=sym_mu)
+
+    # NOTE: the waveguide operator needs several interface geometries, and
+    # the generalized Debye operators are not importable at the moment
+
+    return ops
+
+# }}}
+
+
+def make_places(actx, ambient_dim):
+    if ambient_dim == 2:
+        from meshmode.mesh.generation import make_curve_mesh, starfish
+        mesh = make_curve_mesh(starfish,
+                np.linspace(0, 1, 64 + 1),
+                target_order)
+    else:
+        from meshmode.mesh.generation import generate_icosphere
+        mesh = generate_icosphere(1, target_order)
+
+    pre_density_discr = Discretization(actx, mesh,
+            InterpolatoryQuadratureSimplexGroupFactory(target_order))
+
+    from pytential.qbx import QBXLayerPotentialSource
+    qbx = QBXLayerPotentialSource(pre_density_discr,
+            fine_order=4*target_order,
+            qbx_order=3,
+            fmm_order=10)
+
+    return GeometryCollection(qbx)
+
+
+def time_bind(places, expr):
+    from time import perf_counter
+
+    elapsed = []
+    for _ in range(nruns):
+        t_start = perf_counter()
+        bound_op = bind(places, expr)
+        elapsed.append(perf_counter() - t_start)
+
+    from pytential.symbolic.compiler import ComputePotentialInstruction
+    nlpots = sum(
+            1 for insn in bound_op.code.instructions
+            if isinstance(insn, ComputePotentialInstruction))
+
+    return min(elapsed), nlpots
+
+
+def main():
+    cl_ctx = cl.create_some_context()
+    queue = cl.CommandQueue(cl_ctx)
+    actx = PyOpenCLArrayContext(queue)
+
+    for ambient_dim in [2, 3]:
+        places = make_places(actx, ambient_dim)
+
+        for name, expr in get_operators(ambient_dim).items():
+            elapsed, nlpots = time_bind(places, expr)
+            print(f"{ambient_dim}D {name:32s}: "
+                    f"bind {elapsed:.4f} s, "
+                    f"{nlpots:3d} layer potential evaluations")
+
+
+if __name__ == "__main__":
+    main()
+
+# vim: foldmethod=marker
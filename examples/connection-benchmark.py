@@ -0,0 +1,104 @@
+"""Compares resampling a density from ``QBX_SOURCE_STAGE1`` to
+``QBX_SOURCE_QUAD_STAGE2`` through the chain of refinement and resampling
+connections with the flattened connection returned by
+:meth:`pytential.GeometryCollection.get_connection`.
+"""
+
+import numpy as np
+import numpy.linalg as la
+import pyopencl as cl
+
+from meshmode.array_context import PyOpenCLArrayContext
+from meshmode.discretization import Discretization
+from meshmode.discretization.poly_element import \
+        InterpolatoryQuadratureSimplexGroupFactory
+from meshmode.discretization.connection import ChainedDiscretizationConnection
+from meshmode.dof_array import thaw, flatten
+
+from pytential import sym, GeometryCollection
+
+import logging
+logging.basicConfig(level=logging.WARNING)
+
+# {{{ set some constants for use below
+
+nelements_list = [200, 800, 3200]
+target_order = 8
+qbx_order = 4
+nruns = 10
+
+# }}}
+
+
+def time_connection(actx, conn, sigma):
+    from time import perf_counter
+
+    # warm up: code generation
+    result = conn(sigma)
+    actx.queue.finish()
+
+    elapsed = []
+    for _ in range(nruns):
+        t_start = perf_counter()
+        result = conn(sigma)
+        actx.queue.finish()
+        elapsed.append(perf_counter() - t_start)
+
+    return min(elapsed), result
+
+
+def main():
+    cl_ctx = cl.create_some_context()
+    queue = cl.CommandQueue(cl_ctx)
+    actx = PyOpenCLArrayContext(queue)
+
+    from meshmode.mesh.generation import make_curve_mesh, starfish
+    from pytential.qbx import QBXLayerPotentialSource
+
+    for nelements in nelements_list:
+        mesh = make_curve_mesh(starfish,
+                np.linspace(0, 1, nelements+1),
+                target_order)
+        pre_density_discr = Discretization(
+                actx, mesh,
+                InterpolatoryQuadratureSimplexGroupFactory(target_order))
+
+        qbx = QBXLayerPotentialSource(
+                pre_density_discr, fine_order=4*target_order,
+                qbx_order=qbx_order, fmm_order=False)
+        places = GeometryCollection(qbx)
+        name = places.auto_source.geometry
+
+        density_discr = places.get_discretization(name)
+        nodes = thaw(actx, density_discr.nodes())
+        sigma = actx.np.cos(3 * actx.np.arctan2(nodes[1], nodes[0]))
+
+        chained = ChainedDiscretizationConnection([
+            places._get_conn_from_cache(name,
+                sym.QBX_SOURCE_STAGE1, sym.QBX_SOURCE_STAGE2),
+            places._get_conn_from_cache(name,
+                sym.QBX_SOURCE_STAGE2, sym.QBX_SOURCE_QUAD_STAGE2),
+            ])
+        flattened = places.get_connection(
+                sym.DOFDescriptor(name, discr_stage=sym.QBX_SOURCE_STAGE1),
+                sym.DOFDescriptor(name, discr_stage=sym.QBX_SOURCE_QUAD_STAGE2))
+
+        t_chained, result_chained = time_connection(actx, chained, sigma)
+        t_flattened, result_flattened = time_connection(actx, flattened, sigma)
+
+        result_chained = actx.to_numpy(flatten(result_chained))
+        result_flattened = actx.to_numpy(flatten(result_flattened))
+        error = (la.norm(result_chained - result_flattened)
+                / la.norm(result_chained))
+
+        print(f"nelements {nelements:5d}: "
+                f"chained {t_chained:.5f} s, "
+                f"flattened {t_flattened:.5f} s, "
+                f"speedup {t_chained / t_flattened:.2f}, "
+                f"rel. difference {error:.3e}")
+
+
+if __name__ == "__main__":
+    main()
+
+# vim: foldmethod=marker
@@ -0,0 +1,96 @@
+"""Measures the time taken by ``import pytential`` (and the time until the
+symbolic execution machinery is available) in a fresh interpreter, using the
+``-X importtime`` output of CPython.
+
+Pass ``--max-time SECONDS`` to fail if the bare ``import pytential`` gets
+slower than that, e.g. to catch import time regressions in CI.
+"""
+
+import re
+import subprocess
+import sys
+
+# {{{ set some constants for use below
+
+nruns = 5
+
+statements = {
+        "import pytential": "import pytential",
+        "pytential.bind": "import pytential; pytential.bind",
+        }
+
+# }}}
+
+
+_IMPORTTIME_RE = re.compile(
+        r"^import time:\s+(?P<self>\d+)\s+\|\s+(?P<cumulative>\d+)\s+\|"
+        r"(?P<indent>\s+)(?P<name>\S+)\s*$")
+
+
+def parse_importtime(stderr):
+    """
+    :returns: a tuple ``(total, modules)``, where *total* is the cumulative
+        import time in seconds of all top-level imports, and *modules* maps
+        the name of every imported module to its cumulative import time.
+    """
+    total = 0
+    modules = {}
+    for line in stderr.splitlines():
+        match = _IMPORTTIME_RE.match(line)
+        if match is None:
+            continue
+
+        cumulative = int(match.group("cumulative")) * 1e-6
+        modules[match.group("name")] = cumulative
+
+        # top-level imports are indented by a single space
+        if len(match.group("indent")) == 1:
+            total += cumulative
+
+    return total, modules
+
+
+def time_import(statement):
+    elapsed = []
+    for _ in range(nruns):
+        result = subprocess.run(
+                [sys.executable, "-X", "importtime", "-c", statement],
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                universal_newlines=True, check=True)
+
+        total, modules = parse_importtime(result.stderr)
+        elapsed.append(total)
+
+    return min(elapsed), modules
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--max-time", type=float, default=None,
+            help="maximum time (in seconds) allowed for 'import pytential'")
+    args = parser.parse_args()
+
+    heavy_modules = ["pyopencl", "loopy", "meshmode", "sumpy", "boxtree"]
+
+    # modules imported during interpreter startup are reported as well
+    baseline, _ = time_import("pass")
+
+    for name, statement in statements.items():
+        elapsed, modules = time_import(statement)
+        elapsed = max(elapsed - baseline, 0)
+        loaded = [m for m in heavy_modules if m in modules]
+        print(f"{name:20s}: {elapsed:.4f} s "
+                f"({len(modules)} modules, heavy: {', '.join(loaded) or 'none'})")
+
+        if name == "import pytential" and args.max_time is not None:
+            if elapsed > args.max_time:
+                print(f"'{statement}' took {elapsed:.4f} s, "
+                        f"more than the allowed {args.max_time:.4f} s")
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
+
+# vim: foldmethod=marker
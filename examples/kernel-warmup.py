@@ -0,0 +1,100 @@
+"""Generates and compiles all kernels needed to evaluate a layer potential
+ahead of time using :meth:`pytential.symbolic.execution.BoundExpression.warmup`
+and compares the time of the first (cold) evaluation with a later one.
+
+With ``--cache-dir DIR``, the kernels are stored in *DIR*, which can then be
+copied to other nodes and used there by running with the same option (or
+with ``XDG_CACHE_HOME=DIR``) to skip code generation and compilation.
+"""
+
+import argparse
+
+import pytential
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--cache-dir", default=None,
+        help="directory in which to store generated and compiled kernels")
+args = parser.parse_args()
+
+if args.cache_dir is not None:
+    # NOTE: needs to happen before pyopencl and loopy are imported
+    pytential.set_kernel_cache_dir(args.cache_dir)
+
+import numpy as np  # noqa: E402
+import pyopencl as cl  # noqa: E402
+
+from meshmode.array_context import PyOpenCLArrayContext  # noqa: E402
+from meshmode.discretization import Discretization  # noqa: E402
+from meshmode.discretization.poly_element import (  # noqa: E402
+        InterpolatoryQuadratureSimplexGroupFactory)
+
+from pytential import bind, sym, GeometryCollection  # noqa: E402
+
+import logging  # noqa: E402
+logging.basicConfig(level=logging.INFO)
+
+# {{{ set some constants for use below
+
+nelements = 64
+target_order = 8
+qbx_order = 4
+fmm_order = 10
+
+# }}}
+
+
+def main():
+    cl_ctx = cl.create_some_context()
+    queue = cl.CommandQueue(cl_ctx)
+    actx = PyOpenCLArrayContext(queue)
+
+    from meshmode.mesh.generation import make_curve_mesh, starfish
+    mesh = make_curve_mesh(starfish,
+            np.linspace(0, 1, nelements + 1),
+            target_order)
+    pre_density_discr = Discretization(actx, mesh,
+            InterpolatoryQuadratureSimplexGroupFactory(target_order))
+
+    from pytential.qbx import QBXLayerPotentialSource
+    qbx = QBXLayerPotentialSource(pre_density_discr,
+            fine_order=4*target_order,
+            qbx_order=qbx_order,
+            fmm_order=fmm_order)
+    places = GeometryCollection(qbx)
+
+    from sumpy.kernel import LaplaceKernel
+    from pytential.symbolic.pde.scalar import DirichletOperator
+    op = DirichletOperator(LaplaceKernel(2), -1, use_l2_weighting=True)
+    bound_op = bind(places, op.operator(sym.var("sigma")))
+
+    from time import perf_counter
+    density_discr = places.get_discretization(places.auto_source.geometry)
+    sigma = density_discr.zeros(actx)
+
+    t_start = perf_counter()
+    records = bound_op.warmup(actx, sigma=sigma)
+    t_warmup = perf_counter() - t_start
+
+    for record in records:
+        level_to_order = record["fmm_level_to_order"]
+        record_fmm_order = getattr(level_to_order, "fmm_order", level_to_order)
+        print(f"{record['source'].geometry}: "
+                f"{', '.join(str(k) for k in record['kernels'])} "
+                f"(qbx_order {record['qbx_order']}, "
+                f"fmm_order {record_fmm_order}): "
+                f"{record['wall_time']:.3f} s")
+
+    sigma = density_discr.zeros(actx) + 1
+
+    t_start = perf_counter()
+    bound_op(actx, sigma=sigma)
+    actx.queue.finish()
+    t_eval = perf_counter() - t_start
+
+    print(f"warmup {t_warmup:.3f} s, evaluation after warmup {t_eval:.3f} s")
+
+
+if __name__ == "__main__":
+    main()
+
+# vim: foldmethod=marker
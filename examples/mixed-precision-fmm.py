@@ -0,0 +1,124 @@
+"""Compares the accuracy and run time of the QBX FMM with double precision
+expansions to the mixed precision mode (see *_use_mixed_precision_fmm* in
+:class:`pytential.qbx.QBXLayerPotentialSource`), in which the multipole and
+local expansions are stored in single precision.
+
+The setup follows ``test_off_surface_eval_vs_direct`` in
+``test/test_layer_pot.py``: a double layer potential on a wobbly circle is
+evaluated off the surface and compared to direct (non-FMM) QBX, for a range
+of FMM orders. The bytes allocated by the FMM for one evaluation are
+recorded with a :class:`pytential.allocation.StatisticsMemoryPool`.
+"""
+
+import numpy as np
+import pyopencl as cl
+
+from meshmode.array_context import PyOpenCLArrayContext
+from meshmode.discretization import Discretization
+from meshmode.discretization.poly_element import \
+        InterpolatoryQuadratureSimplexGroupFactory
+from meshmode.mesh.generation import make_curve_mesh, WobblyCircle
+
+from pytential import bind, sym, GeometryCollection
+from pytential.allocation import StatisticsMemoryPool
+
+import logging
+logging.basicConfig(level=logging.WARNING)
+
+# {{{ set some constants for use below
+
+nelements = 300
+target_order = 8
+qbx_order = 3
+fmm_orders = [4, 6, 8, 10, 12]
+nruns = 3
+
+# }}}
+
+
+def get_name(fmm_order, mixed_precision):
+    return f"fmm-{fmm_order}-{'mixed' if mixed_precision else 'double'}"
+
+
+def get_places(actx):
+    from pytential.qbx import QBXLayerPotentialSource
+    from pytential.target import PointsTarget
+    from sumpy.visualization import FieldPlotter
+
+    mesh = make_curve_mesh(WobblyCircle.random(8, seed=30),
+                np.linspace(0, 1, nelements+1),
+                target_order)
+    pre_density_discr = Discretization(
+            actx, mesh, InterpolatoryQuadratureSimplexGroupFactory(target_order))
+
+    direct_qbx = QBXLayerPotentialSource(
+            pre_density_discr, 4*target_order, qbx_order,
+            fmm_order=False,
+            target_association_tolerance=0.05)
+
+    places = {"direct_qbx": direct_qbx}
+    for fmm_order in fmm_orders:
+        for mixed_precision in [False, True]:
+            places[get_name(fmm_order, mixed_precision)] = direct_qbx.copy(
+                    fmm_order=fmm_order,
+                    _use_mixed_precision_fmm=mixed_precision)
+
+    fplot = FieldPlotter(np.zeros(2), extent=5, npoints=500)
+    places["target"] = PointsTarget(fplot.points)
+
+    return GeometryCollection(places)
+
+
+def main():
+    cl_ctx = cl.create_some_context()
+    queue = cl.CommandQueue(cl_ctx)
+
+    allocator = StatisticsMemoryPool(queue)
+    actx = PyOpenCLArrayContext(queue, allocator=allocator)
+
+    places = get_places(actx)
+
+    from sumpy.kernel import LaplaceKernel
+    op = sym.D(LaplaceKernel(2), sym.var("sigma"), qbx_forced_limit=None)
+
+    def evaluate(source_name):
+        density_discr = places.get_discretization(source_name)
+        sigma = density_discr.zeros(actx) + 1
+        bound_op = bind(places, op, auto_where=(source_name, "target"))
+
+        # NOTE: the first evaluation generates and compiles all kernels
+        result = actx.to_numpy(bound_op(actx, sigma=sigma))
+
+        from time import perf_counter
+        elapsed = []
+        for _ in range(nruns):
+            allocator.reset_statistics()
+
+            t_start = perf_counter()
+            bound_op(actx, sigma=sigma)
+            queue.finish()
+            elapsed.append(perf_counter() - t_start)
+
+        nbytes = allocator.get_statistics()["bytes_per_stage"].get("qbx_fmm", 0)
+        return result, min(elapsed), nbytes
+
+    ref, _, _ = evaluate("direct_qbx")
+    ref_norm = np.max(np.abs(ref))
+
+    print(f"{'fmm_order':>9s} {'precision':>9s} {'rel. error':>10s} "
+            f"{'time [s]':>8s} {'fmm [MiB]':>9s}")
+    for fmm_order in fmm_orders:
+        for mixed_precision in [False, True]:
+            result, elapsed, nbytes = evaluate(
+                    get_name(fmm_order, mixed_precision))
+            error = np.max(np.abs(result - ref)) / ref_norm
+
+            print(f"{fmm_order:9d} "
+                    f"{'mixed' if mixed_precision else 'double':>9s} "
+                    f"{error:10.3e} {elapsed:8.4f} {nbytes / 2**20:9.3f}")
+
+
+if __name__ == "__main__":
+    main()
+
+# vim: foldmethod=marker
@@ -0,0 +1,115 @@
+"""Compares target-specific QBX with the P2QBXL + QBXL2P path in two
+dimensions for a high-order Helmholtz and Laplace workload in the style of
+:file:`helmholtz-dirichlet.py`.
+"""
+
+import numpy as np
+import pyopencl as cl
+
+from meshmode.array_context import PyOpenCLArrayContext
+from meshmode.discretization import Discretization
+from meshmode.discretization.poly_element import \
+        InterpolatoryQuadratureSimplexGroupFactory
+
+from pytential import bind, sym, GeometryCollection
+from sumpy.kernel import LaplaceKernel, HelmholtzKernel
+
+import logging
+logging.basicConfig(level=logging.WARNING)
+
+# {{{ set some constants for use below
+
+nelements = 400
+bdry_quad_order = 4
+mesh_order = bdry_quad_order
+qbx_orders = [4, 8, 12]
+bdry_ovsmp_quad_order = 4*bdry_quad_order
+fmm_order = 20
+k = 20
+nruns = 3
+
+# these stages are replaced by eval_target_specific_qbx_locals
+QBX_STAGES = ["form_global_qbx_locals", "eval_qbx_expansions"]
+TSQBX_STAGES = ["eval_target_specific_qbx_locals", "eval_qbx_expansions"]
+
+# }}}
+
+
+def qbx_stage_time(bound_op, context, actx, stages):
+    elapsed = []
+    for _ in range(nruns):
+        timing_data = {}
+        bound_op.eval(context, timing_data=timing_data, array_context=actx)
+
+        elapsed.append(sum(
+            stage_timing[stage]["wall_elapsed"]
+            for stage_timing in timing_data.values()
+            for stage in stages
+            if stage in stage_timing))
+
+    return min(elapsed)
+
+
+def main():
+    cl_ctx = cl.create_some_context()
+    queue = cl.CommandQueue(cl_ctx)
+    actx = PyOpenCLArrayContext(queue)
+
+    from meshmode.mesh.generation import make_curve_mesh, starfish
+    mesh = make_curve_mesh(starfish,
+            np.linspace(0, 1, nelements+1),
+            mesh_order)
+
+    pre_density_discr = Discretization(
+            actx, mesh,
+            InterpolatoryQuadratureSimplexGroupFactory(bdry_quad_order))
+
+    from pytential.qbx import QBXLayerPotentialSource
+
+    for kernel, kernel_kwargs in [
+            (LaplaceKernel(2), {}),
+            (HelmholtzKernel(2), {"k": sym.var("k")}),
+            ]:
+        sym_op = (
+                sym.S(kernel, sym.var("sigma"), qbx_forced_limit=+1,
+                    **kernel_kwargs)
+                + sym.D(kernel, sym.var("sigma"), qbx_forced_limit=+1,
+                    **kernel_kwargs))
+
+        for qbx_order in qbx_orders:
+            qbx = QBXLayerPotentialSource(
+                    pre_density_discr, fine_order=bdry_ovsmp_quad_order,
+                    qbx_order=qbx_order, fmm_order=fmm_order,
+                    fmm_backend="fmmlib",
+                    _use_target_specific_qbx=False)
+
+            places = GeometryCollection({
+                "qbx": qbx,
+                "tsqbx": qbx.copy(_use_target_specific_qbx=True),
+                }, auto_where="qbx")
+
+            density_discr = places.get_discretization("qbx")
+            from meshmode.dof_array import thaw
+            nodes = thaw(actx, density_discr.nodes())
+            sigma = actx.np.cos(3 * actx.np.arctan2(nodes[1], nodes[0]))
+            context = {"sigma": sigma, "k": k}
+
+            timings = {}
+            for name, stages in [("qbx", QBX_STAGES), ("tsqbx", TSQBX_STAGES)]:
+                bound_op = bind(places, sym_op, auto_where=name)
+
+                # warm up: refinement, geometry setup, code generation
+                bound_op.eval(context, array_context=actx)
+
+                timings[name] = qbx_stage_time(bound_op, context, actx, stages)
+
+            print(f"{type(kernel).__name__:>16s} qbx_order {qbx_order:2d}: "
+                    f"p2qbxl + qbxl2p {timings['qbx']:.3f} s, "
+                    f"tsqbx {timings['tsqbx']:.3f} s, "
+                    f"speedup {timings['qbx'] / timings['tsqbx']:.2f}")
+
+
+if __name__ == "__main__":
+    main()
+
+# vim: foldmethod=marker
@@ -0,0 +1,110 @@
+"""Microbenchmarks for the Cython routines of target-specific QBX.
+
+Calls :func:`pytential.qbx.target_specific.eval_target_specific_qbx_locals`
+directly on synthetic data, so that the kernels can be timed without building
+a geometry or an FMM tree. Each QBX center gets its own target box, whose
+neighborhood consists of a single source box with *nsources* sources spread
+over a shell around the center.
+
+Run with ``OMP_NUM_THREADS`` set to the number of cores to use.
+"""
+
+import numpy as np
+from timeit import repeat
+
+import pytential.qbx.target_specific as ts
+
+# {{{ set some constants for use below
+
+ncenters = 200
+ntargets_per_center = 4
+nsources_list = [16, 64, 256]
+orders = [4, 8, 16]
+helmholtz_k = 20
+nruns = 5
+
+# }}}
+
+
+def make_problem(dim, nsources, rng):
+    def random_directions(n):
+        x = rng.normal(size=(dim, n))
+        return x / np.linalg.norm(x, axis=0)
+
+    centers = rng.uniform(-10, 10, size=(dim, ncenters))
+
+    # targets lie inside, sources outside the radius of convergence
+    targets = np.repeat(centers, ntargets_per_center, axis=1) + (
+            0.5 * random_directions(ncenters * ntargets_per_center))
+    sources = np.repeat(centers, nsources, axis=1) + (
+            rng.uniform(1.5, 2.5, size=ncenters * nsources)
+            * random_directions(ncenters * nsources))
+
+    qbx_centers = np.arange(ncenters, dtype=np.int32)
+    return dict(
+            sources=sources,
+            targets=targets,
+            centers=centers,
+            qbx_centers=qbx_centers,
+            qbx_center_to_target_box=qbx_centers,
+            center_to_target_starts=(
+                ntargets_per_center * np.arange(ncenters + 1, dtype=np.int32)),
+            center_to_target_lists=np.arange(
+                ncenters * ntargets_per_center, dtype=np.int32),
+            source_box_starts=np.arange(ncenters + 1, dtype=np.int32),
+            source_box_lists=qbx_centers,
+            box_source_starts=nsources * qbx_centers,
+            box_source_counts_nonchild=np.full(ncenters, nsources, np.int32),
+            charge=rng.normal(size=ncenters * nsources).astype(np.complex128),
+            dipstr=rng.normal(size=ncenters * nsources).astype(np.complex128),
+            dipvec=random_directions(ncenters * nsources),
+            )
+
+
+def time_kernel(problem, order, k, ifcharge, ifgrad):
+    dim, ntargets = problem["targets"].shape
+    pot = np.zeros(ntargets, np.complex128)
+    grad = np.zeros((dim, ntargets), np.complex128)
+
+    def run():
+        ts.eval_target_specific_qbx_locals(
+                ifpot=not ifgrad,
+                ifgrad=ifgrad,
+                ifcharge=ifcharge,
+                ifdipole=not ifcharge,
+                order=order,
+                helmholtz_k=k,
+                pot=pot,
+                grad=grad,
+                **problem)
+
+    run()
+    return min(repeat(run, number=1, repeat=nruns))
+
+
+def main():
+    rng = np.random.default_rng(seed=42)
+
+    for dim in [2, 3]:
+        for nsources in nsources_list:
+            problem = make_problem(dim, nsources, rng)
+            npairs = ncenters * ntargets_per_center * nsources
+
+            for kernel, k in [("Laplace", 0), ("Helmholtz", helmholtz_k)]:
+                for op, ifcharge, ifgrad in [
+                        ("S", True, False),
+                        ("Sp", True, True),
+                        ("D", False, False),
+                        ]:
+                    for order in orders:
+                        elapsed = time_kernel(problem, order, k, ifcharge, ifgrad)
+                        print(f"{dim}D {kernel:>9s} {op:>2s} "
+                                f"nsources {nsources:4d} order {order:2d}: "
+                                f"{elapsed:.4f} s "
+                                f"({1e9 * elapsed / npairs:.1f} ns / pair)")
+
+
+if __name__ == "__main__":
+    main()
+
+# vim: foldmethod=marker
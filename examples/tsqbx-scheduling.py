@@ -0,0 +1,112 @@
+"""Compares the static and the load-balanced thread schedules of target-specific
+QBX on a sphere that is locally refined around one of its poles, where the
+work per QBX center varies strongly.
+
+Run with ``OMP_NUM_THREADS`` set to the number of cores to use. The thread
+utilization of each run is logged by :mod:`pytential.qbx.fmmlib`.
+"""
+
+import numpy as np
+import pyopencl as cl
+
+from meshmode.array_context import PyOpenCLArrayContext
+from meshmode.discretization import Discretization
+from meshmode.discretization.poly_element import \
+        InterpolatoryQuadratureSimplexGroupFactory
+
+from pytential import bind, sym, GeometryCollection
+from sumpy.kernel import LaplaceKernel
+
+import logging
+logging.basicConfig(level=logging.WARNING)
+logging.getLogger("pytential.qbx.fmmlib").setLevel(logging.DEBUG)
+
+# {{{ set some constants for use below
+
+target_order = 4
+qbx_order = 4
+fmm_order = 10
+nrefinements = 3
+refine_radius = 0.4
+nruns = 5
+
+# }}}
+
+
+def make_locally_refined_mesh():
+    from meshmode.mesh.generation import generate_icosphere
+    from meshmode.mesh.refinement import RefinerWithoutAdjacency
+
+    mesh = generate_icosphere(1, target_order)
+    pole = np.array([0, 0, 1])
+
+    for _ in range(nrefinements):
+        group = mesh.groups[0]
+        centroids = np.mean(mesh.vertices[:, group.vertex_indices], axis=-1)
+        flags = (
+                np.linalg.norm(centroids - pole[:, np.newaxis], axis=0)
+                < refine_radius)
+
+        refiner = RefinerWithoutAdjacency(mesh)
+        mesh = refiner.refine(flags)
+
+    return mesh
+
+
+def main():
+    cl_ctx = cl.create_some_context()
+    queue = cl.CommandQueue(cl_ctx)
+    actx = PyOpenCLArrayContext(queue)
+
+    mesh = make_locally_refined_mesh()
+    pre_density_discr = Discretization(
+            actx, mesh,
+            InterpolatoryQuadratureSimplexGroupFactory(target_order))
+
+    from pytential.qbx import QBXLayerPotentialSource
+    qbx = QBXLayerPotentialSource(
+            pre_density_discr, 4*target_order,
+            qbx_order=qbx_order,
+            fmm_order=fmm_order,
+            fmm_backend="fmmlib",
+            _use_target_specific_qbx=True)
+
+    schedules = ["static", "balanced"]
+    places = GeometryCollection({
+        schedule: qbx.copy(_tsqbx_schedule=schedule)
+        for schedule in schedules
+        }, auto_where="static")
+
+    density_discr = places.get_discretization("static")
+    print(f"nelements {mesh.nelements} ndofs {density_discr.ndofs}")
+
+    from meshmode.dof_array import thaw
+    nodes = thaw(actx, density_discr.nodes())
+    sigma = actx.np.sin(3 * nodes[0]) * actx.np.cos(nodes[2])
+
+    sym_op = sym.S(LaplaceKernel(3), sym.var("sigma"), qbx_forced_limit=+1)
+
+    for schedule in schedules:
+        bound_op = bind(places, sym_op, auto_where=schedule)
+
+        # warm up: geometry setup, refinement, code generation
+        bound_op(actx, sigma=sigma)
+
+        elapsed = []
+        for _ in range(nruns):
+            timing_data = {}
+            bound_op.eval({"sigma": sigma},
+                    timing_data=timing_data, array_context=actx)
+
+            stage_timing, = timing_data.values()
+            elapsed.append(
+                    stage_timing["eval_target_specific_qbx_locals"]["wall_elapsed"])
+
+        print(f"{schedule:>10s}: eval_target_specific_qbx_locals "
+                f"min {min(elapsed):.3f} s mean {np.mean(elapsed):.3f} s")
+
+
+if __name__ == "__main__":
+    main()
+
+# vim: foldmethod=marker
@@ -22,13 +22,43 @@ THE SOFTWARE.
 
 import numpy as np
 
-import pytential.symbolic.primitives as sym
-from pytential.symbolic.execution import bind
-from pytential.symbolic.execution import GeometryCollection
-
 from pytools import memoize_on_first_arg
 
 
+# {{{ lazy loading
+
+# NOTE: the execution machinery pulls in pyopencl, loopy, meshmode and sumpy,
+# so it is only imported once one of these names is first used
+_LAZY_ATTRIBUTES = {
+        "sym": ("pytential.symbolic.primitives", None),
+        "bind": ("pytential.symbolic.execution", "bind"),
+        "GeometryCollection": ("pytential.symbolic.execution",
+            "GeometryCollection"),
+        }
+
+
+def __getattr__(name):
+    try:
+        module_name, attr_name = _LAZY_ATTRIBUTES[name]
+    except KeyError:
+        raise AttributeError(
+                f"module '{__name__}' has no attribute '{name}'") from None
+
+    from importlib import import_module
+    value = import_module(module_name)
+    if attr_name is not None:
+        value = getattr(value, attr_name)
+
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRIBUTES))
+
+# }}}
+
+
 def _set_up_logging_from_environment():
     import logging
     import os
@@ -47,15 +77,62 @@ def _set_up_logging_from_environment():
 
 
 def _set_up_errors():
+    # NOTE: matched by message and module instead of by category, so that the
+    # refiner (and with it pyopencl) does not need to be imported here
     import warnings
-    from pytential.qbx.refinement import RefinerNotConvergedWarning
-    warnings.filterwarnings("error", category=RefinerNotConvergedWarning)
+    warnings.filterwarnings("error",
+            message="QBX layer potential source refiner did not terminate",
+            category=UserWarning,
+            module=r"pytential\.qbx\.refinement")
 
 
 _set_up_logging_from_environment()
 _set_up_errors()
 
 
+# {{{ kernel cache
+
+def set_kernel_cache_dir(cache_dir):
+    """Store generated code and compiled kernels (of :mod:`loopy`,
+    :mod:`pyopencl` and the other packages using
+    :class:`pytools.persistent_dict.PersistentDict`) in *cache_dir*.
+
+    This allows preparing a directory of kernels ahead of time, e.g. with
+    :meth:`pytential.symbolic.execution.BoundExpression.warmup`, and reusing
+    it from other processes, possibly on other nodes. Entries in the caches
+    are keyed by content, so that the directory can be moved or copied.
+
+    Must be called before :mod:`loopy` or :mod:`pyopencl` are imported, as
+    their caches are opened on import. Equivalently, ``XDG_CACHE_HOME`` can
+    be set in the environment.
+
+    This works by setting ``XDG_CACHE_HOME``, which has two limitations:
+
+    * It changes the environment of the whole process and of all its
+      subprocesses, so that every other application using the XDG cache
+      directory also stores its caches in *cache_dir*.
+    * The caches are only redirected on platforms on which
+      :mod:`platformdirs` honors ``XDG_CACHE_HOME`` (e.g. Linux), but not on
+      macOS or Windows, where the platform cache directory is used
+      regardless. Kernel directories prepared ahead of time are therefore
+      only relocatable on the former.
+    """
+    import os
+    import sys
+
+    imported = [name for name in ["pyopencl", "loopy", "sumpy", "boxtree"]
+            if name in sys.modules]
+    if imported:
+        raise RuntimeError("cannot change the kernel cache directory after "
+                f"importing {', '.join(imported)}")
+
+    cache_dir = os.path.abspath(cache_dir)
+    os.makedirs(cache_dir, exist_ok=True)
+    os.environ["XDG_CACHE_HOME"] = cache_dir
+
+# }}}
+
+
 @memoize_on_first_arg
 def _integral_op(discr):
     from pytential import sym, bind
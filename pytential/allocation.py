@@ -0,0 +1,197 @@
+__copyright__ = "Copyright (C) 2020 Andreas Kloeckner"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+from contextlib import contextmanager
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+__doc__ = """
+.. note::
+
+   This module is experimental. Its interface is subject to change until this
+   notice is removed.
+
+A pooled device memory allocator that keeps statistics about the allocations
+made through it. When it is passed as the *allocator* of a
+:class:`meshmode.array_context.PyOpenCLArrayContext`, the arrays allocated
+by the geometry processing, refinement, target association and the QBX FMM
+are taken from the pool, so that buffers are reused across evaluations (e.g.
+the matrix-vector products of an iterative solver)::
+
+    allocator = StatisticsMemoryPool(queue)
+    actx = PyOpenCLArrayContext(queue, allocator=allocator)
+
+    ...
+
+    print(allocator.get_statistics())
+
+.. autoclass:: StatisticsMemoryPool
+.. autofunction:: get_allocator
+.. autofunction:: allocation_stage
+"""
+
+
+# {{{ memory pool
+
+class StatisticsMemoryPool:
+    """A :class:`pyopencl.tools.MemoryPool` that records the number of
+    allocations, how many of them were served from buffers held by the pool,
+    and the number of bytes allocated in each *stage* (see :meth:`stage`).
+
+    .. attribute:: pool
+
+        The underlying :class:`pyopencl.tools.MemoryPool`.
+
+    .. attribute:: nallocations
+    .. attribute:: nhits
+
+        The number of allocations that reused a buffer held by the pool.
+
+    .. attribute:: bytes_per_stage
+
+        A :class:`dict` mapping stage names to the number of bytes allocated
+        while the stage was active. Allocations outside of any stage are
+        recorded under *None*.
+
+    .. attribute:: high_water_mark
+
+        The largest number of bytes in use at once, or *None* if the installed
+        version of :mod:`pyopencl` does not keep track of it.
+
+    .. automethod:: __call__
+    .. automethod:: stage
+    .. autoattribute:: hit_rate
+    .. automethod:: get_statistics
+    .. automethod:: reset_statistics
+    .. automethod:: free_held
+    """
+
+    def __init__(self, queue):
+        import pyopencl.tools as cl_tools
+        self.pool = cl_tools.MemoryPool(cl_tools.ImmediateAllocator(queue))
+
+        self._stages = []
+        self.reset_statistics()
+
+    def reset_statistics(self):
+        self.nallocations = 0
+        self.nhits = 0
+        self.bytes_per_stage = {}
+        self.high_water_mark = None
+
+    def __call__(self, nbytes):
+        """Allocate a buffer of *nbytes* bytes from the pool."""
+        held_blocks = self.pool.held_blocks
+        buf = self.pool.allocate(nbytes)
+
+        self.nallocations += 1
+        if self.pool.held_blocks < held_blocks:
+            self.nhits += 1
+
+        stage = self._stages[-1] if self._stages else None
+        self.bytes_per_stage[stage] = self.bytes_per_stage.get(stage, 0) + nbytes
+
+        active_bytes = getattr(self.pool, "active_bytes", None)
+        if active_bytes is not None:
+            self.high_water_mark = max(self.high_water_mark or 0, active_bytes)
+
+        return buf
+
+    @contextmanager
+    def stage(self, name):
+        """A context manager that attributes all allocations made inside of it
+        to the stage *name*. Stages can be nested, in which case allocations
+        are attributed to the innermost one.
+        """
+        self._stages.append(name)
+        try:
+            yield
+        finally:
+            self._stages.pop()
+
+    @property
+    def hit_rate(self):
+        """The fraction of allocations that reused a buffer held by the pool."""
+        if not self.nallocations:
+            return 0.0
+
+        return self.nhits / self.nallocations
+
+    def get_statistics(self):
+        """
+        :returns: a :class:`dict` with the keys ``"nallocations"``,
+            ``"hit_rate"``, ``"high_water_mark"``, ``"managed_bytes"`` (the
+            size of all buffers of the pool, in use or not), ``"held_bytes"``
+            (the size of the buffers held by the pool but not in use) and
+            ``"bytes_per_stage"``. The byte counts are *None* if the installed
+            version of :mod:`pyopencl` does not keep track of them.
+        """
+        managed_bytes = getattr(self.pool, "managed_bytes", None)
+        active_bytes = getattr(self.pool, "active_bytes", None)
+        if managed_bytes is not None and active_bytes is not None:
+            held_bytes = managed_bytes - active_bytes
+        else:
+            held_bytes = None
+
+        return {
+                "nallocations": self.nallocations,
+                "hit_rate": self.hit_rate,
+                "high_water_mark": self.high_water_mark,
+                "managed_bytes": managed_bytes,
+                "held_bytes": held_bytes,
+                "bytes_per_stage": dict(self.bytes_per_stage),
+                }
+
+    def free_held(self):
+        """Release all buffers held (but not in use) by the pool."""
+        self.pool.free_held()
+
+# }}}
+
+
+# {{{ helpers
+
+def get_allocator(actx):
+    """
+    :returns: the allocator of *actx*, to be passed as *allocator* to the
+        array constructors of :mod:`pyopencl.array`, or *None*.
+    """
+    return getattr(actx, "allocator", None)
+
+
+@contextmanager
+def allocation_stage(allocator, name):
+    """Attribute all allocations made by *allocator* inside of this context
+    manager to the stage *name*, if *allocator* is a
+    :class:`StatisticsMemoryPool`. Does nothing otherwise.
+    """
+    if isinstance(allocator, StatisticsMemoryPool):
+        with allocator.stage(name):
+            yield
+    else:
+        yield
+
+# }}}
+
+# vim: foldmethod=marker
@@ -20,16 +20,11 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 THE SOFTWARE.
 """
 
-from meshmode.array_context import PyOpenCLArrayContext
-from meshmode.dof_array import flatten, unflatten, thaw
 import numpy as np
 from pytools import memoize_method, memoize_in
 
-from pytential.qbx.target_assoc import QBXTargetAssociationFailedException
 from pytential.source import LayerPotentialSourceBase
 
-import pyopencl as cl
-
 import logging
 logger = logging.getLogger(__name__)
 
@@ -47,6 +42,45 @@ class _not_provided:  # noqa: N801
     pass
 
 
+class _ConstantFMMLevelToOrder:
+    """The *fmm_level_to_order* used for a fixed *fmm_order*, which keeps
+    the order around for code that needs to know it ahead of time.
+    """
+
+    def __init__(self, fmm_order):
+        self.fmm_order = fmm_order
+
+    def __call__(self, kernel, kernel_args, tree, level):
+        return self.fmm_order
+
+
+def _get_qbx_sides(qbx_forced_limit):
+    """
+    :returns: a tuple of the sides on which an output with *qbx_forced_limit*
+        is evaluated, i.e. both one-sided limits for ``"avg"``.
+    """
+    if qbx_forced_limit == "avg":
+        return (+1, -1)
+    else:
+        return (qbx_forced_limit,)
+
+
+def _average_sides(queue, results):
+    """Combine the results on the sides returned by :func:`_get_qbx_sides`."""
+    if len(results) == 1:
+        result, = results
+        return result
+
+    plus, minus = results
+    return plus.mul_add(0.5, minus, 0.5, queue=queue)
+
+
+_SINGLE_PRECISION_DTYPES = {
+        np.dtype(np.float64): np.dtype(np.float32),
+        np.dtype(np.complex128): np.dtype(np.complex64),
+        }
+
+
 class QBXLayerPotentialSource(LayerPotentialSourceBase):
     """A source discretization for a QBX layer potential.
 
@@ -83,9 +117,11 @@ class QBXLayerPotentialSource(LayerPotentialSourceBase):
             _from_sep_smaller_min_nsources_cumul=None,
             _tree_kind="adaptive",
             _use_target_specific_qbx=None,
+            _tsqbx_schedule="static",
             geometry_data_inspector=None,
             cost_model=None,
             fmm_backend="sumpy",
+            _use_mixed_precision_fmm=False,
             target_stick_out_factor=_not_provided):
         """
         :arg fine_order: The total degree to which the (upsampled)
@@ -104,9 +140,20 @@ class QBXLayerPotentialSource(LayerPotentialSourceBase):
         :arg _use_target_specific_qbx: Whether to use target-specific
             acceleration by default if possible. *None* means
             "use if possible".
+        :arg _tsqbx_schedule: How target-specific QBX distributes centers
+            among threads, either *"static"* or *"balanced"*. See
+            :func:`pytential.qbx.target_specific.eval_target_specific_qbx_locals`.
         :arg cost_model: Either *None* or an object implementing the
              :class:`~pytential.qbx.cost.AbstractQBXCostModel` interface, used for
              gathering modeled costs if provided (experimental)
+        :arg _use_mixed_precision_fmm: If *True*, the multipole and local
+            expansions of the FMM (and hence all translations between them)
+            are stored in single precision, while the QBX expansions, the
+            direct (near-field) interactions and the outputs remain in the
+            precision of *density_discr*. This is only useful when the
+            requested accuracy is well above single precision round-off
+            (e.g. around :math:`10^{-5}`). Only supported by the *"sumpy"*
+            FMM backend.
         """
 
         # {{{ argument processing
@@ -140,6 +187,10 @@ class QBXLayerPotentialSource(LayerPotentialSourceBase):
         if fmm_order is not None and fmm_level_to_order is not None:
             raise TypeError("may not specify both fmm_order and fmm_level_to_order")
 
+        if _use_mixed_precision_fmm and fmm_backend != "sumpy":
+            raise ValueError("mixed precision FMM is only supported by "
+                    f"the 'sumpy' backend, not '{fmm_backend}'")
+
         if _box_extent_norm is None:
             _box_extent_norm = "l2"
 
@@ -152,8 +203,7 @@ class QBXLayerPotentialSource(LayerPotentialSourceBase):
             if fmm_order is False:
                 fmm_level_to_order = False
             else:
-                def fmm_level_to_order(kernel, kernel_args, tree, level):  # noqa pylint:disable=function-redefined
-                    return fmm_order
+                fmm_level_to_order = _ConstantFMMLevelToOrder(fmm_order)
 
         if _max_leaf_refine_weight is None:
             if density_discr.ambient_dim == 2:
@@ -187,6 +237,7 @@ class QBXLayerPotentialSource(LayerPotentialSourceBase):
 
         self.target_association_tolerance = target_association_tolerance
         self.fmm_backend = fmm_backend
+        self._use_mixed_precision_fmm = _use_mixed_precision_fmm
 
         if expansion_factory is None:
             from sumpy.expansion import DefaultExpansionFactory
@@ -206,6 +257,7 @@ class QBXLayerPotentialSource(LayerPotentialSourceBase):
                 _from_sep_smaller_min_nsources_cumul
         self._tree_kind = _tree_kind
         self._use_target_specific_qbx = _use_target_specific_qbx
+        self._tsqbx_schedule = _tsqbx_schedule
         self.geometry_data_inspector = geometry_data_inspector
 
         if cost_model is None:
@@ -233,11 +285,14 @@ class QBXLayerPotentialSource(LayerPotentialSourceBase):
             _max_leaf_refine_weight=None,
             _box_extent_norm=None,
             _from_sep_smaller_crit=None,
+            _from_sep_smaller_min_nsources_cumul=None,
             _tree_kind=None,
             _use_target_specific_qbx=_not_provided,
+            _tsqbx_schedule=None,
             geometry_data_inspector=None,
             cost_model=_not_provided,
             fmm_backend=None,
+            _use_mixed_precision_fmm=_not_provided,
 
             debug=_not_provided,
             _disable_refinement=_not_provided,
@@ -316,11 +371,13 @@ class QBXLayerPotentialSource(LayerPotentialSourceBase):
                 _from_sep_smaller_crit=(
                     _from_sep_smaller_crit or self._from_sep_smaller_crit),
                 _from_sep_smaller_min_nsources_cumul=(
-                    self._from_sep_smaller_min_nsources_cumul),
+                    _from_sep_smaller_min_nsources_cumul
+                    or self._from_sep_smaller_min_nsources_cumul),
                 _tree_kind=_tree_kind or self._tree_kind,
                 _use_target_specific_qbx=(_use_target_specific_qbx
                     if _use_target_specific_qbx is not _not_provided
                     else self._use_target_specific_qbx),
+                _tsqbx_schedule=_tsqbx_schedule or self._tsqbx_schedule,
                 geometry_data_inspector=(
                     geometry_data_inspector or self.geometry_data_inspector),
                 cost_model=(
@@ -329,6 +386,11 @@ class QBXLayerPotentialSource(LayerPotentialSourceBase):
                     if cost_model is not _not_provided
                     else self.cost_model),
                 fmm_backend=fmm_backend or self.fmm_backend,
+                _use_mixed_precision_fmm=(
+                    # False is a valid value here
+                    _use_mixed_precision_fmm
+                    if _use_mixed_precision_fmm is not _not_provided
+                    else self._use_mixed_precision_fmm),
                 **kwargs)
 
     # }}}
@@ -444,16 +506,20 @@ class QBXLayerPotentialSource(LayerPotentialSourceBase):
         else:
             func = self.exec_compute_potential_insn_fmm
 
-            def drive_fmm(wrangler, strengths, geo_data, kernel, kernel_arguments):
+            def drive_fmm(wrangler, strengths, geo_data, kernel, kernel_arguments,
+                    src_weights_in_tree_order=False):
                 del geo_data, kernel, kernel_arguments
                 from pytential.qbx.fmm import drive_fmm
                 if return_timing_data:
                     timing_data = {}
                 else:
                     timing_data = None
-                return drive_fmm(wrangler, strengths, timing_data), timing_data
+                result = drive_fmm(wrangler, strengths, timing_data,
+                        src_weights_in_tree_order=src_weights_in_tree_order)
+                return result, timing_data
 
             extra_args["fmm_driver"] = drive_fmm
+            extra_args["fuse_strengths"] = True
 
         return self._dispatch_compute_potential_insn(
                 actx, insn, bound_expr, evaluate, func, extra_args)
@@ -506,6 +572,75 @@ class QBXLayerPotentialSource(LayerPotentialSourceBase):
             extra_args={"fmm_driver": drive_cost_model}
         )
 
+    def expansion_field_compute_potential_insn(self, actx, insn, bound_expr,
+            evaluate):
+        """Evaluate *insn* using the FMM, keeping the QBX local expansions.
+
+        :returns: a tuple ``(assignments, field)``, where *field* is a
+            :class:`~pytential.qbx.expansion_field.QBXExpansionField`.
+        """
+        if self.fmm_level_to_order is False:
+            raise NotImplementedError("expansion fields of direct evaluations")
+        if self.fmm_backend != "sumpy":
+            raise NotImplementedError(
+                    f"expansion fields with the '{self.fmm_backend}' backend")
+
+        def drive_fmm(wrangler, strengths, geo_data, kernel, kernel_arguments,
+                src_weights_in_tree_order=False):
+            del kernel, kernel_arguments
+            from pytential.qbx.fmm import drive_fmm_upward, drive_fmm_downward
+            from pytential.qbx.expansion_field import QBXExpansionField
+
+            upward = drive_fmm_upward(wrangler, strengths,
+                    src_weights_in_tree_order=src_weights_in_tree_order)
+            result, qbx_expansions = drive_fmm_downward(
+                    wrangler, upward, return_qbx_expansions=True)
+
+            return result, QBXExpansionField.from_geometry_data(
+                    actx.queue, wrangler, geo_data, qbx_expansions,
+                    radius_factor=1 + self.target_association_tolerance)
+
+        return self._dispatch_compute_potential_insn(
+            actx, insn, bound_expr, evaluate,
+            self.exec_compute_potential_insn_fmm,
+            extra_args={"fmm_driver": drive_fmm, "fuse_strengths": True}
+        )
+
+    def memory_model_compute_potential_insn(self, actx, insn, bound_expr,
+            evaluate):
+        """Using :attr:`cost_model`, predict the memory footprint of executing
+        *insn*, see
+        :meth:`~pytential.qbx.cost.AbstractQBXCostModel.qbx_memory_per_stage`.
+
+        :returns: whatever :meth:`exec_compute_potential_insn_fmm` returns.
+        """
+        if self.fmm_level_to_order is False:
+            raise NotImplementedError("memory modeling direct evaluations")
+
+        def drive_memory_model(
+                    wrangler, strengths, geo_data, kernel, kernel_arguments):
+            del strengths
+
+            memory_model_result, metadata = self.cost_model.qbx_memory_per_stage(
+                actx.queue, geo_data, kernel, kernel_arguments,
+                dtype=wrangler.dtype, noutputs=len(insn.kernels),
+                far_field_dtype=getattr(
+                    wrangler, "far_field_dtype", wrangler.dtype)
+            )
+
+            from pytools.obj_array import obj_array_vectorize
+            return (
+                    obj_array_vectorize(
+                        wrangler.finalize_potentials,
+                        wrangler.full_output_zeros()),
+                    (memory_model_result, metadata))
+
+        return self._dispatch_compute_potential_insn(
+            actx, insn, bound_expr, evaluate,
+            self.exec_compute_potential_insn_fmm,
+            extra_args={"fmm_driver": drive_memory_model}
+        )
+
     def _dispatch_compute_potential_insn(self, actx, insn, bound_expr,
             evaluate, func, extra_args=None):
         if self._disable_refinement:
@@ -562,8 +697,11 @@ class QBXLayerPotentialSource(LayerPotentialSourceBase):
         target_discrs_and_qbx_sides = []
 
         for o in insn.outputs:
-            key = (o.target_name, o.qbx_forced_limit)
-            if key not in target_name_and_side_to_number:
+            for qbx_side in _get_qbx_sides(o.qbx_forced_limit):
+                key = (o.target_name, qbx_side)
+                if key in target_name_and_side_to_number:
+                    continue
+
                 target_name_and_side_to_number[key] = \
                         len(target_discrs_and_qbx_sides)
 
@@ -572,33 +710,98 @@ class QBXLayerPotentialSource(LayerPotentialSourceBase):
                 if isinstance(target_discr, LayerPotentialSourceBase):
                     target_discr = target_discr.density_discr
 
-                qbx_forced_limit = o.qbx_forced_limit
-                if qbx_forced_limit is None:
-                    qbx_forced_limit = 0
+                if qbx_side is None:
+                    qbx_side = 0
 
-                target_discrs_and_qbx_sides.append(
-                        (target_discr, qbx_forced_limit))
+                target_discrs_and_qbx_sides.append((target_discr, qbx_side))
 
         return target_name_and_side_to_number, tuple(target_discrs_and_qbx_sides)
 
-    def exec_compute_potential_insn_fmm(self, actx: PyOpenCLArrayContext,
-            insn, bound_expr, evaluate, fmm_driver):
+    def _evaluate_density(self, actx, insn, bound_expr, evaluate,
+            density=None):
+        """Evaluate the density of *insn* on its source discretization,
+        interpolating it if needed. Scalar densities are returned as is.
+
+        :arg density: the already evaluated (uninterpolated) density of
+            *insn*, if available.
+        """
+        if density is None:
+            density = evaluate(insn.density)
+
+        if (insn.density_from_dd is not None
+                and not isinstance(density, (int, float, complex, np.number))):
+            density = bound_expr.places.get_connection(
+                    insn.density_from_dd, insn.source)(density)
+
+        return density
+
+    def _get_source_strength_operator(self, actx, places, from_dd, to_dd,
+            geo_data):
+        cache = places._get_cache("source_strength_coo")
+        key = (from_dd, to_dd)
+
+        try:
+            coo = cache[key]
+        except KeyError:
+            from pytential.utils import flatten_to_numpy
+            from pytential.qbx.utils import _weighted_resampling_coo
+
+            waa = flatten_to_numpy(actx,
+                    self.weights_and_area_elements(actx, places, to_dd))
+            coo = cache[key] = _weighted_resampling_coo(actx,
+                    places.get_connection(from_dd, to_dd), waa)
+
+        @memoize_in(geo_data, (
+            QBXLayerPotentialSource, "source_strength_operator"))
+        def make_operator(from_dd, to_dd):
+            from pytential.qbx.utils import SourceStrengthOperator
+            return SourceStrengthOperator(actx, coo,
+                    actx.to_numpy(geo_data.tree().user_source_ids))
+
+        return make_operator(from_dd, to_dd)
+
+    def get_fmm_far_field_expansion_dtype(self, output_and_expansion_dtype):
+        """
+        :returns: the dtype of the multipole and local expansions of the FMM,
+            which is the single precision counterpart of
+            *output_and_expansion_dtype* if mixed precision was requested
+            (see *_use_mixed_precision_fmm* in :meth:`__init__`).
+        """
+        dtype = np.dtype(output_and_expansion_dtype)
+        if not self._use_mixed_precision_fmm:
+            return dtype
+
+        return _SINGLE_PRECISION_DTYPES.get(dtype, dtype)
+
+    def exec_compute_potential_insn_fmm(self, actx,
+            insn, bound_expr, evaluate, fmm_driver, fuse_strengths=False):
         """
         :arg fmm_driver: A function that accepts four arguments:
             *wrangler*, *strength*, *geo_data*, *kernel*, *kernel_arguments*
+        :arg fuse_strengths: if *True* and the density of *insn* needs to be
+            interpolated, the interpolation, the quadrature weights and the
+            permutation into tree order are applied as one sparse operator
+            (see :class:`~pytential.qbx.utils.SourceStrengthOperator`). The
+            strengths are then passed to *fmm_driver* in tree order, which is
+            signaled by the keyword argument *src_weights_in_tree_order*.
         :returns: a tuple ``(assignments, extra_outputs)``, where *assignments*
             is a list of tuples containing pairs ``(name, value)`` representing
             assignments to be performed in the evaluation context.
             *extra_outputs* is data that *fmm_driver* may return
             (such as timing data), passed through unmodified.
         """
+        from meshmode.dof_array import flatten
+        from pytential.allocation import get_allocator, allocation_stage
+        allocator = get_allocator(actx)
+
         target_name_and_side_to_number, target_discrs_and_qbx_sides = (
                 self.get_target_discrs_and_qbx_sides(insn, bound_expr))
 
-        geo_data = self.qbx_fmm_geometry_data(
-                bound_expr.places,
-                insn.source.geometry,
-                target_discrs_and_qbx_sides)
+        with allocation_stage(allocator, "qbx_geometry"):
+            geo_data = self.qbx_fmm_geometry_data(
+                    bound_expr.places,
+                    insn.source.geometry,
+                    target_discrs_and_qbx_sides)
 
         # FIXME Exert more positive control over geo_data attribute lifetimes using
         # geo_data.<method>.clear_cache(geo_data).
@@ -609,12 +812,29 @@ class QBXLayerPotentialSource(LayerPotentialSourceBase):
         # FIXME don't compute *all* output kernels on all targets--respect that
         # some target discretizations may only be asking for derivatives (e.g.)
 
-        from pytential import bind, sym
-        waa = bind(bound_expr.places, sym.weights_and_area_elements(
-            self.ambient_dim, dofdesc=insn.source))(actx)
-        density = evaluate(insn.density)
-        strengths = waa * density
-        flat_strengths = flatten(strengths)
+        # NOTE: the fused operator permutes with the user_source_ids of the
+        # tree, which only the sumpy wrangler consumes on the device
+        with allocation_stage(allocator, "qbx_strengths"):
+            density = evaluate(insn.density)
+
+            src_weights_in_tree_order = (
+                    fuse_strengths
+                    and insn.density_from_dd is not None
+                    and self.fmm_backend == "sumpy"
+                    and not isinstance(
+                        density, (int, float, complex, np.number)))
+
+            if src_weights_in_tree_order:
+                strength_op = self._get_source_strength_operator(
+                        actx, bound_expr.places, insn.density_from_dd,
+                        insn.source, geo_data)
+                flat_strengths = strength_op(actx, flatten(density))
+            else:
+                waa = self.weights_and_area_elements(
+                        actx, bound_expr.places, insn.source)
+                strengths = waa * self._evaluate_density(
+                        actx, insn, bound_expr, evaluate, density=density)
+                flat_strengths = flatten(strengths)
 
         out_kernels = tuple(knl for knl in insn.kernels)
         fmm_kernel = self.get_fmm_kernel(out_kernels)
@@ -625,6 +845,12 @@ class QBXLayerPotentialSource(LayerPotentialSourceBase):
                     actx, out_kernels, geo_data.tree().user_source_ids,
                     insn.kernel_arguments, evaluate))
 
+        wrangler_kwargs = {}
+        if self._use_mixed_precision_fmm:
+            wrangler_kwargs["far_field_dtype"] = (
+                    self.get_fmm_far_field_expansion_dtype(
+                        output_and_expansion_dtype))
+
         wrangler = self.expansion_wrangler_code_container(
                 fmm_kernel, out_kernels).get_wrangler(
                         actx.queue, geo_data, output_and_expansion_dtype,
@@ -632,12 +858,15 @@ class QBXLayerPotentialSource(LayerPotentialSourceBase):
                         self.fmm_level_to_order,
                         source_extra_kwargs=source_extra_kwargs,
                         kernel_extra_kwargs=kernel_extra_kwargs,
-                        _use_target_specific_qbx=self._use_target_specific_qbx)
+                        _use_target_specific_qbx=self._use_target_specific_qbx,
+                        allocator=allocator,
+                        **wrangler_kwargs)
 
         from pytential.qbx.geometry import target_state
-        if (actx.thaw(geo_data.user_target_to_center())
-                == target_state.FAILED).any().get():
-            raise RuntimeError("geometry has failed targets")
+        with allocation_stage(allocator, "qbx_geometry"):
+            if (actx.thaw(geo_data.user_target_to_center())
+                    == target_state.FAILED).any().get():
+                raise RuntimeError("geometry has failed targets")
 
         # {{{ geometry data inspection hook
 
@@ -648,27 +877,43 @@ class QBXLayerPotentialSource(LayerPotentialSourceBase):
 
         # }}}
 
+        fmm_driver_kwargs = {}
+        if src_weights_in_tree_order:
+            fmm_driver_kwargs["src_weights_in_tree_order"] = True
+
         # Execute global QBX.
-        all_potentials_on_every_target, extra_outputs = (
-                fmm_driver(
-                    wrangler, (flat_strengths,), geo_data,
-                    fmm_kernel, kernel_extra_kwargs))
+        with allocation_stage(allocator, "qbx_fmm"):
+            all_potentials_on_every_target, extra_outputs = (
+                    fmm_driver(
+                        wrangler, (flat_strengths,), geo_data,
+                        fmm_kernel, kernel_extra_kwargs, **fmm_driver_kwargs))
 
         results = []
 
-        for o in insn.outputs:
-            target_side_number = target_name_and_side_to_number[
-                    o.target_name, o.qbx_forced_limit]
-            target_discr, _ = target_discrs_and_qbx_sides[target_side_number]
-            target_slice = slice(*geo_data.target_info().target_discr_starts[
-                    target_side_number:target_side_number+2])
-
-            result = all_potentials_on_every_target[o.kernel_index][target_slice]
+        target_discr_starts = geo_data.target_info().target_discr_starts
 
-            from meshmode.discretization import Discretization
-            if isinstance(target_discr, Discretization):
-                from meshmode.dof_array import unflatten
-                result = unflatten(actx, target_discr, result)
+        for o in insn.outputs:
+            # NOTE: for "avg", both one-sided limits were computed in the same
+            # FMM, and are averaged in place of separate outputs
+            side_results = []
+            for qbx_side in _get_qbx_sides(o.qbx_forced_limit):
+                target_side_number = target_name_and_side_to_number[
+                        o.target_name, qbx_side]
+                target_discr, _ = target_discrs_and_qbx_sides[target_side_number]
+                target_slice = slice(*target_discr_starts[
+                        target_side_number:target_side_number+2])
+
+                side_results.append(
+                        all_potentials_on_every_target[o.kernel_index][
+                            target_slice])
+
+            with allocation_stage(allocator, "qbx_output"):
+                result = _average_sides(actx.queue, side_results)
+
+                from meshmode.discretization import Discretization
+                if isinstance(target_discr, Discretization):
+                    from meshmode.dof_array import unflatten
+                    result = unflatten(actx, target_discr, result)
 
             results.append((o.name, result))
 
@@ -730,7 +975,15 @@ class QBXLayerPotentialSource(LayerPotentialSourceBase):
 
     def exec_compute_potential_insn_direct(self, actx, insn, bound_expr, evaluate,
             return_timing_data):
-        from pytential import bind, sym
+        """Evaluate all outputs of *insn* directly, with one launch for all
+        on-surface targets and one set of launches (P2P, target association,
+        QBX on the associated subset) for all off-surface targets.
+        """
+        import pyopencl as cl
+        import pyopencl.array  # noqa: F401
+        from meshmode.dof_array import flatten, unflatten, thaw
+
+        from pytential import sym
         if return_timing_data:
             from pytential.source import UnableToCollectTimingData
             from warnings import warn
@@ -738,137 +991,211 @@ class QBXLayerPotentialSource(LayerPotentialSourceBase):
                     "Timing data collection not supported.",
                     category=UnableToCollectTimingData)
 
-        lpot_applier = self.get_lpot_applier(insn.kernels)
-        p2p = None
-        lpot_applier_on_tgt_subset = None
-
         from pytential.utils import flatten_if_needed
         kernel_args = {}
         for arg_name, arg_expr in insn.kernel_arguments.items():
             kernel_args[arg_name] = flatten_if_needed(actx, evaluate(arg_expr))
 
-        waa = bind(bound_expr.places, sym.weights_and_area_elements(
-            self.ambient_dim, dofdesc=insn.source))(actx)
-        strengths = waa * evaluate(insn.density)
-
-        from meshmode.discretization import Discretization
+        waa = self.weights_and_area_elements(actx, bound_expr.places, insn.source)
+        strengths = waa * self._evaluate_density(actx, insn, bound_expr, evaluate)
         flat_strengths = flatten(strengths)
 
         source_discr = bound_expr.places.get_discretization(
                 insn.source.geometry, insn.source.discr_stage)
+        flat_sources = flatten(thaw(actx, source_discr.nodes()))
+
+        # {{{ gather unique targets
+
+        # map (target_name, qbx_forced_limit) to index into the target lists
+        self_key_to_index = {}
+        self_targets = []
+        self_target_dds = []
+        nonself_key_to_index = {}
+        nonself_targets = []
 
-        # FIXME: Do this all at once
-        results = []
         for o in insn.outputs:
-            source_dd = insn.source.copy(discr_stage=o.target_name.discr_stage)
-            target_discr = bound_expr.places.get_discretization(
-                    o.target_name.geometry, o.target_name.discr_stage)
-            density_discr = bound_expr.places.get_discretization(
-                    source_dd.geometry, source_dd.discr_stage)
-
-            is_self = density_discr is target_discr
-            if is_self:
-                # QBXPreprocessor is supposed to have taken care of this
-                assert o.qbx_forced_limit is not None
-                assert abs(o.qbx_forced_limit) > 0
-
-                expansion_radii = bind(bound_expr.places, sym.expansion_radii(
-                    self.ambient_dim, dofdesc=o.target_name))(actx)
-                centers = bind(bound_expr.places, sym.expansion_centers(
-                    self.ambient_dim, o.qbx_forced_limit,
-                    dofdesc=o.target_name))(actx)
-
-                evt, output_for_each_kernel = lpot_applier(
-                        actx.queue,
-                        flatten(thaw(actx, target_discr.nodes())),
-                        flatten(thaw(actx, source_discr.nodes())),
-                        flatten(centers),
-                        [flat_strengths],
-                        expansion_radii=flatten(expansion_radii),
-                        **kernel_args)
-
-                result = output_for_each_kernel[o.kernel_index]
-                if isinstance(target_discr, Discretization):
-                    result = unflatten(actx, target_discr, result)
+            for qbx_side in _get_qbx_sides(o.qbx_forced_limit):
+                key = (o.target_name, qbx_side)
+                if key in self_key_to_index or key in nonself_key_to_index:
+                    continue
 
-                results.append((o.name, result))
+                target_discr = bound_expr.places.get_discretization(
+                        o.target_name.geometry, o.target_name.discr_stage)
+                density_discr = bound_expr.places.get_discretization(
+                        insn.source.geometry, o.target_name.discr_stage)
+
+                if density_discr is target_discr:
+                    # QBXPreprocessor is supposed to have taken care of this
+                    assert qbx_side is not None
+                    assert abs(qbx_side) > 0
+
+                    self_key_to_index[key] = len(self_targets)
+                    self_targets.append((target_discr, qbx_side))
+                    self_target_dds.append(o.target_name)
+                else:
+                    if qbx_side is None:
+                        qbx_side = 0
+
+                    nonself_key_to_index[key] = len(nonself_targets)
+                    nonself_targets.append((target_discr, qbx_side))
+
+        def concatenate(arys):
+            if len(arys) == 1:
+                return arys[0]
+
+            from pytools.obj_array import make_obj_array
+            return make_obj_array([
+                cl.array.concatenate([ary[idim] for ary in arys], queue=actx.queue)
+                for idim in range(self.ambient_dim)])
+
+        def target_starts(targets):
+            return np.cumsum([0] + [discr.ndofs for discr, _ in targets])
+
+        # }}}
+
+        # {{{ on-surface targets
+
+        self_output_for_each_kernel = None
+        if self_targets:
+            flat_targets = []
+            flat_centers = []
+            flat_radii = []
+            for (target_discr, qbx_forced_limit), target_dd in zip(
+                    self_targets, self_target_dds):
+                flat_targets.append(flatten(thaw(actx, target_discr.nodes())))
+                flat_centers.append(flatten(self.evaluate_geometry_expr(
+                    actx, bound_expr.places,
+                    sym.expansion_centers(
+                        self.ambient_dim, qbx_forced_limit, dofdesc=target_dd))))
+                flat_radii.append(flatten(self.evaluate_geometry_expr(
+                    actx, bound_expr.places,
+                    sym.expansion_radii(self.ambient_dim, dofdesc=target_dd))))
+
+            if len(flat_radii) == 1:
+                flat_radii, = flat_radii
             else:
-                # no on-disk kernel caching
-                if p2p is None:
-                    p2p = self.get_p2p(actx, insn.kernels)
-                if lpot_applier_on_tgt_subset is None:
-                    lpot_applier_on_tgt_subset = self.get_lpot_applier_on_tgt_subset(
-                            insn.kernels)
-
-                queue = actx.queue
-
-                flat_targets = flatten_if_needed(actx, target_discr.nodes())
-                flat_sources = flatten(thaw(actx, source_discr.nodes()))
-
-                evt, output_for_each_kernel = p2p(queue,
-                        flat_targets, flat_sources,
-                        [flat_strengths], **kernel_args)
-
-                qbx_forced_limit = o.qbx_forced_limit
-                if qbx_forced_limit is None:
-                    qbx_forced_limit = 0
-
-                target_discrs_and_qbx_sides = ((target_discr, qbx_forced_limit),)
-                geo_data = self.qbx_fmm_geometry_data(
-                        bound_expr.places,
-                        insn.source.geometry,
-                        target_discrs_and_qbx_sides=target_discrs_and_qbx_sides)
-
-                # center-related info is independent of targets
-
-                # First ncenters targets are the centers
-                tgt_to_qbx_center = (
-                        geo_data.user_target_to_center()[geo_data.ncenters:]
-                        .copy(queue=queue)
-                        .with_queue(queue))
-
-                qbx_tgt_numberer = self.get_qbx_target_numberer(
-                        tgt_to_qbx_center.dtype)
-                qbx_tgt_count = cl.array.empty(queue, (), np.int32)
-                qbx_tgt_numbers = cl.array.empty_like(tgt_to_qbx_center)
-
-                qbx_tgt_numberer(
-                        tgt_to_qbx_center, qbx_tgt_numbers, qbx_tgt_count,
-                        queue=queue)
-
-                qbx_tgt_count = int(qbx_tgt_count.get())
-
-                if (o.qbx_forced_limit is not None
-                        and abs(o.qbx_forced_limit) == 1
-                        and qbx_tgt_count < target_discr.ndofs):
+                flat_radii = cl.array.concatenate(flat_radii, queue=actx.queue)
+
+            lpot_applier = self.get_lpot_applier(insn.kernels)
+            evt, self_output_for_each_kernel = lpot_applier(
+                    actx.queue,
+                    concatenate(flat_targets),
+                    flat_sources,
+                    concatenate(flat_centers),
+                    [flat_strengths],
+                    expansion_radii=flat_radii,
+                    **kernel_args)
+
+        # }}}
+
+        # {{{ off-surface targets
+
+        nonself_output_for_each_kernel = None
+        if nonself_targets:
+            queue = actx.queue
+
+            flat_targets = concatenate([
+                flatten_if_needed(actx, target_discr.nodes())
+                for target_discr, _ in nonself_targets])
+
+            # no on-disk kernel caching
+            p2p = self.get_p2p(actx, insn.kernels)
+            evt, nonself_output_for_each_kernel = p2p(queue,
+                    flat_targets, flat_sources,
+                    [flat_strengths], **kernel_args)
+
+            geo_data = self.qbx_fmm_geometry_data(
+                    bound_expr.places,
+                    insn.source.geometry,
+                    target_discrs_and_qbx_sides=tuple(nonself_targets))
+
+            # center-related info is independent of targets
+
+            # First ncenters targets are the centers
+            tgt_to_qbx_center = (
+                    geo_data.user_target_to_center()[geo_data.ncenters:]
+                    .copy(queue=queue)
+                    .with_queue(queue))
+
+            qbx_tgt_numberer = self.get_qbx_target_numberer(
+                    tgt_to_qbx_center.dtype)
+            qbx_tgt_count = cl.array.empty(queue, (), np.int32)
+            qbx_tgt_numbers = cl.array.empty_like(tgt_to_qbx_center)
+
+            qbx_tgt_numberer(
+                    tgt_to_qbx_center, qbx_tgt_numbers, qbx_tgt_count,
+                    queue=queue)
+
+            qbx_tgt_count = int(qbx_tgt_count.get())
+
+            # targets with a forced one-sided limit must all have a center
+            starts = target_starts(nonself_targets)
+            for (target_discr, qbx_forced_limit), start, end in zip(
+                    nonself_targets, starts[:-1], starts[1:]):
+                if abs(qbx_forced_limit) != 1:
+                    continue
+
+                if (tgt_to_qbx_center[start:end] < 0).any().get():
                     raise RuntimeError("Did not find a matching QBX center "
                             "for some targets")
 
-                qbx_tgt_numbers = qbx_tgt_numbers[:qbx_tgt_count]
-                qbx_center_numbers = tgt_to_qbx_center[qbx_tgt_numbers]
-                qbx_center_numbers.finish()
-
-                tgt_subset_kwargs = kernel_args.copy()
-                for i, res_i in enumerate(output_for_each_kernel):
-                    tgt_subset_kwargs[f"result_{i}"] = res_i
-
-                if qbx_tgt_count:
-                    lpot_applier_on_tgt_subset(
-                            queue,
-                            targets=flat_targets,
-                            sources=flat_sources,
-                            centers=geo_data.flat_centers(),
-                            expansion_radii=geo_data.flat_expansion_radii(),
-                            strengths=[flat_strengths],
-                            qbx_tgt_numbers=qbx_tgt_numbers,
-                            qbx_center_numbers=qbx_center_numbers,
-                            **tgt_subset_kwargs)
-
-                result = output_for_each_kernel[o.kernel_index]
-                if isinstance(target_discr, Discretization):
-                    result = unflatten(actx, target_discr, result)
+            qbx_tgt_numbers = qbx_tgt_numbers[:qbx_tgt_count]
+            qbx_center_numbers = tgt_to_qbx_center[qbx_tgt_numbers]
+            qbx_center_numbers.finish()
+
+            tgt_subset_kwargs = kernel_args.copy()
+            for i, res_i in enumerate(nonself_output_for_each_kernel):
+                tgt_subset_kwargs[f"result_{i}"] = res_i
+
+            if qbx_tgt_count:
+                lpot_applier_on_tgt_subset = self.get_lpot_applier_on_tgt_subset(
+                        insn.kernels)
+                lpot_applier_on_tgt_subset(
+                        queue,
+                        targets=flat_targets,
+                        sources=flat_sources,
+                        centers=geo_data.flat_centers(),
+                        expansion_radii=geo_data.flat_expansion_radii(),
+                        strengths=[flat_strengths],
+                        qbx_tgt_numbers=qbx_tgt_numbers,
+                        qbx_center_numbers=qbx_center_numbers,
+                        **tgt_subset_kwargs)
+
+        # }}}
+
+        # {{{ split results
+
+        from meshmode.discretization import Discretization
 
-                results.append((o.name, result))
+        self_starts = target_starts(self_targets)
+        nonself_starts = target_starts(nonself_targets)
+
+        results = []
+        for o in insn.outputs:
+            side_results = []
+            for qbx_side in _get_qbx_sides(o.qbx_forced_limit):
+                key = (o.target_name, qbx_side)
+                if key in self_key_to_index:
+                    index = self_key_to_index[key]
+                    target_discr, _ = self_targets[index]
+                    output_for_each_kernel = self_output_for_each_kernel
+                    start, end = self_starts[index:index+2]
+                else:
+                    index = nonself_key_to_index[key]
+                    target_discr, _ = nonself_targets[index]
+                    output_for_each_kernel = nonself_output_for_each_kernel
+                    start, end = nonself_starts[index:index+2]
+
+                side_results.append(
+                        output_for_each_kernel[o.kernel_index][start:end])
+
+            result = _average_sides(actx.queue, side_results)
+            if isinstance(target_discr, Discretization):
+                result = unflatten(actx, target_discr, result)
+
+            results.append((o.name, result))
+
+        # }}}
 
         timing_data = {}
         return results, timing_data
@@ -880,6 +1207,17 @@ class QBXLayerPotentialSource(LayerPotentialSourceBase):
 # }}}
 
 
+def __getattr__(name):
+    # NOTE: imported on first use, since target association pulls in
+    # pyopencl and boxtree
+    if name == "QBXTargetAssociationFailedException":
+        from pytential.qbx.target_assoc import \
+                QBXTargetAssociationFailedException
+        return QBXTargetAssociationFailedException
+
+    raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
+
+
 __all__ = (
         "QBXLayerPotentialSource",
         "QBXTargetAssociationFailedException",
@@ -0,0 +1,305 @@
+__copyright__ = "Copyright (C) 2020 Andreas Kloeckner"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import numpy as np
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+__doc__ = """
+.. note::
+
+   This module is experimental. Its interface is subject to change until this
+   notice is removed.
+
+Chooses the FMM and tree parameters of a
+:class:`~pytential.qbx.QBXLayerPotentialSource` by minimizing the cost
+predicted by :mod:`pytential.qbx.cost`, optionally followed by a few timed
+evaluations of the most promising candidates.
+
+The tuned parameters are
+
+* ``fmm_order``,
+* ``_max_leaf_refine_weight``,
+* ``_from_sep_smaller_min_nsources_cumul``,
+* ``_use_target_specific_qbx``.
+
+.. autofunction:: autotune_qbx_source
+.. autofunction:: fmm_order_for_tolerance
+"""
+
+
+# {{{ helpers
+
+def fmm_order_for_tolerance(tolerance, convergence_factor=0.5):
+    """
+    :arg tolerance: the desired relative accuracy of the FMM.
+    :arg convergence_factor: the ratio by which the truncation error of the
+        multipole and local expansions decreases with each additional order.
+        The default value is appropriate for the 2-away separation criterion
+        used by :class:`~pytential.qbx.QBXLayerPotentialSource`.
+    :returns: the smallest FMM order for which the truncation error estimate
+        :math:`c^{p + 1}` is below *tolerance*.
+    """
+    if not 0 < tolerance < 1:
+        raise ValueError(f"'tolerance' must be in (0, 1): got {tolerance}")
+
+    return max(1, int(np.ceil(np.log(tolerance) / np.log(convergence_factor))) - 1)
+
+
+def _geometry_hash(actx, lpot_source):
+    from hashlib import sha1
+    from pytential.utils import flatten_to_numpy
+
+    h = sha1()
+    h.update(repr((
+        type(lpot_source).__name__,
+        lpot_source.ambient_dim,
+        lpot_source.qbx_order,
+        lpot_source.fine_order,
+        lpot_source.fmm_backend,
+        )).encode("utf-8"))
+
+    for ary in flatten_to_numpy(actx, lpot_source.density_discr.nodes()):
+        h.update(np.ascontiguousarray(ary).tobytes())
+
+    return h.hexdigest()
+
+
+def _total_modeled_cost(modeled_cost):
+    return sum(
+            float(stage_cost)
+            for insn_cost in modeled_cost.values()
+            for stage_cost in insn_cost.values())
+
+# }}}
+
+
+# {{{ autotuner
+
+_AUTOTUNE_CACHE = {}
+
+
+def autotune_qbx_source(actx, places, expr, context=None, *,
+        geometry=None,
+        fmm_tolerance=None,
+        fmm_orders=None,
+        max_leaf_refine_weights=None,
+        from_sep_smaller_min_nsources_cumuls=None,
+        use_target_specific_qbx=None,
+        calibration_params="constant_one",
+        ntiming_probes=0,
+        cache=None):
+    """Find the parameters of the layer potential source *geometry* in
+    *places* that minimize the cost of evaluating *expr*.
+
+    Every combination of the candidate parameters is evaluated with the cost
+    model of the layer potential source. If *ntiming_probes* is positive, the
+    candidates with the lowest modeled cost are then evaluated for real and the
+    fastest one is picked.
+
+    :arg expr: a symbolic expression, as passed to :func:`pytential.bind`.
+    :arg context: a :class:`dict` of arguments to *expr*, used for evaluating
+        the cost model and for the timing probes.
+    :arg geometry: the name of a :class:`~pytential.qbx.QBXLayerPotentialSource`
+        in *places*. Defaults to :attr:`~pytential.GeometryCollection.auto_source`.
+    :arg fmm_tolerance: the requested relative accuracy of the FMM. FMM orders
+        below :func:`fmm_order_for_tolerance` are not considered.
+    :arg fmm_orders: candidate FMM orders. Defaults to the smallest order
+        satisfying *fmm_tolerance* or, if no tolerance is given, the current
+        order of the source. The latter is only known if the source was
+        constructed with a fixed *fmm_order*, so *fmm_orders* must be given
+        for sources with a general *fmm_level_to_order*.
+    :arg max_leaf_refine_weights: candidate values for
+        ``_max_leaf_refine_weight``. Defaults to powers of two around the
+        current value.
+    :arg from_sep_smaller_min_nsources_cumuls: candidate values for
+        ``_from_sep_smaller_min_nsources_cumul``. Defaults to the current
+        value, half of it and twice it.
+    :arg use_target_specific_qbx: candidate values for
+        ``_use_target_specific_qbx``. Defaults to trying target-specific QBX
+        only with the ``"fmmlib"`` backend.
+    :arg calibration_params: passed on to
+        :meth:`~pytential.symbolic.execution.BoundExpression.cost_per_stage`.
+    :arg ntiming_probes: the number of candidates with the lowest modeled
+        cost that are timed.
+    :arg cache: a mapping used to store the tuned parameters, keyed by a hash
+        of the geometry and the search space. Defaults to an in-memory cache
+        shared by all calls in the process. Any
+        :class:`~collections.abc.MutableMapping` with string keys, e.g. a
+        :class:`pytools.persistent_dict.PersistentDict`, can be used to keep
+        results across runs.
+
+    :returns: a copy of the layer potential source with the tuned parameters.
+    """
+    from pytential import bind, GeometryCollection
+    from pytential.qbx import QBXLayerPotentialSource
+
+    if not isinstance(places, GeometryCollection):
+        places = GeometryCollection(places)
+
+    if context is None:
+        context = {}
+
+    if cache is None:
+        cache = _AUTOTUNE_CACHE
+
+    if geometry is None:
+        geometry = places.auto_source.geometry
+
+    lpot_source = places.get_geometry(geometry)
+    if not isinstance(lpot_source, QBXLayerPotentialSource):
+        raise TypeError(f"'{geometry}' is not a QBXLayerPotentialSource")
+
+    # {{{ search space
+
+    min_fmm_order = 1
+    if fmm_tolerance is not None:
+        min_fmm_order = fmm_order_for_tolerance(fmm_tolerance)
+
+    if fmm_orders is None:
+        if fmm_tolerance is not None:
+            fmm_orders = [min_fmm_order]
+        elif lpot_source.fmm_level_to_order is False:
+            raise ValueError("cannot infer FMM orders for a source using "
+                    "direct evaluation: pass 'fmm_orders' or 'fmm_tolerance'")
+        else:
+            fmm_order = getattr(lpot_source.fmm_level_to_order, "fmm_order", None)
+            if fmm_order is None:
+                raise ValueError("cannot infer FMM orders for a source with a "
+                        "level- or tree-dependent 'fmm_level_to_order': "
+                        "pass 'fmm_orders' or 'fmm_tolerance'")
+
+            fmm_orders = [fmm_order]
+
+    fmm_orders = sorted({
+        order for order in fmm_orders if order >= min_fmm_order})
+    if not fmm_orders:
+        raise ValueError(
+                f"no candidate FMM order satisfies the tolerance {fmm_tolerance} "
+                f"(requires fmm_order >= {min_fmm_order})")
+
+    if max_leaf_refine_weights is None:
+        weight = lpot_source._max_leaf_refine_weight
+        max_leaf_refine_weights = [weight // 4, weight // 2, weight, 2 * weight]
+
+    if from_sep_smaller_min_nsources_cumuls is None:
+        nsources = lpot_source._from_sep_smaller_min_nsources_cumul
+        from_sep_smaller_min_nsources_cumuls = [
+                nsources // 2, nsources, 2 * nsources]
+
+    if use_target_specific_qbx is None:
+        if lpot_source.fmm_backend == "fmmlib":
+            use_target_specific_qbx = [False, True]
+        else:
+            use_target_specific_qbx = [False]
+
+    from itertools import product
+    candidates = [
+            dict(fmm_order=fmm_order,
+                _max_leaf_refine_weight=weight,
+                _from_sep_smaller_min_nsources_cumul=nsources,
+                _use_target_specific_qbx=use_tsqbx)
+            for fmm_order, weight, nsources, use_tsqbx in product(
+                fmm_orders,
+                sorted({w for w in max_leaf_refine_weights if w > 0}),
+                sorted({n for n in from_sep_smaller_min_nsources_cumuls if n > 0}),
+                sorted(set(use_target_specific_qbx)))
+            ]
+
+    # }}}
+
+    from hashlib import sha1
+    cache_key = "{}-{}".format(
+            _geometry_hash(actx, lpot_source),
+            sha1(repr((
+                str(expr), candidates, ntiming_probes,
+                calibration_params if isinstance(calibration_params, str)
+                else sorted(getattr(calibration_params, "items", list)())
+                )).encode("utf-8")).hexdigest())
+
+    try:
+        best_kwargs = cache[cache_key]
+    except KeyError:
+        pass
+    else:
+        logger.info("autotune: using cached parameters %s", best_kwargs)
+        return lpot_source.copy(**best_kwargs)
+
+    # {{{ rank candidates by modeled cost
+
+    def make_places(kwargs):
+        # refinement does not depend on any of the tuned parameters, so the
+        # refined discretizations can be shared among all candidates
+        from pytential.symbolic.execution import _copy_refinement_caches
+        cand_places = places.merge({geometry: lpot_source.copy(**kwargs)})
+        _copy_refinement_caches(places, cand_places)
+        return cand_places
+
+    modeled_costs = []
+    for kwargs in candidates:
+        bound_op = bind(make_places(kwargs), expr)
+        modeled_cost, _ = bound_op.cost_per_stage(calibration_params, **context)
+        modeled_costs.append(_total_modeled_cost(modeled_cost))
+
+        logger.debug("autotune: %s: modeled cost %.5e", kwargs, modeled_costs[-1])
+
+    order = np.argsort(modeled_costs, kind="stable")
+    best_kwargs = candidates[order[0]]
+
+    # }}}
+
+    # {{{ timing probes
+
+    if ntiming_probes > 0:
+        from time import perf_counter
+
+        best_time = np.inf
+        for icand in order[:ntiming_probes]:
+            kwargs = candidates[icand]
+            bound_op = bind(make_places(kwargs), expr)
+
+            # first evaluation includes geometry setup and code generation
+            bound_op.eval(context, array_context=actx)
+            actx.queue.finish()
+
+            t_start = perf_counter()
+            bound_op.eval(context, array_context=actx)
+            actx.queue.finish()
+            elapsed = perf_counter() - t_start
+
+            logger.debug("autotune: %s: measured %.5e s", kwargs, elapsed)
+            if elapsed < best_time:
+                best_time = elapsed
+                best_kwargs = kwargs
+
+    # }}}
+
+    logger.info("autotune: chose %s", best_kwargs)
+    cache[cache_key] = best_kwargs
+
+    return lpot_source.copy(**best_kwargs)
+
+# }}}
+
+# vim: foldmethod=marker
@@ -89,6 +89,19 @@ Calibration (Generate Calibration Parameters)
 
 .. automethod:: AbstractQBXCostModel.estimate_kernel_specific_calibration_params
 
+Online Calibration
+^^^^^^^^^^^^^^^^^^
+
+Instead of collecting model costs and timing data by hand, a
+:class:`CalibrationStore` can be passed to
+:meth:`pytential.symbolic.execution.BoundExpression.eval`, which then records
+both for every layer potential evaluation and refits the calibration parameters
+incrementally.
+
+.. autoclass:: CalibrationStore
+
+.. autofunction:: get_machine_fingerprint
+
 Evaluating
 ^^^^^^^^^^
 
@@ -100,6 +113,14 @@ To get the cost from `BoundExpression`, refer to
 :meth:`pytential.symbolic.execution.BoundExpression.cost_per_stage` and
 :meth:`pytential.symbolic.execution.BoundExpression.cost_per_box`.
 
+Memory Model
+^^^^^^^^^^^^
+
+.. automethod:: AbstractQBXCostModel.qbx_memory_per_stage
+
+To get the memory footprint from `BoundExpression`, refer to
+:meth:`pytential.symbolic.execution.BoundExpression.memory_per_stage`.
+
 Utilities
 ^^^^^^^^^
 
@@ -185,6 +206,47 @@ def make_taylor_translation_cost_model(dim, nlevels):
 # }}}
 
 
+# {{{ memory helpers
+
+def _nbytes(obj):
+    """Return the number of bytes held by the arrays in *obj*, which may be an
+    array, a :class:`pytools.Record` of arrays (e.g. a tree or a traversal) or
+    a sequence of those.
+    """
+    if obj is None:
+        return 0
+
+    if isinstance(obj, np.ndarray) and obj.dtype.char == "O":
+        return sum(_nbytes(item) for item in obj.flat)
+
+    if hasattr(obj, "nbytes") and hasattr(obj, "dtype"):
+        return int(obj.nbytes)
+
+    if isinstance(obj, (list, tuple)):
+        return sum(_nbytes(item) for item in obj)
+
+    fields = getattr(type(obj), "fields", None)
+    if fields is not None:
+        return sum(_nbytes(getattr(obj, name, None)) for name in fields)
+
+    return 0
+
+
+def _fmmlib_expansion_ncoeffs(dim, is_helmholtz, order):
+    """Return the number of (complex) coefficients of an expansion of order
+    *order*, following
+    :meth:`boxtree.pyfmmlib_integration.FMMLibExpansionWrangler.expansion_shape`.
+    """
+    if dim == 2:
+        return 2*order + 1 if is_helmholtz else order + 1
+    elif dim == 3:
+        return (2*order + 1) * (order + 1)
+    else:
+        raise ValueError(f"unsupported dimension: {dim}")
+
+# }}}
+
+
 # {{{ abstract cost model
 
 class AbstractQBXCostModel(BaseAbstractFMMCostModel):
@@ -495,6 +557,134 @@ class AbstractQBXCostModel(BaseAbstractFMMCostModel):
 
         return result, metadata
 
+    # {{{ memory model
+
+    # Stages of :func:`pytential.qbx.fmm.drive_fmm` in execution order, with
+    # the arrays allocated by each of them.
+    _QBX_MEMORY_STAGES = (
+        ("form_multipoles", ("strengths", "multipole_expansions")),
+        ("coarsen_multipoles", ()),
+        ("eval_direct", ("potentials",)),
+        ("multipole_to_local", ("local_expansions",)),
+        ("eval_multipoles", ()),
+        ("form_locals", ()),
+        ("refine_locals", ()),
+        ("eval_locals", ()),
+        ("form_global_qbx_locals", ("qbx_expansions",)),
+        ("translate_box_multipoles_to_qbx_local", ()),
+        ("translate_box_local_to_qbx_local", ()),
+        ("eval_qbx_expansions", ("qbx_potentials",)),
+        )
+
+    def qbx_memory_per_stage(self, queue, geo_data, kernel, kernel_arguments,
+                             dtype, noutputs=1, far_field_dtype=None):
+        """Predict the memory in use (in bytes) at the end of each stage of the
+        QBX FMM.
+
+        The geometry data (tree, traversal lists, target association) is
+        counted from the arrays in *geo_data*. Expansion storage is modeled
+        from the number of boxes on each level and the number of coefficients
+        given by :attr:`translation_cost_model_factory` for the orders in
+        ``lpot_source.fmm_level_to_order``, so it is consistent with the
+        time cost model. For the *"fmmlib"* backend, the coefficient counts
+        of :mod:`pyfmmlib` are used instead.
+
+        :arg geo_data: a :class:`pytential.qbx.geometry.QBXFMMGeometryData`
+            object.
+        :arg dtype: the expansion and output dtype of the FMM.
+        :arg noutputs: the number of output kernels.
+        :arg far_field_dtype: the dtype of the multipole and local expansions,
+            if different from *dtype* (see *_use_mixed_precision_fmm* in
+            :class:`~pytential.qbx.QBXLayerPotentialSource`).
+        :return: a tuple ``(result, metadata)``, where *result* is a
+            :class:`dict` mapping stage names to the total memory in use at the
+            end of that stage, and *metadata* is a :class:`dict` containing
+            ``"peak_bytes"``, a breakdown of the memory by array kind in
+            ``"nbytes"``, and the memory space (``"device"`` or ``"host"``)
+            in which expansions are stored in ``"expansion_memory_space"``.
+        """
+        lpot_source = geo_data.lpot_source
+        tree = geo_data.tree()
+
+        fmm_level_to_order = [
+            lpot_source.fmm_level_to_order(
+                kernel.get_base_kernel(), kernel_arguments, tree, ilevel
+            ) for ilevel in range(tree.nlevels)
+        ]
+
+        params = {"p_qbx": lpot_source.qbx_order}
+        for ilevel in range(tree.nlevels):
+            params[f"p_fmm_lev{ilevel}"] = fmm_level_to_order[ilevel]
+
+        xlat_cost = self.translation_cost_model_factory(
+            tree.dimensions, tree.nlevels
+        )
+
+        if lpot_source.fmm_backend == "fmmlib":
+            from sumpy.kernel import HelmholtzKernel
+            is_helmholtz = isinstance(kernel.get_base_kernel(), HelmholtzKernel)
+
+            ncoeffs_fmm_by_level = np.array([
+                _fmmlib_expansion_ncoeffs(tree.dimensions, is_helmholtz, order)
+                for order in fmm_level_to_order
+            ])
+            ncoeffs_qbx = _fmmlib_expansion_ncoeffs(
+                    tree.dimensions, is_helmholtz, lpot_source.qbx_order)
+        else:
+            ncoeffs_fmm_by_level = np.array([
+                evaluate(xlat_cost.ncoeffs_fmm_by_level[ilevel], context=params)
+                for ilevel in range(tree.nlevels)
+            ])
+            ncoeffs_qbx = evaluate(xlat_cost.ncoeffs_qbx, context=params)
+
+        if far_field_dtype is None:
+            far_field_dtype = dtype
+
+        itemsize = np.dtype(dtype).itemsize
+        nboxes_by_level = np.diff(np.asarray(tree.level_start_box_nrs))
+        expansion_nbytes = int(
+            np.sum(nboxes_by_level * ncoeffs_fmm_by_level)
+            * np.dtype(far_field_dtype).itemsize)
+
+        qbx_expansion_nbytes = int(geo_data.ncenters * ncoeffs_qbx * itemsize)
+
+        nbytes = {
+            "geometry": sum(
+                _nbytes(getattr(geo_data, name)())
+                for name in [
+                    "tree", "traversal", "global_qbx_centers",
+                    "qbx_center_to_target_box", "center_to_tree_targets",
+                    "non_qbx_box_target_lists"]),
+            "strengths": tree.nsources * itemsize,
+            "multipole_expansions": expansion_nbytes,
+            "local_expansions": expansion_nbytes,
+            "qbx_expansions": qbx_expansion_nbytes,
+            "potentials": noutputs * tree.ntargets * itemsize,
+            "qbx_potentials": noutputs * tree.ntargets * itemsize,
+        }
+
+        stages = self._QBX_MEMORY_STAGES
+        if lpot_source._use_target_specific_qbx:
+            stages = stages + (("eval_target_specific_qbx_locals", ()),)
+
+        result = {}
+        in_use = nbytes["geometry"]
+        for stage, allocated in stages:
+            in_use += sum(nbytes[name] for name in allocated)
+            result[stage] = in_use
+
+        metadata = self.gather_metadata(geo_data, fmm_level_to_order)
+        metadata.update({
+            "peak_bytes": max(result.values()),
+            "nbytes": nbytes,
+            "expansion_memory_space": (
+                "host" if lpot_source.fmm_backend == "fmmlib" else "device"),
+            })
+
+        return result, metadata
+
+    # }}}
+
     @staticmethod
     def get_unit_calibration_params():
         calibration_params = BaseAbstractFMMCostModel.get_unit_calibration_params()
@@ -959,4 +1149,202 @@ class _PythonQBXCostModel(AbstractQBXCostModel, _PythonFMMCostModel):
 
 # }}}
 
+
+# {{{ online calibration store
+
+def get_machine_fingerprint(device=None):
+    """
+    :arg device: an optional :class:`pyopencl.Device`. If given, its name and
+        platform are included in the fingerprint.
+    :return: a :class:`str` identifying the machine (and device) on which
+        timing data was collected.
+    """
+    import platform
+    fields = [platform.node(), platform.machine(), platform.processor()]
+    if device is not None:
+        fields.extend([device.platform.name, device.name])
+
+    from hashlib import sha1
+    return sha1("|".join(fields).encode("utf-8")).hexdigest()[:16]
+
+
+def _kernels_to_key(knls):
+    return "; ".join(sorted(str(knl) for knl in knls))
+
+
+class CalibrationStore:
+    r"""A persistent store of calibration samples, refit incrementally as new
+    timing data arrives.
+
+    The calibration parameters of :class:`AbstractQBXCostModel` are fit
+    independently per stage by least squares, so that the store only needs to
+    keep the sufficient statistics :math:`\sum m^2` and :math:`\sum m t` of
+    modeled costs :math:`m` (with unit calibration parameters) and measured
+    times :math:`t` for each parameter. Adding a sample and refitting are both
+    constant time, and the fit agrees with
+    :meth:`AbstractQBXCostModel.estimate_kernel_specific_calibration_params`
+    applied to all samples seen so far.
+
+    Samples are keyed by a machine fingerprint (see
+    :func:`get_machine_fingerprint`) and by the set of kernels of the
+    instruction, and stored as JSON in :attr:`filename`.
+
+    .. attribute:: filename
+    .. attribute:: fingerprint
+
+    .. automethod:: add_sample
+    .. automethod:: get_calibration_params
+    .. automethod:: __getitem__
+    .. automethod:: nsamples
+    .. automethod:: save
+    """
+
+    _STORE_VERSION = 1
+
+    def __init__(self, filename, fingerprint=None,
+            time_field_name="wall_elapsed", decay=1.0, autosave=True):
+        """
+        :arg filename: path to the JSON file backing the store. It is read if
+            it exists and created on the first :meth:`save` otherwise.
+        :arg fingerprint: a :class:`str` identifying the machine. Defaults to
+            :func:`get_machine_fingerprint` without a device.
+        :arg time_field_name: the field of the timing data used as the measured
+            time, usually ``"wall_elapsed"`` or ``"process_elapsed"``.
+        :arg decay: a factor in :math:`(0, 1]` by which older samples are
+            down-weighted each time a new sample is added, so that the fit can
+            follow slow drifts in machine behavior.
+        :arg autosave: if *True*, the store is written back to disk after
+            every :meth:`add_sample`.
+        """
+        if not 0 < decay <= 1:
+            raise ValueError(f"'decay' must be in (0, 1]: got {decay}")
+
+        if fingerprint is None:
+            fingerprint = get_machine_fingerprint()
+
+        self.filename = filename
+        self.fingerprint = fingerprint
+        self.time_field_name = time_field_name
+        self.decay = decay
+        self.autosave = autosave
+
+        self._entries = self._load()
+
+    def _load(self):
+        import os
+        if not os.path.exists(self.filename):
+            return {}
+
+        import json
+        with open(self.filename) as inf:
+            data = json.load(inf)
+
+        if data.get("version") != self._STORE_VERSION:
+            logger.warning("ignoring calibration store '%s' with version %s",
+                    self.filename, data.get("version"))
+            return {}
+
+        return data["machines"]
+
+    def save(self):
+        """Write the store to :attr:`filename`. The file is replaced atomically,
+        so concurrent readers never observe a partially written store.
+        """
+        import os
+        import json
+        from tempfile import NamedTemporaryFile
+
+        dirname = os.path.dirname(os.path.abspath(self.filename))
+        with NamedTemporaryFile("w", dir=dirname, delete=False,
+                suffix=".tmp") as outf:
+            json.dump({
+                "version": self._STORE_VERSION,
+                "machines": self._entries,
+                }, outf, indent=1, sort_keys=True)
+
+        os.replace(outf.name, self.filename)
+
+    @property
+    def _stage_to_param_names(self):
+        stage_to_param_names = \
+                BaseAbstractFMMCostModel._FMM_STAGE_TO_CALIBRATION_PARAMETER.copy()
+        stage_to_param_names.update(
+                AbstractQBXCostModel._QBX_STAGE_TO_CALIBRATION_PARAMETER)
+
+        return stage_to_param_names
+
+    def add_sample(self, knls, model_result, timing_result):
+        """
+        :arg knls: the kernels of the instruction the sample belongs to.
+        :arg model_result: a :class:`dict` mapping stage names to modeled costs,
+            computed with :meth:`AbstractQBXCostModel.get_unit_calibration_params`.
+        :arg timing_result: a :class:`dict` mapping stage names to timing data,
+            as returned by
+            :meth:`~pytential.qbx.QBXLayerPotentialSource.exec_compute_potential_insn`.
+            Stages for which the timing field is *None* are skipped.
+        """
+        machine = self._entries.setdefault(self.fingerprint, {})
+        entry = machine.setdefault(_kernels_to_key(knls), {
+            "nsamples": 0,
+            "params": {},
+            })
+
+        for stage_name, param_name in self._stage_to_param_names.items():
+            model = float(model_result.get(stage_name, 0.0))
+            if stage_name in timing_result:
+                actual = timing_result[stage_name][self.time_field_name]
+                if actual is None:
+                    # NOTE: e.g. the wall time is not available if timing was
+                    # collected without profiling, so there is no sample
+                    continue
+
+                actual = float(actual)
+            else:
+                actual = 0.0
+
+            mm, ma = entry["params"].get(param_name, (0.0, 0.0))
+            entry["params"][param_name] = (
+                    self.decay * mm + model * model,
+                    self.decay * ma + model * actual)
+
+        entry["nsamples"] += 1
+
+        if self.autosave:
+            self.save()
+
+    def get_calibration_params(self, knls):
+        """
+        :returns: a :class:`dict` of calibration parameters for *knls* fit from
+            all samples seen on this machine, suitable for
+            :meth:`AbstractQBXCostModel.qbx_cost_per_stage`.
+        :raises KeyError: if no samples for *knls* are available.
+        """
+        entry = self._entries.get(self.fingerprint, {})[_kernels_to_key(knls)]
+
+        result = {
+                param_name: 0.0
+                for param_name in AbstractQBXCostModel.get_unit_calibration_params()
+                }
+        for param_name, (mm, ma) in entry["params"].items():
+            result[param_name] = 0.0 if np.isclose(mm, 0) else ma / mm
+
+        return result
+
+    def __getitem__(self, knls):
+        """Alias of :meth:`get_calibration_params`, so that the store can be
+        passed directly as *calibration_params* to
+        :meth:`~pytential.symbolic.execution.BoundExpression.cost_per_stage`.
+        """
+        return self.get_calibration_params(knls)
+
+    def __contains__(self, knls):
+        return _kernels_to_key(knls) in self._entries.get(self.fingerprint, {})
+
+    def nsamples(self, knls):
+        """:returns: the number of samples recorded for *knls* on this machine."""
+        machine = self._entries.get(self.fingerprint, {})
+        return machine.get(_kernels_to_key(knls), {}).get("nsamples", 0)
+
+# }}}
+
 # vim: foldmethod=marker
@@ -0,0 +1,318 @@
+__copyright__ = "Copyright (C) 2020 Andreas Kloeckner"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+from itertools import product
+
+import numpy as np
+import pyopencl as cl
+import pyopencl.array  # noqa
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+__doc__ = """
+.. note::
+
+   This module is experimental. Its interface is subject to change until this
+   notice is removed.
+
+Keeps the QBX local expansions formed during an FMM evaluation, so that the
+layer potential can be evaluated again at new targets close to the surface
+without repeating the FMM. Expansion fields are obtained from
+:meth:`pytential.symbolic.execution.BoundExpression.qbx_expansion_fields`.
+
+.. autoclass:: QBXExpansionField
+"""
+
+
+# {{{ center lookup
+
+class _CenterGrid:
+    """A uniform grid of cells of the size of the largest expansion disk, so
+    that every disk containing a point overlaps the cell of the point or one
+    of its neighbors.
+
+    Only the occupied cells are stored, as a sorted array of their (linear)
+    cell keys, which are looked up with :func:`numpy.searchsorted`. The
+    memory use is therefore linear in the number of centers, independent of
+    the extent of the grid.
+    """
+
+    def __init__(self, centers, radii):
+        self.centers = centers
+        self.radii = radii
+
+        if not len(radii):
+            return
+
+        self.h = np.max(radii)
+        self.origin = np.min(centers, axis=1)
+
+        cells = self._cells(centers)
+        self.shape = np.max(cells, axis=1) + 1
+
+        keys = self._keys(cells)
+        self.order = np.argsort(keys, kind="stable")
+        self.cell_keys, self.cell_starts, self.cell_counts = np.unique(
+                keys[self.order], return_index=True, return_counts=True)
+
+    def _cells(self, points):
+        return np.floor(
+                (points - self.origin[:, np.newaxis]) / self.h
+                ).astype(np.int64)
+
+    def _keys(self, cells):
+        return np.ravel_multi_index(tuple(cells), tuple(self.shape))
+
+    def __call__(self, points, radius_factor):
+        """
+        :returns: for each point in *points*, the index of the center closest
+            to it relative to its expansion radius, among the centers whose
+            disks (scaled by *radius_factor*) contain the point, or -1.
+        """
+        npoints = points.shape[1]
+        best_center = np.full(npoints, -1, dtype=np.int64)
+        best_dist = np.full(npoints, np.inf)
+
+        if not len(self.radii):
+            return best_center
+
+        point_cells = self._cells(points)
+
+        for offset in product([-1, 0, 1], repeat=len(self.shape)):
+            cells = point_cells + np.array(offset)[:, np.newaxis]
+            in_grid = np.all(
+                    (cells >= 0) & (cells < self.shape[:, np.newaxis]), axis=0)
+
+            ipoints, = np.nonzero(in_grid)
+            keys = self._keys(cells[:, ipoints])
+
+            icells = np.searchsorted(self.cell_keys, keys)
+            icells = np.minimum(icells, len(self.cell_keys) - 1)
+            is_occupied = self.cell_keys[icells] == keys
+
+            ipoints = ipoints[is_occupied]
+            icells = icells[is_occupied]
+            starts = self.cell_starts[icells]
+            ncandidates = self.cell_counts[icells]
+
+            for i in range(np.max(ncandidates, initial=0)):
+                has_candidate = i < ncandidates
+                icandidates = ipoints[has_candidate]
+                icenters = self.order[starts[has_candidate] + i]
+
+                dist = np.linalg.norm(
+                        points[:, icandidates] - self.centers[:, icenters],
+                        axis=0) / self.radii[icenters]
+
+                is_better = (
+                        (dist <= radius_factor)
+                        & (dist < best_dist[icandidates]))
+                best_center[icandidates[is_better]] = icenters[is_better]
+                best_dist[icandidates[is_better]] = dist[is_better]
+
+        return best_center
+
+# }}}
+
+
+# {{{ expansion field
+
+class QBXExpansionField:
+    """The QBX local expansions of all centers that were used in an FMM
+    evaluation of a layer potential, together with the centers and their
+    expansion radii. Evaluating the field at new targets finds an expansion
+    disk containing each target and evaluates the corresponding local
+    expansion (QBXL2P), which is much cheaper than a new FMM.
+
+    Only centers to which targets were associated during the FMM carry
+    expansions, e.g. only the centers on the exterior of the surface for a
+    layer potential evaluated with ``qbx_forced_limit=+1``.
+
+    Kernels with target-dependent arguments (e.g. the direction vector of a
+    :class:`~sumpy.kernel.DirectionalTargetDerivative`) are not supported,
+    since those arguments are only known at the targets of the FMM.
+
+    .. attribute:: kernels
+
+        The output kernels, in the order of the results of :meth:`__call__`.
+
+    .. attribute:: centers
+
+        A :class:`numpy.ndarray` of shape ``(ambient_dim, ncenters)``.
+
+    .. attribute:: expansion_radii
+
+        A :class:`numpy.ndarray` of shape ``(ncenters,)``.
+
+    .. automethod:: find_centers
+    .. automethod:: __call__
+    """
+
+    def __init__(self, qbxl2p, kernels, centers, expansion_radii, expansions,
+            dtype, kernel_extra_kwargs=None, radius_factor=1):
+        """
+        :arg qbxl2p: a :class:`~pytential.qbx.interactions.QBXL2P`.
+        :arg expansions: a :class:`pyopencl.array.Array` of shape
+            ``(ncenters, ncoeffs)``.
+        :arg radius_factor: targets are considered to be inside a disk if
+            their distance to the center is at most *radius_factor* times the
+            expansion radius.
+        """
+        if kernel_extra_kwargs is None:
+            kernel_extra_kwargs = {}
+
+        # NOTE: non-scalar kernel arguments are given per target of the FMM,
+        # so they cannot be used at the new targets
+        target_dependent_args = [
+                name for name, value in kernel_extra_kwargs.items()
+                if not np.isscalar(value)]
+        if target_dependent_args:
+            raise NotImplementedError(
+                    "expansion fields of kernels with target-dependent "
+                    f"arguments: {', '.join(target_dependent_args)}")
+
+        self.qbxl2p = qbxl2p
+        self.kernels = kernels
+        self.centers = centers
+        self.expansion_radii = expansion_radii
+        self.expansions = expansions
+        self.dtype = dtype
+        self.kernel_extra_kwargs = kernel_extra_kwargs
+        self.radius_factor = radius_factor
+
+        self._center_grid = _CenterGrid(centers, expansion_radii)
+        self._device_centers = None
+
+    @classmethod
+    def from_geometry_data(cls, queue, wrangler, geo_data, qbx_expansions,
+            radius_factor=1):
+        """Collect the expansions of the global QBX centers of *geo_data*, as
+        computed by :func:`pytential.qbx.fmm.drive_fmm_downward`.
+        """
+        global_qbx_centers = geo_data.global_qbx_centers().get(queue)
+
+        centers = np.array([
+            axis.get(queue) for axis in geo_data.flat_centers()
+            ])[:, global_qbx_centers]
+        expansion_radii = (
+                geo_data.flat_expansion_radii().get(queue)[global_qbx_centers])
+        expansions = cl.array.to_device(queue,
+                qbx_expansions.get(queue)[global_qbx_centers])
+
+        return cls(
+                wrangler.code.qbxl2p(wrangler.qbx_order),
+                wrangler.code.out_kernels,
+                centers, expansion_radii, expansions,
+                wrangler.dtype,
+                kernel_extra_kwargs=wrangler.kernel_extra_kwargs,
+                radius_factor=radius_factor)
+
+    @property
+    def ncenters(self):
+        return len(self.expansion_radii)
+
+    def find_centers(self, targets):
+        """
+        :arg targets: a :class:`numpy.ndarray` of shape
+            ``(ambient_dim, ntargets)``.
+        :returns: an integer :class:`numpy.ndarray` of shape ``(ntargets,)``
+            containing the index of the center used for each target, or -1 if
+            the target is not inside any expansion disk.
+        """
+        return self._center_grid(targets, self.radius_factor)
+
+    def __call__(self, actx, targets, fill_value=np.nan):
+        """Evaluate the layer potential at *targets*.
+
+        :arg targets: a :class:`numpy.ndarray` of shape
+            ``(ambient_dim, ntargets)``.
+        :arg fill_value: the value of the potential at targets outside all
+            expansion disks.
+        :returns: an object array of :class:`pyopencl.array.Array`\\ s of shape
+            ``(ntargets,)``, one for each of :attr:`kernels`.
+        """
+        queue = actx.queue
+        targets = np.asarray(targets)
+        ntargets = targets.shape[1]
+
+        target_to_center = self.find_centers(targets)
+        has_center, = np.nonzero(target_to_center >= 0)
+
+        logger.debug("expansion field: %d of %d targets inside disks",
+                len(has_center), ntargets)
+
+        from pytools.obj_array import make_obj_array
+        result = make_obj_array([
+            cl.array.empty(queue, ntargets, self.dtype).fill(fill_value)
+            for _ in self.kernels])
+
+        if not len(has_center):
+            return result
+
+        # {{{ build center-to-target lists
+
+        center_to_targets_lists = has_center[
+                np.argsort(target_to_center[has_center], kind="stable")]
+        center_to_targets_starts = np.searchsorted(
+                target_to_center[center_to_targets_lists],
+                np.arange(self.ncenters + 1))
+        used_centers, = np.nonzero(np.diff(center_to_targets_starts))
+
+        # }}}
+
+        def to_device(ary, dtype=np.int32):
+            return cl.array.to_device(queue,
+                    np.ascontiguousarray(ary.astype(dtype)))
+
+        coord_dtype = self.centers.dtype
+        if self._device_centers is None:
+            self._device_centers = (
+                    make_obj_array([
+                        to_device(axis, coord_dtype) for axis in self.centers]),
+                    to_device(self.expansion_radii, coord_dtype))
+
+        qbx_centers, qbx_expansion_radii = self._device_centers
+
+        evt, result = self.qbxl2p(queue,
+                qbx_centers=qbx_centers,
+                qbx_expansion_radii=qbx_expansion_radii,
+
+                global_qbx_centers=to_device(used_centers),
+
+                center_to_targets_starts=to_device(center_to_targets_starts),
+                center_to_targets_lists=to_device(center_to_targets_lists),
+
+                targets=make_obj_array([
+                    to_device(axis, coord_dtype) for axis in targets]),
+
+                qbx_expansions=self.expansions,
+                result=result,
+
+                **self.kernel_extra_kwargs.copy())
+
+        return result
+
+# }}}
+
+# vim: foldmethod=marker
@@ -43,6 +43,9 @@ __doc__ = """
 .. autoclass:: QBXExpansionWrangler
 
 .. autofunction:: drive_fmm
+.. autofunction:: drive_fmm_upward
+.. autofunction:: drive_fmm_downward
+.. autoclass:: FMMUpwardPassResult
 """
 
 
@@ -89,13 +92,17 @@ class QBXSumpyExpansionWranglerCodeContainer(SumpyExpansionWranglerCodeContainer
             qbx_order, fmm_level_to_order,
             source_extra_kwargs={},
             kernel_extra_kwargs=None,
-            _use_target_specific_qbx=False):
+            _use_target_specific_qbx=False,
+            allocator=None,
+            far_field_dtype=None):
         return QBXExpansionWrangler(self, queue, geo_data,
                 dtype,
                 qbx_order, fmm_level_to_order,
                 source_extra_kwargs,
                 kernel_extra_kwargs,
-                _use_target_specific_qbx)
+                _use_target_specific_qbx,
+                allocator=allocator,
+                far_field_dtype=far_field_dtype)
 
 
 class QBXExpansionWrangler(SumpyExpansionWrangler):
@@ -120,7 +127,15 @@ non_qbx_box_target_lists`),
     def __init__(self, code_container, queue, geo_data, dtype,
             qbx_order, fmm_level_to_order,
             source_extra_kwargs, kernel_extra_kwargs,
-            _use_target_specific_qbx=None):
+            _use_target_specific_qbx=None, allocator=None,
+            far_field_dtype=None):
+        """
+        :arg allocator: used for all expansion and output arrays, e.g. a
+            :class:`~pytential.allocation.StatisticsMemoryPool`.
+        :arg far_field_dtype: the dtype of the multipole and local expansions,
+            which may have a lower precision than *dtype*. QBX expansions and
+            outputs always use *dtype*. Defaults to *dtype*.
+        """
         if _use_target_specific_qbx:
             raise ValueError("TSQBX is not implemented in sumpy")
 
@@ -131,9 +146,28 @@ non_qbx_box_target_lists`),
         self.qbx_order = qbx_order
         self.geo_data = geo_data
         self.using_tsqbx = False
+        self.allocator = allocator
+
+        if far_field_dtype is None:
+            far_field_dtype = dtype
+        self.far_field_dtype = np.dtype(far_field_dtype)
 
     # {{{ data vector utilities
 
+    def multipole_expansion_zeros(self):
+        return cl.array.zeros(
+                self.queue,
+                self.multipole_expansions_level_starts()[-1],
+                dtype=self.far_field_dtype,
+                allocator=self.allocator)
+
+    def local_expansion_zeros(self):
+        return cl.array.zeros(
+                self.queue,
+                self.local_expansions_level_starts()[-1],
+                dtype=self.far_field_dtype,
+                allocator=self.allocator)
+
     def output_zeros(self):
         """This ought to be called ``non_qbx_output_zeros``, but since
         it has to override the superclass's behavior to integrate seamlessly,
@@ -147,13 +181,21 @@ non_qbx_box_target_lists`),
                 cl.array.zeros(
                     self.queue,
                     nqbtl.nfiltered_targets,
-                    dtype=self.dtype)
+                    dtype=self.dtype,
+                    allocator=self.allocator)
                 for k in self.code.out_kernels])
 
     def full_output_zeros(self):
-        # The superclass generates a full field of zeros, for all
-        # (not just non-QBX) targets.
-        return SumpyExpansionWrangler.output_zeros(self)
+        # NOTE: the superclass's output_zeros, for all (not just non-QBX)
+        # targets, using our allocator
+        from pytools.obj_array import make_obj_array
+        return make_obj_array([
+                cl.array.zeros(
+                    self.queue,
+                    self.tree.ntargets,
+                    dtype=self.dtype,
+                    allocator=self.allocator)
+                for k in self.code.out_kernels])
 
     def qbx_local_expansion_zeros(self):
         order = self.qbx_order
@@ -163,7 +205,8 @@ non_qbx_box_target_lists`),
                     self.queue,
                     (self.geo_data.ncenters,
                         len(qbx_l_expn)),
-                    dtype=self.dtype)
+                    dtype=self.dtype,
+                    allocator=self.allocator)
 
     def reorder_sources(self, source_array):
         return (source_array
@@ -384,40 +427,44 @@ non_qbx_box_target_lists`),
 
 # {{{ FMM top-level
 
-def drive_fmm(expansion_wrangler, src_weight_vecs, timing_data=None,
-        traversal=None):
-    """Top-level driver routine for the QBX fast multipole calculation.
+class FMMUpwardPassResult:
+    """Source-side data of a QBX FMM, as computed by :func:`drive_fmm_upward`.
+    It depends only on the tree of the geometry data, the FMM kernel and the
+    source strengths, not on the output kernels of the wrangler. Since the
+    tree also contains the expansion centers and the targets, it cannot be
+    reused for a different set of targets.
 
-    :arg geo_data: A :class:`pytential.qbx.geometry.QBXFMMGeometryData` instance.
-    :arg expansion_wrangler: An object exhibiting the
-        :class:`boxtree.fmm.ExpansionWranglerInterface`.
-    :arg src_weight_vecs: A sequence of source 'density/weights/charges'.
-        Passed unmodified to *expansion_wrangler*.
-    :arg timing_data: Either *None* or a dictionary that collects
-        timing data.
+    .. attribute:: src_weight_vecs
 
-    Returns the potentials computed by *expansion_wrangler*.
+        The source strengths in tree order.
 
-    See also :func:`boxtree.fmm.drive_fmm`.
+    .. attribute:: mpole_exps
+
+        The multipole expansions of all source boxes, after coarsening.
     """
-    wrangler = expansion_wrangler
 
-    geo_data = wrangler.geo_data
+    def __init__(self, src_weight_vecs, mpole_exps):
+        self.src_weight_vecs = src_weight_vecs
+        self.mpole_exps = mpole_exps
 
-    if traversal is None:
-        traversal = geo_data.traversal()
 
-    tree = traversal.tree
+def drive_fmm_upward(expansion_wrangler, src_weight_vecs, timing_data=None,
+        traversal=None, src_weights_in_tree_order=False):
+    """Form the multipole expansions of the source boxes and propagate them
+    upward. See :func:`drive_fmm` for the arguments.
 
-    recorder = TimingRecorder()
+    :returns: a :class:`FMMUpwardPassResult`.
+    """
+    wrangler = expansion_wrangler
 
-    # Interface guidelines: Attributes of the tree are assumed to be known
-    # to the expansion wrangler and should not be passed.
+    if traversal is None:
+        traversal = wrangler.geo_data.traversal()
 
-    fmm_proc = ProcessLogger(logger, "qbx fmm")
+    recorder = TimingRecorder()
 
-    src_weight_vecs = [wrangler.reorder_sources(weight)
-        for weight in src_weight_vecs]
+    if not src_weights_in_tree_order:
+        src_weight_vecs = [wrangler.reorder_sources(weight)
+            for weight in src_weight_vecs]
 
     # {{{ construct local multipoles
 
@@ -441,6 +488,40 @@ def drive_fmm(expansion_wrangler, src_weight_vecs, timing_data=None,
 
     # }}}
 
+    if timing_data is not None:
+        timing_data.update(recorder.summarize())
+
+    return FMMUpwardPassResult(src_weight_vecs, mpole_exps)
+
+
+def drive_fmm_downward(expansion_wrangler, upward, timing_data=None,
+        traversal=None, return_qbx_expansions=False):
+    """Evaluate the potentials due to the sources of an
+    :class:`FMMUpwardPassResult`. *expansion_wrangler* must use the same
+    geometry data and FMM kernel as the wrangler that produced *upward*, but
+    may have different output kernels.
+
+    :arg return_qbx_expansions: if *True*, also return the QBX local
+        expansions of all centers, e.g. for a
+        :class:`~pytential.qbx.expansion_field.QBXExpansionField`.
+    :returns: the potentials computed by *expansion_wrangler* or, if
+        *return_qbx_expansions* is *True*, a tuple of the potentials and the
+        QBX expansions.
+    """
+    wrangler = expansion_wrangler
+
+    geo_data = wrangler.geo_data
+
+    if traversal is None:
+        traversal = geo_data.traversal()
+
+    tree = traversal.tree
+
+    recorder = TimingRecorder()
+
+    src_weight_vecs = upward.src_weight_vecs
+    mpole_exps = upward.mpole_exps
+
     # {{{ direct evaluation from neighbor source boxes ("list 1")
 
     non_qbx_potentials, timing_future = wrangler.eval_direct(
@@ -587,10 +668,46 @@ def drive_fmm(expansion_wrangler, src_weight_vecs, timing_data=None,
 
     # }}}
 
-    fmm_proc.done()
-
     if timing_data is not None:
         timing_data.update(recorder.summarize())
+
+    if return_qbx_expansions:
+        return result, qbx_expansions
+    else:
+        return result
+
+
+def drive_fmm(expansion_wrangler, src_weight_vecs, timing_data=None,
+        traversal=None, src_weights_in_tree_order=False):
+    """Top-level driver routine for the QBX fast multipole calculation.
+    Equivalent to :func:`drive_fmm_upward` followed by
+    :func:`drive_fmm_downward`.
+
+    :arg expansion_wrangler: An object exhibiting the
+        :class:`boxtree.fmm.ExpansionWranglerInterface`.
+    :arg src_weight_vecs: A sequence of source 'density/weights/charges'.
+        Passed unmodified to *expansion_wrangler*.
+    :arg timing_data: Either *None* or a dictionary that collects
+        timing data.
+    :arg src_weights_in_tree_order: if *True*, *src_weight_vecs* are already
+        in tree order, e.g. as computed by
+        :class:`~pytential.qbx.utils.SourceStrengthOperator`, and are not
+        reordered by the wrangler.
+
+    Returns the potentials computed by *expansion_wrangler*.
+
+    See also :func:`boxtree.fmm.drive_fmm`.
+    """
+    fmm_proc = ProcessLogger(logger, "qbx fmm")
+
+    upward = drive_fmm_upward(expansion_wrangler, src_weight_vecs,
+            timing_data=timing_data, traversal=traversal,
+            src_weights_in_tree_order=src_weights_in_tree_order)
+    result = drive_fmm_downward(expansion_wrangler, upward,
+            timing_data=timing_data, traversal=traversal)
+
+    fmm_proc.done()
+
     return result
 
 # }}}
@@ -57,7 +57,12 @@ class QBXFMMLibExpansionWranglerCodeContainer:
             qbx_order, fmm_level_to_order,
             source_extra_kwargs={},
             kernel_extra_kwargs=None,
-            _use_target_specific_qbx=None):
+            _use_target_specific_qbx=None,
+            allocator=None,
+            far_field_dtype=None):
+        # NOTE: *allocator* is unused, since the expansions live on the host
+        if far_field_dtype is not None and far_field_dtype != dtype:
+            raise ValueError("fmmlib does not support mixed precision expansions")
 
         return QBXFMMLibExpansionWrangler(self, queue, geo_data, dtype,
                 qbx_order, fmm_level_to_order,
@@ -185,12 +190,18 @@ class QBXFMMLibExpansionWrangler(FMMLibExpansionWrangler):
 
     @staticmethod
     def is_supported_helmknl_for_tsqbx(knl):
-        # Supports at most one derivative.
+        # Supports at most one derivative, except for the target gradient of
+        # the Laplace double layer.
+        if (isinstance(knl, AxisTargetDerivative)
+                and isinstance(knl.inner_kernel, DirectionalSourceDerivative)
+                and isinstance(knl.inner_kernel.inner_kernel, LaplaceKernel)):
+            knl = knl.inner_kernel
+
         if isinstance(knl, (DirectionalSourceDerivative, AxisTargetDerivative)):
             knl = knl.inner_kernel
 
         return (isinstance(knl, (LaplaceKernel, HelmholtzKernel))
-                and knl.dim == 3)
+                and knl.dim in (2, 3))
 
     @staticmethod
     def is_supported_helmknl(knl):
@@ -603,7 +614,8 @@ class QBXFMMLibExpansionWrangler(FMMLibExpansionWrangler):
                 np.zeros((self.dim, self.tree.ntargets), np.complex)
                 if ifgrad else None)
 
-        ts.eval_target_specific_qbx_locals(
+        schedule = self.geo_data.lpot_source._tsqbx_schedule
+        thread_times = ts.eval_target_specific_qbx_locals(
                 ifpot=ifpot,
                 ifgrad=ifgrad,
                 ifcharge=ifcharge,
@@ -625,7 +637,12 @@ class QBXFMMLibExpansionWrangler(FMMLibExpansionWrangler):
                 dipstr=src_weights,
                 dipvec=self.dipole_vec,
                 pot=pot,
-                grad=grad)
+                grad=grad,
+                schedule=schedule)
+
+        if thread_times is not None and thread_times.max() > 0:
+            logger.debug("TSQBX (%s schedule): thread utilization %.2f",
+                    schedule, thread_times.mean() / thread_times.max())
 
         output = self.full_output_zeros()
         self.add_potgrad_onto_output(output, slice(None), pot, grad)
@@ -418,6 +418,14 @@ class QBXFMMGeometryData(FMMLibRotationDataInterface):
     def cl_context(self):
         return self.code_getter.cl_context
 
+    @property
+    def allocator(self):
+        """The allocator of :attr:`array_context`, used for temporary arrays
+        that are not retained by the cached geometry data.
+        """
+        from pytential.allocation import get_allocator
+        return get_allocator(self.array_context)
+
     # {{{ centers/radii
 
     @property
@@ -548,10 +556,11 @@ class QBXFMMGeometryData(FMMLibRotationDataInterface):
         target_radii = None
         if lpot_source._expansions_in_tree_have_extent:
             target_radii = cl.array.zeros(queue, target_info.ntargets,
-                    self.coord_dtype)
+                    self.coord_dtype, allocator=self.allocator)
             target_radii[:self.ncenters] = self.flat_expansion_radii()
 
-        refine_weights = cl.array.empty(queue, nparticles, dtype=np.int32)
+        refine_weights = cl.array.empty(queue, nparticles, dtype=np.int32,
+                allocator=self.allocator)
 
         # Assign a weight of 1 to all sources, QBX centers, and conventional
         # (non-QBX) targets. Assign a weight of 0 to all targets that need
@@ -630,7 +639,8 @@ class QBXFMMGeometryData(FMMLibRotationDataInterface):
 
         with cl.CommandQueue(self.cl_context) as queue:
             box_to_target_box = cl.array.empty(
-                    queue, tree.nboxes, tree.box_id_dtype)
+                    queue, tree.nboxes, tree.box_id_dtype,
+                    allocator=self.allocator)
             if self.debug:
                 box_to_target_box.fill(-1)
             box_to_target_box[trav.target_boxes] = cl.array.arange(
@@ -735,7 +745,8 @@ class QBXFMMGeometryData(FMMLibRotationDataInterface):
             tgt_assoc_result = (
                     user_target_to_center.with_queue(queue)[self.ncenters:])
 
-            center_is_used = cl.array.zeros(queue, self.ncenters, np.int8)
+            center_is_used = cl.array.zeros(queue, self.ncenters, np.int8,
+                    allocator=self.allocator)
 
             self.code_getter.pick_used_centers(
                     queue,
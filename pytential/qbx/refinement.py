@@ -303,7 +303,8 @@ class RefinerWrangler(TreeWranglerBase):
         if debug:
             npanels_to_refine_prev = cl.array.sum(refine_flags).get()
 
-        found_panel_to_refine = cl.array.zeros(self.queue, 1, np.int32)
+        found_panel_to_refine = cl.array.zeros(self.queue, 1, np.int32,
+                allocator=self.allocator)
         found_panel_to_refine.finish()
         unwrap_args = AreaQueryElementwiseTemplate.unwrap_args
 
@@ -362,7 +363,8 @@ class RefinerWrangler(TreeWranglerBase):
         if debug:
             npanels_to_refine_prev = cl.array.sum(refine_flags).get()
 
-        found_panel_to_refine = cl.array.zeros(self.queue, 1, np.int32)
+        found_panel_to_refine = cl.array.zeros(self.queue, 1, np.int32,
+                allocator=self.allocator)
         found_panel_to_refine.finish()
 
         from pytential import bind, sym
@@ -948,6 +950,8 @@ def refine_geometry_collection(places,
             refine_discr_stage = sym.QBX_SOURCE_STAGE1
 
     from pytential.qbx import QBXLayerPotentialSource
+    from pytential.allocation import allocation_stage
+
     places = places.copy()
     for geometry in places.places:
         dofdesc = sym.as_dofdesc(geometry).copy(
@@ -956,16 +960,19 @@ def refine_geometry_collection(places,
         if not isinstance(lpot_source, QBXLayerPotentialSource):
             continue
 
-        _refine_for_global_qbx(places, dofdesc,
-                lpot_source.refiner_code_container.get_wrangler(),
-                group_factory=group_factory,
-                kernel_length_scale=kernel_length_scale,
-                scaled_max_curvature_threshold=scaled_max_curvature_threshold,
-                expansion_disturbance_tolerance=expansion_disturbance_tolerance,
-                force_stage2_uniform_refinement_rounds=(
-                    force_stage2_uniform_refinement_rounds),
-                maxiter=maxiter, debug=debug, visualize=visualize,
-                _copy_collection=False)
+        wrangler = lpot_source.refiner_code_container.get_wrangler()
+        with allocation_stage(wrangler.allocator, "refinement"):
+            _refine_for_global_qbx(places, dofdesc, wrangler,
+                    group_factory=group_factory,
+                    kernel_length_scale=kernel_length_scale,
+                    scaled_max_curvature_threshold=(
+                        scaled_max_curvature_threshold),
+                    expansion_disturbance_tolerance=(
+                        expansion_disturbance_tolerance),
+                    force_stage2_uniform_refinement_rounds=(
+                        force_stage2_uniform_refinement_rounds),
+                    maxiter=maxiter, debug=debug, visualize=visualize,
+                    _copy_collection=False)
 
     return places
 
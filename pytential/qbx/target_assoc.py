@@ -517,7 +517,8 @@ class TargetAssociationWrangler(TreeWranglerBase):
                 tree.particle_id_dtype,
                 max_levels)
 
-        found_target_close_to_panel = cl.array.zeros(self.queue, 1, np.int32)
+        found_target_close_to_panel = cl.array.zeros(self.queue, 1, np.int32,
+                allocator=self.allocator)
         found_target_close_to_panel.finish()
 
         # Perform a space invader query over the sources.
@@ -646,7 +647,8 @@ class TargetAssociationWrangler(TreeWranglerBase):
 
         def make_target_field(fill_val, dtype=tree.coord_dtype):
             arr = cl.array.empty(
-                self.queue, tree.nqbxtargets, dtype)
+                self.queue, tree.nqbxtargets, dtype,
+                allocator=self.allocator)
             arr.fill(fill_val)
             wait_for.extend(arr.events)
             return arr
@@ -714,7 +716,8 @@ class TargetAssociationWrangler(TreeWranglerBase):
                 tree.particle_id_dtype,
                 max_levels)
 
-        found_panel_to_refine = cl.array.zeros(self.queue, 1, np.int32)
+        found_panel_to_refine = cl.array.zeros(self.queue, 1, np.int32,
+                allocator=self.allocator)
         found_panel_to_refine.finish()
 
         # Perform a space invader query over the sources.
@@ -771,7 +774,8 @@ class TargetAssociationWrangler(TreeWranglerBase):
 
     def make_target_flags(self, target_discrs_and_qbx_sides):
         ntargets = sum(discr.ndofs for discr, _ in target_discrs_and_qbx_sides)
-        target_flags = cl.array.empty(self.queue, ntargets, dtype=np.int32)
+        target_flags = cl.array.empty(self.queue, ntargets, dtype=np.int32,
+                allocator=self.allocator)
         offset = 0
 
         for discr, flags in target_discrs_and_qbx_sides:
@@ -786,7 +790,8 @@ class TargetAssociationWrangler(TreeWranglerBase):
         return target_flags
 
     def make_default_target_association(self, ntargets):
-        target_to_center = cl.array.empty(self.queue, ntargets, dtype=np.int32)
+        target_to_center = cl.array.empty(self.queue, ntargets, dtype=np.int32,
+                allocator=self.allocator)
         target_to_center.fill(-1)
         target_to_center.finish()
 
@@ -829,7 +834,8 @@ def associate_targets_to_qbx_centers(places, geometry, wrangler,
 
     peer_lists = wrangler.find_peer_lists(tree)
 
-    target_status = cl.array.zeros(wrangler.queue, tree.nqbxtargets, dtype=np.int32)
+    target_status = cl.array.zeros(wrangler.queue, tree.nqbxtargets,
+            dtype=np.int32, allocator=wrangler.allocator)
     target_status.finish()
 
     have_close_targets = wrangler.mark_targets(places, dofdesc,
@@ -874,7 +880,8 @@ def associate_targets_to_qbx_centers(places, geometry, wrangler,
             "this could also cause an invalid center assignment.")
 
         refine_flags = cl.array.zeros(
-                wrangler.queue, tree.nqbxpanels, dtype=np.int32)
+                wrangler.queue, tree.nqbxpanels, dtype=np.int32,
+                allocator=wrangler.allocator)
         have_panel_to_refine = wrangler.mark_panels_for_refinement(
                 places, dofdesc,
                 tree, peer_lists, target_status, refine_flags,
@@ -26,6 +26,11 @@
 /* Temporary buffer size for holding e.g. Legendre polynomial values */
 #define BUFSIZE 64
 
+/* Scratch buffer size for Miller's algorithm for 2D Bessel functions, which
+ * starts the backward recurrence well above the requested order for large
+ * arguments */
+#define BESSEL_BUFSIZE 512
+
 /* Padding for false sharing prevention */
 #define PADDING 65
 
@@ -27,7 +27,7 @@ import numpy as np
 import cython
 import cython.parallel
 
-from libc.math cimport sqrt
+from libc.math cimport sqrt, log, atan2, cos, sin, M_PI
 from libc.stdio cimport printf, fprintf, stderr
 from libc.stdlib cimport abort
 
@@ -36,6 +36,7 @@ cimport openmp
 
 cdef extern from "complex.h" nogil:
     double cabs(double complex)
+    double complex clog(double complex)
 
 
 cdef extern from "helmholtz_utils.h" nogil:
@@ -48,6 +49,7 @@ cdef extern from "helmholtz_utils.h" nogil:
 
 cdef extern from "impl.h" nogil:
     const int BUFSIZE
+    const int BESSEL_BUFSIZE
     const int PADDING
 
 
@@ -219,53 +221,84 @@ cdef void ts_helmholtz_precompute(
 
 # {{{ Laplace S
 
-cdef double complex ts_laplace_s(
-        double[3] source,
+cdef double complex ts_laplace_s_block(
+        int nsources,
+        double[] sources,
+        double complex[] charges,
         double[3] center,
         double[3] target,
-        double complex charge,
-        int order) nogil:
-    """Evaluate the target-specific expansion of the Laplace single-layer kernel."""
+        int order,
+        double[] scratch,
+        int stride) nogil:
+    """Evaluate the target-specific expansion of the Laplace single-layer kernel
+    for a contiguous block of *nsources* sources (shape (*nsources*, 3)).
+
+    The Legendre recurrence runs across the block, so that the innermost loops
+    are over contiguous arrays in *scratch* (of size 6 * *stride*).
+    """
 
     cdef:
-        double j
-        double result, r, sc_d, tc_d, cos_angle
-        # Legendre recurrence values
-        double pj, pjm1, pjm2
+        int i, m
+        double j, tc_d, sc_d, pj
+        double[3] tmc
+        double *cos_angle
+        double *ratio
+        double *rn
+        double *pjm1
+        double *pjm2
+        double *acc
+        double complex result
 
-    tc_d = dist(target, center)
-    sc_d = dist(source, center)
+    cos_angle = scratch
+    ratio = scratch + stride
+    rn = scratch + 2 * stride
+    pjm1 = scratch + 3 * stride
+    pjm2 = scratch + 4 * stride
+    acc = scratch + 5 * stride
 
-    cos_angle = ((
-            (target[0] - center[0]) * (source[0] - center[0]) +
-            (target[1] - center[1]) * (source[1] - center[1]) +
-            (target[2] - center[2]) * (source[2] - center[2]))
-            / (tc_d * sc_d))
+    for m in range(3):
+        tmc[m] = target[m] - center[m]
 
-    if order == 0:
-        return charge / sc_d
+    tc_d = sqrt(tmc[0] * tmc[0] + tmc[1] * tmc[1] + tmc[2] * tmc[2])
 
-    pjm2 = 1
-    pjm1 = cos_angle
+    for i in range(nsources):
+        sc_d = dist(&sources[3 * i], center)
+        cos_angle[i] = (
+                tmc[0] * (sources[3 * i] - center[0])
+                + tmc[1] * (sources[3 * i + 1] - center[1])
+                + tmc[2] * (sources[3 * i + 2] - center[2])) / (tc_d * sc_d)
+        ratio[i] = tc_d / sc_d
 
-    result = 1 / sc_d + (cos_angle * tc_d) / (sc_d * sc_d)
+        # Invariant: rn = tc_d ** n / sc_d ** (n + 1)
+        rn[i] = 1 / sc_d
+        pjm2[i] = 1
+        pjm1[i] = cos_angle[i]
+        acc[i] = rn[i]
 
-    r = (tc_d * tc_d) / (sc_d * sc_d * sc_d)
+    if order >= 1:
+        for i in range(nsources):
+            rn[i] = rn[i] * ratio[i]
+            acc[i] = acc[i] + cos_angle[i] * rn[i]
 
     # Invariant: j matches loop counter. Using a double-precision version of the
     # loop counter avoids an int-to-double conversion inside the loop.
     j = 2.
 
     for _ in range(2, order + 1):
-        pj = ( (2.*j-1.)*cos_angle*pjm1-(j-1.)*pjm2 ) / j
-        result += pj * r
+        for i in range(nsources):
+            pj = ((2.*j-1.)*cos_angle[i]*pjm1[i]-(j-1.)*pjm2[i]) / j
+            rn[i] = rn[i] * ratio[i]
+            acc[i] = acc[i] + pj * rn[i]
+            pjm2[i] = pjm1[i]
+            pjm1[i] = pj
 
-        r *= (tc_d / sc_d)
         j += 1
-        pjm2 = pjm1
-        pjm1 = pj
 
-    return charge * result
+    result = 0
+    for i in range(nsources):
+        result = result + charges[i] * acc[i]
+
+    return result
 
 # }}}
 
@@ -360,59 +393,205 @@ cdef double complex ts_laplace_d(
 # }}}
 
 
-# {{{ Helmholtz S
+# {{{ Laplace grad(D)
+
+cdef void legderivs2(int n, double[] derivs, double[] derivs2) nogil:
+    """Compute the second derivatives of the Legendre polynomials up to order n
+    from their first derivatives *derivs*, using
+    :math:`P''_{j} = P''_{j-2} + (2j - 1) P'_{j-1}`."""
+    cdef int j
+
+    derivs2[0] = 0
+    if n == 0:
+        return
 
-cdef double complex ts_helmholtz_s(
+    derivs2[1] = 0
+    for j in range(2, n + 1):
+        derivs2[j] = derivs2[j - 2] + (2*j - 1) * derivs[j - 1]
+
+
+cdef void ts_laplace_dp(
+        double complex[3] grad,
         double[3] source,
         double[3] center,
         double[3] target,
-        double complex charge,
-        int order,
-        double complex k,
-        double complex[] jvals,
-        double jscale) nogil:
-    """Evaluate the target-specific expansion of the Helmholtz single-layer
-    kernel."""
+        double[3] dipole,
+        double complex dipstr,
+        int order) nogil:
+    """Evaluate the target-specific expansion of the gradient of the Laplace
+    double-layer kernel."""
 
     cdef:
-        int n, ifder
-        double sc_d, tc_d, cos_angle
-        double[BUFSIZE] lvals
-        double complex[BUFSIZE] hvals
-        double hscale, unscale
-        double complex z, result
+        int n, m
+        double sc_d, tc_d, cos_angle, Rn, alpha, beta, h
+        double[BUFSIZE] lvals, lderivs, lderivs2
+        double[3] shat, that, grad_tmp
 
     tc_d = dist(target, center)
     sc_d = dist(source, center)
 
-    cos_angle = ((
-            (target[0] - center[0]) * (source[0] - center[0]) +
-            (target[1] - center[1]) * (source[1] - center[1]) +
-            (target[2] - center[2]) * (source[2] - center[2]))
-            / (tc_d * sc_d))
+    for m in range(3):
+        shat[m] = (source[m] - center[m]) / sc_d
+        that[m] = (target[m] - center[m]) / tc_d
+        grad_tmp[m] = 0
 
-    # Evaluate the Legendre terms.
-    legvals(cos_angle, order, lvals, NULL)
+    cos_angle = that[0] * shat[0] + that[1] * shat[1] + that[2] * shat[2]
+    alpha = dipole[0] * that[0] + dipole[1] * that[1] + dipole[2] * that[2]
+    beta = dipole[0] * shat[0] + dipole[1] * shat[1] + dipole[2] * shat[2]
+
+    legvals(cos_angle, order, lvals, lderivs)
+    legderivs2(order, lderivs, lderivs2)
+
+    # The n = 0 term does not depend on the target.
+    # Invariant: Rn = tc_d ** (n - 1) / sc_d ** (n + 2)
+    Rn = 1 / (sc_d * sc_d * sc_d)
+
+    for n in range(1, order + 1):
+        # source derivative of the n-th term, divided by Rn * tc_d
+        h = -(n + 1) * beta * lvals[n] + (alpha - cos_angle * beta) * lderivs[n]
+
+        for m in range(3):
+            grad_tmp[m] += Rn * (
+                    n * that[m] * h
+                    + lderivs[n] * (
+                        dipole[m] - alpha * that[m]
+                        - (n + 2) * beta * (shat[m] - cos_angle * that[m]))
+                    + (alpha - cos_angle * beta) * lderivs2[n]
+                    * (shat[m] - cos_angle * that[m]))
+
+        Rn *= (tc_d / sc_d)
+
+    for m in range(3):
+        grad[m] += dipstr * grad_tmp[m]
+
+# }}}
+
+
+# {{{ Helmholtz source terms
+
+cdef void ts_helmholtz_precompute_source(
+        double[3] source,
+        double[3] center,
+        int order,
+        int ifder,
+        double complex k,
+        double complex[] hvals,
+        double complex[] hderivs,
+        int hstride,
+        double *hscale) nogil:
+    """Evaluate the target-invariant spherical Hankel terms of the Helmholtz
+    target-specific expansion for one source. The term of order *n* is stored
+    at index ``n * hstride`` of *hvals* (and *hderivs*, if *ifder* is set), so
+    that the terms of a block of sources are contiguous for each order."""
+
+    cdef:
+        int n
+        double complex z
+        double complex[BUFSIZE] htmp, hdtmp
+
+    z = k * dist(source, center)
 
     # Scaling magic for Hankel terms.
     # These values are taken from the fmmlib documentation.
-    hscale = cabs(k * sc_d) if (cabs(k * sc_d) < 1) else 1
-    # unscale = (jscale / hscale) ** n
-    # Multiply against unscale to remove the scaling.
-    unscale = 1
+    hscale[0] = cabs(z) if (cabs(z) < 1) else 1
 
-    # Evaluate the spherical Hankel terms.
-    z = k * sc_d
-    ifder = 0
-    h3dall_(&order, &z, &hscale, hvals, &ifder, NULL)
+    h3dall_(&order, &z, hscale, htmp, &ifder, hdtmp)
 
-    result = 0
+    for n in range(order + 1):
+        hvals[n * hstride] = htmp[n]
+        if ifder:
+            hderivs[n * hstride] = hdtmp[n]
 
-    for n in range(1 + order):
-        result += (2 * n + 1) * unscale * (jvals[n] * hvals[n] * lvals[n])
-        unscale *= jscale / hscale
+# }}}
+
+
+# {{{ Helmholtz S
+
+cdef double complex ts_helmholtz_s_block(
+        int nsources,
+        double[] sources,
+        double complex[] charges,
+        double[3] center,
+        double[3] target,
+        int order,
+        double complex k,
+        double complex[] jvals,
+        double jscale,
+        double complex[] hvals,
+        double[] hscales,
+        int hstride,
+        double[] scratch,
+        double complex[] cscratch) nogil:
+    """Evaluate the target-specific expansion of the Helmholtz single-layer
+    kernel for a contiguous block of *nsources* sources (shape (*nsources*, 3))
+    with precomputed Hankel terms (see :func:`ts_helmholtz_precompute_source`).
+
+    The Legendre recurrence runs across the block, so that the innermost loops
+    are over contiguous arrays in *scratch* (of size 4 * *hstride*) and
+    *cscratch* (of size *hstride*).
+    """
+
+    cdef:
+        int i, n, m
+        double j, tc_d, sc_d, pj
+        double[3] tmc
+        double *cos_angle
+        double *unscale
+        double *pjm1
+        double *pjm2
+        double complex *acc
+        double complex result
+
+    cos_angle = scratch
+    unscale = scratch + hstride
+    pjm1 = scratch + 2 * hstride
+    pjm2 = scratch + 3 * hstride
+    acc = cscratch
+
+    for m in range(3):
+        tmc[m] = target[m] - center[m]
+
+    tc_d = sqrt(tmc[0] * tmc[0] + tmc[1] * tmc[1] + tmc[2] * tmc[2])
+
+    for i in range(nsources):
+        sc_d = dist(&sources[3 * i], center)
+        cos_angle[i] = (
+                tmc[0] * (sources[3 * i] - center[0])
+                + tmc[1] * (sources[3 * i + 1] - center[1])
+                + tmc[2] * (sources[3 * i + 2] - center[2])) / (tc_d * sc_d)
+
+        # unscale = (jscale / hscale) ** n removes the scaling of the terms
+        unscale[i] = 1
+        pjm2[i] = 1
+        pjm1[i] = cos_angle[i]
+        acc[i] = jvals[0] * hvals[i]
+
+    if order >= 1:
+        for i in range(nsources):
+            unscale[i] = unscale[i] * jscale / hscales[i]
+            acc[i] = acc[i] + (
+                    3 * unscale[i] * jvals[1] * hvals[hstride + i] * cos_angle[i])
+
+    # Invariant: j matches loop counter.
+    j = 2.
+
+    for n in range(2, order + 1):
+        for i in range(nsources):
+            pj = ((2.*j-1.)*cos_angle[i]*pjm1[i]-(j-1.)*pjm2[i]) / j
+            unscale[i] = unscale[i] * jscale / hscales[i]
+            acc[i] = acc[i] + (
+                    (2 * n + 1) * unscale[i] * jvals[n] * hvals[n * hstride + i]
+                    * pj)
+            pjm2[i] = pjm1[i]
+            pjm1[i] = pj
+
+        j += 1
+
+    result = 0
+    for i in range(nsources):
+        result = result + charges[i] * acc[i]
 
-    return 1j * k * charge * result
+    return 1j * k * result
 
 # }}}
 
@@ -429,20 +608,21 @@ cdef void ts_helmholtz_sp(
         double complex k,
         double complex[] jvals,
         double complex[] jderivs,
-        double jscale) nogil:
+        double jscale,
+        double complex[] hvals,
+        double hscale,
+        int hstride) nogil:
     """Evaluate the target-specific expansion of the gradient of the Helmholtz
-    single-layer kernel."""
+    single-layer kernel, with precomputed Hankel terms (see
+    :func:`ts_helmholtz_precompute_source`)."""
 
     cdef:
         int n, m
-        int ifder
         double sc_d, tc_d, cos_angle
         double[3] smc, tmc
         double complex[3] grad_tmp
         double[BUFSIZE] lvals, lderivs
-        double complex z
-        double complex [BUFSIZE] hvals
-        double hscale, unscale
+        double unscale
 
     for m in range(3):
         smc[m] = source[m] - center[m]
@@ -456,18 +636,10 @@ cdef void ts_helmholtz_sp(
     cos_angle = (tmc[0] * smc[0] + tmc[1] * smc[1] + tmc[2] * smc[2]) / (tc_d * sc_d)
     legvals(cos_angle, order, lvals, lderivs)
 
-    # Scaling magic for Hankel terms.
-    # These values are taken from the fmmlib documentation.
-    hscale = cabs(k * sc_d) if (cabs(k * sc_d) < 1) else 1
     # unscale = (jscale / hscale) ** n
     # Multiply against unscale to remove the scaling.
     unscale = 1
 
-    # Evaluate the spherical Hankel terms.
-    z = k * sc_d
-    ifder = 0
-    h3dall_(&order, &z, &hscale, hvals, &ifder, NULL)
-
     #
     # This is a mess, but amounts to the t-gradient of:
     #
@@ -478,7 +650,7 @@ cdef void ts_helmholtz_sp(
     #
     for n in range(0, order + 1):
         for m in range(3):
-            grad_tmp[m] += (2 * n + 1) * unscale * hvals[n] / tc_d * (
+            grad_tmp[m] += (2 * n + 1) * unscale * hvals[n * hstride] / tc_d * (
                     k * jderivs[n] * lvals[n] * tmc[m]
                     + (smc[m] / sc_d - cos_angle * tmc[m] / tc_d)
                     * jvals[n] * lderivs[n])
@@ -501,20 +673,22 @@ cdef double complex ts_helmholtz_d(
         int order,
         double complex k,
         double complex[] jvals,
-        double jscale) nogil:
+        double jscale,
+        double complex[] hvals,
+        double complex[] hderivs,
+        double hscale,
+        int hstride) nogil:
     """Evaluate the target-specific expansion of the Helmholtz double-layer
-    kernel."""
+    kernel, with precomputed Hankel terms (see
+    :func:`ts_helmholtz_precompute_source`)."""
 
     cdef:
         int n, m
-        int ifder
         double sc_d, tc_d, cos_angle
         double[3] smc, tmc
         double complex[3] grad
         double[BUFSIZE] lvals, lderivs
-        double complex z
-        double complex [BUFSIZE] hvals, hderivs
-        double hscale, unscale
+        double unscale
 
     for m in range(3):
         smc[m] = source[m] - center[m]
@@ -529,18 +703,10 @@ cdef double complex ts_helmholtz_d(
     # Evaluate the Legendre terms.
     legvals(cos_angle, order, lvals, lderivs)
 
-    # Scaling magic for Hankel terms.
-    # These values are taken from the fmmlib documentation.
-    hscale = cabs(k * sc_d) if (cabs(k * sc_d) < 1) else 1
     # unscale = (jscale / hscale) ** n
     # Multiply against unscale to remove the scaling.
     unscale = 1
 
-    # Evaluate the spherical Hankel terms.
-    z = k * sc_d
-    ifder = 1
-    h3dall_(&order, &z, &hscale, hvals, &ifder, hderivs)
-
     #
     # This is a mess, but amounts to the s-gradient of:
     #
@@ -552,9 +718,9 @@ cdef double complex ts_helmholtz_d(
     for n in range(0, order + 1):
         for m in range(3):
             grad[m] += (2 * n + 1) * unscale * jvals[n] / sc_d * (
-                    k * smc[m] * hderivs[n] * lvals[n]
+                    k * smc[m] * hderivs[n * hstride] * lvals[n]
                     + (tmc[m] / tc_d - cos_angle * smc[m] / sc_d)
-                    * hvals[n] * lderivs[n])
+                    * hvals[n * hstride] * lderivs[n])
         unscale *= jscale / hscale
 
     return 1j * k * dipstr * (
@@ -563,6 +729,540 @@ cdef double complex ts_helmholtz_d(
 # }}}
 
 
+# {{{ 2D helpers
+
+# Euler-Mascheroni constant
+cdef double EULER_GAMMA = 0.57721566490153286061
+
+cdef int besselj_2d_start(double complex z, int nterms) nogil:
+    """Return an (even) starting index for the backward recurrence in
+    :func:`besselj_2d` that gives full double precision for orders up to
+    *nterms*."""
+    cdef double n = max(<double> nterms, cabs(z))
+    return 2 * ((<int> (n + 15 + sqrt(40 * n))) // 2 + 1)
+
+
+cdef void besselj_2d(double complex z, int nstart, double complex[] jvals) nogil:
+    """Compute the Bessel functions :math:`J_n(z)` for *n* from 0 to *nstart*
+    using Miller's backward recurrence, normalized by
+    :math:`J_0 + 2 \\sum_k J_{2k} = 1`.
+    """
+    cdef:
+        int n, i
+        double complex norm
+
+    if cabs(z) == 0:
+        jvals[0] = 1
+        for n in range(1, nstart + 1):
+            jvals[n] = 0
+        return
+
+    jvals[nstart] = 0
+    jvals[nstart - 1] = 1e-100
+
+    for n in range(nstart - 1, 0, -1):
+        jvals[n - 1] = (2 * n / z) * jvals[n] - jvals[n + 1]
+
+        if cabs(jvals[n - 1]) > 1e200:
+            for i in range(n - 1, nstart):
+                jvals[i] = jvals[i] * 1e-200
+
+    norm = jvals[0]
+    for n in range(2, nstart, 2):
+        norm = norm + 2 * jvals[n]
+
+    for n in range(nstart + 1):
+        jvals[n] = jvals[n] / norm
+
+
+cdef void hankel_2d(double complex z, int nterms, double complex[] hvals) nogil:
+    """Compute the Hankel functions :math:`H^{(1)}_n(z)` for *n* from 0 to
+    *nterms*.
+
+    :math:`Y_0` is obtained from the Neumann series in terms of :math:`J_{2k}`
+    and :math:`Y_1 = -Y_0'` from its derivative. Higher orders are obtained by
+    forward recurrence, which is stable for Hankel functions.
+    """
+    cdef:
+        int n, nstart
+        double complex[BESSEL_BUFSIZE] jtmp
+        double complex y0, y1, log_term, dj
+        double sign
+
+    nstart = besselj_2d_start(z, nterms)
+    if nstart + 1 >= BESSEL_BUFSIZE:
+        fprintf(stderr, "argument passed to hankel_2d is too large\n")
+        abort()
+
+    besselj_2d(z, nstart, jtmp)
+
+    log_term = clog(z / 2) + EULER_GAMMA
+
+    y0 = (2 / M_PI) * log_term * jtmp[0]
+    y1 = -(2 / M_PI) * (jtmp[0] / z - log_term * jtmp[1])
+
+    sign = -1
+    for n in range(1, nstart // 2):
+        dj = (jtmp[2*n - 1] - jtmp[2*n + 1]) / 2
+        y0 = y0 - (4 / M_PI) * sign * jtmp[2*n] / n
+        y1 = y1 + (4 / M_PI) * sign * dj / n
+        sign = -sign
+
+    hvals[0] = jtmp[0] + 1j * y0
+    hvals[1] = jtmp[1] + 1j * y1
+
+    for n in range(1, nterms):
+        hvals[n + 1] = (2 * n / z) * hvals[n] - hvals[n - 1]
+
+
+cdef void ts_helmholtz_precompute_2d(
+        double[3] center,
+        double[3] target,
+        int order,
+        double complex k,
+        double complex[] jvals,
+        double complex[] jderivs) nogil:
+    """Evaluate the source-invariant Bessel terms of the 2D Helmholtz
+    target-specific expansion, i.e. :math:`J_n(k |t - c|)` and their
+    derivatives for *n* from 0 to *order*."""
+
+    cdef:
+        double complex z
+        int n, nstart
+        double complex[BESSEL_BUFSIZE] jtmp
+
+    z = k * sqrt(
+            (target[0] - center[0]) * (target[0] - center[0])
+            + (target[1] - center[1]) * (target[1] - center[1]))
+
+    nstart = besselj_2d_start(z, order + 1)
+    if nstart + 1 >= BESSEL_BUFSIZE:
+        fprintf(stderr, "argument passed to besselj_2d is too large\n")
+        abort()
+
+    besselj_2d(z, nstart, jtmp)
+
+    # J_{-1} = -J_1
+    jderivs[0] = -jtmp[1]
+    for n in range(order + 1):
+        jvals[n] = jtmp[n]
+        if n > 0:
+            jderivs[n] = (jtmp[n - 1] - jtmp[n + 1]) / 2
+
+
+cdef void ts_helmholtz_precompute_source_2d(
+        double[3] source,
+        double[3] center,
+        int order,
+        double complex k,
+        double complex[] hvals,
+        int hstride) nogil:
+    """Evaluate the target-invariant Hankel terms :math:`H_n(k |s - c|)` of the
+    2D Helmholtz target-specific expansion for *n* from 0 to *order* + 1 (the
+    last one is needed for derivatives). The term of order *n* is stored at
+    index ``n * hstride`` of *hvals*."""
+
+    cdef:
+        int n
+        double complex[BUFSIZE] htmp
+
+    hankel_2d(k * sqrt(
+            (source[0] - center[0]) * (source[0] - center[0])
+            + (source[1] - center[1]) * (source[1] - center[1])),
+            order + 1, htmp)
+
+    for n in range(order + 2):
+        hvals[n * hstride] = htmp[n]
+
+# }}}
+
+
+# {{{ 2D Laplace S, grad(S), D, grad(D)
+
+# These use the complex-variable form of the expansion of log|t - s| about the
+# center c. With z_s = s - c and z_t = t - c,
+#
+#   log|t - s| = log|z_s| - Re sum_{n >= 1} (z_t / z_s)^n / n.
+
+cdef inline double log_abs2(double complex z) nogil:
+    return log(z.real * z.real + z.imag * z.imag)
+
+
+cdef double complex ts_laplace_s_2d(
+        double[3] source,
+        double[3] center,
+        double[3] target,
+        double complex charge,
+        int order) nogil:
+    """Evaluate the target-specific expansion of the 2D Laplace single-layer
+    kernel."""
+
+    cdef:
+        int n
+        double complex zs, ratio, ratio_n
+        double result
+
+    zs = (source[0] - center[0]) + 1j * (source[1] - center[1])
+    ratio = ((target[0] - center[0]) + 1j * (target[1] - center[1])) / zs
+
+    result = 0.5 * log_abs2(zs)
+    ratio_n = 1
+    for n in range(1, order + 1):
+        ratio_n = ratio_n * ratio
+        result -= ratio_n.real / n
+
+    return charge * result
+
+
+cdef void ts_laplace_sp_2d(
+        double complex[3] grad,
+        double[3] source,
+        double[3] center,
+        double[3] target,
+        double complex charge,
+        int order) nogil:
+    """Evaluate the target-specific expansion of the gradient of the 2D Laplace
+    single-layer kernel."""
+
+    cdef:
+        int n
+        double complex zs, zt, deriv, term
+
+    zs = (source[0] - center[0]) + 1j * (source[1] - center[1])
+    zt = (target[0] - center[0]) + 1j * (target[1] - center[1])
+
+    # d/dz_t of the analytic part, -sum_n z_t^(n-1) / z_s^n
+    deriv = 0
+    term = 1 / zs
+    for n in range(1, order + 1):
+        deriv = deriv - term
+        term = term * zt / zs
+
+    # grad Re f = (Re f', -Im f')
+    grad[0] += charge * deriv.real
+    grad[1] += charge * (-deriv.imag)
+
+
+cdef double complex ts_laplace_d_2d(
+        double[3] source,
+        double[3] center,
+        double[3] target,
+        double[3] dipole,
+        double complex dipstr,
+        int order) nogil:
+    """Evaluate the target-specific expansion of the 2D Laplace double-layer
+    kernel."""
+
+    cdef:
+        int n
+        double complex zs, zt, deriv, term
+
+    zs = (source[0] - center[0]) + 1j * (source[1] - center[1])
+    zt = (target[0] - center[0]) + 1j * (target[1] - center[1])
+
+    # d/dz_s of the analytic part, 1/z_s + sum_n z_t^n / z_s^(n+1)
+    deriv = 1 / zs
+    term = deriv
+    for n in range(1, order + 1):
+        term = term * zt / zs
+        deriv = deriv + term
+
+    # d . grad Re f = Re(f' (d_0 + i d_1))
+    return dipstr * (deriv * (dipole[0] + 1j * dipole[1])).real
+
+
+cdef void ts_laplace_dp_2d(
+        double complex[3] grad,
+        double[3] source,
+        double[3] center,
+        double[3] target,
+        double[3] dipole,
+        double complex dipstr,
+        int order) nogil:
+    """Evaluate the target-specific expansion of the gradient of the 2D Laplace
+    double-layer kernel."""
+
+    cdef:
+        int n
+        double complex zs, zt, deriv, term
+
+    zs = (source[0] - center[0]) + 1j * (source[1] - center[1])
+    zt = (target[0] - center[0]) + 1j * (target[1] - center[1])
+
+    # d/dz_t d/dz_s of the analytic part, sum_n n z_t^(n-1) / z_s^(n+1)
+    deriv = 0
+    term = 1 / (zs * zs)
+    for n in range(1, order + 1):
+        deriv = deriv + n * term
+        term = term * zt / zs
+
+    deriv = deriv * (dipole[0] + 1j * dipole[1])
+
+    grad[0] += dipstr * deriv.real
+    grad[1] += dipstr * (-deriv.imag)
+
+# }}}
+
+
+# {{{ 2D Helmholtz S, grad(S), D
+
+# These use Graf's addition theorem. With polar coordinates (rho_s, theta_s)
+# and (rho_t, theta_t) of s - c and t - c and phi = theta_s - theta_t,
+#
+#   H_0(k |t - s|) = sum_{n=-p}^{p} H_n(k rho_s) J_n(k rho_t) e^{i n phi}
+#                  = sum_{n=0}^{p} a_n H_n(k rho_s) J_n(k rho_t) cos(n phi)
+#
+# with a_0 = 1 and a_n = 2 otherwise. As in FMMLIB2D, the kernel is
+# (i/4) H_0(k r).
+
+cdef double complex ts_helmholtz_s_2d(
+        double[3] source,
+        double[3] center,
+        double[3] target,
+        double complex charge,
+        int order,
+        double complex[] jvals,
+        double complex[] hvals,
+        int hstride) nogil:
+    """Evaluate the target-specific expansion of the 2D Helmholtz single-layer
+    kernel, with precomputed Hankel terms (see
+    :func:`ts_helmholtz_precompute_source_2d`)."""
+
+    cdef:
+        int n
+        double phi
+        double complex result
+
+    phi = (
+            atan2(source[1] - center[1], source[0] - center[0])
+            - atan2(target[1] - center[1], target[0] - center[0]))
+
+    result = hvals[0] * jvals[0]
+    for n in range(1, order + 1):
+        result = result + 2 * hvals[n * hstride] * jvals[n] * cos(n * phi)
+
+    return 0.25j * charge * result
+
+
+cdef void ts_helmholtz_sp_2d(
+        double complex[3] grad,
+        double[3] source,
+        double[3] center,
+        double[3] target,
+        double complex charge,
+        int order,
+        double complex k,
+        double complex[] jvals,
+        double complex[] jderivs,
+        double complex[] hvals,
+        int hstride) nogil:
+    """Evaluate the target-specific expansion of the gradient of the 2D
+    Helmholtz single-layer kernel, with precomputed Hankel terms (see
+    :func:`ts_helmholtz_precompute_source_2d`)."""
+
+    cdef:
+        int n
+        double rho_t, theta_t, phi, a_n
+        double complex d_rho, d_theta
+
+    rho_t = sqrt(
+            (target[0] - center[0]) * (target[0] - center[0])
+            + (target[1] - center[1]) * (target[1] - center[1]))
+    theta_t = atan2(target[1] - center[1], target[0] - center[0])
+    phi = atan2(source[1] - center[1], source[0] - center[0]) - theta_t
+
+    # derivatives of the expansion with respect to rho_t and theta_t
+    d_rho = 0
+    d_theta = 0
+    for n in range(order + 1):
+        a_n = 1 if n == 0 else 2
+        d_rho = d_rho + a_n * k * hvals[n * hstride] * jderivs[n] * cos(n * phi)
+        d_theta = d_theta + a_n * n * hvals[n * hstride] * jvals[n] * sin(n * phi)
+
+    grad[0] += 0.25j * charge * (
+            d_rho * cos(theta_t) - d_theta / rho_t * sin(theta_t))
+    grad[1] += 0.25j * charge * (
+            d_rho * sin(theta_t) + d_theta / rho_t * cos(theta_t))
+
+
+cdef double complex ts_helmholtz_d_2d(
+        double[3] source,
+        double[3] center,
+        double[3] target,
+        double[3] dipole,
+        double complex dipstr,
+        int order,
+        double complex k,
+        double complex[] jvals,
+        double complex[] hvals,
+        int hstride) nogil:
+    """Evaluate the target-specific expansion of the 2D Helmholtz double-layer
+    kernel, with precomputed Hankel terms (see
+    :func:`ts_helmholtz_precompute_source_2d`)."""
+
+    cdef:
+        int n
+        double rho_s, theta_s, phi, a_n
+        double complex d_rho, d_theta, hderiv
+
+    rho_s = sqrt(
+            (source[0] - center[0]) * (source[0] - center[0])
+            + (source[1] - center[1]) * (source[1] - center[1]))
+    theta_s = atan2(source[1] - center[1], source[0] - center[0])
+    phi = theta_s - atan2(target[1] - center[1], target[0] - center[0])
+
+    # derivatives of the expansion with respect to rho_s and theta_s
+    d_rho = 0
+    d_theta = 0
+    for n in range(order + 1):
+        a_n = 1 if n == 0 else 2
+        # H_{-1} = -H_1
+        if n == 0:
+            hderiv = -hvals[hstride]
+        else:
+            hderiv = (hvals[(n - 1) * hstride] - hvals[(n + 1) * hstride]) / 2
+
+        d_rho = d_rho + a_n * k * hderiv * jvals[n] * cos(n * phi)
+        d_theta = d_theta - a_n * n * hvals[n * hstride] * jvals[n] * sin(n * phi)
+
+    return 0.25j * dipstr * (
+            dipole[0] * (d_rho * cos(theta_s) - d_theta / rho_s * sin(theta_s))
+            + dipole[1] * (d_rho * sin(theta_s) + d_theta / rho_s * cos(theta_s)))
+
+# }}}
+
+
+# {{{ 2D dispatch
+
+cdef double complex ts_eval_2d(
+        double complex[3] grad,
+        double[3] source,
+        double[3] center,
+        double[3] target,
+        double[3] dipole,
+        double complex charge,
+        double complex dipstr,
+        int order,
+        double complex k,
+        double complex[] jvals,
+        double complex[] jderivs,
+        double complex[] hvals,
+        int hstride,
+        int laplace_s, int laplace_sp, int laplace_d, int laplace_dp,
+        int helmholtz_s, int helmholtz_sp, int helmholtz_d) nogil:
+    """Evaluate all requested 2D target-specific expansions for one
+    source-target pair. Gradients are added onto *grad*, the potential is
+    returned."""
+
+    cdef double complex result = 0
+
+    if laplace_s:
+        result = result + ts_laplace_s_2d(source, center, target, charge, order)
+
+    if laplace_sp:
+        ts_laplace_sp_2d(grad, source, center, target, charge, order)
+
+    if laplace_d:
+        result = result + ts_laplace_d_2d(
+                source, center, target, dipole, dipstr, order)
+
+    if laplace_dp:
+        ts_laplace_dp_2d(grad, source, center, target, dipole, dipstr, order)
+
+    if helmholtz_s:
+        result = result + ts_helmholtz_s_2d(
+                source, center, target, charge, order, jvals, hvals, hstride)
+
+    if helmholtz_sp:
+        ts_helmholtz_sp_2d(
+                grad, source, center, target, charge, order, k, jvals, jderivs,
+                hvals, hstride)
+
+    if helmholtz_d:
+        result = result + ts_helmholtz_d_2d(
+                source, center, target, dipole, dipstr, order, k, jvals,
+                hvals, hstride)
+
+    return result
+
+# }}}
+
+
+# {{{ scheduling
+
+# Number of centers per chunk for the "static" schedule
+STATIC_CHUNKSIZE = 128
+
+
+def center_source_counts(
+        qbx_centers, qbx_center_to_target_box,
+        source_box_starts, source_box_lists,
+        box_source_counts_nonchild):
+    """Count the sources in the neighbor boxes of the target box of each QBX
+    center.
+
+    Returns: an array of shape (*nqbx_centers*,)
+    """
+    source_counts = np.asarray(box_source_counts_nonchild)[
+            np.asarray(source_box_lists)]
+    source_counts_cumul = np.concatenate([[0], np.cumsum(source_counts)])
+    source_box_starts = np.asarray(source_box_starts)
+    nsources_per_target_box = (
+            source_counts_cumul[source_box_starts[1:]]
+            - source_counts_cumul[source_box_starts[:-1]])
+
+    target_boxes = np.asarray(qbx_center_to_target_box)[np.asarray(qbx_centers)]
+    return nsources_per_target_box[target_boxes]
+
+
+def estimate_center_work(
+        qbx_centers, qbx_center_to_target_box,
+        center_to_target_starts,
+        source_box_starts, source_box_lists,
+        box_source_counts_nonchild):
+    """Estimate the cost of evaluating TSQBX for each QBX center as the number
+    of targets associated with the center times the number of sources in the
+    neighbor boxes of its target box (plus one for the per-target setup).
+
+    Returns: an array of shape (*nqbx_centers*,)
+    """
+    ntargets = np.diff(np.asarray(center_to_target_starts))[
+            np.asarray(qbx_centers)]
+
+    return ntargets * (center_source_counts(
+        qbx_centers, qbx_center_to_target_box,
+        source_box_starts, source_box_lists,
+        box_source_counts_nonchild) + 1)
+
+
+def make_center_work_packets(work, nthreads, packets_per_thread=8):
+    """Group centers into packets of similar total *work*.
+
+    Centers are sorted by decreasing work, so that when packets are handed out
+    dynamically in order, the most expensive ones are started first and the
+    cheap ones fill in the remaining gaps.
+
+    Returns: a tuple *(center_order, packet_starts)* of :class:`numpy.int32`
+    arrays, where packet *i* consists of the centers
+    ``center_order[packet_starts[i]:packet_starts[i+1]]``
+    """
+    work = np.asarray(work, dtype=np.float64)
+    center_order = np.argsort(-work, kind="stable").astype(np.int32)
+
+    npackets = max(1, nthreads * packets_per_thread)
+    work_cumul = np.cumsum(work[center_order])
+    packet_work = max(work_cumul[-1] / npackets, 1) if len(work) else 1
+
+    cuts = np.searchsorted(
+            work_cumul, packet_work * np.arange(1, npackets), side="right")
+    packet_starts = np.unique(
+            np.concatenate([[0], cuts, [len(work)]])).astype(np.int32)
+
+    return center_order, packet_starts
+
+# }}}
+
+
 def eval_target_specific_qbx_locals(
         int ifpot,
         int ifgrad,
@@ -582,7 +1282,8 @@ def eval_target_specific_qbx_locals(
         double complex[:] dipstr,
         double[:,:] dipvec,
         double complex[:] pot,
-        double complex[:,:] grad):
+        double complex[:,:] grad,
+        schedule="static"):
     """TSQBX entry point.
 
     Arguments:
@@ -591,9 +1292,10 @@ def eval_target_specific_qbx_locals(
         ifcharge: Flag indicating whether to include monopole sources
         ifdipole: Flag indicating whether to include dipole sources
         order: Expansion order
-        sources: Array of sources of shape (3, *nsrcs*)
-        targets: Array of targets of shape (3, *ntgts*)
-        centers: Array of centers of shape (3, *nctrs*)
+        sources: Array of sources of shape (*dim*, *nsrcs*), where *dim* is
+            2 or 3
+        targets: Array of targets of shape (*dim*, *ntgts*)
+        centers: Array of centers of shape (*dim*, *nctrs*)
         qbx_centers: Array of subset of indices into *centers* which are QBX centers
         qbx_center_to_target_box: Array mapping centers to target box numbers
         center_to_target_starts: "Start" indices for center-to-target CSR list
@@ -605,9 +1307,18 @@ def eval_target_specific_qbx_locals(
         helmholtz_k: Helmholtz parameter (Pass 0 for Laplace)
         charge: (Complex) Source strengths, shape (*nsrcs*,), or *None*
         dipstr: (Complex) Dipole source strengths, shape (*nsrcs*,) or *None*
-        dipvec: (Real) Dipole source orientations, shape (3, *nsrcs*), or *None*
+        dipvec: (Real) Dipole source orientations, shape (*dim*, *nsrcs*), or
+            *None*
         pot: (Complex) Output potential, shape (*ngts*,), or *None*
-        grad: (Complex) Output gradient, shape (3, *ntgts*), or *None*
+        grad: (Complex) Output gradient, shape (*dim*, *ntgts*), or *None*
+        schedule: *"static"* to distribute fixed-size chunks of centers
+            evenly among threads, or *"balanced"* to distribute work
+            packets of similar estimated cost (see
+            :func:`make_center_work_packets`) dynamically
+
+    Returns:
+        An array of shape (*maxthreads*,) with the time (in seconds) each
+        thread spent evaluating, or *None* if there was nothing to evaluate.
     """
 
     cdef:
@@ -616,15 +1327,26 @@ def eval_target_specific_qbx_locals(
         int tgt_box, src_ibox
         int isrc_box, isrc_box_start, isrc_box_end
         int isrc, isrc_start, isrc_end
-        int tid, m
-        double jscale
+        int i, nsrc, hstride
+        int tid, m, dim
+        int ipacket, iictr, npackets
+        double jscale, t_start
+        int[:] center_order, packet_starts
+        double[:,:] busy
         double complex result
-        double[:,:] source, center, target, dipole
+        double[:,:] center, target
         double complex[:,:] result_grad, jvals, jderivs
+        double[:,:] gsources, gdipoles, ghscales, scratch
+        double complex[:,:] gcharges, gdipstrs, ghvals, ghderivs, cscratch
         int laplace_s, helmholtz_s, laplace_sp, helmholtz_sp, laplace_d, helmholtz_d
+        int laplace_dp
 
     # {{{ process arguments
 
+    dim = sources.shape[0]
+    if dim not in (2, 3):
+        raise ValueError(f"unsupported dimension: {dim}")
+
     if ifcharge:
         if charge is None:
             raise ValueError("Missing charge")
@@ -635,10 +1357,11 @@ def eval_target_specific_qbx_locals(
         if dipvec is None:
             raise ValueError("Missing dipvec")
 
-    if ifdipole and ifgrad:
-        raise ValueError("Does not support computing gradient of dipole sources")
+    if ifdipole and ifgrad and helmholtz_k != 0:
+        raise ValueError("Does not support computing gradient of Helmholtz "
+                "dipole sources")
 
-    laplace_s = laplace_sp = laplace_d = 0
+    laplace_s = laplace_sp = laplace_d = laplace_dp = 0
     helmholtz_s = helmholtz_sp = helmholtz_d = 0
 
     if helmholtz_k == 0:
@@ -648,6 +1371,7 @@ def eval_target_specific_qbx_locals(
 
         if ifgrad:
             laplace_sp = ifcharge
+            laplace_dp = ifdipole
 
     else:
         if ifpot:
@@ -660,8 +1384,8 @@ def eval_target_specific_qbx_locals(
     # }}}
 
     if not any([
-            laplace_s, laplace_sp, laplace_d, helmholtz_s, helmholtz_sp,
-            helmholtz_d]):
+            laplace_s, laplace_sp, laplace_d, laplace_dp,
+            helmholtz_s, helmholtz_sp, helmholtz_d]):
         return
 
     if qbx_centers.shape[0] == 0:
@@ -672,51 +1396,99 @@ def eval_target_specific_qbx_locals(
     # Hack to obtain thread-local storage
     maxthreads = openmp.omp_get_max_threads()
 
+    # Temporary arrays in this module that are limited by BUFSIZE overflow
+    # if the order is too high
+    if order + 2 > BUFSIZE:
+        raise ValueError(f"order {order} too high: must be at most "
+                f"{BUFSIZE - 2}")
+
+    # The sources in the neighborhood of a center are gathered into contiguous
+    # thread-local blocks, together with the source-dependent (but
+    # target-invariant) Hankel terms. The terms of order n for all sources of
+    # the block are stored contiguously at offset n * hstride.
+    hstride = max(1, np.max(center_source_counts(
+        qbx_centers, qbx_center_to_target_box,
+        source_box_starts, source_box_lists,
+        box_source_counts_nonchild)))
+
     # Prevent false sharing by padding the thread-local buffers
-    source = np.zeros((maxthreads, PADDING))
     target = np.zeros((maxthreads, PADDING))
     center = np.zeros((maxthreads, PADDING))
-    dipole = np.zeros((maxthreads, PADDING))
     result_grad = np.zeros((maxthreads, PADDING), dtype=np.complex)
     jvals = np.zeros((maxthreads, BUFSIZE + PADDING), dtype=np.complex)
     jderivs = np.zeros((maxthreads, BUFSIZE + PADDING), dtype=np.complex)
 
-    # TODO: Check that the order is not too high, since temporary
-    # arrays in this module that are limited by BUFSIZE may overflow
-    # if that is the case
+    gsources = np.zeros((maxthreads, 3 * hstride + PADDING))
+    gdipoles = np.zeros((maxthreads, 3 * hstride + PADDING))
+    gcharges = np.zeros((maxthreads, hstride + PADDING), dtype=np.complex)
+    gdipstrs = np.zeros((maxthreads, hstride + PADDING), dtype=np.complex)
+    ghscales = np.zeros((maxthreads, hstride + PADDING))
+    scratch = np.zeros((maxthreads, 6 * hstride + PADDING))
+    cscratch = np.zeros((maxthreads, hstride + PADDING), dtype=np.complex)
+
+    if helmholtz_s or helmholtz_sp or helmholtz_d:
+        ghvals = np.zeros(
+                (maxthreads, (order + 2) * hstride + PADDING), dtype=np.complex)
+        ghderivs = np.zeros(
+                (maxthreads, (order + 2) * hstride + PADDING), dtype=np.complex)
+    else:
+        ghvals = np.zeros((maxthreads, PADDING), dtype=np.complex)
+        ghderivs = ghvals
+
+    busy = np.zeros((maxthreads, PADDING))
 
     # }}}
 
-    for ictr in cython.parallel.prange(0, qbx_centers.shape[0],
-                                       nogil=True, schedule="static",
-                                       chunksize=128):
-        # Assign to jscale so Cython marks it as private
-        jscale = 0
-        ctr = qbx_centers[ictr]
-        itgt_start = center_to_target_starts[ctr]
-        itgt_end = center_to_target_starts[ctr + 1]
-        tgt_box = qbx_center_to_target_box[ctr]
+    # {{{ set up work packets
+
+    if schedule == "static":
+        center_order = np.arange(qbx_centers.shape[0], dtype=np.int32)
+        packet_starts = np.append(
+                np.arange(0, qbx_centers.shape[0], STATIC_CHUNKSIZE,
+                    dtype=np.int32),
+                np.int32(qbx_centers.shape[0]))
+        openmp.omp_set_schedule(openmp.omp_sched_static, 1)
+
+    elif schedule == "balanced":
+        work = estimate_center_work(
+                qbx_centers, qbx_center_to_target_box,
+                center_to_target_starts,
+                source_box_starts, source_box_lists,
+                box_source_counts_nonchild)
+        center_order, packet_starts = make_center_work_packets(
+                work, maxthreads)
+        openmp.omp_set_schedule(openmp.omp_sched_dynamic, 1)
+
+    else:
+        raise ValueError(f"unknown schedule: '{schedule}'")
+
+    npackets = packet_starts.shape[0] - 1
+
+    # }}}
+
+    for ipacket in cython.parallel.prange(0, npackets,
+                                          nogil=True, schedule="runtime"):
         tid = cython.parallel.threadid()
+        t_start = openmp.omp_get_wtime()
 
-        for m in range(3):
-            center[tid, m] = centers[m, ctr]
+        for iictr in range(packet_starts[ipacket], packet_starts[ipacket + 1]):
+            # Assign to jscale so Cython marks it as private
+            jscale = 0
+            ictr = center_order[iictr]
+            ctr = qbx_centers[ictr]
+            itgt_start = center_to_target_starts[ctr]
+            itgt_end = center_to_target_starts[ctr + 1]
+            tgt_box = qbx_center_to_target_box[ctr]
 
-        for itgt in range(itgt_start, itgt_end):
-            result = 0
-            tgt = center_to_target_lists[itgt]
+            for m in range(dim):
+                center[tid, m] = centers[m, ctr]
 
-            for m in range(3):
-                target[tid, m] = targets[m, tgt]
-                if ifgrad:
-                    result_grad[tid, m] = 0
+            # {{{ gather sources
 
-            if helmholtz_s or helmholtz_sp or helmholtz_d:
-                # Precompute source-invariant Helmholtz terms.
-                ts_helmholtz_precompute(
-                        &center[tid, 0], &target[tid, 0],
-                        order, ifgrad, helmholtz_k, &jvals[tid, 0],
-                        &jderivs[tid, 0], &jscale)
+            # NOTE: Don't use +=, since that makes Cython think we are
+            # doing an OpenMP reduction.
 
+            nsrc = 0
             isrc_box_start = source_box_starts[tgt_box]
             isrc_box_end = source_box_starts[tgt_box + 1]
 
@@ -726,60 +1498,138 @@ def eval_target_specific_qbx_locals(
                 isrc_end = isrc_start + box_source_counts_nonchild[src_ibox]
 
                 for isrc in range(isrc_start, isrc_end):
-
-                    for m in range(3):
-                        source[tid, m] = sources[m, isrc]
+                    for m in range(dim):
+                        gsources[tid, 3 * nsrc + m] = sources[m, isrc]
                         if ifdipole:
-                            dipole[tid, m] = dipvec[m, isrc]
+                            gdipoles[tid, 3 * nsrc + m] = dipvec[m, isrc]
 
-                    # NOTE: Don't use +=, since that makes Cython think we are
-                    # doing an OpenMP reduction.
+                    if ifcharge:
+                        gcharges[tid, nsrc] = charge[isrc]
+                    if ifdipole:
+                        gdipstrs[tid, nsrc] = dipstr[isrc]
 
-                    # {{{ evaluate potentials
+                    nsrc = nsrc + 1
 
-                    if laplace_s:
-                        result = result + (
-                                ts_laplace_s(
-                                    &source[tid, 0], &center[tid, 0], &target[tid, 0],
-                                    charge[isrc], order))
+            # }}}
+
+            # {{{ precompute target-invariant Hankel terms
 
-                    if laplace_sp:
-                        ts_laplace_sp(
+            if helmholtz_s or helmholtz_sp or helmholtz_d:
+                for i in range(nsrc):
+                    if dim == 2:
+                        ts_helmholtz_precompute_source_2d(
+                                &gsources[tid, 3 * i], &center[tid, 0],
+                                order, helmholtz_k, &ghvals[tid, i], hstride)
+                    else:
+                        ts_helmholtz_precompute_source(
+                                &gsources[tid, 3 * i], &center[tid, 0],
+                                order, helmholtz_d, helmholtz_k,
+                                &ghvals[tid, i], &ghderivs[tid, i], hstride,
+                                &ghscales[tid, i])
+
+            # }}}
+
+            for itgt in range(itgt_start, itgt_end):
+                result = 0
+                tgt = center_to_target_lists[itgt]
+
+                for m in range(dim):
+                    target[tid, m] = targets[m, tgt]
+                    if ifgrad:
+                        result_grad[tid, m] = 0
+
+                if (helmholtz_s or helmholtz_sp or helmholtz_d) and dim == 2:
+                    # Precompute source-invariant Helmholtz terms.
+                    ts_helmholtz_precompute_2d(
+                            &center[tid, 0], &target[tid, 0],
+                            order, helmholtz_k, &jvals[tid, 0],
+                            &jderivs[tid, 0])
+
+                elif helmholtz_s or helmholtz_sp or helmholtz_d:
+                    # Precompute source-invariant Helmholtz terms.
+                    ts_helmholtz_precompute(
+                            &center[tid, 0], &target[tid, 0],
+                            order, ifgrad, helmholtz_k, &jvals[tid, 0],
+                            &jderivs[tid, 0], &jscale)
+
+                if dim == 2:
+                    for i in range(nsrc):
+                        result = result + ts_eval_2d(
                                 &result_grad[tid, 0],
-                                &source[tid, 0], &center[tid, 0], &target[tid, 0],
-                                charge[isrc], order)
+                                &gsources[tid, 3 * i], &center[tid, 0],
+                                &target[tid, 0], &gdipoles[tid, 3 * i],
+                                gcharges[tid, i] if ifcharge else 0,
+                                gdipstrs[tid, i] if ifdipole else 0,
+                                order, helmholtz_k,
+                                &jvals[tid, 0], &jderivs[tid, 0],
+                                &ghvals[tid, i], hstride,
+                                laplace_s, laplace_sp, laplace_d, laplace_dp,
+                                helmholtz_s, helmholtz_sp, helmholtz_d)
+
+                else:
+                    # {{{ evaluate potentials
 
-                    if laplace_d:
-                        result = result + (
-                                ts_laplace_d(
-                                    &source[tid, 0], &center[tid, 0], &target[tid, 0],
-                                    &dipole[tid, 0], dipstr[isrc], order))
+                    if laplace_s:
+                        result = result + ts_laplace_s_block(
+                                nsrc, &gsources[tid, 0], &gcharges[tid, 0],
+                                &center[tid, 0], &target[tid, 0], order,
+                                &scratch[tid, 0], hstride)
 
                     if helmholtz_s:
-                        result = result + (
-                                ts_helmholtz_s(&source[tid, 0], &center[tid, 0],
-                                    &target[tid, 0], charge[isrc], order, helmholtz_k,
-                                    &jvals[tid, 0], jscale))
+                        result = result + ts_helmholtz_s_block(
+                                nsrc, &gsources[tid, 0], &gcharges[tid, 0],
+                                &center[tid, 0], &target[tid, 0],
+                                order, helmholtz_k, &jvals[tid, 0], jscale,
+                                &ghvals[tid, 0], &ghscales[tid, 0], hstride,
+                                &scratch[tid, 0], &cscratch[tid, 0])
+
+                    for i in range(nsrc):
+                        if laplace_sp:
+                            ts_laplace_sp(
+                                    &result_grad[tid, 0],
+                                    &gsources[tid, 3 * i], &center[tid, 0],
+                                    &target[tid, 0], gcharges[tid, i], order)
+
+                        if laplace_d:
+                            result = result + ts_laplace_d(
+                                    &gsources[tid, 3 * i], &center[tid, 0],
+                                    &target[tid, 0], &gdipoles[tid, 3 * i],
+                                    gdipstrs[tid, i], order)
+
+                        if laplace_dp:
+                            ts_laplace_dp(
+                                    &result_grad[tid, 0],
+                                    &gsources[tid, 3 * i], &center[tid, 0],
+                                    &target[tid, 0], &gdipoles[tid, 3 * i],
+                                    gdipstrs[tid, i], order)
+
+                        if helmholtz_sp:
+                            ts_helmholtz_sp(
+                                    &result_grad[tid, 0],
+                                    &gsources[tid, 3 * i], &center[tid, 0],
+                                    &target[tid, 0], gcharges[tid, i],
+                                    order, helmholtz_k,
+                                    &jvals[tid, 0], &jderivs[tid, 0], jscale,
+                                    &ghvals[tid, i], ghscales[tid, i], hstride)
+
+                        if helmholtz_d:
+                            result = result + ts_helmholtz_d(
+                                    &gsources[tid, 3 * i], &center[tid, 0],
+                                    &target[tid, 0], &gdipoles[tid, 3 * i],
+                                    gdipstrs[tid, i], order, helmholtz_k,
+                                    &jvals[tid, 0], jscale,
+                                    &ghvals[tid, i], &ghderivs[tid, i],
+                                    ghscales[tid, i], hstride)
 
-                    if helmholtz_sp:
-                        ts_helmholtz_sp(
-                                &result_grad[tid, 0],
-                                &source[tid, 0], &center[tid, 0], &target[tid, 0],
-                                charge[isrc], order, helmholtz_k,
-                                &jvals[tid, 0], &jderivs[tid, 0], jscale)
+                    # }}}
 
-                    if helmholtz_d:
-                        result = result + (
-                                ts_helmholtz_d(
-                                    &source[tid, 0], &center[tid, 0], &target[tid, 0],
-                                    &dipole[tid, 0], dipstr[isrc], order, helmholtz_k,
-                                    &jvals[tid, 0], jscale))
+                if ifpot:
+                    pot[tgt] = result
 
-                    # }}}
+                if ifgrad:
+                    for m in range(dim):
+                        grad[m, tgt] = result_grad[tid, m]
 
-            if ifpot:
-                pot[tgt] = result
+        busy[tid, 0] = busy[tid, 0] + (openmp.omp_get_wtime() - t_start)
 
-            if ifgrad:
-                for m in range(3):
-                    grad[m, tgt] = result_grad[tid, m]
+    return np.array(busy[:, 0])
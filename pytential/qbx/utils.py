@@ -122,6 +122,11 @@ class TreeWranglerBase:
     def queue(self):
         return self.array_context.queue
 
+    @property
+    def allocator(self):
+        from pytential.allocation import get_allocator
+        return get_allocator(self.array_context)
+
     def build_tree(self, places, targets_list=(), sources_list=(),
                    use_stage2_discr=False):
         tb = self.code_container.build_tree()
@@ -469,4 +474,136 @@ class ToHostTransferredGeoDataWrapper(FMMLibRotationDataInterface):
 
 # }}}
 
+
+# {{{ fused source strengths
+
+def _weighted_resampling_coo(actx, conn, weights):
+    r"""Assemble the resampling matrix of *conn*, with its rows scaled by
+    *weights*, in coordinate format.
+
+    :arg conn: a direct
+        :class:`~meshmode.discretization.connection.DiscretizationConnection`.
+    :arg weights: a :class:`numpy.ndarray` of shape ``(to_discr.ndofs,)``.
+    :returns: a tuple ``(rows, cols, values)`` of :class:`numpy.ndarray`\ s,
+        indexing flattened DOF arrays.
+    """
+    import modepy as mp
+
+    from_group_starts = np.cumsum(
+            [0] + [grp.ndofs for grp in conn.from_discr.groups])
+    to_group_starts = np.cumsum(
+            [0] + [grp.ndofs for grp in conn.to_discr.groups])
+
+    rows = []
+    cols = []
+    values = []
+    for igrp, cgrp in enumerate(conn.groups):
+        to_grp = conn.to_discr.groups[igrp]
+
+        for batch in cgrp.batches:
+            from_grp = conn.from_discr.groups[batch.from_group_index]
+            resample_mat = mp.resampling_matrix(
+                    from_grp.basis(), batch.result_unit_nodes, from_grp.unit_nodes)
+
+            from_el = actx.to_numpy(batch.from_element_indices)
+            to_el = actx.to_numpy(batch.to_element_indices)
+
+            batch_rows = (to_group_starts[igrp]
+                    + to_el.reshape(-1, 1) * to_grp.nunit_dofs
+                    + np.arange(to_grp.nunit_dofs))
+            batch_cols = (from_group_starts[batch.from_group_index]
+                    + from_el.reshape(-1, 1) * from_grp.nunit_dofs
+                    + np.arange(from_grp.nunit_dofs))
+
+            # (nelements, to_nunit_dofs, from_nunit_dofs)
+            shape = (len(to_el), to_grp.nunit_dofs, from_grp.nunit_dofs)
+            rows.append(np.broadcast_to(batch_rows[:, :, np.newaxis], shape))
+            cols.append(np.broadcast_to(batch_cols[:, np.newaxis, :], shape))
+            values.append(np.broadcast_to(resample_mat, shape))
+
+    rows = np.concatenate([r.ravel() for r in rows])
+    cols = np.concatenate([c.ravel() for c in cols])
+    values = np.concatenate([v.ravel() for v in values]) * weights[rows]
+
+    return rows, cols, values
+
+
+class SourceStrengthOperator:
+    """A sparse operator that maps a density to the source strengths of an FMM,
+    in tree order, by combining interpolation to the quadrature
+    discretization, multiplication by the quadrature weights and area
+    elements, and the permutation of the sources into tree order.
+
+    .. automethod:: __call__
+    """
+
+    def __init__(self, actx, coo, user_source_ids):
+        """
+        :arg coo: a tuple ``(rows, cols, values)``, as returned by
+            :func:`_weighted_resampling_coo`, with rows in user order.
+        :arg user_source_ids: the permutation from tree order to user order
+            of the sources, see :attr:`boxtree.Tree.user_source_ids`.
+        """
+        rows, cols, values = coo
+
+        nsources = len(user_source_ids)
+        user_to_tree = np.empty(nsources, dtype=np.int64)
+        user_to_tree[user_source_ids] = np.arange(nsources)
+
+        tree_rows = user_to_tree[rows]
+        order = np.argsort(tree_rows, kind="stable")
+
+        self.nsources = nsources
+        self.row_starts = actx.from_numpy(np.searchsorted(
+            tree_rows[order], np.arange(nsources + 1)).astype(np.int32))
+        self.col_indices = actx.from_numpy(cols[order].astype(np.int32))
+        self.values = actx.from_numpy(values[order])
+
+    def __call__(self, actx, density):
+        """
+        :arg density: a flattened :class:`pyopencl.array.Array`.
+        :returns: a :class:`pyopencl.array.Array` of source strengths in tree
+            order.
+        """
+        from pytools import memoize_in
+
+        @memoize_in(actx, (SourceStrengthOperator, "csr_matvec"))
+        def prg():
+            import loopy as lp
+            from loopy.version import MOST_RECENT_LANGUAGE_VERSION
+
+            knl = lp.make_kernel([
+                "{[isrc]: 0<=isrc<nsources}",
+                "{[inz]: row_start<=inz<row_end}",
+                ],
+                """
+                for isrc
+                    <> row_start = row_starts[isrc]
+                    <> row_end = row_starts[isrc + 1]
+                    result[isrc] = sum(inz, values[inz] * density[col_indices[inz]])
+                end
+                """, [
+                    lp.GlobalArg("density", None, shape=None),
+                    "..."
+                    ],
+                name="source_strengths_from_density",
+                lang_version=MOST_RECENT_LANGUAGE_VERSION)
+
+            return lp.split_iname(knl, "isrc", 128,
+                    outer_tag="g.0", inner_tag="l.0")
+
+        result = actx.empty(self.nsources,
+                dtype=np.result_type(self.values.dtype, density.dtype))
+
+        prg()(actx.queue,
+                row_starts=self.row_starts,
+                col_indices=self.col_indices,
+                values=self.values,
+                density=density,
+                result=result)
+
+        return result
+
+# }}}
+
 # vim: foldmethod=marker:filetype=pyopencl
@@ -29,15 +29,26 @@ __doc__ = """
 .. autoexception:: GMRESError
 
 .. autoclass:: ResidualPrinter
+
+.. autoclass:: BlockJacobiPreconditioner
+
+.. autofunction:: lu
+.. autofunction:: factorize
+.. autoclass:: DenseFactorization
 """
 
 
 import numpy as np
+import numpy.linalg as la
 from numbers import Number
 import pyopencl as cl
 import pyopencl.array  # noqa
 from meshmode.dof_array import obj_or_dof_array_vectorize_n_args, DOFArray
 from pytools.obj_array import obj_array_vectorize_n_args
+from pytools import memoize_in
+
+import logging
+logger = logging.getLogger(__name__)
 
 
 def structured_vdot(x, y):
@@ -261,11 +272,36 @@ class ResidualPrinter:
 
 # {{{ entrypoint
 
+class _RightPreconditionedOperator:
+    def __init__(self, op, preconditioner):
+        self.op = op
+        self.preconditioner = preconditioner
+
+    @property
+    def shape(self):
+        return self.op.shape
+
+    @property
+    def dtype(self):
+        return self.op.dtype
+
+    def matvec(self, x):
+        return _apply_operator(self.op, self.preconditioner(x))
+
+
+def _apply_operator(op, x):
+    if callable(op):
+        return op(x)
+    else:
+        return op.matvec(x)
+
+
 def gmres(op, rhs, restart=None, tol=None, x0=None,
         inner_product=structured_vdot,
         maxiter=None, hard_failure=None,
         no_progress_factor=None, stall_iterations=None,
-        callback=None, progress=False, require_monotonicity=True):
+        callback=None, progress=False, require_monotonicity=True,
+        preconditioner=None):
     """Solve a linear system Ax=b by means of GMRES
     with restarts.
 
@@ -281,6 +317,12 @@ def gmres(op, rhs, restart=None, tol=None, x0=None,
     :arg stall_iterations: Number of iterations with residual decrease
         below *no_progress_factor* indicates stall. Set to 0 to disable
         stall detection.
+    :arg preconditioner: a callable applying an approximate inverse
+        :math:`M^{-1}` of *op*, e.g. a :class:`BlockJacobiPreconditioner`.
+        It is used as a right preconditioner, i.e. GMRES is applied to
+        :math:`A M^{-1} y = b` and the solution is recovered as
+        :math:`x = M^{-1} y`, so that residual norms (and *tol*) still refer
+        to the original system.
 
     :return: a :class:`GMRESResult`
     """
@@ -290,13 +332,27 @@ def gmres(op, rhs, restart=None, tol=None, x0=None,
         else:
             callback = None
 
-    result = _gmres(op, rhs, restart=restart, tol=tol, x0=x0,
+    if preconditioner is not None:
+        if x0 is not None:
+            rhs = rhs - _apply_operator(op, x0)
+
+        op = _RightPreconditionedOperator(op, preconditioner)
+
+    result = _gmres(op, rhs, restart=restart, tol=tol,
+            x0=None if preconditioner is not None else x0,
             dot=inner_product,
             maxiter=maxiter, hard_failure=hard_failure,
             no_progress_factor=no_progress_factor,
             stall_iterations=stall_iterations, callback=callback,
             require_monotonicity=require_monotonicity)
 
+    if preconditioner is not None:
+        solution = preconditioner(result.solution)
+        if x0 is not None:
+            solution = x0 + solution
+
+        result = result.copy(solution=solution)
+
     return result
 
 # }}}
@@ -304,22 +360,483 @@ def gmres(op, rhs, restart=None, tol=None, x0=None,
 # }}}
 
 
+# {{{ block preconditioners
+
+class BlockJacobiPreconditioner:
+    r"""A block-Jacobi (or overlapping restricted additive Schwarz)
+    preconditioner for a scalar layer potential operator.
+
+    The discretization is split into blocks of nodes using
+    :func:`~pytential.linalg.proxy.partition_by_nodes` and the diagonal
+    blocks of the operator are assembled using
+    :class:`~pytential.symbolic.matrix.NearFieldBlockBuilder`. The blocks are
+    LU factored once on construction and the factors are then applied (by
+    forward and backward substitution, as in :func:`scipy.linalg.lu_solve`)
+    in a single batched kernel on the device.
+
+    The blocks are assembled directly on the discretization given by
+    *domain* (without oversampling to
+    :class:`~pytential.symbolic.primitives.QBX_SOURCE_QUAD_STAGE2`), so they
+    are only an approximation of the operator, which is sufficient for
+    preconditioning.
+
+    If *overlap* is *True*, each block is extended by the neighboring points
+    inside its proxy ball (see
+    :func:`~pytential.linalg.proxy.gather_block_neighbor_points`). The
+    extended blocks are factored, but only the rows corresponding to the
+    original (non-overlapping) block are kept, which results in a restricted
+    additive Schwarz preconditioner.
+
+    Instances are meant to be passed as the *preconditioner* to :func:`gmres`.
+
+    .. attribute:: shape
+    .. attribute:: dtype
+    .. attribute:: nblocks
+
+    .. automethod:: __call__
+    """
+
+    def __init__(self, actx, places, expr, input_expr,
+            domain=None, auto_where=None, context=None,
+            index_set=None, max_nodes_in_box=None,
+            overlap=False, radius_factor=None):
+        """
+        :arg actx: a :class:`~meshmode.array_context.PyOpenCLArrayContext`.
+        :arg places: a :class:`~pytential.GeometryCollection`.
+            Alternatively, any list or mapping that is a valid argument for its
+            constructor can also be used.
+        :arg expr: a scalar symbolic operator. It must be linear in
+            *input_expr* and only contain linear combinations of layer
+            potentials acting directly on *input_expr*.
+        :arg input_expr: the symbolic variable the operator acts on.
+        :arg domain: a :class:`~pytential.symbolic.primitives.DOFDescriptor`
+            for the discretization on which the density lives. Defaults
+            to the :attr:`~pytential.GeometryCollection.auto_source`
+            of *places*, on
+            :class:`~pytential.symbolic.primitives.QBX_SOURCE_STAGE1`.
+        :arg context: a mapping of additional kernel arguments.
+        :arg index_set: a :class:`sumpy.tools.BlockIndexRanges` describing a
+            partition of the nodes in *domain*. If not given, it is
+            constructed with :func:`~pytential.linalg.proxy.partition_by_nodes`
+            using *max_nodes_in_box*.
+        :arg overlap: if *True*, use overlapping blocks.
+        :arg radius_factor: passed to
+            :class:`~pytential.linalg.proxy.ProxyGenerator` to determine
+            the size of the overlap.
+        """
+
+        if context is None:
+            context = {}
+
+        from pytential import GeometryCollection
+        if not isinstance(places, GeometryCollection):
+            places = GeometryCollection(places, auto_where=auto_where)
+
+        if isinstance(expr, np.ndarray) and expr.dtype.char == "O":
+            raise NotImplementedError("block preconditioners for systems")
+
+        from pytential import sym
+        if domain is None:
+            domain = places.auto_source
+        domain = sym.as_dofdesc(domain)
+        if domain.discr_stage is None:
+            domain = domain.to_stage1()
+
+        discr = places.get_discretization(domain.geometry, domain.discr_stage)
+
+        from pytential.symbolic.execution import _prepare_expr
+        expr = _prepare_expr(places, expr, auto_where=(domain, domain))
+
+        # {{{ blocks
+
+        if index_set is None:
+            from pytential.linalg.proxy import partition_by_nodes
+            index_set = partition_by_nodes(actx, discr,
+                    max_nodes_in_box=max_nodes_in_box)
+
+        if overlap:
+            from pytential.linalg.proxy import (
+                    ProxyGenerator, gather_block_neighbor_points)
+            generator = ProxyGenerator(places, radius_factor=radius_factor)
+            _, _, pxycenters, pxyradii = generator(actx, domain, index_set)
+            neighbors = gather_block_neighbor_points(actx, discr,
+                    index_set, pxycenters, pxyradii,
+                    max_nodes_in_box=max_nodes_in_box)
+            neighbors = neighbors.get(actx.queue)
+        else:
+            neighbors = None
+
+        index_set = index_set.get(actx.queue)
+        if np.unique(index_set.indices).size != discr.ndofs:
+            raise ValueError("'index_set' must cover all the nodes in 'domain'")
+
+        row_indices = []
+        col_indices = []
+        for i in range(index_set.nblocks):
+            irow = index_set.block_indices(i)
+            row_indices.append(irow)
+
+            if neighbors is not None:
+                col_indices.append(np.hstack([irow, neighbors.block_indices(i)]))
+            else:
+                col_indices.append(irow)
+
+        from sumpy.tools import BlockIndexRanges, MatrixBlockIndexRanges
+
+        def make_block_index_ranges(indices):
+            ranges = np.cumsum([0] + [idx.size for idx in indices])
+            return BlockIndexRanges(actx.context,
+                    actx.freeze(actx.from_numpy(np.hstack(indices))),
+                    actx.freeze(actx.from_numpy(ranges)))
+
+        col_index_set = make_block_index_ranges(col_indices)
+        block_index_set = MatrixBlockIndexRanges(actx.context,
+                col_index_set, col_index_set)
+
+        from pytential.symbolic.matrix import NearFieldBlockBuilder
+        blk = NearFieldBlockBuilder(actx,
+                dep_expr=input_expr,
+                other_dep_exprs=[],
+                dep_source=places.get_geometry(domain.geometry),
+                dep_discr=discr,
+                places=places,
+                index_set=block_index_set,
+                context=context)(expr)
+
+        # }}}
+
+        # {{{ factor
+
+        block_index_set = block_index_set.get(actx.queue)
+
+        from scipy.linalg import lu_factor
+
+        factors = []
+        perms = []
+        for i in range(block_index_set.nblocks):
+            lu, piv = lu_factor(block_index_set.block_take(blk, i))
+
+            # NOTE: turn the LAPACK row interchanges into a permutation, so
+            # that the right-hand side can be gathered in one go
+            perm = np.arange(piv.size)
+            for irow, jrow in enumerate(piv):
+                perm[irow], perm[jrow] = perm[jrow], perm[irow]
+
+            factors.append(lu.reshape(-1))
+            perms.append(perm)
+
+        # }}}
+
+        self.array_context = actx
+        self.row_index_set = make_block_index_ranges(row_indices)
+        self.col_index_set = col_index_set
+        self.block_ranges = actx.freeze(actx.from_numpy(
+            np.cumsum([0] + [f.size for f in factors])))
+        self.blocks = actx.freeze(actx.from_numpy(np.hstack(factors)))
+        self.perms = actx.freeze(actx.from_numpy(np.hstack(perms)))
+
+        self.discr = discr
+        self.dtype = self.blocks.dtype
+        self.shape = (discr.ndofs, discr.ndofs)
+
+    @property
+    def nblocks(self):
+        return self.row_index_set.nblocks
+
+    def get_kernel(self):
+        @memoize_in(self.array_context, (BlockJacobiPreconditioner, "apply_knl"))
+        def knl():
+            import loopy as lp
+            from loopy.version import MOST_RECENT_LANGUAGE_VERSION
+
+            # NOTE: *blocks* contains the combined LU factors (with a unit
+            # lower triangle) of each block, as returned by
+            # scipy.linalg.lu_factor, and *work* holds the solution of each
+            # block, of which only the first *nrows* entries are kept
+            loopy_knl = lp.make_kernel([
+                "{[irange]: 0 <= irange < nranges}",
+                "{[i]: 0 <= i < ncols}",
+                "{[k, l]: 0 <= k < ncols and 0 <= l < k}",
+                "{[kb, lb]: 0 <= kb < ncols and ncols - kb <= lb < ncols}",
+                "{[irow]: 0 <= irow < nrows}",
+                ],
+                """
+                for irange
+                    <> rowstart = rowranges[irange]
+                    <> nrows = rowranges[irange + 1] - rowstart
+                    <> colstart = colranges[irange]
+                    <> ncols = colranges[irange + 1] - colstart
+                    <> blkstart = blkranges[irange]
+
+                    for i
+                        work[colstart + i] = \
+                            x[colindices[colstart + perms[colstart + i]]] \
+                            {id=gather}
+                    end
+
+                    for k, l
+                        work[colstart + k] = work[colstart + k] \
+                            - blocks[blkstart + k * ncols + l] \
+                            * work[colstart + l] \
+                            {id=forward, dep=gather}
+                    end
+
+                    for kb
+                        for lb
+                            work[colstart + ncols - 1 - kb] = \
+                                work[colstart + ncols - 1 - kb] \
+                                - blocks[blkstart \
+                                    + (ncols - 1 - kb) * ncols + lb] \
+                                * work[colstart + lb] \
+                                {id=backward, dep=forward}
+                        end
+
+                        work[colstart + ncols - 1 - kb] = \
+                            work[colstart + ncols - 1 - kb] \
+                            / blocks[blkstart + (ncols - 1 - kb) * (ncols + 1)] \
+                            {id=diagonal, dep=backward:forward}
+                    end
+
+                    for irow
+                        result[rowindices[rowstart + irow]] = \
+                            work[colstart + irow] {dep=diagonal}
+                    end
+                end
+                """,
+                [
+                    lp.GlobalArg("x", None, shape="n"),
+                    lp.GlobalArg("result", None, shape="n"),
+                    lp.GlobalArg("work", None, shape="nwork"),
+                    lp.ValueArg("n", np.int32),
+                    lp.ValueArg("nwork", np.int32),
+                    "..."
+                ],
+                name="apply_block_jacobi",
+                lang_version=MOST_RECENT_LANGUAGE_VERSION)
+
+            loopy_knl = lp.split_iname(loopy_knl, "irange", 128, outer_tag="g.0")
+            return loopy_knl
+
+        return knl()
+
+    def __call__(self, x):
+        """Apply the preconditioner to *x*, which can be a flat
+        :class:`numpy.ndarray` or :class:`pyopencl.array.Array`, or a
+        :class:`~meshmode.dof_array.DOFArray`. The result has the same type.
+        """
+        actx = self.array_context
+
+        if isinstance(x, np.ndarray) and x.dtype.char != "O":
+            x_flat = actx.from_numpy(x)
+        elif isinstance(x, cl.array.Array):
+            x_flat = x
+        elif isinstance(x, DOFArray):
+            from meshmode.dof_array import flatten
+            x_flat = flatten(x)
+        else:
+            raise TypeError(f"unsupported input type: '{type(x).__name__}'")
+
+        dtype = np.result_type(self.dtype, x_flat.dtype)
+        _, (result, _) = self.get_kernel()(actx.queue,
+                x=x_flat,
+                result=actx.empty(self.shape[0], dtype=dtype),
+                work=actx.empty(self.col_index_set.indices.size, dtype=dtype),
+                blocks=self.blocks,
+                perms=self.perms,
+                blkranges=self.block_ranges,
+                rowindices=self.row_index_set.indices,
+                rowranges=self.row_index_set.ranges,
+                colindices=self.col_index_set.indices,
+                colranges=self.col_index_set.ranges)
+
+        if isinstance(x, np.ndarray):
+            return actx.to_numpy(result)
+        elif isinstance(x, DOFArray):
+            from meshmode.dof_array import unflatten
+            return unflatten(actx, self.discr, result)
+        else:
+            return result
+
+    matvec = __call__
+
+# }}}
+
+
 # {{{ direct solve
 
-def lu(op, rhs, show_spectrum=False):
-    import numpy.linalg as la
+class DenseFactorization:
+    """A factorization of a dense operator matrix, reusable for any number
+    of right-hand sides. The factorizations are computed by
+    :mod:`scipy.linalg`.
+
+    .. attribute:: matrix
+
+        The assembled matrix, as a :class:`numpy.ndarray`.
+
+    .. attribute:: method
+
+        The factorization that is used, one of ``"lu"`` or ``"qr"``.
+
+    .. attribute:: condition_number
+
+        An estimate of the 2-norm condition number of :attr:`matrix`, or
+        *None* if it was not requested.
+
+    .. automethod:: solve
+    """
+
+    def __init__(self, mat, method="lu", estimate_condition_number=False):
+        if method == "lu":
+            from scipy.linalg import lu_factor
+            self._factors = lu_factor(mat)
+        elif method == "qr":
+            from scipy.linalg import qr
+            self._factors = qr(mat)
+        else:
+            raise ValueError(f"unknown factorization method: '{method}'")
+
+        if estimate_condition_number:
+            self.condition_number = la.cond(mat)
+        else:
+            self.condition_number = None
+
+        self.matrix = mat
+        self.method = method
+
+    def solve(self, rhs):
+        """
+        :arg rhs: a :class:`numpy.ndarray` of shape ``(n,)`` or
+            ``(n, nrhs)``.
+        """
+        if self.method == "lu":
+            from scipy.linalg import lu_solve
+            return lu_solve(self._factors, rhs)
+        elif self.method == "qr":
+            from scipy.linalg import solve_triangular
+            q, r = self._factors
+            return solve_triangular(r, q.T.conj() @ rhs)
+        else:
+            raise AssertionError()
+
+
+def factorize(op, method="lu", estimate_condition_number=False):
+    """Assemble the dense matrix of *op* and factor it.
+
+    If *op* is obtained from
+    :meth:`~pytential.symbolic.execution.BoundExpression.scipy_op`, the
+    matrix is assembled directly using
+    :func:`~pytential.symbolic.execution.build_matrix` and the
+    factorization is cached on the bound expression, so that subsequent
+    calls with the same arguments reuse it. Otherwise (or if the operator
+    has scalar unknowns or contains expressions that
+    :class:`~pytential.symbolic.matrix.MatrixBuilder` does not support),
+    the matrix is assembled by applying *op* to each unit vector.
+
+    :arg method: one of ``"lu"`` or ``"qr"``.
+    :arg estimate_condition_number: if *True*, also compute
+        :attr:`DenseFactorization.condition_number`. This has a cost
+        comparable to the factorization itself.
+    :return: a :class:`DenseFactorization`.
+    """
+
+    from pytential.symbolic.execution import MatVecOp
+    if not isinstance(op, MatVecOp) or op.domains is None:
+        from sumpy.tools import build_matrix
+        return DenseFactorization(build_matrix(op),
+                method=method,
+                estimate_condition_number=estimate_condition_number)
+
+    bound_expr = op.bound_expr
+    cache = bound_expr._get_cache("direct_solver")
+
+    try:
+        key = (op.arg_name, tuple(op.domains), method,
+                frozenset(op.extra_args.items()))
+        hash(key)
+    except TypeError:
+        # NOTE: array-valued arguments are not hashable, so we cannot cache
+        key = None
+
+    if key is not None and key in cache:
+        result = cache[key]
+        if estimate_condition_number and result.condition_number is None:
+            result.condition_number = la.cond(result.matrix)
+
+        return result
+
+    mat = None
+
+    # NOTE: scalar unknowns (a *None* domain) have no discretization, so
+    # the MatrixBuilder cannot assemble their columns
+    if all(domain is not None for domain in op.domains):
+        from pytential import sym
+        if op._operator_uses_obj_array:
+            input_exprs = sym.make_sym_vector(op.arg_name, len(op.discrs))
+        else:
+            input_exprs = sym.var(op.arg_name)
+
+        from pytential.symbolic.execution import _build_matrix
+        actx = op.array_context
+        try:
+            mat = actx.to_numpy(_build_matrix(actx,
+                bound_expr.places, bound_expr.sym_op_expr, input_exprs,
+                domains=op.domains, context=op.extra_args))
+        except NotImplementedError as exc:
+            logger.info("cannot assemble matrix directly (%s), "
+                    "falling back to applying the operator", exc)
+
+    if mat is None:
+        from sumpy.tools import build_matrix
+        mat = build_matrix(op)
+
+    result = DenseFactorization(mat,
+            method=method,
+            estimate_condition_number=estimate_condition_number)
+
+    if key is not None:
+        cache[key] = result
 
-    from sumpy.tools import build_matrix
-    mat = build_matrix(op)
+    return result
+
+
+def lu(op, rhs, show_spectrum=False,
+        method="lu", estimate_condition_number=False):
+    """Solve a linear system :math:`Ax = b` using a direct solver. The
+    factorization of the matrix is obtained from :func:`factorize`, so it is
+    reused for subsequent right-hand sides.
+
+    :arg rhs: the right-hand side. If *op* is obtained from
+        :meth:`~pytential.symbolic.execution.BoundExpression.scipy_op`,
+        it can be any of the inputs supported by its ``matvec`` and
+        the solution is returned in the same format. Otherwise, it is
+        expected to be a :class:`numpy.ndarray`.
+    """
+
+    fact = factorize(op,
+            method=method,
+            estimate_condition_number=estimate_condition_number)
+
+    if fact.condition_number is not None:
+        logger.info("condition number: %.5e", fact.condition_number)
 
-    print(f"condition number: {la.cond(mat)}")
     if show_spectrum:
-        ev = la.eigvals(mat)
+        ev = la.eigvals(fact.matrix)
         import matplotlib.pyplot as pt
         pt.plot(ev.real, ev.imag, "o")
         pt.show()
 
-    return la.solve(mat, rhs)
+    from pytential.symbolic.execution import MatVecOp
+    if not isinstance(op, MatVecOp):
+        return fact.solve(rhs)
+
+    actx = op.array_context
+    if isinstance(rhs, np.ndarray) and rhs.dtype.char != "O":
+        return fact.solve(rhs)
+    elif isinstance(rhs, cl.array.Array):
+        return actx.from_numpy(fact.solve(actx.to_numpy(rhs)))
+    else:
+        result = fact.solve(actx.to_numpy(op.flatten(rhs)))
+        return op.unflatten(actx.from_numpy(result))
 
 # }}}
 
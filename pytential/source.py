@@ -21,9 +21,7 @@ THE SOFTWARE.
 """
 
 import numpy as np
-import pyopencl as cl
 from pytools import memoize_in
-from sumpy.fmm import UnableToCollectTimingData
 
 
 __doc__ = """
@@ -33,6 +31,16 @@ __doc__ = """
 """
 
 
+def __getattr__(name):
+    # NOTE: re-exported for backwards compatibility, without importing
+    # sumpy's FMM (and with it, pyopencl) along with this module
+    if name == "UnableToCollectTimingData":
+        from sumpy.fmm import UnableToCollectTimingData
+        return UnableToCollectTimingData
+
+    raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
+
+
 class PotentialSource:
     """
     .. automethod:: preprocess_optemplate
@@ -78,22 +86,124 @@ class _SumpyP2PMixin:
         return p2p(kernels)
 
 
+class _SumpyFMMMixin:
+
+    def get_fmm_kernel(self, kernels):
+        fmm_kernel = None
+
+        from sumpy.kernel import AxisTargetDerivativeRemover
+        for knl in kernels:
+            candidate_fmm_kernel = AxisTargetDerivativeRemover()(knl)
+
+            if fmm_kernel is None:
+                fmm_kernel = candidate_fmm_kernel
+            else:
+                assert fmm_kernel == candidate_fmm_kernel
+
+        return fmm_kernel
+
+    def get_fmm_output_and_expansion_dtype(self, base_kernel, strengths):
+        if base_kernel.is_complex_valued or _entry_dtype(strengths).kind == "c":
+            return self.complex_dtype
+        else:
+            return self.real_dtype
+
+    def get_fmm_expansion_wrangler_extra_kwargs(
+            self, actx, out_kernels, tree_user_source_ids, arguments, evaluator):
+        # This contains things like the Helmholtz parameter k or
+        # the normal directions for double layers.
+
+        import pyopencl.array as cla
+        queue = actx.queue
+
+        def reorder_sources(source_array):
+            if isinstance(source_array, cla.Array):
+                return (source_array
+                        .with_queue(queue)
+                        [tree_user_source_ids]
+                        .with_queue(None))
+            else:
+                return source_array
+
+        kernel_extra_kwargs = {}
+        source_extra_kwargs = {}
+
+        from sumpy.tools import gather_arguments, gather_source_arguments
+        from pytools.obj_array import obj_array_vectorize
+        from pytential.utils import flatten_if_needed
+
+        for func, var_dict in [
+                (gather_arguments, kernel_extra_kwargs),
+                (gather_source_arguments, source_extra_kwargs),
+                ]:
+            for arg in func(out_kernels):
+                var_dict[arg.name] = obj_array_vectorize(
+                        reorder_sources,
+                        flatten_if_needed(actx, evaluator(arguments[arg.name])))
+
+        return kernel_extra_kwargs, source_extra_kwargs
+
+
 # {{{ point potential source
 
-class PointPotentialSource(_SumpyP2PMixin, PotentialSource):
+class PointPotentialSource(_SumpyP2PMixin, _SumpyFMMMixin, PotentialSource):
     """
     .. attribute:: nodes
 
         An :class:`pyopencl.array.Array` of shape ``[ambient_dim, ndofs]``.
 
     .. attribute:: ndofs
+    .. attribute:: fmm_level_to_order
+    .. attribute:: fmm_threshold
+
+        Potentials are evaluated using an FMM if :attr:`fmm_level_to_order`
+        is not *False* and the number of source-target pairs of a layer
+        potential instruction exceeds this value. Otherwise they are evaluated
+        directly.
 
     .. automethod:: cost_model_compute_potential_insn
     .. automethod:: exec_compute_potential_insn
     """
 
-    def __init__(self, nodes):
+    def __init__(self, nodes,
+            fmm_order=False,
+            fmm_level_to_order=None,
+            expansion_factory=None,
+            fmm_threshold=10**7,
+            cost_model=None,
+            # begin undocumented arguments
+            debug=False):
+        """
+        :arg fmm_order: `False` for direct calculation.
+        :arg cost_model: a :class:`boxtree.cost.AbstractFMMCostModel` used for
+            :meth:`cost_model_compute_potential_insn`. Defaults to
+            :class:`boxtree.cost.FMMCostModel`.
+        """
         self._nodes = nodes
+        self.debug = debug
+
+        if fmm_order is not False and fmm_level_to_order is not None:
+            raise TypeError("may not specify both fmm_order and fmm_level_to_order")
+
+        if fmm_level_to_order is None:
+            if fmm_order is not False:
+                def fmm_level_to_order(kernel, kernel_args, tree, level):  # noqa pylint:disable=function-redefined
+                    return fmm_order
+            else:
+                fmm_level_to_order = False
+
+        self.fmm_level_to_order = fmm_level_to_order
+        self.fmm_threshold = fmm_threshold
+
+        if expansion_factory is None:
+            from sumpy.expansion import DefaultExpansionFactory
+            expansion_factory = DefaultExpansionFactory()
+        self.expansion_factory = expansion_factory
+
+        if cost_model is None:
+            from boxtree.cost import FMMCostModel
+            cost_model = FMMCostModel()
+        self.cost_model = cost_model
 
     @property
     def points(self):
@@ -135,19 +245,153 @@ class PointPotentialSource(_SumpyP2PMixin, PotentialSource):
 
         return result
 
+    # {{{ fmm setup
+
+    def expansion_wrangler_code_container(self, actx, fmm_kernel, out_kernels):
+        @memoize_in(self, (PointPotentialSource, "wrangler_code_container"))
+        def make_container(context, fmm_kernel, out_kernels):
+            mpole_expn_class = \
+                    self.expansion_factory.get_multipole_expansion_class(fmm_kernel)
+            local_expn_class = \
+                    self.expansion_factory.get_local_expansion_class(fmm_kernel)
+
+            from functools import partial
+            from sumpy.fmm import SumpyExpansionWranglerCodeContainer
+            return SumpyExpansionWranglerCodeContainer(
+                    context,
+                    partial(mpole_expn_class, fmm_kernel),
+                    partial(local_expn_class, fmm_kernel),
+                    out_kernels)
+
+        return make_container(actx.context, fmm_kernel, out_kernels)
+
+    def fmm_geometry_data(self, actx, targets):
+        """
+        :arg targets: a tuple of
+            :class:`meshmode.discretization.Discretization`
+            or
+            :class:`pytential.target.TargetBase`
+            instances
+        :returns: a tree and traversal of the nodes of *self* and *targets*,
+            cached per array context and tuple of targets.
+        """
+        @memoize_in(self, (PointPotentialSource, "fmm_geometry_data"))
+        def make_geometry_data(actx, targets):
+            from pytential.unregularized import (
+                    _FMMGeometryData, _FMMGeometryDataCodeContainer)
+            return _FMMGeometryData(
+                    self,
+                    _FMMGeometryDataCodeContainer(
+                        actx, self.ambient_dim, self.debug),
+                    targets,
+                    self.debug)
+
+        return make_geometry_data(actx, targets)
+
+    def _get_targets(self, insn, bound_expr):
+        target_name_to_index = {}
+        targets = []
+
+        for o in insn.outputs:
+            if o.target_name in target_name_to_index:
+                continue
+
+            target_name_to_index[o.target_name] = len(targets)
+            targets.append(bound_expr.places.get_discretization(
+                o.target_name.geometry, o.target_name.discr_stage))
+
+        return target_name_to_index, tuple(targets)
+
+    def _use_fmm(self, targets):
+        if self.fmm_level_to_order is False:
+            return False
+
+        ntargets = sum(target.ndofs for target in targets)
+        return self.ndofs * ntargets > self.fmm_threshold
+
+    # }}}
+
+    # {{{ execution
+
     def cost_model_compute_potential_insn(self, actx, insn, bound_expr,
-                                          evaluate, costs):
+                                          evaluate, calibration_params, per_box):
+        """Using :attr:`cost_model`, evaluate the cost of executing *insn* with
+        an FMM. Direct evaluation is modeled as ``c_p2p`` times the number of
+        source-target pairs in the ``"eval_direct"`` stage.
+
+        :arg calibration_params: a :class:`dict` of calibration parameters,
+            mapping from parameter names to calibration values.
+        :arg per_box: if *True*, the result is an array with the cost of all
+            stages for each box. Otherwise, it is a :class:`dict` mapping
+            stage names to their predicted cost.
+
+        :returns: a tuple ``(results, (cost_model_result, metadata))``,
+            where *results* assigns zero to all outputs.
+        """
+        _, targets = self._get_targets(insn, bound_expr)
+        zero_results = [(o.name, 0) for o in insn.outputs]
+
+        if not self._use_fmm(targets):
+            if per_box:
+                raise NotImplementedError("per-box modeling of direct evaluation")
+
+            ntargets = sum(target.ndofs for target in targets)
+            metadata = {"nsources": self.ndofs, "ntargets": ntargets}
+            cost_model_result = {
+                    "eval_direct": (
+                        calibration_params["c_p2p"] * self.ndofs * ntargets)
+                    }
+
+            return zero_results, (cost_model_result, metadata)
+
+        geo_data = self.fmm_geometry_data(actx, targets)
+        tree = geo_data.tree()
+        traversal = geo_data.traversal()
+
+        fmm_kernel = self.get_fmm_kernel(insn.kernels)
+        kernel_args = {
+                arg_name: evaluate(arg_expr)
+                for arg_name, arg_expr in insn.kernel_arguments.items()}
+        level_to_order = [
+                self.fmm_level_to_order(
+                    fmm_kernel.get_base_kernel(), kernel_args, tree, ilevel)
+                for ilevel in range(tree.nlevels)]
+
+        ndirect_sources_per_target_box = (
+                self.cost_model.get_ndirect_sources_per_target_box(
+                    actx.queue, traversal))
+
+        if per_box:
+            cost_model_result = self.cost_model.cost_per_box(
+                    actx.queue, traversal, level_to_order, calibration_params,
+                    ndirect_sources_per_target_box=ndirect_sources_per_target_box)
+        else:
+            cost_model_result = self.cost_model.cost_per_stage(
+                    actx.queue, traversal, level_to_order, calibration_params,
+                    ndirect_sources_per_target_box=ndirect_sources_per_target_box)
+
+        metadata = {
+                "nlevels": tree.nlevels,
+                "nsources": tree.nsources,
+                "ntargets": tree.ntargets,
+                }
+        for ilevel in range(tree.nlevels):
+            metadata[f"p_fmm_lev{ilevel}"] = level_to_order[ilevel]
+
+        return zero_results, (cost_model_result, metadata)
+
+    def memory_model_compute_potential_insn(self, actx, insn, bound_expr,
+                                            evaluate):
         raise NotImplementedError
 
     def exec_compute_potential_insn(self, actx, insn, bound_expr, evaluate,
             return_timing_data):
-        if return_timing_data:
-            from warnings import warn
-            warn(
-                   "Timing data collection not supported.",
-                   category=UnableToCollectTimingData)
-
-        p2p = None
+        """Evaluate all outputs of *insn* at once: by a single FMM over all
+        targets if there are more than :attr:`fmm_threshold` source-target
+        pairs, or by a single direct evaluation otherwise.
+        """
+        target_name_to_index, targets = self._get_targets(insn, bound_expr)
+        geo_data = self.fmm_geometry_data(actx, targets)
 
         kernel_args = {}
         for arg_name, arg_expr in insn.kernel_arguments.items():
@@ -155,39 +399,86 @@ class PointPotentialSource(_SumpyP2PMixin, PotentialSource):
 
         strengths = evaluate(insn.density)
 
-        # FIXME: Do this all at once
-        results = []
-        for o in insn.outputs:
-            target_discr = bound_expr.places.get_discretization(
-                    o.target_name.geometry, o.target_name.discr_stage)
+        if self._use_fmm(targets):
+            output_for_each_kernel, timing_data = self._exec_fmm(
+                    actx, insn, geo_data, strengths, evaluate,
+                    return_timing_data)
+        else:
+            if return_timing_data:
+                from sumpy.fmm import UnableToCollectTimingData
+                from warnings import warn
+                warn(
+                       "Timing data collection not supported.",
+                       category=UnableToCollectTimingData)
 
             # no on-disk kernel caching
-            if p2p is None:
-                p2p = self.get_p2p(actx, insn.kernels)
-
-            from pytential.utils import flatten_if_needed
+            p2p = self.get_p2p(actx, insn.kernels)
             evt, output_for_each_kernel = p2p(actx.queue,
-                    flatten_if_needed(actx, target_discr.nodes()),
+                    geo_data.target_info().targets,
                     self._nodes,
                     [strengths], **kernel_args)
 
+            timing_data = {}
+
+        results = []
+        for o in insn.outputs:
+            target_index = target_name_to_index[o.target_name]
+            target_slice = slice(*geo_data.target_info().target_discr_starts[
+                    target_index:target_index+2])
+            target_discr = targets[target_index]
+
+            result = output_for_each_kernel[o.kernel_index][target_slice]
+
             from meshmode.discretization import Discretization
-            result = output_for_each_kernel[o.kernel_index]
             if isinstance(target_discr, Discretization):
                 from meshmode.dof_array import unflatten
                 result = unflatten(actx, target_discr, result)
 
             results.append((o.name, result))
 
-        timing_data = {}
         return results, timing_data
 
+    def _exec_fmm(self, actx, insn, geo_data, strengths, evaluate,
+            return_timing_data):
+        out_kernels = tuple(insn.kernels)
+        fmm_kernel = self.get_fmm_kernel(out_kernels)
+        output_and_expansion_dtype = (
+                self.get_fmm_output_and_expansion_dtype(fmm_kernel, strengths))
+        kernel_extra_kwargs, source_extra_kwargs = (
+                self.get_fmm_expansion_wrangler_extra_kwargs(
+                    actx, out_kernels, geo_data.tree().user_source_ids,
+                    insn.kernel_arguments, evaluate))
+
+        wrangler = geo_data.get_wrangler(
+                actx,
+                self.expansion_wrangler_code_container(
+                    actx, fmm_kernel, out_kernels),
+                output_and_expansion_dtype,
+                self.fmm_level_to_order,
+                source_extra_kwargs=source_extra_kwargs,
+                kernel_extra_kwargs=kernel_extra_kwargs)
+
+        if return_timing_data:
+            timing_data = {}
+        else:
+            timing_data = None
+
+        from boxtree.fmm import drive_fmm
+        output_for_each_kernel = drive_fmm(
+                geo_data.traversal(), wrangler, (strengths,),
+                timing_data=timing_data)
+
+        return output_for_each_kernel, timing_data
+
+    # }}}
+
 # }}}
 
 
 # {{{ layer potential source
 
 def _entry_dtype(ary):
+    import pyopencl.array as cla
     from meshmode.dof_array import DOFArray
     if isinstance(ary, DOFArray):
         # the "normal case"
@@ -198,14 +489,15 @@ def _entry_dtype(ary):
             return single_valued(_entry_dtype(entry) for entry in ary.flat)
         else:
             return ary.dtype
-    elif isinstance(ary, cl.array.Array):
+    elif isinstance(ary, cla.Array):
         # for "unregularized" layer potential sources
         return ary.dtype
     else:
         raise TypeError(f"unexpected type '{type(ary)}' in _entry_dtype")
 
 
-class LayerPotentialSourceBase(_SumpyP2PMixin, PotentialSource):
+class LayerPotentialSourceBase(_SumpyP2PMixin, _SumpyFMMMixin,
+        PotentialSource):
     """A discretization of a layer potential using panel-based geometry, with
     support for refinement and upsampling.
 
@@ -218,6 +510,10 @@ class LayerPotentialSourceBase(_SumpyP2PMixin, PotentialSource):
     .. attribute:: real_dtype
     .. attribute:: complex_dtype
 
+    .. rubric:: Geometry helpers
+
+    .. automethod:: evaluate_geometry_expr
+    .. automethod:: weights_and_area_elements
     """
 
     def __init__(self, density_discr):
@@ -247,61 +543,30 @@ class LayerPotentialSourceBase(_SumpyP2PMixin, PotentialSource):
     def complex_dtype(self):
         return self.density_discr.complex_dtype
 
-    # {{{ fmm setup helpers
-
-    def get_fmm_kernel(self, kernels):
-        fmm_kernel = None
-
-        from sumpy.kernel import AxisTargetDerivativeRemover
-        for knl in kernels:
-            candidate_fmm_kernel = AxisTargetDerivativeRemover()(knl)
-
-            if fmm_kernel is None:
-                fmm_kernel = candidate_fmm_kernel
-            else:
-                assert fmm_kernel == candidate_fmm_kernel
-
-        return fmm_kernel
-
-    def get_fmm_output_and_expansion_dtype(self, base_kernel, strengths):
-        if base_kernel.is_complex_valued or _entry_dtype(strengths).kind == "c":
-            return self.complex_dtype
-        else:
-            return self.real_dtype
-
-    def get_fmm_expansion_wrangler_extra_kwargs(
-            self, actx, out_kernels, tree_user_source_ids, arguments, evaluator):
-        # This contains things like the Helmholtz parameter k or
-        # the normal directions for double layers.
-
-        queue = actx.queue
-
-        def reorder_sources(source_array):
-            if isinstance(source_array, cl.array.Array):
-                return (source_array
-                        .with_queue(queue)
-                        [tree_user_source_ids]
-                        .with_queue(None))
-            else:
-                return source_array
-
-        kernel_extra_kwargs = {}
-        source_extra_kwargs = {}
-
-        from sumpy.tools import gather_arguments, gather_source_arguments
-        from pytools.obj_array import obj_array_vectorize
-        from pytential.utils import flatten_if_needed
-
-        for func, var_dict in [
-                (gather_arguments, kernel_extra_kwargs),
-                (gather_source_arguments, source_extra_kwargs),
-                ]:
-            for arg in func(out_kernels):
-                var_dict[arg.name] = obj_array_vectorize(
-                        reorder_sources,
-                        flatten_if_needed(actx, evaluator(arguments[arg.name])))
-
-        return kernel_extra_kwargs, source_extra_kwargs
+    # {{{ geometry helpers
+
+    def evaluate_geometry_expr(self, actx, places, expr):
+        """Evaluate *expr*, which may only depend on the geometry in *places*.
+        The bound expression is cached in *places*, so that it is not rebound
+        for every evaluation of a layer potential.
+        """
+        bound_op_cache = places._get_cache("bound_op")
+        try:
+            bound_op = bound_op_cache[expr]
+        except KeyError:
+            from pytential import bind
+            bound_op = bind(places, expr)
+            bound_op_cache[expr] = bound_op
+
+        return bound_op(actx)
+
+    def weights_and_area_elements(self, actx, places, dofdesc):
+        """Evaluate :func:`~pytential.symbolic.primitives.weights_and_area_elements`
+        on *dofdesc* (see :meth:`evaluate_geometry_expr`).
+        """
+        from pytential import sym
+        return self.evaluate_geometry_expr(actx, places,
+                sym.weights_and_area_elements(self.ambient_dim, dofdesc=dofdesc))
 
     # }}}
 
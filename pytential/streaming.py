@@ -0,0 +1,297 @@
+__copyright__ = "Copyright (C) 2020 The pytential developers"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import numpy as np
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+__doc__ = """
+.. note::
+
+   This module is experimental. Its interface is subject to change until this
+   notice is removed.
+
+Evaluates layer potentials at more off-surface targets than fit into device
+memory at once, e.g. on dense volume grids for visualization. The targets
+are split into spatially coherent tiles, each of which is evaluated as a
+separate :class:`~pytential.target.PointsTarget`, and the results are written
+to a host array as they become available. Any array supporting assignment by
+index, such as a :class:`numpy.memmap` (see also
+:func:`numpy.lib.format.open_memmap`), can be used for the output.
+
+The expression is bound only once, and refinement of the source geometry
+is shared by all tiles. Reusing the source multipole expansions across
+tiles is not supported: the QBX FMM builds its tree over the sources, the
+expansion centers and the targets together, so the whole FMM (including
+its upward pass) is repeated for every tile.
+
+.. autoclass:: StreamingEvaluator
+.. autofunction:: morton_order
+"""
+
+
+# {{{ spatial ordering
+
+def _bounding_box(targets, chunk_size):
+    ambient_dim, ntargets = targets.shape
+
+    bbox_min = np.full(ambient_dim, np.inf)
+    bbox_max = np.full(ambient_dim, -np.inf)
+    for start in range(0, ntargets, chunk_size):
+        chunk = np.asarray(targets[:, start:start + chunk_size])
+        bbox_min = np.minimum(bbox_min, chunk.min(axis=1))
+        bbox_max = np.maximum(bbox_max, chunk.max(axis=1))
+
+    return bbox_min, bbox_max
+
+
+def morton_order(targets, nbits=10, chunk_size=2**22):
+    """Find an ordering of *targets* along a Morton (Z-order) curve, so that
+    consecutive ranges of the ordering are spatially coherent.
+
+    :arg targets: an array-like of shape ``(ambient_dim, ntargets)``, e.g. a
+        :class:`numpy.memmap`. It is read in chunks of *chunk_size* targets.
+    :arg nbits: the number of bits per coordinate of the Morton keys, i.e. the
+        bounding box of *targets* is divided into :math:`2^{nbits}` cells
+        along each axis.
+    :returns: an integer :class:`numpy.ndarray` of shape ``(ntargets,)``.
+    """
+    ambient_dim, ntargets = targets.shape
+    if ambient_dim * nbits > 63:
+        raise ValueError(f"too many bits for {ambient_dim}D Morton keys: {nbits}")
+
+    bbox_min, bbox_max = _bounding_box(targets, chunk_size)
+    extent = np.maximum(bbox_max - bbox_min, np.finfo(np.float64).tiny)
+    ncells = 2**nbits
+
+    keys = np.zeros(ntargets, dtype=np.uint64)
+    for start in range(0, ntargets, chunk_size):
+        chunk = np.asarray(targets[:, start:start + chunk_size])
+        cells = np.clip(
+                ((chunk - bbox_min[:, np.newaxis]) / extent[:, np.newaxis]
+                    * ncells).astype(np.uint64),
+                0, ncells - 1)
+
+        chunk_keys = keys[start:start + chunk_size]
+        for ibit in range(nbits):
+            for iaxis in range(ambient_dim):
+                bit = (cells[iaxis] >> np.uint64(ibit)) & np.uint64(1)
+                chunk_keys |= bit << np.uint64(ambient_dim * ibit + iaxis)
+
+    return np.argsort(keys, kind="stable")
+
+# }}}
+
+
+# {{{ streaming evaluator
+
+class StreamingEvaluator:
+    """Evaluates a (scalar or vector-valued) layer potential expression at a
+    large number of off-surface targets in tiles of at most
+    :attr:`tile_size` targets.
+
+    The expression is bound and the source geometry is refined only once,
+    for all tiles. The tree, the target association and the device-side
+    results are sized by a single tile. The FMM (including its upward pass
+    over the sources) is rerun for each tile, since the source multipoles
+    cannot be reused across trees.
+
+    .. attribute:: tile_size
+
+    .. automethod:: __call__
+    .. automethod:: evaluate_tile
+    """
+
+    def __init__(self, places, expr, *,
+            source=None, target_name="streaming_targets",
+            tile_size=2**20, morton_nbits=10):
+        """
+        :arg places: a :class:`~pytential.GeometryCollection` containing the
+            sources of *expr*.
+        :arg expr: a symbolic expression evaluated at off-surface targets, i.e.
+            its layer potentials should use ``qbx_forced_limit=None``.
+        :arg source: the name of the source geometry in *places*. Defaults to
+            :attr:`~pytential.GeometryCollection.auto_source`.
+        :arg target_name: the name under which each tile is added to *places*.
+        :arg tile_size: the maximum number of targets evaluated at once.
+        :arg morton_nbits: passed on to :func:`morton_order`.
+        """
+        from pytential import GeometryCollection
+        if not isinstance(places, GeometryCollection):
+            places = GeometryCollection(places)
+
+        if source is None:
+            source = places.auto_source.geometry
+
+        if target_name in places.places:
+            raise ValueError(f"'{target_name}' is already in 'places'")
+
+        # refine once up front, so that all tiles share the result
+        from pytential import sym
+        from pytential.qbx import QBXLayerPotentialSource
+        if isinstance(places.get_geometry(source), QBXLayerPotentialSource):
+            places.get_discretization(source, sym.QBX_SOURCE_QUAD_STAGE2)
+
+        self.places = places
+        self.expr = expr
+        self.source = source
+        self.target_name = target_name
+        self.tile_size = tile_size
+        self.morton_nbits = morton_nbits
+
+        self._bound_expr = None
+
+    def evaluate_tile(self, actx, targets, context):
+        """Evaluate the expression at a single tile of *targets*.
+
+        :arg targets: a :class:`numpy.ndarray` of shape
+            ``(ambient_dim, ntargets)``.
+        :returns: a :class:`numpy.ndarray` of shape ``(ntargets,)`` or
+            ``(ncomponents, ntargets)``.
+        """
+        from pytential import bind
+        from pytential.target import PointsTarget
+        from pytential.symbolic.execution import _copy_refinement_caches
+
+        tile_places = self.places.merge({
+            self.target_name: PointsTarget(
+                actx.from_numpy(np.ascontiguousarray(targets)))
+            })
+        _copy_refinement_caches(self.places, tile_places)
+
+        # NOTE: only the points of the target differ between tiles, so the
+        # expression is compiled once and then evaluated on each tile
+        if self._bound_expr is None:
+            self._bound_expr = bind(tile_places, self.expr,
+                    auto_where=(self.source, self.target_name))
+            bound_expr = self._bound_expr
+        else:
+            bound_expr = self._bound_expr._with_places(tile_places)
+
+        result = bound_expr(actx, **context)
+
+        if isinstance(result, np.ndarray) and result.dtype.char == "O":
+            return np.array([actx.to_numpy(r) for r in result])
+        else:
+            return actx.to_numpy(result)
+
+    def _tiles(self, targets):
+        """Yields tuples *(indices, tile)*, where *indices* is *None* for
+        tiles that follow the order of *targets*.
+        """
+        if hasattr(targets, "shape") and len(targets.shape) == 2:
+            ntargets = targets.shape[1]
+            order = morton_order(targets, nbits=self.morton_nbits)
+
+            for start in range(0, ntargets, self.tile_size):
+                # sorted for monotone reads from memory-mapped files
+                indices = np.sort(order[start:start + self.tile_size])
+                yield indices, np.asarray(targets[:, indices])
+        else:
+            for chunk in targets:
+                chunk = np.asarray(chunk)
+                for start in range(0, chunk.shape[1], self.tile_size):
+                    yield None, chunk[:, start:start + self.tile_size]
+
+    def _empty_result(self, context):
+        from pytential.source import _entry_dtype
+        from pytential.symbolic.mappers import OperatorCollector
+        from pytential.symbolic.primitives import IntG
+
+        if isinstance(self.expr, np.ndarray):
+            shape = (len(self.expr), 0)
+            exprs = list(self.expr.flat)
+        else:
+            shape = (0,)
+            exprs = [self.expr]
+
+        is_complex = any(
+                isinstance(op, IntG) and op.kernel.is_complex_valued
+                for expr in exprs for op in OperatorCollector()(expr))
+        is_complex = is_complex or any(
+                _entry_dtype(value).kind == "c"
+                for value in context.values() if not np.isscalar(value))
+        is_complex = is_complex or any(
+                isinstance(value, complex) for value in context.values())
+
+        discr = self.places.get_discretization(self.source)
+        dtype = discr.complex_dtype if is_complex else discr.real_dtype
+
+        return np.empty(shape, dtype=dtype)
+
+    def __call__(self, actx, targets, out=None, **context):
+        """
+        :arg targets: either an array-like of shape ``(ambient_dim, ntargets)``
+            (e.g. a :class:`numpy.memmap`), which is divided into tiles along
+            :func:`morton_order`, or an iterable of arrays of shape
+            ``(ambient_dim, n)``, which are evaluated in order (and split if
+            larger than :attr:`tile_size`). In the latter case, the caller is
+            responsible for yielding spatially coherent chunks.
+        :arg out: an array-like of shape ``(ntargets,)`` or
+            ``(ncomponents, ntargets)``, e.g. a :class:`numpy.memmap`, into
+            which the results are written tile by tile. Required if *targets*
+            is an iterable.
+        :arg context: arguments to the expression, e.g. the density.
+        :returns: *out*, or a newly allocated :class:`numpy.ndarray` if *out*
+            is *None*.
+        """
+        from time import perf_counter
+
+        if out is None and not hasattr(targets, "shape"):
+            raise ValueError("'out' is required when 'targets' is an iterable")
+
+        offset = 0
+        ntiles = 0
+        t_start = perf_counter()
+
+        for indices, tile in self._tiles(targets):
+            result = self.evaluate_tile(actx, tile, context)
+
+            if out is None:
+                out = np.empty(result.shape[:-1] + (targets.shape[1],),
+                        dtype=result.dtype)
+
+            if indices is None:
+                out[..., offset:offset + tile.shape[1]] = result
+            else:
+                out[..., indices] = result
+
+            offset += tile.shape[1]
+            ntiles += 1
+
+        if out is None:
+            # no targets, so there was no tile to take the shape from
+            out = self._empty_result(context)
+
+        if hasattr(out, "flush"):
+            out.flush()
+
+        logger.info("streaming evaluation: %d targets in %d tiles: %.3f s",
+                offset, ntiles, perf_counter() - t_start)
+
+        return out
+
+# }}}
+
+# vim: foldmethod=marker
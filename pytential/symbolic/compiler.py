@@ -27,6 +27,9 @@ from pymbolic.primitives import cse_scope
 from pytential.symbolic.mappers import IdentityMapper
 from functools import reduce
 
+import logging
+logger = logging.getLogger(__name__)
+
 
 # {{{ instructions ------------------------------------------------------------
 
@@ -126,7 +129,8 @@ class PotentialOutput(Record):
 
         +1 if the output is required to originate from a QBX center on the "+" side
         of the boundary. -1 for the other side. 0 if either side of center (or no
-        center at all) is acceptable.
+        center at all) is acceptable. ``"avg"`` for the average of the +1 and
+        -1 limits.
     """
 
 
@@ -152,11 +156,20 @@ class ComputePotentialInstruction(Instruction):
         layer potentials removed.
 
     .. attribute:: density
+    .. attribute:: density_from_dd
+
+        If not *None*, :attr:`density` is given on this
+        :class:`~pytential.symbolic.primitives.DOFDescriptor` and needs to be
+        interpolated to :attr:`source` before use. This allows sources to fuse
+        the interpolation with the formation of the source strengths.
+
     .. attribute:: source
 
     .. attribute:: priority
     """
 
+    density_from_dd = None
+
     def get_assignees(self):
         return {o.name for o in self.outputs}
 
@@ -172,6 +185,8 @@ class ComputePotentialInstruction(Instruction):
 
     def __str__(self):
         args = [f"density={self.density}", f"source={self.source}"]
+        if self.density_from_dd is not None:
+            args.insert(1, f"density_from={self.density_from_dd}")
 
         from pytential.symbolic.mappers import StringifyMapper, stringify_where
         strify = StringifyMapper()
@@ -467,6 +482,9 @@ class OperatorCompiler(IdentityMapper):
             features = self.op_group_features(op)
             self.group_to_operators.setdefault(features, set()).add(op)
 
+        logger.info("compiler: %d layer potentials in %d evaluations",
+                len(operators), len(self.group_to_operators))
+
         # }}}
 
         # Traverse the expression, generate code.
@@ -569,7 +587,24 @@ class OperatorCompiler(IdentityMapper):
         except KeyError:
             # make sure operator assignments stand alone and don't get muddled
             # up in vector arithmetic
-            density_var = self.assign_to_new_var(self.rec(expr.density))
+            density = expr.density
+            density_from_dd = None
+
+            # NOTE: constant densities are not interpolated at all, see
+            # EvaluationMapperBase.map_interpolation
+            from pymbolic.primitives import is_constant
+            from pytential.symbolic.primitives import Interpolation
+            if (isinstance(density, Interpolation)
+                    and not is_constant(density.operand)
+                    and density.to_dd == expr.source
+                    and density.from_dd.granularity == density.to_dd.granularity):
+                from pytential.qbx import QBXLayerPotentialSource
+                lpot_source = self.places.get_geometry(expr.source.geometry)
+                if isinstance(lpot_source, QBXLayerPotentialSource):
+                    density_from_dd = density.from_dd
+                    density = density.operand
+
+            density_var = self.assign_to_new_var(self.rec(density))
 
             group = self.group_to_operators[self.op_group_features(expr)]
             names = [self.get_var_name() for op in group]
@@ -585,7 +620,7 @@ class OperatorCompiler(IdentityMapper):
                     atdr(kernel) for kernel in kernels)
 
             for op in group:
-                assert op.qbx_forced_limit in [-2, -1, None, 1, 2]
+                assert op.qbx_forced_limit in [-2, -1, None, 1, 2, "avg"]
 
             kernel_arguments = {
                     arg_name: self.rec(arg_val)
@@ -608,6 +643,7 @@ class OperatorCompiler(IdentityMapper):
                         kernel_arguments=kernel_arguments,
                         base_kernel=base_kernel,
                         density=density_var,
+                        density_from_dd=density_from_dd,
                         source=expr.source,
                         priority=max(getattr(op, "priority", 0) for op in group),
                         dep_mapper_factory=self.dep_mapper_factory))
@@ -201,6 +201,33 @@ class DOFConnection:
         return ary
 
 
+def _get_flattened_connection(places, geometry, from_stage, to_stage,
+        connections):
+    """Collapse a chain of refinement and resampling *connections* into a
+    single direct connection, which interpolates from *from_stage* to
+    *to_stage* with one elementwise resampling matrix per batch and without
+    intermediate arrays. The result is cached on *places*.
+    """
+    from pytential.symbolic.execution import \
+            _GEOMETRY_COLLECTION_FLAT_CONNS_CACHE_NAME
+    cache = places._get_cache(_GEOMETRY_COLLECTION_FLAT_CONNS_CACHE_NAME)
+    key = (geometry, from_stage, to_stage)
+
+    try:
+        return cache[key]
+    except KeyError:
+        pass
+
+    from meshmode.discretization.connection import (
+            ChainedDiscretizationConnection, flatten_chained_connection)
+    actx = connections[0].from_discr._setup_actx
+    conn = flatten_chained_connection(actx,
+            ChainedDiscretizationConnection(connections))
+
+    cache[key] = conn
+    return conn
+
+
 def connection_from_dds(places, from_dd, to_dd):
     """
     :arg places: a :class:`~pytential.symbolic.execution.GeometryCollection`
@@ -259,11 +286,19 @@ def connection_from_dds(places, from_dd, to_dd):
         from_stage = stage_name_to_index_map[from_dd.discr_stage]
         to_stage = stage_name_to_index_map[to_dd.discr_stage]
 
-        for istage in range(from_stage, to_stage):
-            conn = places._get_conn_from_cache(from_dd.geometry,
+        stage_connections = [
+                places._get_conn_from_cache(from_dd.geometry,
                     stage_index_to_name_map[istage],
                     stage_index_to_name_map[istage + 1])
-            connections.append(conn)
+                for istage in range(from_stage, to_stage)]
+
+        if len(stage_connections) > 1:
+            connections.append(_get_flattened_connection(
+                places, from_dd.geometry,
+                from_dd.discr_stage, to_dd.discr_stage,
+                stage_connections))
+        else:
+            connections.extend(stage_connections)
 
     if from_dd.granularity is not to_dd.granularity:
         if to_dd.granularity is sym.GRANULARITY_NODE:
@@ -278,6 +313,8 @@ def connection_from_dds(places, from_dd, to_dd):
 
     if from_dd.granularity is not to_dd.granularity:
         conn = DOFConnection(connections, from_dd=from_dd, to_dd=to_dd)
+    elif len(connections) == 1:
+        conn, = connections
     else:
         from meshmode.discretization.connection import \
                 ChainedDiscretizationConnection
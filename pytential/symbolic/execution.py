@@ -37,7 +37,6 @@ from meshmode.array_context import PyOpenCLArrayContext
 from meshmode.dof_array import DOFArray, thaw
 
 from pytools import memoize_in
-from pytential.qbx.cost import AbstractQBXCostModel
 
 from pytential import sym
 
@@ -47,6 +46,7 @@ logger = logging.getLogger(__name__)
 
 __doc__ = """
 .. autoclass :: BoundExpression
+.. autoclass :: MultiTargetBoundExpression
 """
 
 
@@ -329,28 +329,51 @@ class EvaluationMapperBase(PymbolicEvaluationMapper):
 class EvaluationMapper(EvaluationMapperBase):
 
     def __init__(self, bound_expr, actx, context=None,
-            timing_data=None):
+            timing_data=None, calibration_store=None):
         EvaluationMapperBase.__init__(self, bound_expr, actx, context)
         self.timing_data = timing_data
+        self.calibration_store = calibration_store
 
     def exec_compute_potential_insn(
             self, actx: PyOpenCLArrayContext, insn, bound_expr, evaluate):
         source = bound_expr.places.get_geometry(insn.source.geometry)
 
-        return_timing_data = self.timing_data is not None
+        return_timing_data = (
+                self.timing_data is not None
+                or self.calibration_store is not None)
 
         result, timing_data = (
                 source.exec_compute_potential_insn(
                     actx, insn, bound_expr, evaluate, return_timing_data))
 
-        if return_timing_data:
+        if self.timing_data is not None:
             # The compiler ensures this.
             assert insn not in self.timing_data
 
             self.timing_data[insn] = timing_data
 
+        if self.calibration_store is not None and timing_data:
+            self._add_calibration_sample(actx, insn, bound_expr, evaluate,
+                    source, timing_data)
+
         return result
 
+    def _add_calibration_sample(self, actx, insn, bound_expr, evaluate,
+            source, timing_data):
+        from pytential.qbx.cost import AbstractQBXCostModel
+
+        try:
+            _, (model_result, _) = source.cost_model_compute_potential_insn(
+                    actx, insn, bound_expr, evaluate,
+                    AbstractQBXCostModel.get_unit_calibration_params(),
+                    per_box=False)
+        except NotImplementedError:
+            # no cost model for this source (e.g. direct evaluation)
+            return
+
+        self.calibration_store.add_sample(
+                frozenset(insn.kernels), model_result, timing_data)
+
 # }}}
 
 
@@ -398,6 +421,7 @@ class CostModelMapper(EvaluationMapperBase):
 
         if (isinstance(self.kernel_to_calibration_params, str)
                 and self.kernel_to_calibration_params == "constant_one"):
+            from pytential.qbx.cost import AbstractQBXCostModel
             calibration_params = \
                 AbstractQBXCostModel.get_unit_calibration_params()
         else:
@@ -422,6 +446,122 @@ class CostModelMapper(EvaluationMapperBase):
 # }}}
 
 
+# {{{ expansion field evaluation mapper
+
+class ExpansionFieldMapper(EvaluationMapperBase):
+    """Mapper for evaluating an expression while keeping the QBX local
+    expansions of each layer potential, see
+    :class:`~pytential.qbx.expansion_field.QBXExpansionField`.
+    """
+
+    def __init__(self, bound_expr, actx, context=None):
+        if context is None:
+            context = {}
+        EvaluationMapperBase.__init__(self, bound_expr, actx, context)
+
+        self.expansion_fields = {}
+
+    def exec_compute_potential_insn(
+            self, actx: PyOpenCLArrayContext, insn, bound_expr, evaluate):
+        source = bound_expr.places.get_geometry(insn.source.geometry)
+
+        if not hasattr(source, "expansion_field_compute_potential_insn"):
+            raise TypeError("expansion fields are not supported by "
+                    f"'{type(source).__name__}'")
+
+        result, field = source.expansion_field_compute_potential_insn(
+                actx, insn, bound_expr, evaluate)
+
+        # The compiler ensures this.
+        assert insn not in self.expansion_fields
+
+        self.expansion_fields[insn] = field
+
+        return result
+
+# }}}
+
+
+# {{{ warmup evaluation mapper
+
+class WarmupMapperMixin:
+    """Evaluates an expression once to generate and compile the kernels it
+    needs, see :meth:`BoundExpression.warmup`. Records the kernels and orders
+    used by each layer potential evaluation.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.records = []
+
+    def exec_compute_potential_insn(
+            self, actx: PyOpenCLArrayContext, insn, bound_expr, evaluate):
+        from time import perf_counter
+        t_start = perf_counter()
+
+        result = super().exec_compute_potential_insn(
+                actx, insn, bound_expr, evaluate)
+        actx.queue.finish()
+
+        source = bound_expr.places.get_geometry(insn.source.geometry)
+        self.records.append({
+            "source": insn.source,
+            "targets": tuple(o.target_name for o in insn.outputs),
+            "kernels": tuple(insn.kernels),
+            "qbx_order": getattr(source, "qbx_order", None),
+            "fmm_level_to_order": getattr(source, "fmm_level_to_order", None),
+            "wall_time": perf_counter() - t_start,
+            })
+
+        return result
+
+
+class WarmupMapper(WarmupMapperMixin, EvaluationMapper):
+    pass
+
+# }}}
+
+
+# {{{ memory model evaluation mapper
+
+class MemoryModelMapper(EvaluationMapperBase):
+    """Mapper for evaluating memory models.
+
+    Like :class:`CostModelMapper`, this executes everything *except* the layer
+    potential operator, for which the predicted memory footprint per stage is
+    collected instead.
+    """
+
+    def __init__(self, bound_expr, actx, context=None):
+        if context is None:
+            context = {}
+        EvaluationMapperBase.__init__(self, bound_expr, actx, context)
+
+        self.modeled_memory = {}
+        self.metadata = {}
+
+    def exec_compute_potential_insn(
+            self, actx: PyOpenCLArrayContext, insn, bound_expr, evaluate):
+        source = bound_expr.places.get_geometry(insn.source.geometry)
+
+        result, (memory_model_result, metadata) = \
+            source.memory_model_compute_potential_insn(
+                actx, insn, bound_expr, evaluate)
+
+        # The compiler ensures this.
+        assert insn not in self.modeled_memory
+
+        self.modeled_memory[insn] = memory_model_result
+        self.metadata[insn] = metadata
+
+        return result
+
+    def get_modeled_memory(self):
+        return self.modeled_memory, self.metadata
+
+# }}}
+
+
 # {{{ scipy-like mat-vec op
 
 class MatVecOp:
@@ -436,7 +576,8 @@ class MatVecOp:
 
     def __init__(self,
             bound_expr, actx: PyOpenCLArrayContext,
-            arg_name, dtype, total_dofs, discrs, starts_and_ends, extra_args):
+            arg_name, dtype, total_dofs, discrs, starts_and_ends, extra_args,
+            domains=None):
         self.bound_expr = bound_expr
         self.array_context = actx
         self.arg_name = arg_name
@@ -445,6 +586,7 @@ class MatVecOp:
         self.discrs = discrs
         self.starts_and_ends = starts_and_ends
         self.extra_args = extra_args
+        self.domains = domains
 
     @property
     def shape(self):
@@ -578,6 +720,22 @@ def _prepare_auto_where(auto_where, places=None):
     return (sym.as_dofdesc(auto_source), sym.as_dofdesc(auto_target))
 
 
+def _count_operator_groups(places, expr):
+    """
+    :returns: the number of layer potential evaluations (e.g. FMMs) needed
+        for the operators in *expr*, grouped in the same way as in
+        :class:`~pytential.symbolic.compiler.OperatorCompiler`.
+    """
+    from pytential.symbolic.mappers import OperatorCollector
+    from pytential.symbolic.primitives import IntG, hashable_kernel_args
+
+    return len({
+        places.get_geometry(op.source.geometry).op_group_features(op)
+        + hashable_kernel_args(op.kernel_arguments)
+        for op in OperatorCollector()(expr)
+        if isinstance(op, IntG)})
+
+
 def _prepare_expr(places, expr, auto_where=None):
     """
     :arg places: :class:`~pytential.GeometryCollection`.
@@ -588,13 +746,27 @@ def _prepare_expr(places, expr, auto_where=None):
 
     from pytential.source import LayerPotentialSourceBase
     from pytential.symbolic.mappers import (
+            HashConsingMapper,
             ToTargetTagger,
-            DerivativeBinder)
+            DerivativeBinder,
+            TargetDerivativeCanonicalizer)
+
+    # NOTE: the mappers below memoize their results by node identity, so
+    # merging equal subexpressions up front lets them map each only once
+    expr = HashConsingMapper()(expr)
 
     auto_source, auto_target = _prepare_auto_where(auto_where, places=places)
     expr = ToTargetTagger(auto_source, auto_target)(expr)
     expr = DerivativeBinder()(expr)
 
+    ngroups_before = _count_operator_groups(places, expr)
+    canonicalizer = TargetDerivativeCanonicalizer()
+    expr = canonicalizer(expr)
+    logger.info("merging target derivatives: %d layer potential evaluations "
+            "before, %d after (%d directional derivatives rewritten)",
+            ngroups_before, _count_operator_groups(places, expr),
+            canonicalizer.nrewritten)
+
     for name, place in places.places.items():
         if isinstance(place, LayerPotentialSourceBase):
             expr = place.preprocess_optemplate(name, places, expr)
@@ -616,6 +788,19 @@ def _is_valid_identifier(name):
 
 _GEOMETRY_COLLECTION_DISCR_CACHE_NAME = "refined_qbx_discrs"
 _GEOMETRY_COLLECTION_CONNS_CACHE_NAME = "refined_qbx_conns"
+_GEOMETRY_COLLECTION_FLAT_CONNS_CACHE_NAME = "flattened_qbx_conns"
+
+
+def _copy_refinement_caches(from_places, to_places):
+    """Share the refined discretizations and connections of *from_places* with
+    *to_places*, e.g. after :meth:`GeometryCollection.merge` only changed
+    geometries that do not affect refinement (such as point targets).
+    """
+    for name in [
+            _GEOMETRY_COLLECTION_DISCR_CACHE_NAME,
+            _GEOMETRY_COLLECTION_CONNS_CACHE_NAME,
+            _GEOMETRY_COLLECTION_FLAT_CONNS_CACHE_NAME]:
+        to_places._get_cache(name).update(from_places._get_cache(name))
 
 
 class GeometryCollection:
@@ -775,11 +960,14 @@ class GeometryCollection:
             from pytential import sym
             from pytential.qbx.refinement import _refine_for_global_qbx
 
+            from pytential.allocation import allocation_stage
+            wrangler = lpot_source.refiner_code_container.get_wrangler()
+
             # NOTE: this adds the required discretizations to the cache
             dofdesc = sym.DOFDescriptor(geometry, discr_stage)
-            _refine_for_global_qbx(self, dofdesc,
-                    lpot_source.refiner_code_container.get_wrangler(),
-                    _copy_collection=False)
+            with allocation_stage(wrangler.allocator, "refinement"):
+                _refine_for_global_qbx(self, dofdesc, wrangler,
+                        _copy_collection=False)
 
             discr = self._get_discr_from_cache(geometry, discr_stage)
 
@@ -897,42 +1085,92 @@ def _find_array_context_from_args_in_context(context, supplied_array_context=Non
     return array_context
 
 
+_EVALUATION_MODES = ("eager", "lazy")
+
+
+def _check_evaluation_mode(evaluation_mode):
+    if evaluation_mode not in _EVALUATION_MODES:
+        raise ValueError(f"unknown evaluation mode: '{evaluation_mode}' "
+                f"(expected one of {', '.join(_EVALUATION_MODES)})")
+
+
 class BoundExpression:
     """An expression readied for evaluation by binding it to a
     :class:`~pytential.GeometryCollection`.
 
     .. automethod :: cost_per_stage
     .. automethod :: cost_per_box
+    .. automethod :: memory_per_stage
+    .. automethod :: qbx_expansion_fields
+    .. automethod :: warmup
     .. automethod :: scipy_op
     .. automethod :: eval
     .. automethod :: __call__
     .. attribute :: places
+    .. attribute :: evaluation_mode
+
+        The default evaluation mode of :meth:`eval`, either ``"eager"`` or
+        ``"lazy"``. See :mod:`pytential.symbolic.lazy`.
 
     Created by calling :func:`pytential.bind`.
     """
 
-    def __init__(self, places, sym_op_expr):
+    def __init__(self, places, sym_op_expr, evaluation_mode="eager"):
         self.places = places
         self.sym_op_expr = sym_op_expr
         self.caches = {}
 
+        _check_evaluation_mode(evaluation_mode)
+        self.evaluation_mode = evaluation_mode
+
         from pytential.symbolic.compiler import OperatorCompiler
         self.code = OperatorCompiler(self.places)(sym_op_expr)
 
     def _get_cache(self, name):
         return self.caches.setdefault(name, {})
 
-    def cost_per_stage(self, calibration_params, **kwargs):
+    def _with_places(self, places):
+        """
+        :returns: a copy of *self* that evaluates the already compiled code
+            on *places*, which must contain geometries of the same kinds
+            under the same names as :attr:`places` (e.g. point targets with
+            different points).
+        """
+        result = type(self).__new__(type(self))
+        result.places = places
+        result.sym_op_expr = self.sym_op_expr
+        result.caches = {}
+        result.evaluation_mode = self.evaluation_mode
+        result.code = self.code
+
+        return result
+
+    def _get_lazy_code(self):
+        cache = self._get_cache("lazy_code")
+        try:
+            return cache[self.code]
+        except KeyError:
+            from pytential.symbolic.lazy import optimize_code
+            code = optimize_code(self.code)
+            cache[self.code] = code
+
+            return code
+
+    def cost_per_stage(self, calibration_params, array_context=None, **kwargs):
         """
-        :arg queue: a :class:`pyopencl.CommandQueue` object.
         :arg calibration_params: either a :class:`dict` returned by
-            `estimate_kernel_specific_calibration_params`, or a :class:`str`
+            `estimate_kernel_specific_calibration_params`, a
+            :class:`~pytential.qbx.cost.CalibrationStore`, or a :class:`str`
             "constant_one".
+        :arg array_context: a :class:`meshmode.array_context.PyOpenCLArrayContext`.
+            Only needed if it cannot be inferred from the arguments, e.g. if
+            none of them is a :class:`~meshmode.dof_array.DOFArray`.
         :return: a :class:`dict` mapping from instruction to per-stage cost. Each
             per-stage cost is represented by a :class:`dict` mapping from the stage
             name to the predicted time.
         """
-        array_context = _find_array_context_from_args_in_context(kwargs)
+        array_context = _find_array_context_from_args_in_context(
+                kwargs, array_context)
 
         if array_context is None:
             raise ValueError("unable to figure array context from arguments")
@@ -943,18 +1181,19 @@ class BoundExpression:
         self.code.execute(cost_model_mapper)
         return cost_model_mapper.get_modeled_cost()
 
-    def cost_per_box(self, calibration_params, **kwargs):
+    def cost_per_box(self, calibration_params, array_context=None, **kwargs):
         """
-        :arg queue: a :class:`pyopencl.CommandQueue` object.
         :arg calibration_params: either a :class:`dict` returned by
             `estimate_kernel_specific_calibration_params`, or a :class:`str`
             "constant_one".
+        :arg array_context: see :meth:`cost_per_stage`.
         :return: a :class:`dict` mapping from instruction to per-box cost. Each
             per-box cost is represented by a :class:`numpy.ndarray` or
             :class:`pyopencl.array.Array` of shape (nboxes,), where the ith entry
             represents the cost of all stages for box i.
         """
-        array_context = _find_array_context_from_args_in_context(kwargs)
+        array_context = _find_array_context_from_args_in_context(
+                kwargs, array_context)
 
         cost_model_mapper = CostModelMapper(
             self, array_context, calibration_params, per_box=True, context=kwargs
@@ -962,6 +1201,100 @@ class BoundExpression:
         self.code.execute(cost_model_mapper)
         return cost_model_mapper.get_modeled_cost()
 
+    def memory_per_stage(self, array_context=None, **kwargs):
+        r"""Predict the memory footprint of the layer potential evaluations in
+        *self* without running them.
+
+        :arg array_context: see :meth:`cost_per_stage`.
+        :return: a tuple ``(modeled_memory, metadata)`` of :class:`dict`\ s
+            keyed by instruction. Each entry of *modeled_memory* maps stage
+            names to the predicted memory in use (in bytes) at the end of that
+            stage. The corresponding *metadata* contains the predicted peak in
+            ``"peak_bytes"``. See
+            :meth:`pytential.qbx.cost.AbstractQBXCostModel.qbx_memory_per_stage`.
+        """
+        array_context = _find_array_context_from_args_in_context(
+                kwargs, array_context)
+
+        if array_context is None:
+            raise ValueError("unable to figure array context from arguments")
+
+        memory_model_mapper = MemoryModelMapper(
+            self, array_context, context=kwargs
+        )
+        self.code.execute(memory_model_mapper)
+        return memory_model_mapper.get_modeled_memory()
+
+    def qbx_expansion_fields(self, array_context=None, **kwargs):
+        r"""Evaluate the expression using the FMM, keeping the QBX local
+        expansions of its layer potentials.
+
+        :arg array_context: see :meth:`cost_per_stage`.
+        :returns: a tuple ``(result, fields)``, where *result* is the value of
+            the expression and *fields* is a :class:`dict` mapping from
+            instructions to
+            :class:`~pytential.qbx.expansion_field.QBXExpansionField`\ s.
+        """
+        array_context = _find_array_context_from_args_in_context(
+                kwargs, array_context)
+
+        if array_context is None:
+            raise ValueError("unable to figure array context from arguments")
+
+        mapper = ExpansionFieldMapper(self, array_context, context=kwargs)
+        result = self.code.execute(mapper)
+
+        return result, mapper.expansion_fields
+
+    def warmup(self, array_context=None, **kwargs):
+        """Evaluate the expression once, discarding the result, so that all
+        kernels needed by later evaluations (for refinement, geometry
+        processing, the FMM or direct evaluation of each layer potential, and
+        fused kernels in the ``"lazy"`` :attr:`evaluation_mode`) are
+        generated and compiled ahead of time.
+
+        The values of the arguments in *kwargs* do not matter (e.g. zeros
+        suffice), but their shapes and types do, as they determine the
+        generated code. Generated code and compiled binaries are stored in
+        the on-disk caches of :mod:`loopy` and :mod:`pyopencl`, so that other
+        processes using the same cache directory (and the same devices) can
+        reuse them. See :func:`pytential.set_kernel_cache_dir`.
+
+        :arg array_context: see :meth:`cost_per_stage`.
+        :returns: a :class:`list` with a :class:`dict` for each layer
+            potential evaluation, with the keys ``"source"``, ``"targets"``,
+            ``"kernels"``, ``"qbx_order"``, ``"fmm_level_to_order"`` (*False*
+            for direct evaluation, see
+            :class:`~pytential.qbx.QBXLayerPotentialSource`) and
+            ``"wall_time"`` (the time spent in the evaluation, including code
+            generation and compilation).
+        """
+        array_context = _find_array_context_from_args_in_context(
+                kwargs, array_context)
+
+        if array_context is None:
+            raise ValueError("unable to figure array context from arguments")
+
+        if self.evaluation_mode == "lazy":
+            from pytential.symbolic.lazy import LazyWarmupMapper
+            mapper = LazyWarmupMapper(self, array_context, context=kwargs)
+            self._get_lazy_code().execute(mapper)
+        else:
+            mapper = WarmupMapper(self, array_context, context=kwargs)
+            self.code.execute(mapper)
+
+        array_context.queue.finish()
+
+        for record in mapper.records:
+            fmm_level_to_order = record["fmm_level_to_order"]
+            logger.info("warmup: %s on '%s' (qbx_order %s, fmm_order %s): "
+                    "%.3f s", ", ".join(str(k) for k in record["kernels"]),
+                    record["source"].geometry, record["qbx_order"],
+                    getattr(fmm_level_to_order, "fmm_order", fmm_level_to_order),
+                    record["wall_time"])
+
+        return mapper.records
+
     def scipy_op(
             self, actx: PyOpenCLArrayContext, arg_name, dtype,
             domains=None, **extra_args):
@@ -1007,10 +1340,12 @@ class BoundExpression:
         # for linear system solving, in which case the assumption
         # has to be true.
         return MatVecOp(self, actx,
-                arg_name, dtype, total_dofs, discrs, starts_and_ends, extra_args)
+                arg_name, dtype, total_dofs, discrs, starts_and_ends, extra_args,
+                domains=domains)
 
     def eval(self, context=None, timing_data=None,
-            array_context: Optional[PyOpenCLArrayContext] = None):
+            array_context: Optional[PyOpenCLArrayContext] = None,
+            calibration_store=None, evaluation_mode=None):
         """Evaluate the expression in *self*, using the
         :class:`pyopencl.CommandQueue` *queue* and the
         input variables given in the dictionary *context*.
@@ -1022,6 +1357,14 @@ class BoundExpression:
             :class:`~meshmode.dof_array.DOFArray` with a
             :class:`~meshmode.array_context.PyOpenCLArrayContext`
             are supplied as part of *context*.
+        :arg calibration_store: a :class:`~pytential.qbx.cost.CalibrationStore`.
+            If given, timing data and modeled costs of every layer potential
+            evaluation are recorded in the store, which refits its calibration
+            parameters accordingly.
+            (experimental)
+        :arg evaluation_mode: ``"eager"`` or ``"lazy"``, overriding
+            :attr:`evaluation_mode` for this evaluation.
+            (experimental)
         :returns: the value of the expression, as a scalar,
             :class:`pyopencl.array.Array`, or an object array of these.
         """
@@ -1029,11 +1372,23 @@ class BoundExpression:
         if context is None:
             context = {}
 
+        if evaluation_mode is None:
+            evaluation_mode = self.evaluation_mode
+        _check_evaluation_mode(evaluation_mode)
+
         array_context = _find_array_context_from_args_in_context(
                 context, array_context)
 
+        if evaluation_mode == "lazy":
+            from pytential.symbolic.lazy import LazyEvaluationMapper
+            exec_mapper = LazyEvaluationMapper(
+                    self, array_context, context, timing_data=timing_data,
+                    calibration_store=calibration_store)
+            return self._get_lazy_code().execute(exec_mapper)
+
         exec_mapper = EvaluationMapper(
-                self, array_context, context, timing_data=timing_data)
+                self, array_context, context, timing_data=timing_data,
+                calibration_store=calibration_store)
         return self.code.execute(exec_mapper)
 
     def __call__(self, *args, **kwargs):
@@ -1062,7 +1417,7 @@ class BoundExpression:
         return self.eval(kwargs, array_context=array_context)
 
 
-def bind(places, expr, auto_where=None):
+def bind(places, expr, auto_where=None, evaluation_mode="eager"):
     """
     :arg places: a :class:`pytential.GeometryCollection`.
         Alternatively, any list or mapping that is a valid argument for its
@@ -1073,6 +1428,9 @@ def bind(places, expr, auto_where=None):
         form :mod:`pytential.symbolic.primitives` (aka ``pytential.sym``).
         Multiple expressions can be combined into one object to pass here
         in the form of a :mod:`numpy` object array
+    :arg evaluation_mode: ``"eager"`` evaluates every operation as it is
+        encountered, while ``"lazy"`` generates fused kernels for the
+        arithmetic in the expression (see :mod:`pytential.symbolic.lazy`).
     :returns: a :class:`pytential.symbolic.execution.BoundExpression`
     """
     if not isinstance(places, GeometryCollection):
@@ -1080,7 +1438,83 @@ def bind(places, expr, auto_where=None):
         auto_where = places.auto_where
     expr = _prepare_expr(places, expr, auto_where=auto_where)
 
-    return BoundExpression(places, expr)
+    return BoundExpression(places, expr, evaluation_mode=evaluation_mode)
+
+# }}}
+
+
+# {{{ multiple target sets
+
+class MultiTargetBoundExpression:
+    """Evaluates layer potentials of a single source at several target sets
+    that are known up front.
+
+    All target sets are added to one :class:`GeometryCollection` and the
+    expressions for all of them are bound together, so that (as for any
+    bound expression) the layer potentials that share a source and density
+    end up in one instruction and hence in one FMM, whose tree contains all
+    target sets.
+
+    The source multipole expansions are *not* kept between evaluations: the
+    QBX FMM tree is built over the sources, the expansion centers and the
+    targets together, so a target set that is not known up front requires
+    a new tree and a new FMM, including its upward pass.
+
+    .. attribute:: places
+    .. attribute:: target_names
+
+    .. automethod:: __call__
+    """
+
+    def __init__(self, places, exprs, targets=None, source=None):
+        """
+        :arg places: a :class:`GeometryCollection` containing the source.
+        :arg exprs: either a single expression or a mapping from target names
+            to expressions. Each expression is evaluated from *source* to its
+            target set, as if bound with ``auto_where=(source, name)``.
+        :arg targets: a mapping from names to target geometries (e.g.
+            :class:`~pytential.target.PointsTarget`) that are added to
+            *places*. Target sets that are already in *places* only need to be
+            named in *exprs*.
+        :arg source: the name of the source geometry. Defaults to
+            :attr:`GeometryCollection.auto_source`.
+        """
+        if not isinstance(places, GeometryCollection):
+            places = GeometryCollection(places)
+
+        if source is None:
+            source = places.auto_source.geometry
+
+        if targets is None:
+            targets = {}
+
+        if not isinstance(exprs, dict):
+            if not targets:
+                raise ValueError("'targets' is required if 'exprs' is not a dict")
+            exprs = {name: exprs for name in targets}
+
+        if targets:
+            new_places = places.merge(targets)
+            _copy_refinement_caches(places, new_places)
+            places = new_places
+
+        self.places = places
+        self.source = source
+        self.target_names = tuple(exprs)
+
+        from pytools.obj_array import make_obj_array
+        self._bound_expr = BoundExpression(places, make_obj_array([
+            _prepare_expr(places, exprs[name], auto_where=(source, name))
+            for name in self.target_names
+            ]))
+
+    def __call__(self, actx, **context):
+        """
+        :arg context: arguments to the expressions, e.g. the density.
+        :returns: a :class:`dict` mapping target names to results.
+        """
+        results = self._bound_expr.eval(context, array_context=actx)
+        return dict(zip(self.target_names, results))
 
 # }}}
 
@@ -1138,14 +1572,24 @@ def build_matrix(actx, places, exprs, input_exprs, domains=None,
         evaluations, find 'where' attributes automatically.
     """
 
-    if context is None:
-        context = {}
-
     from pytential import GeometryCollection
     if not isinstance(places, GeometryCollection):
         places = GeometryCollection(places, auto_where=auto_where)
     exprs = _prepare_expr(places, exprs, auto_where=auto_where)
 
+    return _build_matrix(actx, places, exprs, input_exprs,
+            domains=domains, context=context)
+
+
+def _build_matrix(actx, places, exprs, input_exprs, domains=None, context=None):
+    """Same as :func:`build_matrix`, but *exprs* are expected to already
+    be prepared for evaluation on *places*, e.g. as in
+    :attr:`BoundExpression.sym_op_expr`.
+    """
+
+    if context is None:
+        context = {}
+
     if not (isinstance(exprs, np.ndarray) and exprs.dtype.char == "O"):
         from pytools.obj_array import make_obj_array
         exprs = make_obj_array([exprs])
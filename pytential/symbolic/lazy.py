@@ -0,0 +1,568 @@
+__copyright__ = "Copyright (C) 2020 Andreas Kloeckner"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+from numbers import Number
+
+import numpy as np
+import pyopencl as cl
+import pyopencl.array  # noqa
+
+from pymbolic.mapper import Mapper
+import pymbolic.primitives as p
+
+from meshmode.dof_array import DOFArray
+
+from pytential import sym
+from pytential.symbolic.mappers import IdentityMapper
+from pytential.symbolic.execution import (
+        EvaluationMapper, WarmupMapperMixin)
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+__doc__ = """
+.. note::
+
+   This module is experimental. Its interface is subject to change until this
+   notice is removed.
+
+Deferred evaluation of the arithmetic in the instruction stream produced by
+:class:`~pytential.symbolic.compiler.OperatorCompiler`, selected by passing
+``evaluation_mode="lazy"`` to :func:`pytential.bind` or to
+:meth:`~pytential.symbolic.execution.BoundExpression.eval`.
+
+Before execution, instructions whose results are never used are removed and
+assignments used by only a single other assignment are inlined into it.
+Each remaining assignment is then evaluated as a whole: the operands that
+are not elementwise arithmetic (e.g. geometric quantities, interpolations,
+layer potentials) are evaluated once per assignment, and the arithmetic
+combining them is generated into a single kernel. Node and elementwise
+reductions of such arithmetic are fused into the kernel, so that their
+operands are never stored.
+
+.. autoclass:: LazyEvaluationMapper
+"""
+
+
+# {{{ instruction stream optimization
+
+class _VariableInliner(IdentityMapper):
+    def __init__(self, substitutions):
+        IdentityMapper.__init__(self)
+        self.substitutions = substitutions
+
+    def map_variable(self, expr):
+        return self.substitutions.get(expr.name, expr)
+
+
+def optimize_code(code):
+    """Remove dead instructions from *code* and inline assignments that are
+    only used by a single other assignment.
+
+    :returns: a new :class:`~pytential.symbolic.compiler.Code`.
+    """
+    from pytools.obj_array import obj_array_vectorize
+    from pytential.symbolic.compiler import Assign, Code
+    from pytential.symbolic.mappers import DependencyMapper
+
+    dep_mapper = DependencyMapper(composite_leaves=False)
+    result_deps = set()
+
+    def add_result_deps(expr):
+        result_deps.update(var.name for var in dep_mapper(expr))
+
+    obj_array_vectorize(add_result_deps, code.result)
+
+    # {{{ dead code elimination
+
+    live_names = set(result_deps)
+    instructions = []
+    for insn in reversed(code.instructions):
+        if not insn.get_assignees() & live_names:
+            continue
+
+        if isinstance(insn, Assign):
+            live = [i for i, name in enumerate(insn.names) if name in live_names]
+            if len(live) < len(insn.names):
+                insn = insn.copy(
+                        names=[insn.names[i] for i in live],
+                        exprs=[insn.exprs[i] for i in live],
+                        do_not_return=[insn.do_not_return[i] for i in live])
+
+        live_names.update(dep.name for dep in insn.get_dependencies())
+        instructions.append(insn)
+
+    instructions.reverse()
+
+    # }}}
+
+    # {{{ inline single-use assignments
+
+    users = {}
+    for insn in instructions:
+        for dep in insn.get_dependencies():
+            users.setdefault(dep.name, []).append(insn)
+
+    def is_inlinable(insn):
+        return (isinstance(insn, Assign)
+                and len(insn.names) == 1
+                and insn.names[0] not in result_deps
+                and len(users.get(insn.names[0], [])) == 1
+                and isinstance(users[insn.names[0]][0], Assign))
+
+    substitutions = {}
+    inliner = _VariableInliner(substitutions)
+
+    new_instructions = []
+    for insn in instructions:
+        if isinstance(insn, Assign):
+            insn = insn.copy(exprs=[inliner(expr) for expr in insn.exprs])
+
+        if is_inlinable(insn):
+            substitutions[insn.names[0]] = insn.exprs[0]
+        else:
+            new_instructions.append(insn)
+
+    # }}}
+
+    logger.debug("lazy evaluation: %d of %d instructions left after "
+            "optimization", len(new_instructions), len(code.instructions))
+
+    return Code(new_instructions, code.result)
+
+# }}}
+
+
+# {{{ fusion
+
+_LOOPY_FUNCTIONS = {
+        # numpy name: loopy name
+        "sqrt": "sqrt", "exp": "exp", "log": "log", "log10": "log10",
+        "sin": "sin", "cos": "cos", "tan": "tan",
+        "arcsin": "asin", "arccos": "acos", "arctan": "atan", "arctan2": "atan2",
+        "sinh": "sinh", "cosh": "cosh", "tanh": "tanh",
+        "fabs": "fabs", "floor": "floor", "ceil": "ceil",
+        "real": "real", "imag": "imag", "conj": "conj", "abs": "abs",
+        }
+
+_NUMPY_FUNCTIONS = {
+        loopy_name: getattr(np, numpy_name)
+        for numpy_name, loopy_name in _LOOPY_FUNCTIONS.items()}
+
+
+class _NotFusible(Exception):
+    pass
+
+
+class _ArrayLeaf:
+    """Marks an evaluated operand that is an array of the given *kind*,
+    either ``"dof"`` for :class:`~meshmode.dof_array.DOFArray` or ``"flat"``
+    for one-dimensional :class:`pyopencl.array.Array`.
+    """
+
+    def __init__(self, kind, value):
+        self.kind = kind
+        self.value = value
+
+
+class _FusionMapper(Mapper):
+    """Turns an expression into elementwise arithmetic on variables (called
+    *leaves*) that stand for the values of the operands that cannot be fused.
+    The leaves are evaluated eagerly by *evaluator* as they are encountered,
+    and only once for identical expressions.
+    """
+
+    def __init__(self, evaluator):
+        self.evaluator = evaluator
+        self.expr_to_leaf = {}
+        self.leaves = {}
+        self.nkernels = 0
+
+    # {{{ leaves
+
+    def add_leaf(self, value, expr=None):
+        if isinstance(value, DOFArray):
+            value = _ArrayLeaf("dof", value)
+        elif isinstance(value, cl.array.Array) and value.ndim == 1:
+            value = _ArrayLeaf("flat", value)
+        elif isinstance(value, (Number, np.number)):
+            # NOTE: passed as a kernel argument, so that the generated code
+            # does not depend on its value
+            value = np.asarray(value)[()]
+        else:
+            raise _NotFusible(type(value).__name__)
+
+        name = f"_lz{len(self.leaves)}"
+        self.leaves[name] = value
+        if expr is not None:
+            self.expr_to_leaf[expr] = p.Variable(name)
+
+        return p.Variable(name)
+
+    def map_leaf(self, expr):
+        try:
+            return self.expr_to_leaf[expr]
+        except KeyError:
+            return self.add_leaf(self.evaluator.rec(expr), expr)
+
+    map_algebraic_leaf = map_leaf
+    map_variable = map_leaf
+    map_subscript = map_leaf
+    map_if = map_leaf
+    map_comparison = map_leaf
+    map_ones = map_leaf
+    map_node_coordinate_component = map_leaf
+    map_num_reference_derivative = map_leaf
+    map_q_weight = map_leaf
+    map_inverse = map_leaf
+    map_max = map_leaf
+    map_min = map_leaf
+
+    def map_constant(self, expr):
+        return expr
+
+    def map_common_subexpression(self, expr):
+        if expr.scope == sym.cse_scope.EVALUATION:
+            return self.rec(expr.child)
+
+        # longer-lived scopes are cached by the evaluator
+        return self.map_leaf(expr)
+
+    # }}}
+
+    # {{{ arithmetic
+
+    def map_sum(self, expr):
+        return p.Sum(tuple(self.rec(ch) for ch in expr.children))
+
+    def map_product(self, expr):
+        return p.Product(tuple(self.rec(ch) for ch in expr.children))
+
+    def map_quotient(self, expr):
+        return p.Quotient(self.rec(expr.numerator), self.rec(expr.denominator))
+
+    def map_power(self, expr):
+        return p.Power(self.rec(expr.base), self.rec(expr.exponent))
+
+    def map_call(self, expr):
+        from pytential.symbolic.primitives import (
+                EvalMapperFunction, NumpyMathFunction)
+
+        if (isinstance(expr.function, (EvalMapperFunction, NumpyMathFunction))
+                and expr.function.name in _LOOPY_FUNCTIONS):
+            return p.Variable(_LOOPY_FUNCTIONS[expr.function.name])(
+                    *[self.rec(par) for par in expr.parameters])
+
+        return self.map_leaf(expr)
+
+    # }}}
+
+    # {{{ reductions
+
+    def map_node_sum(self, expr):
+        return self._map_node_reduction("sum", expr)
+
+    def map_node_max(self, expr):
+        return self._map_node_reduction("max", expr)
+
+    def map_node_min(self, expr):
+        return self._map_node_reduction("min", expr)
+
+    def _map_node_reduction(self, reduction_name, expr):
+        try:
+            return self.expr_to_leaf[expr]
+        except KeyError:
+            pass
+
+        operand = self.rec(expr.operand)
+        kind = self.get_kind(operand)
+        queue = self.evaluator.array_context.queue
+
+        if kind == "dof":
+            # reduce over each element in the kernel, so that only one value
+            # per element is stored
+            partials = self.reduce(reduction_name, operand, per_element=True)
+        elif kind == "flat":
+            partials = [self.materialize(operand)]
+        else:
+            raise _NotFusible(f"node reduction of a {kind}")
+
+        cl_reduce = getattr(cl.array, reduction_name)
+        from functools import reduce
+        from operator import add
+        value = reduce(
+                {"sum": add, "max": max, "min": min}[reduction_name],
+                [cl_reduce(ary, queue=queue).get()[()] for ary in partials])
+
+        return self.add_leaf(value, expr)
+
+    def map_elementwise_sum(self, expr):
+        return self._map_elementwise_reduction("sum", expr)
+
+    def map_elementwise_min(self, expr):
+        return self._map_elementwise_reduction("min", expr)
+
+    def map_elementwise_max(self, expr):
+        return self._map_elementwise_reduction("max", expr)
+
+    def _map_elementwise_reduction(self, reduction_name, expr):
+        try:
+            return self.expr_to_leaf[expr]
+        except KeyError:
+            pass
+
+        operand = self.rec(expr.operand)
+        if self.get_kind(operand) != "dof":
+            raise _NotFusible("elementwise reduction of a non-DOF array")
+
+        granularity = expr.dofdesc.granularity
+        if granularity is sym.GRANULARITY_NODE:
+            per_element = False
+        elif granularity is sym.GRANULARITY_ELEMENT:
+            per_element = True
+        else:
+            raise ValueError(f"unsupported granularity: {granularity}")
+
+        actx = self.evaluator.array_context
+        result = self.reduce(reduction_name, operand, per_element=per_element)
+
+        return self.add_leaf(DOFArray.from_list(actx, result), expr)
+
+    # }}}
+
+    def map_interpolation(self, expr):
+        try:
+            return self.expr_to_leaf[expr]
+        except KeyError:
+            pass
+
+        operand = self.rec(expr.operand)
+        kind = self.get_kind(operand)
+        if kind == "scalar":
+            return operand
+        elif kind != "dof":
+            raise _NotFusible(f"interpolation of a {kind}")
+
+        conn = self.evaluator.places.get_connection(expr.from_dd, expr.to_dd)
+        return self.add_leaf(conn(self.materialize(operand)), expr)
+
+    def map_numpy_array(self, expr):
+        raise _NotFusible("object array")
+
+    map_multivector = map_numpy_array
+    map_list = map_numpy_array
+    map_tuple = map_numpy_array
+
+    def handle_unsupported_expression(self, expr, *args, **kwargs):
+        return self.map_leaf(expr)
+
+    def map_int_g(self, expr):
+        raise RuntimeError("layer potentials should have been removed "
+                "by the compiler")
+
+    # {{{ code generation
+
+    def get_array_leaves(self, fused_expr):
+        from pymbolic.mapper.dependency import DependencyMapper
+        deps = DependencyMapper(include_calls=False)(fused_expr)
+
+        return {
+                var.name: self.leaves[var.name] for var in deps
+                if isinstance(self.leaves.get(var.name), _ArrayLeaf)}
+
+    def get_scalar_args(self, fused_expr):
+        from pymbolic.mapper.dependency import DependencyMapper
+        deps = DependencyMapper(include_calls=False)(fused_expr)
+
+        return {
+                var.name: self.leaves[var.name] for var in deps
+                if var.name in self.leaves
+                and not isinstance(self.leaves[var.name], _ArrayLeaf)}
+
+    def get_kind(self, fused_expr):
+        kinds = {leaf.kind for leaf in self.get_array_leaves(fused_expr).values()}
+        if not kinds:
+            return "scalar"
+        elif len(kinds) > 1:
+            raise _NotFusible("mixed DOF and flat arrays")
+
+        kind, = kinds
+        return kind
+
+    def _get_kernel(self, kind, fused_expr, array_names, reduction_name=None,
+            per_element=False):
+        cache = self.evaluator.places._get_cache("lazy_kernels")
+        key = (kind, fused_expr, frozenset(array_names), reduction_name,
+                per_element)
+
+        try:
+            return cache[key]
+        except KeyError:
+            pass
+
+        import loopy as lp
+        from pymbolic.mapper.substitutor import make_subst_func, substitute
+
+        if kind == "dof":
+            index = "idof" if reduction_name is None else "jdof"
+            domain = "{[iel, %s]: 0<=iel<nelements and 0<=%s<ndofs}" % (
+                    index, index)
+            indices = (p.Variable("iel"), p.Variable(index))
+        else:
+            domain = "{[i0]: 0<=i0<n}"
+            indices = (p.Variable("i0"),)
+
+        value = substitute(fused_expr, make_subst_func({
+            name: p.Variable(name)[indices] for name in array_names
+            }))
+
+        result = p.Variable("result")
+        if reduction_name is None:
+            lhs = result[indices]
+        elif per_element:
+            lhs = result[p.Variable("iel"), 0]
+            value = lp.Reduction(reduction_name, ("jdof",), value)
+        else:
+            # NOTE: *jdof* is reduced, but each node keeps its own result
+            domain = ("{[iel, idof, jdof]: 0<=iel<nelements "
+                    "and 0<=idof, jdof<ndofs}")
+            lhs = result[p.Variable("iel"), p.Variable("idof")]
+            value = lp.Reduction(reduction_name, ("jdof",), value)
+
+        from meshmode.array_context import make_loopy_program
+        knl = make_loopy_program(domain, [lp.Assignment(lhs, value)],
+                name="lazy_fused")
+
+        cache[key] = knl
+        return knl
+
+    def _call_kernel(self, knl, fused_expr):
+        actx = self.evaluator.array_context
+        arrays = self.get_array_leaves(fused_expr)
+        scalars = self.get_scalar_args(fused_expr)
+
+        self.nkernels += 1
+        kinds = {leaf.kind for leaf in arrays.values()}
+        if kinds == {"flat"}:
+            return [actx.call_loopy(knl,
+                    **{name: leaf.value for name, leaf in arrays.items()},
+                    **scalars)["result"]]
+
+        ngroups = {len(leaf.value) for leaf in arrays.values()}
+        if len(ngroups) != 1:
+            raise ValueError("DOF arrays with different numbers of groups "
+                    "in a single expression")
+
+        ngroups, = ngroups
+        return [
+                actx.call_loopy(knl,
+                    **{name: leaf.value[igrp] for name, leaf in arrays.items()},
+                    **scalars)["result"]
+                for igrp in range(ngroups)]
+
+    def reduce(self, reduction_name, fused_expr, per_element):
+        """
+        :returns: a list of arrays per group, of shape ``(nelements, 1)`` if
+            *per_element* is *True* or of the shape of the group otherwise.
+        """
+        arrays = self.get_array_leaves(fused_expr)
+        knl = self._get_kernel("dof", fused_expr, list(arrays),
+                reduction_name=reduction_name, per_element=per_element)
+        return self._call_kernel(knl, fused_expr)
+
+    def materialize(self, fused_expr):
+        """Evaluate *fused_expr*, returning a scalar, a
+        :class:`~meshmode.dof_array.DOFArray` or a
+        :class:`pyopencl.array.Array`.
+        """
+        if isinstance(fused_expr, p.Variable) and fused_expr.name in self.leaves:
+            leaf = self.leaves[fused_expr.name]
+            return leaf.value if isinstance(leaf, _ArrayLeaf) else leaf
+
+        kind = self.get_kind(fused_expr)
+        if kind == "scalar":
+            from pymbolic.mapper.evaluator import EvaluationMapper as EvalMapper
+            return EvalMapper({**_NUMPY_FUNCTIONS, **self.leaves})(fused_expr)
+
+        arrays = self.get_array_leaves(fused_expr)
+        result = self._call_kernel(
+                self._get_kernel(kind, fused_expr, list(arrays)),
+                fused_expr)
+
+        if kind == "dof":
+            return DOFArray.from_list(self.evaluator.array_context, result)
+        else:
+            result, = result
+            return result
+
+    # }}}
+
+# }}}
+
+
+# {{{ lazy evaluation mapper
+
+class LazyEvaluationMapper(EvaluationMapper):
+    """An :class:`~pytential.symbolic.execution.EvaluationMapper` that
+    evaluates each assignment of the instruction stream as a fused kernel.
+    Assignments that cannot be fused, e.g. because they contain object arrays,
+    are evaluated eagerly.
+
+    .. attribute:: nkernels
+
+        The number of fused kernels launched so far.
+    """
+
+    def __init__(self, bound_expr, actx, context=None,
+            timing_data=None, calibration_store=None):
+        super().__init__(bound_expr, actx, context,
+                timing_data=timing_data, calibration_store=calibration_store)
+        self.nkernels = 0
+
+    def exec_assign(self, actx, insn, bound_expr, evaluate):
+        fusion_mapper = _FusionMapper(self)
+
+        results = []
+        for name, expr in zip(insn.names, insn.exprs):
+            try:
+                value = fusion_mapper.materialize(fusion_mapper(expr))
+            except _NotFusible as exc:
+                logger.debug("lazy evaluation: evaluating '%s' eagerly: %s",
+                        name, exc)
+                value = evaluate(expr)
+
+            results.append((name, value))
+
+        self.nkernels += fusion_mapper.nkernels
+        return results
+
+
+class LazyWarmupMapper(WarmupMapperMixin, LazyEvaluationMapper):
+    """Generates and compiles the fused kernels along with the kernels of the
+    layer potentials, see
+    :meth:`~pytential.symbolic.execution.BoundExpression.warmup`.
+    """
+
+# }}}
+
+# vim: foldmethod=marker
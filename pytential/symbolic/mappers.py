@@ -139,7 +139,71 @@ class Collector(CollectorBase, CombineMapper):
     map_q_weight = map_ones
 
 
-class OperatorCollector(Collector):
+# {{{ node caching and hash-consing
+
+class NodeCachingMapperMixin:
+    """Memoizes the result of mapping each node, keyed by the identity of the
+    node, so that shared subexpressions are only mapped once. The mapped
+    results are shared in the same way as their inputs.
+
+    Calls with extra arguments are not cached.
+    """
+
+    def __call__(self, expr, *args, **kwargs):
+        if args or kwargs:
+            return super().__call__(expr, *args, **kwargs)
+
+        try:
+            cache = self._node_cache
+        except AttributeError:
+            cache = self._node_cache = {}
+
+        # NOTE: *expr* is kept in the cache so that its id cannot be reused
+        try:
+            cached_expr, result = cache[id(expr)]
+        except KeyError:
+            pass
+        else:
+            if cached_expr is expr:
+                return result
+
+        result = self.map_node_uncached(expr)
+        cache[id(expr)] = (expr, result)
+
+        return result
+
+    rec = __call__
+
+    def map_node_uncached(self, expr):
+        return super().__call__(expr)
+
+
+class HashConsingMapper(NodeCachingMapperMixin, IdentityMapper):
+    """Rebuilds an expression such that all structurally equal subexpressions
+    are represented by a single instance. Together with
+    :class:`NodeCachingMapperMixin`, this makes mapping expressions built from
+    many separately constructed copies of the same subexpressions (e.g.
+    normals or layer potentials) proportional to the number of distinct
+    subexpressions.
+    """
+
+    def __init__(self):
+        IdentityMapper.__init__(self)
+        self.interned = {}
+
+    def map_node_uncached(self, expr):
+        result = super().map_node_uncached(expr)
+
+        from pymbolic.primitives import Expression
+        if isinstance(result, Expression):
+            result = self.interned.setdefault(result, result)
+
+        return result
+
+# }}}
+
+
+class OperatorCollector(NodeCachingMapperMixin, Collector):
     def map_int_g(self, expr):
         return {expr} | Collector.map_int_g(self, expr)
 
@@ -201,7 +265,8 @@ class EvaluationMapper(EvaluationMapperBase):
 
 # {{{ dofdesc tagging
 
-class LocationTagger(CSECachingMapperMixin, IdentityMapper):
+class LocationTagger(NodeCachingMapperMixin,
+        CSECachingMapperMixin, IdentityMapper):
     """Used internally by :class:`ToTargetTagger`."""
 
     def __init__(self, default_where, default_source=prim.DEFAULT_SOURCE):
@@ -320,7 +385,7 @@ class ToTargetTagger(LocationTagger):
                                           default_source=default_source)
 
 
-class DiscretizationStageTagger(IdentityMapper):
+class DiscretizationStageTagger(NodeCachingMapperMixin, IdentityMapper):
     """Descends into an expression tree and changes the
     :attr:`~pytential.symbolic.primitives.DOFDescriptor.discr_stage` to
     :attr:`discr_stage`.
@@ -414,7 +479,8 @@ class DerivativeSourceFinder(EvaluationMapper,
     pass
 
 
-class DerivativeBinder(DerivativeBinderBase, IdentityMapper):
+class DerivativeBinder(NodeCachingMapperMixin,
+        DerivativeBinderBase, IdentityMapper):
     derivative_source_and_nabla_component_collector = \
             DerivativeSourceAndNablaComponentCollector
     nabla_component_to_unit_vector = NablaComponentToUnitVector
@@ -426,9 +492,114 @@ class DerivativeBinder(DerivativeBinderBase, IdentityMapper):
 # }}}
 
 
+# {{{ target derivative canonicalizer
+
+class TargetDerivativeCanonicalizer(NodeCachingMapperMixin, IdentityMapper):
+    """Rewrites layer potentials with a
+    :class:`~sumpy.kernel.DirectionalTargetDerivative` kernel as a linear
+    combination of layer potentials with
+    :class:`~sumpy.kernel.AxisTargetDerivative` kernels, the form that
+    :class:`~pytential.symbolic.primitives.Derivative` already produces. The
+    compiler groups all such layer potentials of a density, so that e.g.
+    :math:`S` and :math:`S'` are evaluated in a single FMM.
+
+    Only applies to on-surface evaluations (where the direction vector,
+    which is tagged with the source, is also valid on the targets) with
+    direction vectors given as object arrays. Layer potentials that have no
+    other layer potential of the same density, base kernel and (remaining)
+    kernel arguments to be merged with are left as they are, since rewriting
+    them would only add work.
+
+    .. attribute:: nrewritten
+
+        The number of layer potentials that were rewritten.
+    """
+
+    def __init__(self):
+        self.nrewritten = 0
+        self.merge_group_sizes = {}
+
+    @staticmethod
+    def _merge_group_features(expr):
+        from pytential.symbolic.primitives import hashable_kernel_args
+        from sumpy.kernel import AxisTargetDerivative, DirectionalTargetDerivative
+
+        kernel = expr.kernel
+        while isinstance(kernel, AxisTargetDerivative):
+            kernel = kernel.inner_kernel
+
+        kernel_arguments = expr.kernel_arguments
+        if isinstance(kernel, DirectionalTargetDerivative):
+            # NOTE: the direction vector is not an argument of the rewritten
+            # layer potentials
+            kernel_arguments = {
+                    name: arg for name, arg in kernel_arguments.items()
+                    if name != kernel.dir_vec_name}
+            kernel = kernel.inner_kernel
+
+        return (expr.source, expr.density, kernel,
+                hashable_kernel_args(kernel_arguments))
+
+    def __call__(self, expr, *args, **kwargs):
+        from pytential.symbolic.primitives import IntG
+
+        self.merge_group_sizes = {}
+        for op in OperatorCollector()(expr):
+            if isinstance(op, IntG):
+                features = self._merge_group_features(op)
+                self.merge_group_sizes[features] = (
+                        self.merge_group_sizes.get(features, 0) + 1)
+
+        return super().__call__(expr, *args, **kwargs)
+
+    def map_int_g(self, expr):
+        import numpy as np
+        from sumpy.kernel import AxisTargetDerivative, DirectionalTargetDerivative
+
+        axes = []
+        kernel = expr.kernel
+        while isinstance(kernel, AxisTargetDerivative):
+            axes.append(kernel.axis)
+            kernel = kernel.inner_kernel
+
+        dir_vec = None
+        if isinstance(kernel, DirectionalTargetDerivative):
+            dir_vec = expr.kernel_arguments.get(kernel.dir_vec_name)
+
+        if (dir_vec is None
+                or not isinstance(dir_vec, np.ndarray)
+                or expr.source != expr.target
+                or self.merge_group_sizes.get(
+                    self._merge_group_features(expr), 0) < 2):
+            return IdentityMapper.map_int_g(self, expr)
+
+        kernel_arguments = {
+                name: self.rec(arg_expr)
+                for name, arg_expr in expr.kernel_arguments.items()
+                if name != kernel.dir_vec_name}
+        density = self.rec(expr.density)
+
+        def wrap(knl):
+            for axis in reversed(axes):
+                knl = AxisTargetDerivative(axis, knl)
+            return knl
+
+        self.nrewritten += 1
+
+        from pymbolic.primitives import flattened_sum
+        return flattened_sum(tuple(
+            self.rec(dir_vec_axis) * type(expr)(
+                wrap(AxisTargetDerivative(iaxis, kernel.inner_kernel)),
+                density, expr.qbx_forced_limit, expr.source, expr.target,
+                kernel_arguments)
+            for iaxis, dir_vec_axis in enumerate(dir_vec)))
+
+# }}}
+
+
 # {{{ Unregularized preprocessor
 
-class UnregularizedPreprocessor(IdentityMapper):
+class UnregularizedPreprocessor(NodeCachingMapperMixin, IdentityMapper):
 
     def __init__(self, geometry, places):
         self.geometry = geometry
@@ -455,7 +626,7 @@ class UnregularizedPreprocessor(IdentityMapper):
 
 # {{{ interpolation preprocessor
 
-class InterpolationPreprocessor(IdentityMapper):
+class InterpolationPreprocessor(NodeCachingMapperMixin, IdentityMapper):
     """Handle expressions that require upsampling or downsampling by inserting
     a :class:`~pytential.symbolic.primitives.Interpolation`. This is used to
 
@@ -525,7 +696,7 @@ class InterpolationPreprocessor(IdentityMapper):
 
 # {{{ QBX preprocessor
 
-class QBXPreprocessor(IdentityMapper):
+class QBXPreprocessor(NodeCachingMapperMixin, IdentityMapper):
     def __init__(self, geometry, places):
         self.geometry = geometry
         self.places = places
@@ -574,12 +745,10 @@ class QBXPreprocessor(IdentityMapper):
             raise ValueError("May not specify qbx_forced_limit == +/-2 "
                     "for self-evaluation. Specify +/-1 or 'avg' instead.")
 
-        if expr.qbx_forced_limit == "avg":
-            return 0.5*(
-                    expr.copy(qbx_forced_limit=+1)
-                    + expr.copy(qbx_forced_limit=-1))
-        else:
-            return expr
+        # NOTE: "avg" is passed on as is, so that the layer potential source
+        # can compute both one-sided limits in the same evaluation and
+        # average them as they are extracted
+        return expr
 
 # }}}
 
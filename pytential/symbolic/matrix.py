@@ -353,6 +353,11 @@ class MatrixBuilder(MatrixBuilderBase):
             raise RuntimeError("unknown operand type: {}".format(type(operand)))
 
     def map_int_g(self, expr):
+        if expr.qbx_forced_limit == "avg":
+            return 0.5 * (
+                    self.map_int_g(expr.copy(qbx_forced_limit=+1))
+                    + self.map_int_g(expr.copy(qbx_forced_limit=-1)))
+
         lpot_source = self.places.get_geometry(expr.source.geometry)
         source_discr = self.places.get_discretization(
                 expr.source.geometry, expr.source.discr_stage)
@@ -479,6 +484,11 @@ class NearFieldBlockBuilder(MatrixBlockBuilderBase):
         return np.equal(tgtindices, srcindices).astype(np.float64)
 
     def map_int_g(self, expr):
+        if expr.qbx_forced_limit == "avg":
+            return 0.5 * (
+                    self.map_int_g(expr.copy(qbx_forced_limit=+1))
+                    + self.map_int_g(expr.copy(qbx_forced_limit=-1)))
+
         lpot_source = self.places.get_geometry(expr.source.geometry)
         source_discr = self.places.get_discretization(
                 expr.source.geometry, expr.source.discr_stage)
@@ -25,16 +25,104 @@ import numpy as np
 from pytential import sym
 from sumpy.kernel import StokesletKernel, StressletKernel, LaplaceKernel
 
-__doc__ = """
+__doc__ = r"""
 .. autoclass:: StokesletWrapper
 .. autoclass:: StressletWrapper
 
 .. autoclass:: StokesOperator
 .. autoclass:: HsiaoKressExteriorStokesOperator
 .. autoclass:: HebekerExteriorStokesOperator
+
+.. _stokes-laplace-decomposition:
+
+Laplace Decomposition
+^^^^^^^^^^^^^^^^^^^^^
+
+Both wrappers take a *method* argument. With ``method="naive"``, each entry
+of the Stokeslet and Stresslet tensors is a separate
+:class:`~sumpy.kernel.StokesletKernel` or :class:`~sumpy.kernel.StressletKernel`
+layer potential. With ``method="laplace"``, the layer potentials are written
+in terms of Laplace single and double layers and their target derivatives,
+following [TornbergGreengard2008]_. For example, in three dimensions
+
+.. math::
+
+    \int_\Gamma \left(\frac{\delta_{ij}}{r} + \frac{r_i r_j}{r^3}\right)
+    f_j \,\mathrm{d}S_y
+    = S[f_i] - x_j \partial_i S[f_j] + \partial_i S[y_j f_j],
+
+where :math:`r = x - y` and :math:`S` is the Laplace single layer with kernel
+:math:`1/r`. This needs only :math:`d + 1` Laplace layer potentials (with
+their gradients) for the Stokeslet and :math:`d^2 + d + 1` for the Stresslet,
+all of which can use the FMM and target-specific QBX support for the Laplace
+kernel in :mod:`pytential.qbx.fmmlib`.
+
+.. [TornbergGreengard2008] A.-K. Tornberg and L. Greengard,
+    *A Fast Multipole Method for the Three-Dimensional Stokes Equations*,
+    Journal of Computational Physics, Vol. 227, 2008,
+    `DOI <https://doi.org/10.1016/j.jcp.2007.06.029>`__.
 """
 
 
+# {{{ Laplace decomposition helpers
+
+_STOKES_METHODS = ("naive", "laplace")
+
+
+def _check_method(method):
+    if method not in _STOKES_METHODS:
+        raise ValueError(f"unknown method: '{method}' "
+                f"(must be one of {_STOKES_METHODS})")
+
+    return method
+
+
+def _laplace_gradient_sign(dim):
+    # sign kappa such that grad_x g = kappa r / |r|^d for the unscaled Laplace
+    # kernel g (log r in 2D and 1/r in 3D) and r = x - y
+    return -1 if dim == 3 else 1
+
+
+def _laplace_scaling_ratio(kernel, mu_sym):
+    """
+    :returns: the ratio of the global scaling constants of *kernel* and of the
+        Laplace kernel in the same dimension.
+    """
+    from pymbolic import evaluate
+    context = {"pi": np.pi, kernel.viscosity_mu_name: mu_sym}
+
+    return (
+            evaluate(kernel.get_global_scaling_const(), context)
+            / evaluate(
+                LaplaceKernel(kernel.dim).get_global_scaling_const(), context))
+
+
+def _laplace_int_g(dim, density, qbx_forced_limit, dir_vec=None, deriv_dirs=()):
+    """
+    :returns: the Laplace single layer potential of *density* or, if *dir_vec*
+        is given, the double layer potential with source derivatives along
+        *dir_vec*, differentiated along the target axes in *deriv_dirs*.
+    """
+    from pytential.symbolic.mappers import DerivativeTaker
+    kernel = LaplaceKernel(dim)
+
+    if dir_vec is None:
+        result = sym.S(kernel, density, qbx_forced_limit=qbx_forced_limit)
+    else:
+        from pytools.obj_array import make_obj_array
+        result = sym.int_g_dsource(dim,
+                sym.MultiVector(make_obj_array(list(dir_vec))),
+                kernel, density,
+                qbx_forced_limit=qbx_forced_limit).xproject(0)
+
+    for deriv_dir in deriv_dirs:
+        result = DerivativeTaker(deriv_dir).map_int_g(result)
+
+    return result
+
+# }}}
+
+
 # {{{ StokesletWrapper
 
 class StokesletWrapper:
@@ -65,6 +153,11 @@ class StokesletWrapper:
         :math:`S_{01}` is identical to :math:`S_{10}` -- and avoid creating
         multiple expansions for the same kernel in a different ordering.
 
+    .. attribute:: method
+
+        Either ``"naive"`` or ``"laplace"``, see :ref:`the module
+        documentation <stokes-laplace-decomposition>`.
+
     .. automethod:: __init__
     .. automethod:: apply
     .. automethod:: apply_pressure
@@ -72,8 +165,13 @@ class StokesletWrapper:
     .. automethod:: apply_stress
     """
 
-    def __init__(self, dim=None):
+    def __init__(self, dim=None, method="naive"):
+        """
+        :arg method: ``"naive"`` to use the Stokeslet kernels directly or
+            ``"laplace"`` to decompose them into Laplace layer potentials.
+        """
         self.dim = dim
+        self.method = _check_method(method)
 
         if dim == 2:
             self.kernel_dict = {
@@ -95,6 +193,46 @@ class StokesletWrapper:
         else:
             raise ValueError("unsupported dimension given to StokesletWrapper")
 
+    def _apply_laplace(self, density_vec_sym, mu_sym, qbx_forced_limit,
+            deriv_dir=None):
+        # With r = x - y, the Stokeslet is c (a delta_ij g + r_i r_j / |r|^d)
+        # with a = -kappa, so that
+        #
+        #   u_i = c kappa (-S[f_i] + x_j d_i S[f_j] - d_i S[y_j f_j])
+        #
+        # where d_i S[f] = kappa int r_i / |r|^d f dS.
+
+        dim = self.dim
+        weight = _laplace_gradient_sign(dim) * _laplace_scaling_ratio(
+                self.kernel_dict[(2,) + (0,) * (dim - 1)], mu_sym)
+
+        def lap_s(density, *deriv_dirs):
+            return _laplace_int_g(dim, density, qbx_forced_limit,
+                    deriv_dirs=deriv_dirs)
+
+        nodes = sym.nodes(dim).as_vector()
+        extra_deriv_dirs = () if deriv_dir is None else (deriv_dir,)
+        common_density = sum(
+                nodes[j] * density_vec_sym[j] for j in range(dim))
+
+        sym_expr = np.empty((dim,), dtype=object)
+        for comp in range(dim):
+            result = (
+                    - lap_s(density_vec_sym[comp], *extra_deriv_dirs)
+                    - lap_s(common_density, comp, *extra_deriv_dirs))
+
+            for j in range(dim):
+                result = result + nodes[j] * lap_s(
+                        density_vec_sym[j], comp, *extra_deriv_dirs)
+
+            if deriv_dir is not None:
+                # product rule for the target coordinate x_j
+                result = result + lap_s(density_vec_sym[deriv_dir], comp)
+
+            sym_expr[comp] = weight * result
+
+        return sym_expr
+
     def apply(self, density_vec_sym, mu_sym, qbx_forced_limit):
         """Symbolic expressions for integrating Stokeslet kernel.
 
@@ -108,6 +246,9 @@ class StokesletWrapper:
             to :class:`~pytential.symbolic.primitives.IntG`.
         """
 
+        if self.method == "laplace":
+            return self._apply_laplace(density_vec_sym, mu_sym, qbx_forced_limit)
+
         sym_expr = np.empty((self.dim,), dtype=object)
 
         for comp in range(self.dim):
@@ -168,6 +309,10 @@ class StokesletWrapper:
             to :class:`~pytential.symbolic.primitives.IntG`.
         """
 
+        if self.method == "laplace":
+            return self._apply_laplace(density_vec_sym, mu_sym, qbx_forced_limit,
+                    deriv_dir=deriv_dir)
+
         from pytential.symbolic.mappers import DerivativeTaker
 
         sym_expr = np.empty((self.dim,), dtype=object)
@@ -227,6 +372,10 @@ class StokesletWrapper:
             to :class:`~pytential.symbolic.primitives.IntG`.
         """
 
+        if self.method == "laplace":
+            return self._apply_stress_laplace(density_vec_sym, dir_vec_sym,
+                    mu_sym, qbx_forced_limit)
+
         import itertools
 
         sym_expr = np.empty((self.dim,), dtype=object)
@@ -260,6 +409,45 @@ class StokesletWrapper:
 
         return sym_expr
 
+    def _apply_stress_laplace(self, density_vec_sym, dir_vec_sym,
+            mu_sym, qbx_forced_limit):
+        # With r = x - y and the direction a applied at the target,
+        #
+        #   T_cij a_i f_j = c (r . a) (r . f) r_c / |r|^(d + 2)
+        #
+        # is decomposed as in StressletWrapper._apply_laplace, except that
+        # the derivatives of the double layer become second derivatives of
+        # the single layer.
+
+        dim = self.dim
+        stresslet_obj = StressletWrapper(dim=dim)
+        weight = _laplace_gradient_sign(dim) / dim * _laplace_scaling_ratio(
+                stresslet_obj.kernel_dict[(3,) + (0,) * (dim - 1)], mu_sym)
+
+        def lap_s(density, *deriv_dirs):
+            return _laplace_int_g(dim, density, qbx_forced_limit,
+                    deriv_dirs=deriv_dirs)
+
+        nodes = sym.nodes(dim).as_vector()
+        common_density = sum(
+                nodes[j] * density_vec_sym[j] for j in range(dim))
+        div_s = sum(lap_s(density_vec_sym[j], j) for j in range(dim))
+
+        sym_expr = np.empty((dim,), dtype=object)
+        for comp in range(dim):
+            result = dir_vec_sym[comp] * div_s
+
+            for i in range(dim):
+                hess = lap_s(common_density, comp, i)
+                for j in range(dim):
+                    hess = hess - nodes[j] * lap_s(density_vec_sym[j], comp, i)
+
+                result = result + dir_vec_sym[i] * hess
+
+            sym_expr[comp] = weight * result
+
+        return sym_expr
+
 # }}}
 
 
@@ -292,6 +480,11 @@ class StressletWrapper:
         :math:`T_{012}` is identical to :math:`T_{120}` -- and avoid creating
         multiple expansions for the same kernel in a different ordering.
 
+    .. attribute:: method
+
+        Either ``"naive"`` or ``"laplace"``, see :ref:`the module
+        documentation <stokes-laplace-decomposition>`.
+
     .. automethod:: __init__
     .. automethod:: apply
     .. automethod:: apply_pressure
@@ -299,8 +492,13 @@ class StressletWrapper:
     .. automethod:: apply_stress
     """
 
-    def __init__(self, dim=None):
+    def __init__(self, dim=None, method="naive"):
+        """
+        :arg method: ``"naive"`` to use the Stresslet kernels directly or
+            ``"laplace"`` to decompose them into Laplace layer potentials.
+        """
         self.dim = dim
+        self.method = _check_method(method)
 
         if dim == 2:
             self.kernel_dict = {
@@ -327,6 +525,53 @@ class StressletWrapper:
         else:
             raise ValueError("unsupported dimension given to StressletWrapper")
 
+    def _apply_laplace(self, density_vec_sym, dir_vec_sym, mu_sym,
+            qbx_forced_limit, deriv_dir=None):
+        # With r = x - y, the Stresslet is c r_i r_j r_k / |r|^(d + 2). Using
+        #
+        #   r_i r_k / |r|^(d + 2) = (delta_ik / |r|^d - d_i (r_k / |r|^d)) / d
+        #
+        # and writing the remaining factors of r in terms of Laplace single
+        # and double layers (along the source directions n) gives
+        #
+        #   u_i = c kappa / d (d_j S[n_i q_j] + x_j d_i D[q_j] - d_i D[y_j q_j]).
+
+        dim = self.dim
+        weight = _laplace_gradient_sign(dim) / dim * _laplace_scaling_ratio(
+                self.kernel_dict[(3,) + (0,) * (dim - 1)], mu_sym)
+
+        def lap_s(density, *deriv_dirs):
+            return _laplace_int_g(dim, density, qbx_forced_limit,
+                    deriv_dirs=deriv_dirs)
+
+        def lap_d(density, *deriv_dirs):
+            return _laplace_int_g(dim, density, qbx_forced_limit,
+                    dir_vec=dir_vec_sym, deriv_dirs=deriv_dirs)
+
+        nodes = sym.nodes(dim).as_vector()
+        extra_deriv_dirs = () if deriv_dir is None else (deriv_dir,)
+        common_density = sum(
+                nodes[j] * density_vec_sym[j] for j in range(dim))
+
+        sym_expr = np.empty((dim,), dtype=object)
+        for comp in range(dim):
+            result = -lap_d(common_density, comp, *extra_deriv_dirs)
+
+            for j in range(dim):
+                result = result + (
+                        lap_s(dir_vec_sym[comp] * density_vec_sym[j],
+                            j, *extra_deriv_dirs)
+                        + nodes[j] * lap_d(
+                            density_vec_sym[j], comp, *extra_deriv_dirs))
+
+            if deriv_dir is not None:
+                # product rule for the target coordinate x_j
+                result = result + lap_d(density_vec_sym[deriv_dir], comp)
+
+            sym_expr[comp] = weight * result
+
+        return sym_expr
+
     def apply(self, density_vec_sym, dir_vec_sym, mu_sym, qbx_forced_limit):
         """Symbolic expressions for integrating Stresslet kernel.
 
@@ -341,6 +586,10 @@ class StressletWrapper:
             to :class:`~pytential.symbolic.primitives.IntG`.
         """
 
+        if self.method == "laplace":
+            return self._apply_laplace(density_vec_sym, dir_vec_sym, mu_sym,
+                    qbx_forced_limit)
+
         import itertools
 
         sym_expr = np.empty((self.dim,), dtype=object)
@@ -416,6 +665,10 @@ class StressletWrapper:
             to :class:`~pytential.symbolic.primitives.IntG`.
         """
 
+        if self.method == "laplace":
+            return self._apply_laplace(density_vec_sym, dir_vec_sym, mu_sym,
+                    qbx_forced_limit, deriv_dir=deriv_dir)
+
         import itertools
         from pytential.symbolic.mappers import DerivativeTaker
 
@@ -516,10 +769,12 @@ class StokesOperator:
     .. automethod:: pressure
     """
 
-    def __init__(self, ambient_dim, side):
+    def __init__(self, ambient_dim, side, method="naive"):
         """
         :arg ambient_dim: dimension of the ambient space.
         :arg side: :math:`+1` for exterior or :math:`-1` for interior.
+        :arg method: passed on to :class:`StokesletWrapper` and
+            :class:`StressletWrapper`.
         """
 
         if side not in [+1, -1]:
@@ -528,8 +783,8 @@ class StokesOperator:
         self.ambient_dim = ambient_dim
         self.side = side
 
-        self.stresslet = StressletWrapper(dim=self.ambient_dim)
-        self.stokeslet = StokesletWrapper(dim=self.ambient_dim)
+        self.stresslet = StressletWrapper(dim=self.ambient_dim, method=method)
+        self.stokeslet = StokesletWrapper(dim=self.ambient_dim, method=method)
 
     @property
     def dim(self):
@@ -585,15 +840,16 @@ class HsiaoKressExteriorStokesOperator(StokesOperator):
     .. automethod:: __init__
     """
 
-    def __init__(self, *, omega, alpha=None, eta=None):
+    def __init__(self, *, omega, alpha=None, eta=None, method="naive"):
         r"""
         :arg omega: farfield behaviour of the velocity field, as defined
             by :math:`A` in [HsiaoKress1985]_ Equation 2.3.
         :arg alpha: real parameter :math:`\alpha > 0`.
         :arg eta: real parameter :math:`\eta > 0`. Choosing this parameter well
             can have a non-trivial effect on the conditioning.
+        :arg method: see :class:`StokesOperator`.
         """
-        super().__init__(ambient_dim=2, side=+1)
+        super().__init__(ambient_dim=2, side=+1, method=method)
 
         # NOTE: in [hsiao-kress], there is an analysis on a circle, which
         # recommends values in
@@ -673,13 +929,14 @@ class HebekerExteriorStokesOperator(StokesOperator):
     .. automethod:: __init__
     """
 
-    def __init__(self, *, eta=None):
+    def __init__(self, *, eta=None, method="naive"):
         r"""
         :arg eta: a parameter :math:`\eta > 0`. Choosing this parameter well
             can have a non-trivial effect on the conditioning of the operator.
+        :arg method: see :class:`StokesOperator`.
         """
 
-        super().__init__(ambient_dim=3, side=+1)
+        super().__init__(ambient_dim=3, side=+1, method=method)
 
         # NOTE: eta is chosen here based on H. 1986 Figure 1, which is
         # based on solving on the unit sphere
@@ -29,7 +29,7 @@ import loopy as lp
 from boxtree.tools import DeviceDataRecord
 from loopy.version import MOST_RECENT_LANGUAGE_VERSION
 from pytential.source import LayerPotentialSourceBase
-from pytools import memoize_method
+from pytools import memoize_method, memoize_in
 
 import pyopencl as cl
 import pyopencl.array  # noqa
@@ -97,25 +97,27 @@ class UnregularizedLayerPotentialSource(LayerPotentialSourceBase):
 
     def exec_compute_potential_insn(self, actx: PyOpenCLArrayContext,
             insn, bound_expr, evaluate, return_timing_data):
-        if return_timing_data:
-            from warnings import warn
-            from pytential.source import UnableToCollectTimingData
-            warn(
-                   "Timing data collection not supported.",
-                   category=UnableToCollectTimingData)
-
         from pytools.obj_array import obj_array_vectorize
 
         def evaluate_wrapper(expr):
             value = evaluate(expr)
             return obj_array_vectorize(lambda x: x, value)
 
+        extra_args = {}
         if self.fmm_level_to_order is False:
+            if return_timing_data:
+                from warnings import warn
+                from pytential.source import UnableToCollectTimingData
+                warn(
+                       "Timing data collection not supported.",
+                       category=UnableToCollectTimingData)
+
             func = self.exec_compute_potential_insn_direct
         else:
             func = self.exec_compute_potential_insn_fmm
+            extra_args["return_timing_data"] = return_timing_data
 
-        return func(actx, insn, bound_expr, evaluate_wrapper)
+        return func(actx, insn, bound_expr, evaluate_wrapper, **extra_args)
 
     def op_group_features(self, expr):
         from sumpy.kernel import AxisTargetDerivativeRemover
@@ -144,9 +146,7 @@ class UnregularizedLayerPotentialSource(LayerPotentialSourceBase):
         for arg_name, arg_expr in insn.kernel_arguments.items():
             kernel_args[arg_name] = flatten_if_needed(actx, evaluate(arg_expr))
 
-        from pytential import bind, sym
-        waa = bind(bound_expr.places, sym.weights_and_area_elements(
-            self.ambient_dim, dofdesc=insn.source))(actx)
+        waa = self.weights_and_area_elements(actx, bound_expr.places, insn.source)
         strengths = waa * evaluate(insn.density)
         flat_strengths = flatten(strengths)
 
@@ -197,18 +197,45 @@ class UnregularizedLayerPotentialSource(LayerPotentialSourceBase):
 
     @property
     def fmm_geometry_code_container(self):
-        return _FMMGeometryDataCodeContainer(
-                self._setup_actx, self.ambient_dim, self.debug)
+        @memoize_in(self._setup_actx, (
+                UnregularizedLayerPotentialSource,
+                "fmm_geometry_code_container"))
+        def make_container(ambient_dim, debug):
+            return _FMMGeometryDataCodeContainer(
+                    self._setup_actx, ambient_dim, debug)
 
-    def fmm_geometry_data(self, targets):
-        return _FMMGeometryData(
+        return make_container(self.ambient_dim, self.debug)
+
+    def fmm_geometry_data(self, places, targets):
+        """
+        :arg places: a :class:`~pytential.GeometryCollection`, in which the
+            geometry data is cached, so that its lifetime (and that of the
+            wranglers cached on it) follows that of *places*.
+        :arg targets: a tuple of
+            :class:`meshmode.discretization.Discretization`
+            or
+            :class:`pytential.target.TargetBase`
+            instances
+        """
+        cache = places._get_cache("unregularized_fmm_geometry_data")
+        key = (self, targets)
+
+        try:
+            return cache[key]
+        except KeyError:
+            pass
+
+        geo_data = _FMMGeometryData(
                 self,
                 self.fmm_geometry_code_container,
                 targets,
                 self.debug)
+        cache[key] = geo_data
+
+        return geo_data
 
     def exec_compute_potential_insn_fmm(self, actx: PyOpenCLArrayContext,
-            insn, bound_expr, evaluate):
+            insn, bound_expr, evaluate, return_timing_data):
         # {{{ gather unique target discretizations used
 
         target_name_to_index = {}
@@ -229,11 +256,9 @@ class UnregularizedLayerPotentialSource(LayerPotentialSourceBase):
 
         # {{{ get wrangler
 
-        geo_data = self.fmm_geometry_data(targets)
+        geo_data = self.fmm_geometry_data(bound_expr.places, targets)
 
-        from pytential import bind, sym
-        waa = bind(bound_expr.places, sym.weights_and_area_elements(
-            self.ambient_dim, dofdesc=insn.source))(actx)
+        waa = self.weights_and_area_elements(actx, bound_expr.places, insn.source)
         strengths = waa * evaluate(insn.density)
 
         from meshmode.dof_array import flatten
@@ -248,21 +273,25 @@ class UnregularizedLayerPotentialSource(LayerPotentialSourceBase):
                     actx, out_kernels, geo_data.tree().user_source_ids,
                     insn.kernel_arguments, evaluate))
 
-        wrangler = self.expansion_wrangler_code_container(
-                fmm_kernel, out_kernels).get_wrangler(
-                    actx.queue,
-                    geo_data.tree(),
-                    output_and_expansion_dtype,
-                    self.fmm_level_to_order,
-                    source_extra_kwargs=source_extra_kwargs,
-                    kernel_extra_kwargs=kernel_extra_kwargs)
+        wrangler = geo_data.get_wrangler(
+                actx,
+                self.expansion_wrangler_code_container(fmm_kernel, out_kernels),
+                output_and_expansion_dtype,
+                self.fmm_level_to_order,
+                source_extra_kwargs=source_extra_kwargs,
+                kernel_extra_kwargs=kernel_extra_kwargs)
 
         # }}}
 
+        if return_timing_data:
+            timing_data = {}
+        else:
+            timing_data = None
+
         from boxtree.fmm import drive_fmm
         all_potentials_on_every_tgt = drive_fmm(
                 geo_data.traversal(), wrangler, (flat_strengths,),
-                timing_data=None)
+                timing_data=timing_data)
 
         # {{{ postprocess fmm
 
@@ -285,7 +314,6 @@ class UnregularizedLayerPotentialSource(LayerPotentialSourceBase):
 
         # }}}
 
-        timing_data = {}
         return results, timing_data
 
     # }}}
@@ -354,6 +382,10 @@ class _TargetInfo(DeviceDataRecord):
 
 
 class _FMMGeometryData:
+    """Tree and traversal for an FMM from the nodes of *lpot_source*, which
+    can be an :class:`UnregularizedLayerPotentialSource` or a
+    :class:`~pytential.source.PointPotentialSource`, to *target_discrs*.
+    """
 
     def __init__(self, lpot_source, code_getter, target_discrs, debug=True):
         self.lpot_source = lpot_source
@@ -361,6 +393,8 @@ class _FMMGeometryData:
         self.target_discrs = target_discrs
         self.debug = debug
 
+        self._wrangler_cache = {}
+
     @property
     def cl_context(self):
         return self.code_getter.cl_context
@@ -371,11 +405,62 @@ class _FMMGeometryData:
 
     @property
     def coord_dtype(self):
-        return self.lpot_source.density_discr.real_dtype
+        return self.lpot_source.real_dtype
 
     @property
     def ambient_dim(self):
-        return self.lpot_source.density_discr.ambient_dim
+        return self.lpot_source.ambient_dim
+
+    @memoize_method
+    def source_nodes(self):
+        """An object array of the (flattened) source node coordinates."""
+        from pytential.source import PointPotentialSource
+
+        lpot_src = self.lpot_source
+        if isinstance(lpot_src, PointPotentialSource):
+            from pytools.obj_array import make_obj_array
+            nodes = lpot_src.nodes()
+            return make_obj_array([nodes[idim] for idim in range(len(nodes))])
+        else:
+            from meshmode.dof_array import thaw, flatten
+            return flatten(
+                    thaw(self.array_context, lpot_src.density_discr.nodes()))
+
+    def get_wrangler(self, actx, wrangler_code_container,
+            output_and_expansion_dtype, fmm_level_to_order,
+            source_extra_kwargs, kernel_extra_kwargs):
+        """Get an expansion wrangler for :meth:`tree`.
+
+        Wranglers are cached if all the extra kernel arguments are scalars
+        (e.g. the Helmholtz parameter), so that they can be reused across
+        evaluations. Array arguments (e.g. the normals of a double-layer
+        potential) may change between evaluations, so a new wrangler is
+        created in that case.
+        """
+        def make_wrangler():
+            return wrangler_code_container.get_wrangler(
+                    actx.queue,
+                    self.tree(),
+                    output_and_expansion_dtype,
+                    fmm_level_to_order,
+                    source_extra_kwargs=source_extra_kwargs,
+                    kernel_extra_kwargs=kernel_extra_kwargs)
+
+        extra_kwargs = {**source_extra_kwargs, **kernel_extra_kwargs}
+        if not all(np.isscalar(value) for value in extra_kwargs.values()):
+            return make_wrangler()
+
+        key = (actx.queue, wrangler_code_container,
+                np.dtype(output_and_expansion_dtype),
+                tuple(sorted(source_extra_kwargs.items())),
+                tuple(sorted(kernel_extra_kwargs.items())))
+
+        try:
+            return self._wrangler_cache[key]
+        except KeyError:
+            wrangler = make_wrangler()
+            self._wrangler_cache[key] = wrangler
+            return wrangler
 
     @memoize_method
     def traversal(self):
@@ -394,12 +479,12 @@ class _FMMGeometryData:
         """
 
         code_getter = self.code_getter
-        lpot_src = self.lpot_source
         target_info = self.target_info()
 
         queue = self.array_context.queue
 
-        nsources = lpot_src.density_discr.ndofs
+        source_nodes = self.source_nodes()
+        nsources = source_nodes[0].shape[0]
         nparticles = nsources + target_info.ntargets
 
         refine_weights = cl.array.zeros(queue, nparticles, dtype=np.int32)
@@ -408,11 +493,8 @@ class _FMMGeometryData:
 
         MAX_LEAF_REFINE_WEIGHT = 32  # noqa
 
-        from meshmode.dof_array import thaw, flatten
-
         tree, _ = code_getter.build_tree(queue,
-                particles=flatten(
-                    thaw(self.array_context, lpot_src.density_discr.nodes())),
+                particles=source_nodes,
                 targets=target_info.targets,
                 max_leaf_refine_weight=MAX_LEAF_REFINE_WEIGHT,
                 refine_weights=refine_weights,
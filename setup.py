@@ -105,7 +105,7 @@ setup(name="pytential",
 
       ext_modules=cythonize(ext_modules),
 
-      python_requires="~=3.6",
+      python_requires="~=3.7",
       install_requires=[
           "pytest>=2.3",
           "pytools>=2018.2",
@@ -117,4 +117,5 @@ setup(name="pytential",
           "sumpy>=2020.2beta1",
           "cgen>=2013.1.2",
           "pyfmmlib>=2019.1.1",
+          "scipy",
           ])
@@ -372,6 +372,118 @@ def test_timing_data_gathering(ctx_factory):
 # }}}
 
 
+# {{{ test online calibration store
+
+def test_calibration_store(ctx_factory, tmp_path):
+    """Test that the calibration store is fed by evaluation and persists."""
+
+    pytest.importorskip("pyfmmlib")
+
+    cl_ctx = ctx_factory()
+    queue = cl.CommandQueue(cl_ctx,
+            properties=cl.command_queue_properties.PROFILING_ENABLE)
+    actx = PyOpenCLArrayContext(queue)
+
+    lpot_source = get_lpot_source(actx, 2)
+    places = GeometryCollection(lpot_source)
+
+    dofdesc = places.auto_source.to_stage1()
+    density_discr = places.get_discretization(dofdesc.geometry)
+    sigma = get_density(actx, density_discr)
+
+    sigma_sym = sym.var("sigma")
+    k_sym = LaplaceKernel(lpot_source.ambient_dim)
+    sym_op_S = sym.S(k_sym, sigma_sym, qbx_forced_limit=+1)
+
+    op_S = bind(places, sym_op_S)
+
+    from pytential.qbx.cost import CalibrationStore
+    filename = str(tmp_path / "calibration.json")
+    store = CalibrationStore(filename, time_field_name="process_elapsed")
+
+    knls = frozenset({k_sym})
+    for _ in range(2):
+        op_S.eval(dict(sigma=sigma), array_context=actx,
+                calibration_store=store)
+
+    assert store.nsamples(knls) == 2
+    params = store[knls]
+    assert params["c_p2qbxl"] >= 0.0
+
+    # reload from disk and check the fit survives the round trip
+    store = CalibrationStore(filename, time_field_name="process_elapsed")
+    assert knls in store
+    assert store[knls] == params
+
+    # the store can be used directly to evaluate the cost model
+    modeled_cost, _ = op_S.cost_per_stage(store, sigma=sigma)
+    assert modeled_cost
+
+    # stages without timing (e.g. no profiling) are skipped
+    store.add_sample(knls, {"form_multipoles": 1.0},
+            {"form_multipoles": {"process_elapsed": None}})
+    assert store.nsamples(knls) == 3
+
+# }}}
+
+
+# {{{ test cost-model-driven autotuning
+
+def test_autotune_qbx_source(ctx_factory):
+    """Test that the autotuner picks admissible parameters and caches them."""
+    cl_ctx = ctx_factory()
+    queue = cl.CommandQueue(cl_ctx)
+    actx = PyOpenCLArrayContext(queue)
+
+    lpot_source = get_lpot_source(actx, 2)
+    places = GeometryCollection(lpot_source)
+
+    density_discr = places.get_discretization(places.auto_source.geometry)
+    sigma = get_density(actx, density_discr)
+
+    sigma_sym = sym.var("sigma")
+    k_sym = LaplaceKernel(lpot_source.ambient_dim)
+    sym_op_S = sym.S(k_sym, sigma_sym, qbx_forced_limit=+1)
+
+    from pytential.qbx.autotune import (
+            autotune_qbx_source, fmm_order_for_tolerance)
+
+    cache = {}
+    kwargs = dict(
+            fmm_tolerance=1.0e-5,
+            fmm_orders=[10, 20, 25],
+            max_leaf_refine_weights=[32, 64],
+            from_sep_smaller_min_nsources_cumuls=[15],
+            cache=cache)
+    tuned_source = autotune_qbx_source(actx, places, sym_op_S,
+            dict(sigma=sigma), **kwargs)
+
+    # higher orders only cost more on the same tree
+    fmm_order = tuned_source.fmm_level_to_order(None, None, None, 0)
+    assert fmm_order == 20
+    assert fmm_order >= fmm_order_for_tolerance(1.0e-5)
+    assert tuned_source._max_leaf_refine_weight in (32, 64)
+    assert tuned_source._from_sep_smaller_min_nsources_cumul == 15
+    assert len(cache) == 1
+
+    cached_source = autotune_qbx_source(actx, places, sym_op_S,
+            dict(sigma=sigma), **kwargs)
+    assert (cached_source._max_leaf_refine_weight
+            == tuned_source._max_leaf_refine_weight)
+    assert len(cache) == 1
+
+    # the current order of a source with a level-dependent order is unknown
+    def fmm_level_to_order(kernel, kernel_args, tree, level):
+        return 10 + level
+
+    places = GeometryCollection(
+            lpot_source.copy(fmm_level_to_order=fmm_level_to_order))
+    with pytest.raises(ValueError):
+        autotune_qbx_source(actx, places, sym_op_S, dict(sigma=sigma))
+
+# }}}
+
+
 # {{{ test cost model
 
 @pytest.mark.parametrize("dim, use_target_specific_qbx, per_box", (
@@ -427,6 +539,95 @@ def test_cost_model(ctx_factory, dim, use_target_specific_qbx, per_box):
 # }}}
 
 
+# {{{ test memory model
+
+@pytest.mark.parametrize("dim", (2, 3))
+def test_memory_model(ctx_factory, dim):
+    """Test that the memory model is consistent across FMM orders."""
+    cl_ctx = ctx_factory()
+    queue = cl.CommandQueue(cl_ctx)
+    actx = PyOpenCLArrayContext(queue)
+
+    lpot_source = get_lpot_source(actx, dim)
+    places = GeometryCollection(lpot_source)
+
+    density_discr = places.get_discretization(places.auto_source.geometry)
+    sigma = get_density(actx, density_discr)
+
+    sigma_sym = sym.var("sigma")
+    k_sym = LaplaceKernel(lpot_source.ambient_dim)
+    sym_op_S = sym.S(k_sym, sigma_sym, qbx_forced_limit=+1)
+
+    def get_memory(fmm_order):
+        op_S = bind(places.merge({
+            places.auto_source.geometry: lpot_source.copy(fmm_order=fmm_order)
+            }), sym_op_S)
+        memory, metadata = op_S.memory_per_stage(sigma=sigma)
+        assert len(memory) == 1
+
+        memory, = memory.values()
+        metadata, = metadata.values()
+
+        stages = list(memory)
+        assert stages[0] == "form_multipoles"
+        assert all(memory[a] <= memory[b] for a, b in zip(stages, stages[1:]))
+        assert metadata["peak_bytes"] == max(memory.values())
+        assert metadata["nbytes"]["geometry"] > 0
+
+        return metadata
+
+    lo = get_memory(FMM_ORDER)
+    hi = get_memory(2 * FMM_ORDER)
+
+    # the geometry does not depend on the order, expansions do
+    assert lo["nbytes"]["geometry"] == hi["nbytes"]["geometry"]
+    assert (lo["nbytes"]["multipole_expansions"]
+            < hi["nbytes"]["multipole_expansions"])
+    assert lo["peak_bytes"] < hi["peak_bytes"]
+
+
+def test_memory_model_vs_allocations(ctx_factory):
+    """Test the memory model against the allocations of an actual evaluation."""
+    cl_ctx = ctx_factory()
+    queue = cl.CommandQueue(cl_ctx)
+
+    from pytential.allocation import StatisticsMemoryPool
+    allocator = StatisticsMemoryPool(queue)
+    actx = PyOpenCLArrayContext(queue, allocator=allocator)
+
+    # NOTE: the fmmlib expansions are allocated on the host
+    lpot_source = get_lpot_source(actx, 2).copy(fmm_backend="sumpy")
+    places = GeometryCollection(lpot_source)
+
+    density_discr = places.get_discretization(places.auto_source.geometry)
+    sigma = get_density(actx, density_discr)
+
+    sigma_sym = sym.var("sigma")
+    k_sym = LaplaceKernel(lpot_source.ambient_dim)
+    op_S = bind(places, sym.S(k_sym, sigma_sym, qbx_forced_limit=+1))
+
+    _, metadata = op_S.memory_per_stage(array_context=actx, sigma=sigma)
+    metadata, = metadata.values()
+    nbytes = metadata["nbytes"]
+
+    op_S(actx, sigma=sigma)
+    allocator.reset_statistics()
+    op_S(actx, sigma=sigma)
+    measured = allocator.get_statistics()["bytes_per_stage"]["qbx_fmm"]
+
+    # the measured bytes also contain the temporaries of adding up partial
+    # results, so they only agree with the model up to a small factor
+    predicted = sum(nbytes[name] for name in [
+        "multipole_expansions", "local_expansions", "qbx_expansions",
+        "potentials", "qbx_potentials"])
+    logger.info("memory model: predicted %d bytes, measured %d bytes",
+            predicted, measured)
+
+    assert 0.5 * predicted <= measured <= 4 * predicted
+
+# }}}
+
+
 # {{{ test cost model metadata gathering
 
 def test_cost_model_metadata_gathering(ctx_factory):
@@ -148,7 +148,8 @@ def test_off_surface_eval(ctx_factory, use_fmm, visualize=False):
 
 # {{{ test off-surface eval vs direct
 
-def test_off_surface_eval_vs_direct(ctx_factory,  do_plot=False):
+@pytest.mark.parametrize("mixed_precision", [False, True])
+def test_off_surface_eval_vs_direct(ctx_factory, mixed_precision, do_plot=False):
     logging.basicConfig(level=logging.INFO)
 
     cl_ctx = ctx_factory()
@@ -183,6 +184,7 @@ def test_off_surface_eval_vs_direct(ctx_factory,  do_plot=False):
             pre_density_discr, 4*target_order, qbx_order,
             fmm_order=qbx_order + 3,
             _expansions_in_tree_have_extent=True,
+            _use_mixed_precision_fmm=mixed_precision,
             target_association_tolerance=0.05,
             )
 
@@ -231,6 +233,46 @@ def test_off_surface_eval_vs_direct(ctx_factory,  do_plot=False):
 
     assert linf_err < 1e-3
 
+    if not mixed_precision:
+        return
+
+    # {{{ compare against the same FMM in double precision
+
+    assert fmm_qbx.get_fmm_far_field_expansion_dtype(np.float64) == np.float32
+
+    from pytential.allocation import StatisticsMemoryPool
+    allocator = StatisticsMemoryPool(queue)
+    pool_actx = PyOpenCLArrayContext(queue, allocator=allocator)
+
+    places = places.merge({
+        "double_fmm_qbx": fmm_qbx.copy(_use_mixed_precision_fmm=False)
+        })
+
+    def evaluate_with_fmm_bytes(source_name):
+        density_discr = places.get_discretization(source_name)
+        sigma = density_discr.zeros(pool_actx) + 1
+        bound_op = bind(places, op, auto_where=(source_name, "target"))
+
+        allocator.reset_statistics()
+        result = pool_actx.to_numpy(bound_op(pool_actx, sigma=sigma))
+
+        return result, allocator.bytes_per_stage["qbx_fmm"]
+
+    mixed_fld_in_vol, mixed_nbytes = evaluate_with_fmm_bytes("fmm_qbx")
+    double_fld_in_vol, double_nbytes = evaluate_with_fmm_bytes("double_fmm_qbx")
+
+    # the multipole and local expansions are allocated in single precision
+    assert mixed_nbytes < double_nbytes
+
+    # and only add a rounding-level error to the double precision FMM
+    mixed_err = (
+            la.norm(mixed_fld_in_vol - double_fld_in_vol, np.inf)
+            / la.norm(double_fld_in_vol, np.inf))
+    print("mixed precision rel. l_inf error:", mixed_err)
+    assert mixed_err < 1e-5
+
+    # }}}
+
 # }}}
 
 
@@ -345,6 +387,554 @@ def test_unregularized_off_surface_fmm_vs_direct(ctx_factory):
 
     # }}}
 
+    # {{{ check geometry data reuse and timing data
+
+    timing_data = {}
+    bound_op = bind(places, op, auto_where=("unregularized_fmm", "targets"))
+    fmm_fld_in_vol_again = bound_op.eval({"sigma": sigma},
+            timing_data=timing_data, array_context=actx)
+
+    assert (
+            fmm.fmm_geometry_data(places, (ptarget,))
+            is fmm.fmm_geometry_data(places, (ptarget,)))
+    assert timing_data
+    assert all(stage_timing for stage_timing in timing_data.values())
+
+    err = actx.np.fabs(fmm_fld_in_vol_again - fmm_fld_in_vol)
+    assert actx.to_numpy(err).max() < 1e-15
+
+    # }}}
+
+# }}}
+
+
+# {{{ test batched direct evaluation
+
+def test_direct_qbx_batched_outputs(ctx_factory):
+    cl_ctx = ctx_factory()
+    queue = cl.CommandQueue(cl_ctx)
+    actx = PyOpenCLArrayContext(queue)
+
+    nelements = 40
+    target_order = 8
+    qbx_order = 4
+
+    mesh = make_curve_mesh(partial(ellipse, 3),
+            np.linspace(0, 1, nelements+1),
+            target_order)
+
+    from pytential.qbx import QBXLayerPotentialSource
+    from meshmode.discretization import Discretization
+    from meshmode.discretization.poly_element import \
+            InterpolatoryQuadratureSimplexGroupFactory
+
+    pre_density_discr = Discretization(
+            actx, mesh, InterpolatoryQuadratureSimplexGroupFactory(target_order))
+    qbx = QBXLayerPotentialSource(
+            pre_density_discr, 4*target_order, qbx_order,
+            fmm_order=False,
+            target_association_tolerance=0.05)
+
+    from pytential.target import PointsTarget
+    fplot = FieldPlotter(np.zeros(2), extent=5, npoints=30)
+    places = GeometryCollection({
+        "qbx": qbx,
+        "targets": PointsTarget(fplot.points)},
+        auto_where="qbx")
+
+    density_discr = places.get_discretization("qbx")
+    from meshmode.dof_array import thaw
+    nodes = thaw(actx, density_discr.nodes())
+    sigma = actx.np.cos(3 * actx.np.arctan2(nodes[1], nodes[0]))
+
+    from sumpy.kernel import LaplaceKernel
+    kernel = LaplaceKernel(2)
+
+    def S(qbx_forced_limit, target="qbx"):  # noqa: N802
+        return sym.S(kernel, sym.var("sigma"),
+                qbx_forced_limit=qbx_forced_limit,
+                source="qbx", target=target)
+
+    # all of these end up in the same layer potential instruction
+    ops = [S(+1), S(-1), S(None, target="targets")]
+
+    batched = bind(places, sym.make_obj_array([
+        ops[0] + ops[1], ops[2]]))(actx, sigma=sigma)
+    separate = [bind(places, op)(actx, sigma=sigma) for op in ops]
+
+    from pytential.utils import flatten_to_numpy
+    for batched_result, separate_result in zip(batched, [
+            separate[0] + separate[1], separate[2]]):
+        batched_result = flatten_to_numpy(actx, batched_result)
+        separate_result = flatten_to_numpy(actx, separate_result)
+
+        assert la.norm(batched_result - separate_result) < (
+                1e-13 * la.norm(separate_result))
+
+# }}}
+
+
+# {{{ streaming evaluation
+
+def test_streaming_off_surface_eval(ctx_factory):
+    cl_ctx = ctx_factory()
+    queue = cl.CommandQueue(cl_ctx)
+    actx = PyOpenCLArrayContext(queue)
+
+    nelements = 30
+    target_order = 8
+    qbx_order = 3
+
+    mesh = make_curve_mesh(partial(ellipse, 3),
+            np.linspace(0, 1, nelements+1),
+            target_order)
+
+    from pytential.qbx import QBXLayerPotentialSource
+    from meshmode.discretization import Discretization
+    from meshmode.discretization.poly_element import \
+            InterpolatoryQuadratureSimplexGroupFactory
+
+    pre_density_discr = Discretization(
+            actx, mesh, InterpolatoryQuadratureSimplexGroupFactory(target_order))
+    qbx = QBXLayerPotentialSource(
+            pre_density_discr, 4*target_order, qbx_order,
+            fmm_order=qbx_order + 3,
+            target_association_tolerance=0.05)
+
+    from pytential.target import PointsTarget
+    fplot = FieldPlotter(np.zeros(2), extent=5, npoints=40)
+    places = GeometryCollection({
+        "qbx": qbx,
+        "targets": PointsTarget(fplot.points)},
+        auto_where="qbx")
+
+    density_discr = places.get_discretization("qbx")
+    from meshmode.dof_array import thaw
+    nodes = thaw(actx, density_discr.nodes())
+    sigma = actx.np.cos(3 * actx.np.arctan2(nodes[1], nodes[0]))
+
+    from sumpy.kernel import LaplaceKernel
+    op = sym.S(LaplaceKernel(2), sym.var("sigma"), qbx_forced_limit=None)
+
+    ref = actx.to_numpy(
+            bind(places, op, auto_where=("qbx", "targets"))(actx, sigma=sigma))
+
+    from pytential.streaming import StreamingEvaluator
+    evaluator = StreamingEvaluator(places, op, source="qbx", tile_size=300)
+
+    # NOTE: each tile builds its own FMM tree, so the results only agree with
+    # the reference up to the FMM accuracy
+    tol = 1e-4
+
+    # tiles along the Morton order of an array
+    result = evaluator(actx, fplot.points, sigma=sigma)
+    assert la.norm(result - ref) < tol * la.norm(ref)
+
+    # tiles as given by an iterable, written to a preallocated array
+    out = np.empty_like(ref)
+    evaluator(actx,
+            (fplot.points[:, i:i + 500]
+                for i in range(0, fplot.points.shape[1], 500)),
+            out=out, sigma=sigma)
+    assert la.norm(out - ref) < tol * la.norm(ref)
+
+    # no targets
+    result = evaluator(actx, np.empty((2, 0)), sigma=sigma)
+    assert result.shape == (0,)
+    assert result.dtype == ref.dtype
+
+# }}}
+
+
+# {{{ multiple target sets
+
+def test_multi_target_bound_expression(ctx_factory):
+    cl_ctx = ctx_factory()
+    queue = cl.CommandQueue(cl_ctx)
+    actx = PyOpenCLArrayContext(queue)
+
+    nelements = 30
+    target_order = 8
+    qbx_order = 3
+
+    mesh = make_curve_mesh(partial(ellipse, 3),
+            np.linspace(0, 1, nelements+1),
+            target_order)
+
+    from pytential.qbx import QBXLayerPotentialSource
+    from meshmode.discretization import Discretization
+    from meshmode.discretization.poly_element import \
+            InterpolatoryQuadratureSimplexGroupFactory
+
+    pre_density_discr = Discretization(
+            actx, mesh, InterpolatoryQuadratureSimplexGroupFactory(target_order))
+    qbx = QBXLayerPotentialSource(
+            pre_density_discr, 4*target_order, qbx_order,
+            fmm_order=15,
+            target_association_tolerance=0.05)
+
+    from pytential.target import PointsTarget
+    targets = {
+            "near": PointsTarget(
+                FieldPlotter(np.zeros(2), extent=5, npoints=20).points),
+            "far": PointsTarget(
+                FieldPlotter(np.zeros(2) + 20, extent=5, npoints=20).points),
+            }
+    places = GeometryCollection({"qbx": qbx}, auto_where="qbx")
+
+    density_discr = places.get_discretization("qbx")
+    from meshmode.dof_array import thaw
+    nodes = thaw(actx, density_discr.nodes())
+    sigma = actx.np.cos(3 * actx.np.arctan2(nodes[1], nodes[0]))
+
+    from sumpy.kernel import LaplaceKernel
+    kernel = LaplaceKernel(2)
+    exprs = {
+            "qbx": sym.S(kernel, sym.var("sigma"), qbx_forced_limit=+1),
+            "near": sym.S(kernel, sym.var("sigma"), qbx_forced_limit=None),
+            "far": sym.S(kernel, sym.var("sigma"), qbx_forced_limit=None),
+            }
+
+    from pytential.symbolic.execution import MultiTargetBoundExpression
+    bound_expr = MultiTargetBoundExpression(places, exprs, targets=targets)
+    results = bound_expr(actx, sigma=sigma)
+    assert set(results) == set(exprs)
+
+    from pytential.symbolic.compiler import ComputePotentialInstruction
+    insn, = [insn for insn in bound_expr._bound_expr.code.instructions
+            if isinstance(insn, ComputePotentialInstruction)]
+    assert len(insn.outputs) == len(exprs)
+
+    from pytential.utils import flatten_to_numpy
+    for name, expr in exprs.items():
+        ref = bind(bound_expr.places, expr,
+                auto_where=("qbx", name))(actx, sigma=sigma)
+
+        result = flatten_to_numpy(actx, results[name])
+        ref = flatten_to_numpy(actx, ref)
+        # the trees differ, so the results agree only up to the FMM error
+        assert la.norm(result - ref) < 1e-4 * la.norm(ref)
+
+# }}}
+
+
+# {{{ qbx expansion field
+
+def test_qbx_expansion_field(ctx_factory):
+    cl_ctx = ctx_factory()
+    queue = cl.CommandQueue(cl_ctx)
+    actx = PyOpenCLArrayContext(queue)
+
+    nelements = 30
+    target_order = 8
+    qbx_order = 4
+
+    mesh = make_curve_mesh(partial(ellipse, 3),
+            np.linspace(0, 1, nelements+1),
+            target_order)
+
+    from pytential.qbx import QBXLayerPotentialSource
+    from meshmode.discretization import Discretization
+    from meshmode.discretization.poly_element import \
+            InterpolatoryQuadratureSimplexGroupFactory
+
+    pre_density_discr = Discretization(
+            actx, mesh, InterpolatoryQuadratureSimplexGroupFactory(target_order))
+    qbx = QBXLayerPotentialSource(
+            pre_density_discr, 4*target_order, qbx_order,
+            fmm_order=15,
+            target_association_tolerance=0.05)
+    places = GeometryCollection(qbx)
+
+    density_discr = places.get_discretization(places.auto_source.geometry)
+    from meshmode.dof_array import thaw
+    nodes = thaw(actx, density_discr.nodes())
+    sigma = actx.np.cos(3 * actx.np.arctan2(nodes[1], nodes[0]))
+
+    from sumpy.kernel import LaplaceKernel
+    kernel = LaplaceKernel(2)
+
+    op = sym.S(kernel, sym.var("sigma"), qbx_forced_limit=+1)
+    _, fields = bind(places, op).qbx_expansion_fields(actx, sigma=sigma)
+    field, = fields.values()
+
+    # targets halfway between the exterior centers and the edge of their disks
+    rng = np.random.default_rng(seed=42)
+    angles = rng.uniform(0, 2*np.pi, field.ncenters)
+    targets = field.centers + 0.5 * field.expansion_radii * np.array([
+        np.cos(angles), np.sin(angles)])
+    # plus one target that is not inside any disk
+    targets = np.hstack([targets, [[20], [20]]])
+
+    assert (field.find_centers(targets)[:-1] >= 0).all()
+    assert field.find_centers(targets)[-1] == -1
+
+    result, = field(actx, targets)
+    result = result.get(queue)
+    assert np.isnan(result[-1])
+
+    from pytential.target import PointsTarget
+    places = places.merge({"targets": PointsTarget(targets[:, :-1])})
+    ref = bind(places,
+            sym.S(kernel, sym.var("sigma"), qbx_forced_limit=None),
+            auto_where=(places.auto_source, "targets"))(actx, sigma=sigma)
+    ref = actx.to_numpy(ref)
+
+    assert la.norm(result[:-1] - ref) < 1e-3 * la.norm(ref)
+
+    # target-dependent kernel arguments are not known at new targets
+    from sumpy.kernel import DirectionalTargetDerivative
+    op = sym.IntG(DirectionalTargetDerivative(kernel, "tgt_dir"),
+            sym.var("sigma"), qbx_forced_limit=+1,
+            tgt_dir=sym.normal(2).as_vector())
+    bound_op = bind(places, op,
+            auto_where=(places.auto_source, places.auto_source))
+    with pytest.raises(NotImplementedError):
+        bound_op.qbx_expansion_fields(actx, sigma=sigma)
+
+# }}}
+
+
+# {{{ fused source strengths
+
+def test_fused_source_strengths(ctx_factory):
+    cl_ctx = ctx_factory()
+    queue = cl.CommandQueue(cl_ctx)
+    actx = PyOpenCLArrayContext(queue)
+
+    nelements = 30
+    target_order = 8
+
+    mesh = make_curve_mesh(partial(ellipse, 3),
+            np.linspace(0, 1, nelements+1),
+            target_order)
+
+    from pytential.qbx import QBXLayerPotentialSource
+    from meshmode.discretization import Discretization
+    from meshmode.discretization.poly_element import \
+            InterpolatoryQuadratureSimplexGroupFactory
+
+    pre_density_discr = Discretization(
+            actx, mesh, InterpolatoryQuadratureSimplexGroupFactory(target_order))
+    qbx = QBXLayerPotentialSource(
+            pre_density_discr, 4*target_order, qbx_order=3, fmm_order=10)
+    places = GeometryCollection(qbx)
+    name = places.auto_source.geometry
+
+    density_discr = places.get_discretization(name)
+    from meshmode.dof_array import thaw, flatten
+    nodes = thaw(actx, density_discr.nodes())
+    sigma = actx.np.cos(3 * actx.np.arctan2(nodes[1], nodes[0]))
+
+    # the density of the layer potential is interpolated by the source
+    from sumpy.kernel import LaplaceKernel
+    bound_op = bind(places,
+            sym.S(LaplaceKernel(2), sym.var("sigma"), qbx_forced_limit=+1))
+
+    from pytential.symbolic.compiler import ComputePotentialInstruction
+    insn, = [insn for insn in bound_op.code.instructions
+            if isinstance(insn, ComputePotentialInstruction)]
+    assert insn.density_from_dd == sym.DOFDescriptor(
+            name, discr_stage=sym.QBX_SOURCE_STAGE1)
+
+    geo_data = qbx.qbx_fmm_geometry_data(
+            places, name, ((density_discr, +1),))
+    strength_op = qbx._get_source_strength_operator(
+            actx, places, insn.density_from_dd, insn.source, geo_data)
+    result = actx.to_numpy(strength_op(actx, flatten(sigma)))
+
+    from pytential.utils import flatten_to_numpy
+    waa = qbx.weights_and_area_elements(actx, places, insn.source)
+    ref = flatten_to_numpy(actx,
+            waa * places.get_connection(insn.density_from_dd, insn.source)(sigma))
+    ref = ref[actx.to_numpy(geo_data.tree().user_source_ids)]
+
+    assert la.norm(result - ref) < 1e-13 * la.norm(ref)
+
+    # constant densities are not interpolated, but evaluated end-to-end
+    op = sym.S(LaplaceKernel(2), 1, qbx_forced_limit=+1)
+    bound_op = bind(places, op)
+    insn, = [insn for insn in bound_op.code.instructions
+            if isinstance(insn, ComputePotentialInstruction)]
+    assert insn.density_from_dd is None
+
+    result = flatten_to_numpy(actx, bound_op(actx))
+    ref = flatten_to_numpy(actx,
+            bind(places, op.copy(density=sym.var("sigma")))(
+                actx, sigma=density_discr.zeros(actx) + 1))
+
+    assert la.norm(result - ref) < 1e-12 * la.norm(ref)
+
+# }}}
+
+
+# {{{ two-sided averages
+
+@pytest.mark.parametrize("use_fmm", [True, False])
+def test_two_sided_average(ctx_factory, use_fmm):
+    cl_ctx = ctx_factory()
+    queue = cl.CommandQueue(cl_ctx)
+    actx = PyOpenCLArrayContext(queue)
+
+    nelements = 30
+    target_order = 8
+
+    mesh = make_curve_mesh(partial(ellipse, 3),
+            np.linspace(0, 1, nelements+1),
+            target_order)
+
+    from pytential.qbx import QBXLayerPotentialSource
+    from meshmode.discretization import Discretization
+    from meshmode.discretization.poly_element import \
+            InterpolatoryQuadratureSimplexGroupFactory
+
+    pre_density_discr = Discretization(
+            actx, mesh, InterpolatoryQuadratureSimplexGroupFactory(target_order))
+    qbx = QBXLayerPotentialSource(
+            pre_density_discr, 4*target_order, qbx_order=3,
+            fmm_order=10 if use_fmm else False)
+    places = GeometryCollection(qbx)
+
+    density_discr = places.get_discretization(places.auto_source.geometry)
+    from meshmode.dof_array import thaw, flatten
+    nodes = thaw(actx, density_discr.nodes())
+    sigma = actx.np.cos(3 * actx.np.arctan2(nodes[1], nodes[0]))
+
+    from sumpy.kernel import LaplaceKernel
+    knl = LaplaceKernel(2)
+    sigma_sym = sym.var("sigma")
+
+    bound_op = bind(places, sym.D(knl, sigma_sym, qbx_forced_limit="avg"))
+
+    # both limits are computed and averaged by a single output
+    from pytential.symbolic.compiler import ComputePotentialInstruction
+    insn, = [insn for insn in bound_op.code.instructions
+            if isinstance(insn, ComputePotentialInstruction)]
+    output, = insn.outputs
+    assert output.qbx_forced_limit == "avg"
+
+    result = actx.to_numpy(flatten(bound_op(actx, sigma=sigma)))
+    ref = actx.to_numpy(flatten(bind(places, 0.5 * (
+        sym.D(knl, sigma_sym, qbx_forced_limit=+1)
+        + sym.D(knl, sigma_sym, qbx_forced_limit=-1)))(actx, sigma=sigma)))
+
+    assert la.norm(result - ref) < 1e-13 * la.norm(ref)
+
+# }}}
+
+
+# {{{ pooled allocation
+
+def test_pooled_allocation(ctx_factory):
+    cl_ctx = ctx_factory()
+    queue = cl.CommandQueue(cl_ctx)
+
+    from pytential.allocation import StatisticsMemoryPool
+    allocator = StatisticsMemoryPool(queue)
+    actx = PyOpenCLArrayContext(queue, allocator=allocator)
+
+    nelements = 30
+    target_order = 8
+
+    mesh = make_curve_mesh(partial(ellipse, 3),
+            np.linspace(0, 1, nelements+1),
+            target_order)
+
+    from pytential.qbx import QBXLayerPotentialSource
+    from meshmode.discretization import Discretization
+    from meshmode.discretization.poly_element import \
+            InterpolatoryQuadratureSimplexGroupFactory
+
+    pre_density_discr = Discretization(
+            actx, mesh, InterpolatoryQuadratureSimplexGroupFactory(target_order))
+    qbx = QBXLayerPotentialSource(
+            pre_density_discr, 4*target_order, qbx_order=3, fmm_order=10)
+    places = GeometryCollection(qbx)
+
+    density_discr = places.get_discretization(places.auto_source.geometry)
+    from meshmode.dof_array import thaw, flatten
+    nodes = thaw(actx, density_discr.nodes())
+    sigma = actx.np.cos(3 * actx.np.arctan2(nodes[1], nodes[0]))
+
+    from sumpy.kernel import LaplaceKernel
+    bound_op = bind(places,
+            sym.S(LaplaceKernel(2), sym.var("sigma"), qbx_forced_limit=+1))
+
+    first = actx.to_numpy(flatten(bound_op(actx, sigma=sigma)))
+    assert "refinement" in allocator.bytes_per_stage
+
+    # the second evaluation reuses the buffers released by the first one
+    allocator.reset_statistics()
+    second = actx.to_numpy(flatten(bound_op(actx, sigma=sigma)))
+
+    stats = allocator.get_statistics()
+    logger.info("allocation statistics: %s", stats)
+
+    assert stats["nallocations"] > 0
+    assert stats["hit_rate"] > 0
+    assert stats["bytes_per_stage"]["qbx_fmm"] > 0
+    if stats["held_bytes"] is not None:
+        assert 0 <= stats["held_bytes"] <= stats["managed_bytes"]
+    assert la.norm(first - second) < 1e-14 * la.norm(first)
+
+# }}}
+
+
+# {{{ point potential source tests
+
+@pytest.mark.parametrize("ambient_dim", [2, 3])
+def test_point_potential_source_fmm_vs_direct(ctx_factory, ambient_dim):
+    cl_ctx = ctx_factory()
+    queue = cl.CommandQueue(cl_ctx)
+    actx = PyOpenCLArrayContext(queue)
+
+    nsources = 2000
+    ntargets = 1000
+    fmm_order = 10
+
+    rng = np.random.default_rng(seed=42)
+    sources = actx.from_numpy(rng.uniform(-1, 1, size=(ambient_dim, nsources)))
+    targets = actx.from_numpy(rng.uniform(-3, 3, size=(ambient_dim, ntargets)))
+    charges = actx.from_numpy(rng.normal(size=nsources))
+
+    from pytential.source import PointPotentialSource
+    from pytential.target import PointsTarget
+    direct = PointPotentialSource(sources)
+    fmm = PointPotentialSource(sources, fmm_order=fmm_order, fmm_threshold=0)
+    places = GeometryCollection({
+        "direct": direct,
+        "fmm": fmm,
+        "targets": PointsTarget(targets)})
+
+    from sumpy.kernel import LaplaceKernel
+    kernel = LaplaceKernel(ambient_dim)
+    pot = sym.S(kernel, sym.var("sigma"), qbx_forced_limit=None)
+    op = sym.make_obj_array([pot, sym.grad(ambient_dim, pot)[0]])
+
+    direct_result = bind(places, op, auto_where=("direct", "targets"))(
+            actx, sigma=charges)
+
+    bound_op = bind(places, op, auto_where=("fmm", "targets"))
+    fmm_result = bound_op(actx, sigma=charges)
+
+    for direct_fld, fmm_fld in zip(direct_result, fmm_result):
+        direct_fld = actx.to_numpy(direct_fld)
+        fmm_fld = actx.to_numpy(fmm_fld)
+
+        rel_err = la.norm(fmm_fld - direct_fld) / la.norm(direct_fld)
+        logger.info("rel_err %.5e", rel_err)
+        assert rel_err < 1e-5
+
+    # {{{ check cost model
+
+    modeled_cost, _ = bound_op.cost_per_stage("constant_one",
+            array_context=actx, sigma=charges)
+    stage_costs, = modeled_cost.values()
+    assert stage_costs["eval_direct"] > 0
+    assert stage_costs["multipole_to_local"] > 0
+
+    # }}}
+
 # }}}
 
 
@@ -405,6 +405,190 @@ def test_build_matrix_fixed_stage(ctx_factory,
     # }}}
 
 
+@pytest.mark.parametrize("overlap", [False, True])
+def test_block_jacobi_preconditioner(ctx_factory, overlap):
+    """Checks that the block-Jacobi preconditioner reduces the number of
+    GMRES iterations on a close-to-touching geometry.
+    """
+
+    ctx = ctx_factory()
+    queue = cl.CommandQueue(ctx)
+    actx = PyOpenCLArrayContext(queue)
+
+    # prevent cache explosion
+    from sympy.core.cache import clear_cache
+    clear_cache()
+
+    case = extra.CurveTestCase(
+            name="ellipse",
+            curve_fn=partial(ellipse, 8.0),
+            target_order=4,
+            qbx_order=4,
+            resolutions=[64],
+            op_type="scalar_mixed",
+            approx_block_count=16,
+            )
+
+    logger.info("\n%s", case)
+
+    # {{{ geometry
+
+    qbx = case.get_layer_potential(actx, case.resolutions[-1], case.target_order)
+    places = GeometryCollection(qbx, auto_where=case.name)
+
+    dd = places.auto_source.to_stage1()
+    density_discr = places.get_discretization(dd.geometry, dd.discr_stage)
+
+    # }}}
+
+    # {{{ solve
+
+    sym_u, sym_op = case.get_operator(places.ambient_dim)
+    bound_op = bind(places, sym_op)
+
+    from pytential.solve import gmres, BlockJacobiPreconditioner
+    precond = BlockJacobiPreconditioner(actx, places, sym_op, sym_u,
+            domain=dd,
+            context=case.knl_concrete_kwargs,
+            max_nodes_in_box=density_discr.ndofs // case.approx_block_count,
+            overlap=overlap)
+    assert precond.nblocks > 1
+
+    # the batched substitution on the device matches a host solve with
+    # the stored LU factors of each block
+    x = np.random.randn(density_discr.ndofs)
+    y = precond(x)
+
+    factors = actx.to_numpy(precond.blocks)
+    block_ranges = actx.to_numpy(precond.block_ranges)
+    perms = actx.to_numpy(precond.perms)
+    row_index_set = precond.row_index_set.get(queue)
+    col_index_set = precond.col_index_set.get(queue)
+    for i in range(precond.nblocks):
+        irow = row_index_set.block_indices(i)
+        icol = col_index_set.block_indices(i)
+        start, end = col_index_set.ranges[i:i + 2]
+
+        lu = factors[block_ranges[i]:block_ranges[i + 1]].reshape(
+                icol.size, icol.size)
+        lower = np.tril(lu, -1) + np.eye(icol.size)
+        upper = np.triu(lu)
+        z = la.solve(lower @ upper, x[icol][perms[start:end]])
+
+        assert la.norm(y[irow] - z[:irow.size]) < 1.0e-12 * la.norm(z)
+
+    scipy_op = bound_op.scipy_op(actx, "u", np.float64,
+            **case.knl_concrete_kwargs)
+    rhs = np.random.randn(density_discr.ndofs)
+
+    result = gmres(scipy_op, rhs, tol=1.0e-10, progress=True)
+    result_pc = gmres(scipy_op, rhs, tol=1.0e-10, progress=True,
+            preconditioner=precond)
+
+    logger.info("iterations: %d (preconditioned: %d)",
+            result.iteration_count, result_pc.iteration_count)
+
+    resid = rhs - scipy_op.matvec(result_pc.solution)
+    assert la.norm(resid) / la.norm(rhs) < 1.0e-9
+    assert result_pc.iteration_count < result.iteration_count
+
+    # }}}
+
+
+@pytest.mark.parametrize("method", ["lu", "qr"])
+def test_direct_solve_cached_factorization(ctx_factory, method):
+    """Checks that :func:`pytential.solve.lu` solves the system and reuses
+    the factorization between right-hand sides.
+    """
+
+    ctx = ctx_factory()
+    queue = cl.CommandQueue(ctx)
+    actx = PyOpenCLArrayContext(queue)
+
+    # prevent cache explosion
+    from sympy.core.cache import clear_cache
+    clear_cache()
+
+    case = extra.CurveTestCase(
+            name="starfish",
+            curve_fn=NArmedStarfish(5, 0.25),
+            target_order=4,
+            qbx_order=4,
+            resolutions=[32],
+            op_type="scalar_mixed",
+            )
+
+    qbx = case.get_layer_potential(actx, case.resolutions[-1], case.target_order)
+    places = GeometryCollection(qbx, auto_where=case.name)
+    density_discr = places.get_discretization(case.name)
+
+    sym_u, sym_op = case.get_operator(places.ambient_dim)
+    bound_op = bind(places, sym_op)
+    scipy_op = bound_op.scipy_op(actx, "u", np.float64,
+            **case.knl_concrete_kwargs)
+
+    from pytential.solve import lu, factorize
+    fact = factorize(scipy_op, method=method)
+    assert fact.condition_number is None
+    assert factorize(scipy_op, method=method) is fact
+
+    for _ in range(2):
+        rhs = np.random.randn(density_discr.ndofs)
+        x = lu(scipy_op, rhs, method=method)
+
+        resid = rhs - scipy_op.matvec(x)
+        assert la.norm(resid) / la.norm(rhs) < 1.0e-12
+
+    fact = factorize(scipy_op, method=method, estimate_condition_number=True)
+    assert fact.condition_number is not None
+
+
+def test_direct_solve_scalar_unknown(ctx_factory):
+    """Checks that :func:`pytential.solve.lu` falls back to applying the
+    operator for systems with scalar unknowns.
+    """
+
+    ctx = ctx_factory()
+    queue = cl.CommandQueue(ctx)
+    actx = PyOpenCLArrayContext(queue)
+
+    # prevent cache explosion
+    from sympy.core.cache import clear_cache
+    clear_cache()
+
+    case = extra.CurveTestCase(
+            name="ellipse",
+            curve_fn=partial(ellipse, 3.0),
+            target_order=4,
+            qbx_order=4,
+            resolutions=[32],
+            )
+
+    qbx = case.get_layer_potential(actx, case.resolutions[-1], case.target_order)
+    places = GeometryCollection(qbx, auto_where=case.name)
+    density_discr = places.get_discretization(case.name)
+
+    # a single layer potential with an additional constant, which is
+    # determined by requiring a density with zero mean
+    from sumpy.kernel import LaplaceKernel
+    sym_u = sym.make_sym_vector("u", 2)
+    sym_op = make_obj_array([
+        sym.S(LaplaceKernel(2), sym_u[0], qbx_forced_limit=+1) + sym_u[1],
+        sym.integral(2, 1, sym_u[0]),
+        ])
+
+    bound_op = bind(places, sym_op)
+    scipy_op = bound_op.scipy_op(actx, "u", np.float64,
+            domains=[case.name, None])
+
+    from pytential.solve import lu
+    rhs = np.random.randn(density_discr.ndofs + 1)
+    x = lu(scipy_op, rhs)
+
+    resid = rhs - scipy_op.matvec(x)
+    assert la.norm(resid) / la.norm(rhs) < 1.0e-12
+
+
 if __name__ == "__main__":
     import sys
     if len(sys.argv) > 1:
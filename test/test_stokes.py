@@ -21,6 +21,7 @@ THE SOFTWARE.
 """
 
 import numpy as np
+import numpy.linalg as la
 import pyopencl as cl
 
 from meshmode.array_context import PyOpenCLArrayContext
@@ -284,6 +285,190 @@ def test_exterior_stokes(ctx_factory, ambient_dim, visualize=False):
 # }}}
 
 
+# {{{ test_stokes_laplace_decomposition
+
+@pytest.mark.parametrize(("ambient_dim", "wrapper", "method_name"), [
+    (2, "stokeslet", "apply"),
+    (2, "stokeslet", "apply_derivative"),
+    (2, "stokeslet", "apply_stress"),
+    (2, "stresslet", "apply"),
+    (2, "stresslet", "apply_derivative"),
+    pytest.param(3, "stokeslet", "apply", marks=pytest.mark.slowtest),
+    pytest.param(3, "stresslet", "apply", marks=pytest.mark.slowtest),
+    ])
+def test_stokes_laplace_decomposition(ctx_factory, ambient_dim, wrapper,
+        method_name, visualize=False):
+    if visualize:
+        logging.basicConfig(level=logging.INFO)
+
+    cl_ctx = ctx_factory()
+    queue = cl.CommandQueue(cl_ctx)
+    actx = PyOpenCLArrayContext(queue)
+
+    target_order = 3
+    radius = 1.5
+
+    if ambient_dim == 2:
+        from meshmode.mesh.generation import make_curve_mesh, ellipse
+        mesh = make_curve_mesh(
+                lambda t: radius * ellipse(1.0, t),
+                np.linspace(0.0, 1.0, 40 + 1),
+                target_order)
+    else:
+        from meshmode.mesh.generation import generate_icosphere
+        mesh = generate_icosphere(radius, target_order + 1)
+
+    pre_density_discr = Discretization(actx, mesh,
+            InterpolatoryQuadratureSimplexGroupFactory(target_order))
+
+    from pytential.qbx import QBXLayerPotentialSource
+    qbx = QBXLayerPotentialSource(pre_density_discr,
+            fine_order=4 * target_order,
+            qbx_order=3,
+            fmm_order=False)
+
+    from extra_int_eq_data import make_source_and_target_points
+    _, point_target = make_source_and_target_points(
+            side=+1,
+            inner_radius=0.5 * radius,
+            outer_radius=2.0 * radius,
+            ambient_dim=ambient_dim,
+            )
+
+    places = GeometryCollection({
+        "source": qbx, "point_target": point_target
+        }, auto_where=("source", "point_target"))
+    density_discr = places.get_discretization("source")
+
+    from pytential.symbolic.stokes import StokesletWrapper, StressletWrapper
+    sym_sigma = sym.make_sym_vector("sigma", ambient_dim)
+    sym_mu = sym.var("mu")
+    sym_normal = sym.normal(ambient_dim).as_vector()
+    sym_dir = sym.make_sym_vector("dir", ambient_dim)
+
+    def make_expr(method):
+        if wrapper == "stokeslet":
+            obj = StokesletWrapper(dim=ambient_dim, method=method)
+            args = {
+                    "apply": (sym_sigma, sym_mu),
+                    "apply_derivative": (0, sym_sigma, sym_mu),
+                    "apply_stress": (sym_sigma, sym_dir, sym_mu),
+                    }[method_name]
+        else:
+            obj = StressletWrapper(dim=ambient_dim, method=method)
+            args = {
+                    "apply": (sym_sigma, sym_normal, sym_mu),
+                    "apply_derivative": (0, sym_sigma, sym_normal, sym_mu),
+                    }[method_name]
+
+        return getattr(obj, method_name)(*args, qbx_forced_limit=None)
+
+    from meshmode.dof_array import thaw
+    nodes = thaw(actx, density_discr.nodes())
+    sigma = make_obj_array([
+        actx.np.cos((iaxis + 1) * nodes[iaxis]) for iaxis in range(ambient_dim)
+        ])
+    direction = make_obj_array([
+        actx.from_numpy(np.full(point_target.ndofs, 1.0 / (iaxis + 1)))
+        for iaxis in range(ambient_dim)
+        ])
+
+    results = {}
+    for method in ["naive", "laplace"]:
+        results[method] = bind(places, make_expr(method))(
+                actx, sigma=sigma, mu=1.3, dir=direction)
+
+    for naive, laplace in zip(results["naive"], results["laplace"]):
+        naive = actx.to_numpy(naive)
+        laplace = actx.to_numpy(laplace)
+
+        error = la.norm(naive - laplace) / la.norm(naive)
+        logger.info("error %.5e", error)
+        assert error < 1.0e-11
+
+
+@pytest.mark.parametrize(("ambient_dim", "wrapper"), [
+    (2, "stokeslet"),
+    (2, "stresslet"),
+    pytest.param(3, "stokeslet", marks=pytest.mark.slowtest),
+    pytest.param(3, "stresslet", marks=pytest.mark.slowtest),
+    ])
+def test_stokes_laplace_decomposition_tsqbx(ctx_factory, ambient_dim, wrapper):
+    """Checks the on-surface limits of the Laplace decomposition evaluated
+    with the fmmlib backend and target-specific QBX against direct QBX on
+    the naive Stokes kernels.
+    """
+
+    cl_ctx = ctx_factory()
+    queue = cl.CommandQueue(cl_ctx)
+    actx = PyOpenCLArrayContext(queue)
+
+    target_order = 3
+    radius = 1.5
+
+    if ambient_dim == 2:
+        from meshmode.mesh.generation import make_curve_mesh, ellipse
+        mesh = make_curve_mesh(
+                lambda t: radius * ellipse(1.0, t),
+                np.linspace(0.0, 1.0, 40 + 1),
+                target_order)
+    else:
+        from meshmode.mesh.generation import generate_icosphere
+        mesh = generate_icosphere(radius, target_order + 1)
+
+    pre_density_discr = Discretization(actx, mesh,
+            InterpolatoryQuadratureSimplexGroupFactory(target_order))
+
+    from pytential.qbx import QBXLayerPotentialSource
+    direct_qbx = QBXLayerPotentialSource(pre_density_discr,
+            fine_order=4 * target_order,
+            qbx_order=3,
+            fmm_order=False)
+    tsqbx = direct_qbx.copy(
+            fmm_order=15,
+            fmm_backend="fmmlib",
+            _use_target_specific_qbx=True)
+
+    places = GeometryCollection({"direct": direct_qbx, "tsqbx": tsqbx})
+
+    from pytential.symbolic.stokes import StokesletWrapper, StressletWrapper
+    sym_sigma = sym.make_sym_vector("sigma", ambient_dim)
+    sym_mu = sym.var("mu")
+    sym_normal = sym.normal(ambient_dim).as_vector()
+
+    def make_expr(method):
+        if wrapper == "stokeslet":
+            obj = StokesletWrapper(dim=ambient_dim, method=method)
+            return obj.apply(sym_sigma, sym_mu, qbx_forced_limit=+1)
+        else:
+            obj = StressletWrapper(dim=ambient_dim, method=method)
+            return obj.apply(sym_sigma, sym_normal, sym_mu, qbx_forced_limit=+1)
+
+    from meshmode.dof_array import thaw
+
+    def evaluate(name, method):
+        density_discr = places.get_discretization(name)
+        nodes = thaw(actx, density_discr.nodes())
+        sigma = make_obj_array([
+            actx.np.cos((iaxis + 1) * nodes[iaxis])
+            for iaxis in range(ambient_dim)
+            ])
+
+        result = bind(places, make_expr(method), auto_where=name)(
+                actx, sigma=sigma, mu=1.3)
+        return [flatten_to_numpy(actx, r) for r in result]
+
+    from pytential.utils import flatten_to_numpy
+    for naive, laplace in zip(
+            evaluate("direct", "naive"), evaluate("tsqbx", "laplace")):
+        # NOTE: only agrees up to the FMM truncation error
+        error = la.norm(naive - laplace) / la.norm(naive)
+        logger.info("error %.5e", error)
+        assert error < 1.0e-5
+
+# }}}
+
+
 # You can test individual routines by typing
 # $ python test_stokes.py 'test_routine()'
 
@@ -205,6 +205,33 @@ def test_expr_pickling():
 # }}}
 
 
+# {{{ test_hash_consing
+
+def test_hash_consing():
+    from sumpy.kernel import LaplaceKernel
+    from pytools.obj_array import make_obj_array
+    from pytential.symbolic.mappers import HashConsingMapper, ToTargetTagger
+
+    def make_op():
+        # builds a new, but structurally equal, expression on every call
+        return sym.D(LaplaceKernel(2),
+                sym.normal(2).as_vector()[0] * sym.var("sigma"),
+                qbx_forced_limit=-1)
+
+    ops = make_obj_array([make_op(), make_op()])
+    assert ops[0] is not ops[1]
+
+    ops = HashConsingMapper()(ops)
+    assert ops[0] is ops[1]
+    assert ops[0] == make_op()
+
+    # shared subexpressions stay shared through the preprocessing mappers
+    tagged_ops = ToTargetTagger(sym.DEFAULT_SOURCE, sym.DEFAULT_TARGET)(ops)
+    assert tagged_ops[0] is tagged_ops[1]
+
+# }}}
+
+
 # {{{ test basic layer potentials
 
 @pytest.mark.parametrize("lpot_class", [
@@ -296,6 +323,59 @@ def test_interpolation(ctx_factory, name, source_discr_stage, target_granularity
 # }}}
 
 
+# {{{ test flattened stage connections
+
+def test_flattened_stage_connection(ctx_factory):
+    ctx = ctx_factory()
+    queue = cl.CommandQueue(ctx)
+    actx = PyOpenCLArrayContext(queue)
+
+    nelements = 32
+    target_order = 7
+
+    mesh = make_curve_mesh(starfish,
+            np.linspace(0.0, 1.0, nelements + 1),
+            target_order)
+    discr = Discretization(actx, mesh,
+            InterpolatoryQuadratureSimplexGroupFactory(target_order))
+
+    from pytential.qbx import QBXLayerPotentialSource
+    qbx = QBXLayerPotentialSource(discr,
+            fine_order=4 * target_order,
+            qbx_order=4,
+            fmm_order=False)
+
+    from pytential import GeometryCollection
+    places = GeometryCollection(qbx)
+    name = places.auto_source.geometry
+
+    from_dd = sym.DOFDescriptor(name, discr_stage=sym.QBX_SOURCE_STAGE1)
+    to_dd = sym.DOFDescriptor(name, discr_stage=sym.QBX_SOURCE_QUAD_STAGE2)
+    conn = places.get_connection(from_dd, to_dd)
+
+    # flattened once and then reused
+    assert places.get_connection(from_dd, to_dd) is conn
+
+    from meshmode.discretization.connection import \
+            ChainedDiscretizationConnection
+    chained = ChainedDiscretizationConnection([
+        places._get_conn_from_cache(name,
+            sym.QBX_SOURCE_STAGE1, sym.QBX_SOURCE_STAGE2),
+        places._get_conn_from_cache(name,
+            sym.QBX_SOURCE_STAGE2, sym.QBX_SOURCE_QUAD_STAGE2),
+        ])
+
+    from meshmode.dof_array import thaw, flatten
+    nodes = thaw(actx, conn.from_discr.nodes())
+    sigma = actx.np.cos(3 * actx.np.arctan2(nodes[1], nodes[0]))
+
+    result = actx.to_numpy(flatten(conn(sigma)))
+    ref = actx.to_numpy(flatten(chained(sigma)))
+    assert la.norm(result - ref) < 1.0e-13 * la.norm(ref)
+
+# }}}
+
+
 # {{{ test node reductions
 
 def test_node_reduction(ctx_factory):
@@ -344,6 +424,239 @@ def test_node_reduction(ctx_factory):
 # }}}
 
 
+# {{{ test lazy evaluation
+
+def test_lazy_evaluation(ctx_factory):
+    ctx = ctx_factory()
+    queue = cl.CommandQueue(ctx)
+    actx = PyOpenCLArrayContext(queue)
+
+    target_order = 4
+    nelements = 32
+
+    mesh = make_curve_mesh(starfish,
+            np.linspace(0.0, 1.0, nelements + 1),
+            target_order)
+    discr = Discretization(actx, mesh,
+            InterpolatoryQuadratureSimplexGroupFactory(target_order))
+
+    from meshmode.dof_array import DOFArray, thaw, flatten
+    nodes = thaw(actx, discr.nodes())
+    sigma = actx.np.cos(3 * actx.np.arctan2(nodes[1], nodes[0]))
+
+    x = sym.nodes(discr.ambient_dim).as_vector()
+    r = sym.sqrt(x[0]**2 + x[1]**2)
+    sigma_sym = sym.var("sigma")
+
+    for expr in [
+            sym.integral(discr.ambient_dim, discr.dim, sym.cos(x[0]) * sigma_sym),
+            sym.NodeMax(r * sigma_sym) / sym.NodeMin(r),
+            sym.ElementwiseMax(r * sigma_sym) + sigma_sym**2,
+            ]:
+        bound_expr = bind(discr, expr, evaluation_mode="lazy")
+        ref = bind(discr, expr)(actx, sigma=sigma)
+
+        # check that the arithmetic was actually fused
+        from pytential.symbolic.lazy import LazyEvaluationMapper
+        exec_mapper = LazyEvaluationMapper(bound_expr, actx, {"sigma": sigma})
+        lazy_code = bound_expr._get_lazy_code()
+        result = lazy_code.execute(exec_mapper)
+
+        assert exec_mapper.nkernels > 0
+        assert len(lazy_code.instructions) <= len(bound_expr.code.instructions)
+
+        if isinstance(ref, DOFArray):
+            result = actx.to_numpy(flatten(result))
+            ref = actx.to_numpy(flatten(ref))
+
+        assert la.norm(result - ref) < 1.0e-13 * la.norm(ref)
+
+    # evaluation mode can be selected per evaluation
+    bound_expr = bind(discr, sym.NodeSum(sigma_sym**2))
+    result = bound_expr.eval({"sigma": sigma}, evaluation_mode="lazy")
+    ref = bound_expr.eval({"sigma": sigma})
+    assert abs(result - ref) < 1.0e-13 * abs(ref)
+
+    with pytest.raises(ValueError):
+        bound_expr.eval({"sigma": sigma}, evaluation_mode="unknown")
+
+    # dead assignments are removed
+    from pytential.symbolic.compiler import Assign, Code
+    from pytential.symbolic.lazy import optimize_code
+
+    code = bound_expr.code
+    dead_insn = Assign(names=["dead"], exprs=[sigma_sym**2], priority=0,
+            dep_mapper_factory=code.instructions[0].dep_mapper_factory)
+    optimized_code = optimize_code(
+            Code([*code.instructions, dead_insn], code.result))
+
+    assert not any("dead" in insn.get_assignees()
+            for insn in optimized_code.instructions)
+
+# }}}
+
+
+# {{{ test warmup
+
+def test_warmup(ctx_factory):
+    ctx = ctx_factory()
+    queue = cl.CommandQueue(ctx)
+    actx = PyOpenCLArrayContext(queue)
+
+    nelements = 32
+    target_order = 7
+
+    mesh = make_curve_mesh(starfish,
+            np.linspace(0.0, 1.0, nelements + 1),
+            target_order)
+    discr = Discretization(actx, mesh,
+            InterpolatoryQuadratureSimplexGroupFactory(target_order))
+
+    from pytential.qbx import QBXLayerPotentialSource
+    qbx = QBXLayerPotentialSource(discr,
+            fine_order=4 * target_order,
+            qbx_order=3,
+            fmm_order=False)
+
+    from pytential import GeometryCollection
+    places = GeometryCollection(qbx)
+
+    from sumpy.kernel import LaplaceKernel
+    sigma_sym = sym.var("sigma")
+    op = (
+            sym.S(LaplaceKernel(2), sigma_sym, qbx_forced_limit=+1)
+            + sym.D(LaplaceKernel(2), sigma_sym, qbx_forced_limit="avg"))
+    bound_op = bind(places, op)
+
+    density_discr = places.get_discretization(places.auto_source.geometry)
+    records = bound_op.warmup(actx, sigma=density_discr.zeros(actx))
+
+    from pytential.symbolic.compiler import ComputePotentialInstruction
+    ninsns = sum(
+            1 for insn in bound_op.code.instructions
+            if isinstance(insn, ComputePotentialInstruction))
+
+    assert len(records) == ninsns
+    for record in records:
+        assert record["qbx_order"] == 3
+        assert record["fmm_level_to_order"] is False
+        assert record["wall_time"] >= 0
+
+    # evaluating after a warmup works as usual
+    from meshmode.dof_array import flatten
+    sigma = density_discr.zeros(actx) + 1
+    result = actx.to_numpy(flatten(bound_op(actx, sigma=sigma)))
+    assert np.all(np.isfinite(result))
+
+    # lazy evaluation is warmed up in a single pass
+    bound_op = bind(places, op, evaluation_mode="lazy")
+    records = bound_op.warmup(actx, sigma=density_discr.zeros(actx))
+    assert len(records) == ninsns
+
+# }}}
+
+
+# {{{ test target derivative merging
+
+def test_target_derivative_merging(ctx_factory):
+    ctx = ctx_factory()
+    queue = cl.CommandQueue(ctx)
+    actx = PyOpenCLArrayContext(queue)
+
+    nelements = 32
+    target_order = 7
+
+    mesh = make_curve_mesh(starfish,
+            np.linspace(0.0, 1.0, nelements + 1),
+            target_order)
+    discr = Discretization(actx, mesh,
+            InterpolatoryQuadratureSimplexGroupFactory(target_order))
+
+    from pytential.qbx import QBXLayerPotentialSource
+    qbx = QBXLayerPotentialSource(discr,
+            fine_order=4 * target_order,
+            qbx_order=3,
+            fmm_order=False)
+
+    from pytential import GeometryCollection
+    places = GeometryCollection(qbx)
+
+    from sumpy.kernel import LaplaceKernel, DirectionalTargetDerivative
+    knl = LaplaceKernel(2)
+    sigma_sym = sym.var("sigma")
+
+    # S' written with a directional target derivative kernel
+    op = (
+            sym.S(knl, sigma_sym, qbx_forced_limit=+1)
+            + sym.IntG(DirectionalTargetDerivative(knl, "tgt_dir"), sigma_sym,
+                qbx_forced_limit=+1, tgt_dir=sym.normal(2).as_vector()))
+    ref_op = (
+            sym.S(knl, sigma_sym, qbx_forced_limit=+1)
+            + sym.Sp(knl, sigma_sym, qbx_forced_limit=+1))
+
+    from pytential.symbolic.execution import _prepare_expr
+    from pytential.symbolic.compiler import (
+            OperatorCompiler, ComputePotentialInstruction)
+
+    compiler = OperatorCompiler(places)
+    code = compiler(_prepare_expr(places, op))
+
+    ninsns = sum(
+            1 for insn in code.instructions
+            if isinstance(insn, ComputePotentialInstruction))
+    assert ninsns == 1
+
+    from pytential.symbolic.execution import _prepare_auto_where
+    from pytential.symbolic.mappers import (
+            ToTargetTagger, DerivativeBinder, TargetDerivativeCanonicalizer)
+
+    from pytential.symbolic.execution import _count_operator_groups
+
+    def canonicalize(expr):
+        auto_source, auto_target = _prepare_auto_where(None, places=places)
+        expr = ToTargetTagger(auto_source, auto_target)(expr)
+        expr = DerivativeBinder()(expr)
+        ngroups_before = _count_operator_groups(places, expr)
+
+        canonicalizer = TargetDerivativeCanonicalizer()
+        expr = canonicalizer(expr)
+        assert _count_operator_groups(places, expr) <= ngroups_before
+
+        return expr, canonicalizer.nrewritten
+
+    merged_op, nrewritten = canonicalize(op)
+    assert nrewritten == 1
+    assert _count_operator_groups(places, merged_op) == 1
+
+    # a lone directional derivative has nothing to be merged with
+    lone_op = sym.IntG(DirectionalTargetDerivative(knl, "tgt_dir"), sigma_sym,
+            qbx_forced_limit=+1, tgt_dir=sym.normal(2).as_vector())
+    lone_op, nrewritten = canonicalize(lone_op)
+    assert nrewritten == 0
+    assert isinstance(lone_op.kernel, DirectionalTargetDerivative)
+
+    # ... and neither does one with different kernel arguments
+    from sumpy.kernel import HelmholtzKernel
+    helm_knl = HelmholtzKernel(2)
+    helm_op = (
+            sym.S(helm_knl, sigma_sym, k=1, qbx_forced_limit=+1)
+            + sym.IntG(DirectionalTargetDerivative(helm_knl, "tgt_dir"),
+                sigma_sym, qbx_forced_limit=+1, k=2,
+                tgt_dir=sym.normal(2).as_vector()))
+    _, nrewritten = canonicalize(helm_op)
+    assert nrewritten == 0
+
+    from meshmode.dof_array import thaw, flatten
+    nodes = thaw(actx, discr.nodes())
+    sigma = actx.np.cos(3 * actx.np.arctan2(nodes[1], nodes[0]))
+
+    result = actx.to_numpy(flatten(bind(places, op)(actx, sigma=sigma)))
+    ref = actx.to_numpy(flatten(bind(places, ref_op)(actx, sigma=sigma)))
+    assert la.norm(result - ref) < 1.0e-13 * la.norm(ref)
+
+# }}}
+
+
 # You can test individual routines by typing
 # $ python test_symbolic.py 'test_routine()'
 
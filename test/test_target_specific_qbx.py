@@ -130,10 +130,13 @@ def test_spherical_hankel_functions():
     assert np.allclose(hder, hder_expected)
 
 
-@pytest.mark.parametrize("op", ["S", "D", "Sp"])
+@pytest.mark.parametrize("op", ["S", "D", "Sp", "Dp"])
 @pytest.mark.parametrize("helmholtz_k", [0, 1.2, 12 + 1.2j])
 @pytest.mark.parametrize("qbx_order", [0, 1, 5])
 def test_target_specific_qbx(ctx_factory, op, helmholtz_k, qbx_order):
+    if op == "Dp" and helmholtz_k != 0:
+        pytest.skip("gradient of the double layer is only supported for Laplace")
+
     logging.basicConfig(level=logging.INFO)
 
     cl_ctx = ctx_factory()
@@ -168,7 +171,10 @@ def test_target_specific_qbx(ctx_factory, op, helmholtz_k, qbx_order):
     kernel_length_scale = 5 / abs(helmholtz_k) if helmholtz_k else None
     places = {
         "qbx": qbx,
-        "qbx_target_specific": qbx.copy(_use_target_specific_qbx=True)
+        "qbx_target_specific": qbx.copy(_use_target_specific_qbx=True),
+        "qbx_target_specific_balanced": qbx.copy(
+            _use_target_specific_qbx=True,
+            _tsqbx_schedule="balanced"),
         }
 
     from pytential.qbx.refinement import refine_geometry_collection
@@ -196,6 +202,8 @@ def test_target_specific_qbx(ctx_factory, op, helmholtz_k, qbx_order):
         op = sym.D
     elif op == "Sp":
         op = sym.Sp
+    elif op == "Dp":
+        op = sym.Dp
     else:
         raise ValueError("unknown operator: '%s'" % op)
 
@@ -210,6 +218,101 @@ def test_target_specific_qbx(ctx_factory, op, helmholtz_k, qbx_order):
 
     assert np.allclose(pot_tsqbx, pot_ref, atol=1e-13, rtol=1e-13)
 
+    bound_op = bind(places, expr, auto_where="qbx_target_specific_balanced")
+    pot_tsqbx = actx.to_numpy(flatten(bound_op(actx, u=u_dev, k=helmholtz_k)))
+
+    assert np.allclose(pot_tsqbx, pot_ref, atol=1e-13, rtol=1e-13)
+
+
+@pytest.mark.parametrize("op", ["S", "D", "Sp", "Dp"])
+@pytest.mark.parametrize("helmholtz_k", [0, 1.2, 12 + 1.2j])
+@pytest.mark.parametrize("qbx_order", [0, 1, 5, 12])
+def test_target_specific_qbx_2d(ctx_factory, op, helmholtz_k, qbx_order):
+    if op == "Dp" and helmholtz_k != 0:
+        pytest.skip("gradient of the double layer is only supported for Laplace")
+
+    logging.basicConfig(level=logging.INFO)
+
+    cl_ctx = ctx_factory()
+    queue = cl.CommandQueue(cl_ctx)
+    actx = PyOpenCLArrayContext(queue)
+
+    target_order = 4
+    fmm_tol = 1e-3
+
+    mesh = make_curve_mesh(
+            NArmedStarfish(5, 0.25), np.linspace(0, 1, 101), target_order)
+
+    from meshmode.discretization import Discretization
+    from meshmode.discretization.poly_element import \
+        InterpolatoryQuadratureSimplexGroupFactory
+    from pytential.qbx import QBXLayerPotentialSource
+    pre_density_discr = Discretization(
+            actx, mesh,
+            InterpolatoryQuadratureSimplexGroupFactory(target_order))
+
+    from sumpy.expansion.level_to_order import SimpleExpansionOrderFinder
+    qbx = QBXLayerPotentialSource(
+            pre_density_discr, 4*target_order,
+            qbx_order=qbx_order,
+            fmm_level_to_order=SimpleExpansionOrderFinder(fmm_tol),
+            fmm_backend="fmmlib",
+            _use_target_specific_qbx=False,
+            )
+
+    kernel_length_scale = 5 / abs(helmholtz_k) if helmholtz_k else None
+    places = {
+        "qbx": qbx,
+        "qbx_target_specific": qbx.copy(_use_target_specific_qbx=True),
+        }
+
+    from pytential.qbx.refinement import refine_geometry_collection
+    places = GeometryCollection(places, auto_where="qbx")
+    places = refine_geometry_collection(places,
+            kernel_length_scale=kernel_length_scale)
+
+    density_discr = places.get_discretization("qbx")
+    from meshmode.dof_array import thaw
+    nodes = thaw(actx, density_discr.nodes())
+    u_dev = actx.np.sin(3 * nodes[0])
+
+    if helmholtz_k == 0:
+        kernel = LaplaceKernel(2)
+        kernel_kwargs = {}
+    else:
+        kernel = HelmholtzKernel(2, allow_evanescent=True)
+        kernel_kwargs = {"k": sym.var("k")}
+
+    op = {"S": sym.S, "D": sym.D, "Sp": sym.Sp, "Dp": sym.Dp}[op]
+    expr = op(kernel, sym.var("u"), qbx_forced_limit=-1, **kernel_kwargs)
+
+    from meshmode.dof_array import flatten
+    bound_op = bind(places, expr)
+    pot_ref = actx.to_numpy(flatten(bound_op(actx, u=u_dev, k=helmholtz_k)))
+
+    bound_op = bind(places, expr, auto_where="qbx_target_specific")
+    pot_tsqbx = actx.to_numpy(flatten(bound_op(actx, u=u_dev, k=helmholtz_k)))
+
+    assert np.allclose(pot_tsqbx, pot_ref, atol=1e-11, rtol=1e-11)
+
+
+def test_target_specific_qbx_work_packets():
+    import pytential.qbx.target_specific as ts
+
+    rng = np.random.default_rng(seed=42)
+    work = rng.integers(0, 1000, size=1000)
+    work[:10] = 100000
+
+    center_order, packet_starts = ts.make_center_work_packets(work, nthreads=4)
+
+    # every center appears in exactly one packet
+    assert sorted(center_order) == list(range(len(work)))
+    assert packet_starts[0] == 0 and packet_starts[-1] == len(work)
+    assert np.all(np.diff(packet_starts) > 0)
+
+    # the most expensive centers are handed out first
+    assert set(center_order[:10]) == set(range(10))
+
 
 # You can test individual routines by typing
 # $ python test_target_specific_qbx.py 'test_routine()'
@@ -57,6 +57,34 @@ def test_gmres():
     assert la.norm(true_sol - sol) / la.norm(sol) < tol
 
 
+def test_gmres_right_preconditioner():
+    n = 200
+    A = (  # noqa
+            np.diag(np.linspace(1, 1.0e3, n))
+            + np.random.randn(n, n))
+
+    true_sol = np.random.randn(n)
+    b = np.dot(A, true_sol)
+
+    A_func = lambda x: np.dot(A, x)  # noqa
+    A_func.shape = A.shape
+    A_func.dtype = A.dtype
+
+    M_inv = np.diag(1.0 / np.diag(A))  # noqa
+    M_func = lambda x: np.dot(M_inv, x)  # noqa
+
+    from pytential.solve import gmres
+    tol = 1e-6
+    result = gmres(A_func, b, maxiter=5*n, tol=tol,
+            hard_failure=False, require_monotonicity=False)
+    result_pc = gmres(A_func, b, maxiter=5*n, tol=tol,
+            preconditioner=M_func, x0=np.ones(n))
+
+    resid = b - np.dot(A, result_pc.solution)
+    assert la.norm(resid) / la.norm(b) < 10 * tol
+    assert result_pc.iteration_count < result.iteration_count
+
+
 def test_interpolatory_error_reporting(ctx_factory):
     logging.basicConfig(level=logging.INFO)
 
@@ -167,6 +195,54 @@ def test_geometry_collection_caching(ctx_factory):
             assert discr is not None
 
 
+def test_lazy_import():
+    # check that importing pytential does not pull in the (slow to import)
+    # execution machinery, while still providing the usual names
+    import subprocess
+    import sys
+
+    script = "\n".join([
+        "import sys",
+        "import pytential",
+        "heavy = ['pyopencl', 'loopy', 'meshmode', 'sumpy', 'boxtree']",
+        "assert not [m for m in heavy if m in sys.modules], sys.modules",
+        "from pytential import bind, sym, GeometryCollection",
+        "assert 'pyopencl' in sys.modules",
+        ])
+
+    subprocess.run([sys.executable, "-c", script], check=True)
+
+
+def test_refiner_warning_filter():
+    # check that the refiner warning is an error by default, but that user
+    # filters installed before the refiner is imported still take precedence
+    import subprocess
+    import sys
+
+    script = "\n".join([
+        "import warnings",
+        "import pytential",
+        "from pytential.qbx.refinement import (",
+        "    RefinerNotConvergedWarning, _warn_max_iterations)",
+        "try:",
+        "    _warn_max_iterations(['criterion'], 0.025)",
+        "except RefinerNotConvergedWarning:",
+        "    pass",
+        "else:",
+        "    raise AssertionError('warning was not an error')",
+        ])
+    subprocess.run([sys.executable, "-c", script], check=True)
+
+    script = "\n".join([
+        "import warnings",
+        "import pytential",
+        "warnings.simplefilter('ignore')",
+        "from pytential.qbx.refinement import _warn_max_iterations",
+        "_warn_max_iterations(['criterion'], 0.025)",
+        ])
+    subprocess.run([sys.executable, "-c", script], check=True)
+
+
 # You can test individual routines by typing
 # $ python test_tools.py 'test_routine()'
 